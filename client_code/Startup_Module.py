@@ -55,15 +55,8 @@ import anvil.users
 import anvil.tables as tables
 from anvil.tables import app_tables
 
-# Import layouts
-from Layouts.MainLayout import MainLayout
-from Layouts.AdminLayout import AdminLayout
-from Layouts.BlankLayout import BlankLayout
-from Layouts.ErrorLayout import ErrorLayout
-
-# Import route definitions
-from routes.crm_routes import CRM_ROUTES
-from routes.marketing_routes import MARKETING_ROUTES
+# Layouts and feature route tables are imported lazily (see load_layout()
+# and load_routes_for_path()) so startup only pays for what is first shown.
 
 
 # =============================================================================
@@ -80,6 +73,12 @@ DEFAULT_AUTHENTICATED_ROUTE = "/marketing"
 DEFAULT_UNAUTHENTICATED_ROUTE = "/login"
 DEFAULT_ERROR_ROUTE = "/error"
 
+# Feature route tables, loaded the first time a path under the prefix is opened
+ROUTE_MODULES = {
+  '/crm': 'crm',
+  '/marketing': 'marketing'
+}
+
 # Public routes that don't require authentication
 PUBLIC_ROUTES = [
   '/login',
@@ -107,14 +106,9 @@ def register_all_routes():
   print("Registering application routes...")
 
   # Combine all route definitions
+  # (CRM and Marketing tables are added on demand by load_routes_for_path)
   all_routes = []
 
-  # Add CRM routes
-  all_routes.extend(CRM_ROUTES)
-
-  # Add Marketing routes
-  all_routes.extend(MARKETING_ROUTES)
-
   # Add public/shared routes
   all_routes.extend(get_public_routes())
 
@@ -245,6 +239,31 @@ def get_error_routes():
   ]
 
 
+_loaded_route_modules = set()
+
+
+def load_routes_for_path(path, all_routes):
+  """
+    Import the feature route table for a path the first time it is needed
+    
+    Args:
+        path (str): URL path being opened
+        all_routes (list): Registered routes (extended in place)
+    """
+  for prefix, module_name in ROUTE_MODULES.items():
+    if not path.startswith(prefix) or module_name in _loaded_route_modules:
+      continue
+
+    if module_name == 'crm':
+      from routes.crm_routes import CRM_ROUTES
+      all_routes.extend(CRM_ROUTES)
+    elif module_name == 'marketing':
+      from routes.marketing_routes import MARKETING_ROUTES
+      all_routes.extend(MARKETING_ROUTES)
+
+    _loaded_route_modules.add(module_name)
+
+
 # =============================================================================
 # AUTHENTICATION & AUTHORIZATION
 # =============================================================================
@@ -330,16 +349,34 @@ def get_layout_for_route(route, user):
     Returns:
         class: Layout class to use
     """
-  layout_name = route.get('layout', 'admin')
+  return load_layout(route.get('layout', 'admin'))
+
 
-  layout_map = {
-    'main': MainLayout,      # Public website
-    'admin': AdminLayout,    # Admin interface
-    'blank': BlankLayout,    # Login, signup, etc.
-    'error': ErrorLayout     # Error pages
-  }
+_layout_cache = {}
+
+
+def load_layout(layout_name):
+  """
+    Import a layout class the first time it is used
+    
+    Args:
+        layout_name (str): 'main', 'admin', 'blank' or 'error'
+    
+    Returns:
+        class: Layout class (AdminLayout for unknown names)
+    """
+  if layout_name not in _layout_cache:
+    if layout_name == 'main':        # Public website
+      from Layouts.MainLayout import MainLayout as layout_class
+    elif layout_name == 'blank':     # Login, signup, etc.
+      from Layouts.BlankLayout import BlankLayout as layout_class
+    elif layout_name == 'error':     # Error pages
+      from Layouts.ErrorLayout import ErrorLayout as layout_class
+    else:                            # Admin interface
+      from Layouts.AdminLayout import AdminLayout as layout_class
+    _layout_cache[layout_name] = layout_class
 
-  return layout_map.get(layout_name, AdminLayout)
+  return _layout_cache[layout_name]
 
 
 # =============================================================================
@@ -356,6 +393,9 @@ def navigate_to_route(path, all_routes):
     """
   user = check_authentication()
 
+  # Pull in the feature route table for this path if not loaded yet
+  load_routes_for_path(path, all_routes)
+
   # Find matching route
   route = find_route(path, all_routes)
 
@@ -453,6 +493,7 @@ def show_error_page(error_code, message):
         message (str): Error message
     """
   try:
+    ErrorLayout = load_layout('error')
     error_layout = ErrorLayout(
       error_code=error_code,
       error_message=message
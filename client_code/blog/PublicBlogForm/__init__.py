@@ -45,6 +45,12 @@ class PublicBlogForm(PublicBlogFormTemplate):
     self.lbl_no_posts.foreground = "#666666"
     self.lbl_no_posts.visible = False
 
+    # Configure load more button (posts are fetched a page at a time)
+    self.page = 1
+    self.btn_load_more.text = "Load more posts"
+    self.btn_load_more.role = "outlined-button"
+    self.btn_load_more.visible = False
+
     # Load data
     self.load_categories()
     self.load_posts()
@@ -61,16 +67,22 @@ class PublicBlogForm(PublicBlogFormTemplate):
     except Exception as e:
       print(f"Error loading categories: {e}")
 
-  def load_posts(self, **event_args):
-    """Load published blog posts"""
+  def load_posts(self, append=False, **event_args):
+    """Load a page of published blog posts"""
     try:
       search_term = self.txt_search.text or None
+      self.page = self.page + 1 if append else 1
 
-      posts = anvil.server.call(
+      result = anvil.server.call(
         'get_public_blog_posts',
         self.selected_category,
-        search_term
+        search_term,
+        self.page
       )
+      posts = result['posts']
+
+      if append:
+        posts = list(self.rp_posts.items) + posts
 
       if posts:
         self.rp_posts.items = posts
@@ -80,9 +92,16 @@ class PublicBlogForm(PublicBlogFormTemplate):
         self.rp_posts.visible = False
         self.lbl_no_posts.visible = True
 
+      self.btn_load_more.visible = result['has_more']
+
     except Exception as e:
       alert(f"Error loading posts: {str(e)}")
 
+  @handle("btn_load_more", "click")
+  def btn_load_more_click(self, **event_args):
+    """Fetch the next page of posts"""
+    self.load_posts(append=True)
+
   @handle("link_back", "click")
   def link_back_click(self, **event_args):
     """Navigate back to home"""
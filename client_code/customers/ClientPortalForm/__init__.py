@@ -14,6 +14,7 @@ from datetime import datetime
 class ClientPortalForm(ClientPortalFormTemplate):
   def __init__(self, **properties):
     self.current_user = None
+    self.cursors = {}
     self.init_components(**properties)
 
     # Check if logged in
@@ -68,6 +69,12 @@ class ClientPortalForm(ClientPortalFormTemplate):
     self.btn_book_new.icon = "fa:calendar-plus"
     self.btn_book_new.role = "primary-color"
 
+    # Configure "show more" buttons
+    for button in [self.btn_more_past, self.btn_more_invoices, self.btn_more_documents]:
+      button.text = "Show more"
+      button.role = "secondary-color"
+      button.visible = False
+
     # Set repeating panel templates
     self.rp_upcoming.item_template = 'customers.UpcomingAppointmentTemplate'
     self.rp_past.item_template = 'customers.PastAppointmentTemplate'
@@ -91,17 +98,44 @@ class ClientPortalForm(ClientPortalFormTemplate):
         self.rp_upcoming.visible = False
         self.lbl_no_upcoming.visible = True
 
-      # Past appointments
-      self.rp_past.items = data['past'][:5]  # Show last 5
+      # Past appointments, invoices and documents (first page of each)
+      for section in ['past', 'invoices', 'documents']:
+        self.show_section(section, data[section], data.get(f'{section}_cursor'))
+
+    except Exception as e:
+      alert(f"Error loading portal data: {str(e)}")
+
+  def section_widgets(self, section):
+    """Repeating panel and "show more" button for a section"""
+    return {
+      'past': (self.rp_past, self.btn_more_past),
+      'invoices': (self.rp_invoices, self.btn_more_invoices),
+      'documents': (self.rp_documents, self.btn_more_documents)
+    }[section]
 
-      # Invoices
-      self.rp_invoices.items = data['invoices'][:5]
+  def show_section(self, section, items, cursor, append=False):
+    """Display a page of a section and remember its cursor"""
+    panel, button = self.section_widgets(section)
 
-      # Documents
-      self.rp_documents.items = data['documents']
+    if append:
+      items = list(panel.items or []) + items
+
+    panel.items = items
+    self.cursors[section] = cursor
+    button.visible = cursor is not None
+
+  def load_more(self, section):
+    """Append the next page of a section"""
+    try:
+      result = anvil.server.call('get_portal_page', section, self.cursors.get(section))
+
+      if result['success']:
+        self.show_section(section, result['data']['items'], result['data']['next_cursor'], append=True)
+      else:
+        alert(f"Error: {result.get('error')}")
 
     except Exception as e:
-      alert(f"Error loading portal data: {str(e)}")
+      alert(f"Error loading more: {str(e)}")
 
   def button_book_new_click(self, **event_args):
     """Book new appointment"""
@@ -121,3 +155,18 @@ class ClientPortalForm(ClientPortalFormTemplate):
   def btn_logout_click(self, **event_args):
     """This method is called when the button is clicked"""
     pass
+
+  @handle("btn_more_past", "click")
+  def btn_more_past_click(self, **event_args):
+    """This method is called when the button is clicked"""
+    self.load_more('past')
+
+  @handle("btn_more_invoices", "click")
+  def btn_more_invoices_click(self, **event_args):
+    """This method is called when the button is clicked"""
+    self.load_more('invoices')
+
+  @handle("btn_more_documents", "click")
+  def btn_more_documents_click(self, **event_args):
+    """This method is called when the button is clicked"""
+    self.load_more('documents')
@@ -14,6 +14,8 @@ class GuestHistoryForm(GuestHistoryFormTemplate):
   def __init__(self, guest_id=None, **properties):
     self.guest_id = guest_id
     self.guest = None
+    self.bookings_page = 1
+    self.notes_page = 1
     self.init_components(**properties)
 
     # Configure back link
@@ -45,6 +47,14 @@ class GuestHistoryForm(GuestHistoryFormTemplate):
     self.btn_full_profile.text = "📊 View Full Profile"
     self.btn_full_profile.role = "secondary-color"
 
+    self.btn_more_bookings.text = "Show more bookings"
+    self.btn_more_bookings.role = "secondary-color"
+    self.btn_more_bookings.visible = False
+
+    self.btn_more_notes.text = "Show more notes"
+    self.btn_more_notes.role = "secondary-color"
+    self.btn_more_notes.visible = False
+
     # Set repeating panel templates
     self.rp_bookings.item_template = 'customers.GuestBookingTemplate'
     self.rp_notes.item_template = 'customers.GuestNoteTemplate'
@@ -93,15 +103,49 @@ class GuestHistoryForm(GuestHistoryFormTemplate):
         f"Favorite Room: {favorite_room}"
       )
 
-      # Display bookings
+      # Display first page of bookings
+      self.bookings_page = 1
       self.rp_bookings.items = data['bookings']
+      self.btn_more_bookings.visible = data.get('bookings_has_more', False)
 
-      # Display notes
+      # Display first page of notes
+      self.notes_page = 1
       self.rp_notes.items = data['notes']
+      self.btn_more_notes.visible = data.get('notes_has_more', False)
 
     except Exception as e:
       alert(f"Error loading guest history: {str(e)}")
 
+  def load_more_bookings(self):
+    """Append the next page of bookings"""
+    try:
+      result = anvil.server.call('get_guest_bookings', self.guest_id, self.bookings_page + 1)
+
+      if result['success']:
+        self.bookings_page = result['data']['page']
+        self.rp_bookings.items = list(self.rp_bookings.items) + result['data']['bookings']
+        self.btn_more_bookings.visible = result['data']['has_more']
+      else:
+        alert(f"Error: {result.get('error')}")
+
+    except Exception as e:
+      alert(f"Error loading bookings: {str(e)}")
+
+  def load_more_notes(self):
+    """Append the next page of notes"""
+    try:
+      result = anvil.server.call('get_guest_notes', self.guest_id, self.notes_page + 1)
+
+      if result['success']:
+        self.notes_page = result['data']['page']
+        self.rp_notes.items = list(self.rp_notes.items) + result['data']['notes']
+        self.btn_more_notes.visible = result['data']['has_more']
+      else:
+        alert(f"Error: {result.get('error')}")
+
+    except Exception as e:
+      alert(f"Error loading notes: {str(e)}")
+
   def button_add_note_click(self, **event_args):
     """Add new note"""
     note_text = alert(
@@ -136,3 +180,13 @@ class GuestHistoryForm(GuestHistoryFormTemplate):
   def btn_full_profile_click(self, **event_args):
     """This method is called when the button is clicked"""
     pass
+
+  @handle("btn_more_bookings", "click")
+  def btn_more_bookings_click(self, **event_args):
+    """This method is called when the button is clicked"""
+    self.load_more_bookings()
+
+  @handle("btn_more_notes", "click")
+  def btn_more_notes_click(self, **event_args):
+    """This method is called when the button is clicked"""
+    self.load_more_notes()
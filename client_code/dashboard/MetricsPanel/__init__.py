@@ -9,6 +9,7 @@ import anvil.users
 import anvil.tables as tables
 import anvil.tables.query as q
 from anvil.tables import app_tables
+from ...shared import app_bootstrap
 
 
 class MetricsPanel(MetricsPanelTemplate):
@@ -27,18 +28,21 @@ class MetricsPanel(MetricsPanelTemplate):
     self.btn_refresh.icon = "fa:refresh"
     self.btn_refresh.role = "outlined-button"
 
-    # Load metrics
-    self.load_metrics()
+    # First paint uses the metrics that came with the bootstrap payload
+    self.load_metrics(initial_data=app_bootstrap.pop_dashboard_metrics())
 
-  def load_metrics(self):
+  def load_metrics(self, initial_data=None):
     """Load and display metrics"""
     try:
       # Show loading state
       self.fp_metrics.clear()
       self.add_loading_indicator()
 
-      # Get metrics from server
-      result = anvil.server.call('get_dashboard_metrics')
+      # Get metrics from server unless already supplied
+      if initial_data:
+        result = {'success': True, 'data': initial_data}
+      else:
+        result = anvil.server.call('get_dashboard_metrics')
 
       if result['success']:
         data = result['data']
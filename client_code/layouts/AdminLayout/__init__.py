@@ -10,6 +10,7 @@ import anvil.tables as tables
 import anvil.tables.query as q
 from anvil.tables import app_tables
 from routing.router import navigate, get_url_hash
+from ...shared import app_bootstrap
 
 class AdminLayout(AdminLayoutTemplate):
   def __init__(self, **properties):
@@ -110,9 +111,9 @@ class AdminLayout(AdminLayoutTemplate):
 
   def build_navigation(self):
     """Build navigation based on user role and enabled features"""
-    config = anvil.server.call('get_config')
-    features = config.get('features', {}) if config else {}
-    user_role = self.user.get('role', 'staff')
+    # Visibility comes precomputed in the bootstrap payload (one server call)
+    navigation = app_bootstrap.get_section('navigation', {})
+    items = navigation.get('items', {})
 
     # Configure group headers with expand/collapse icons
     self.lbl_sales_header.text = "▼ Sales & Operations" if self.expanded_groups['sales'] else "▶ Sales & Operations"
@@ -129,22 +130,22 @@ class AdminLayout(AdminLayoutTemplate):
     self.panel_settings_items.visible = self.expanded_groups['settings']
 
     # --- SALES & OPERATIONS GROUP ---
-    self.link_bookings.visible = features.get('bookings_enabled', False)
+    self.link_bookings.visible = items.get('bookings', False)
     self.link_bookings.text = "📅 Bookings"
 
-    self.link_products.visible = features.get('ecommerce_enabled', False)
+    self.link_products.visible = items.get('products', False)
     self.link_products.text = "🛍️ Products"
 
-    self.link_orders.visible = features.get('ecommerce_enabled', False)
+    self.link_orders.visible = items.get('orders', False)
     self.link_orders.text = "📦 Orders"
 
-    self.link_rooms.visible = features.get('hospitality_enabled', False)
+    self.link_rooms.visible = items.get('rooms', False)
     self.link_rooms.text = "🏨 Rooms"
 
-    self.link_services.visible = features.get('services_enabled', False)
+    self.link_services.visible = items.get('services', False)
     self.link_services.text = "💼 Services"
 
-    self.link_memberships.visible = features.get('memberships_enabled', False)
+    self.link_memberships.visible = items.get('memberships', False)
     self.link_memberships.text = "👥 Memberships"
 
     # Hide entire Sales group if no items visible
@@ -163,30 +164,29 @@ class AdminLayout(AdminLayoutTemplate):
     self.link_contacts.text = "📇 Contacts"
     self.link_contacts.visible = True  # Always visible (core CRM)
 
-    marketing_enabled = features.get('marketing_enabled', False)
-    self.link_campaigns.visible = marketing_enabled
+    self.link_campaigns.visible = items.get('campaigns', False)
     self.link_campaigns.text = "📧 Campaigns"
 
-    self.link_broadcasts.visible = marketing_enabled
+    self.link_broadcasts.visible = items.get('broadcasts', False)
     self.link_broadcasts.text = "📨 Broadcasts"
 
-    self.link_segments.visible = marketing_enabled
+    self.link_segments.visible = items.get('segments', False)
     self.link_segments.text = "🎯 Segments"
 
-    self.link_tasks.visible = marketing_enabled
+    self.link_tasks.visible = items.get('tasks', False)
     self.link_tasks.text = "✅ Tasks"
 
-    self.link_lead_capture.visible = marketing_enabled
+    self.link_lead_capture.visible = items.get('lead_capture', False)
     self.link_lead_capture.text = "📋 Lead Capture"
 
-    self.link_referrals.visible = features.get('referrals_enabled', False)
+    self.link_referrals.visible = items.get('referrals', False)
     self.link_referrals.text = "🎁 Referrals"
 
-    self.link_reviews.visible = features.get('reviews_enabled', False)
+    self.link_reviews.visible = items.get('reviews', False)
     self.link_reviews.text = "⭐ Reviews"
 
     # --- CONTENT GROUP ---
-    self.link_blog.visible = features.get('blog_enabled', False)
+    self.link_blog.visible = items.get('blog', False)
     self.link_blog.text = "📝 Blog"
 
     self.link_pages.visible = True  # Always visible
@@ -196,7 +196,7 @@ class AdminLayout(AdminLayoutTemplate):
     self.link_media.text = "🖼️ Media"
 
     # --- FINANCE GROUP (Owner/Manager only) ---
-    show_finance = user_role in ['owner', 'manager']
+    show_finance = navigation.get('show_finance', False)
     self.lbl_finance_header.visible = show_finance
     self.panel_finance_items.visible = show_finance and self.expanded_groups['finance']
 
@@ -207,7 +207,7 @@ class AdminLayout(AdminLayoutTemplate):
       self.link_reports.text = "📊 Reports"
 
     # --- SETTINGS GROUP (Owner/Manager only) ---
-    show_settings = user_role in ['owner', 'manager']
+    show_settings = navigation.get('show_settings', False)
     self.lbl_settings_header.visible = show_settings
     self.panel_settings_items.visible = show_settings and self.expanded_groups['settings']
 
@@ -481,6 +481,7 @@ class AdminLayout(AdminLayoutTemplate):
     """Logout and redirect"""
     if confirm("Are you sure you want to logout?"):
       anvil.users.logout()
+      app_bootstrap.clear()
       navigate("/")
   
   def link_user_menu_click(self, **event_args):
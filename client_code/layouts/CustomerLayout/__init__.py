@@ -10,6 +10,7 @@ import anvil.tables as tables
 import anvil.tables.query as q
 from anvil.tables import app_tables
 from routing.router import navigate, get_url_hash
+from ...shared import app_bootstrap
 
 class CustomerLayout(CustomerLayoutTemplate):
   def __init__(self, **properties):
@@ -43,12 +44,9 @@ class CustomerLayout(CustomerLayoutTemplate):
     self.lbl_logo.icon = "fa:user-circle"
 
     # Load business name
-    try:
-      config = anvil.server.call('get_config')
-      if config and config.get('business_name'):
-        self.lbl_logo.text = config['business_name']
-    except:
-      pass
+    business_name = app_bootstrap.get_section('business_name')
+    if business_name:
+      self.lbl_logo.text = business_name
 
     # User menu
     user_name = self.user.get('first_name', self.user.get('email', 'User'))
@@ -81,11 +79,9 @@ class CustomerLayout(CustomerLayoutTemplate):
   def build_navigation(self):
     """Build navigation based on customer's activity and enabled features"""
     try:
-      config = anvil.server.call('get_config')
-      features = config.get('features', {}) if config else {}
-
-      # Check customer's activity
-      customer_data = anvil.server.call('get_customer_activity', self.user.get_id())
+      # Features and customer activity arrive together in the bootstrap payload
+      features = app_bootstrap.get_section('features', {})
+      customer_data = app_bootstrap.get_section('customer_activity', {})
 
       # --- ALWAYS VISIBLE ---
       self.link_dashboard.text = "📊 My Dashboard"
@@ -110,24 +106,24 @@ class CustomerLayout(CustomerLayoutTemplate):
 
       # Bookings - show if customer has bookings OR bookings feature enabled
       has_bookings = customer_data.get('has_bookings', False)
-      bookings_enabled = features.get('bookings_enabled', False)
+      bookings_enabled = features.get('bookings', False)
       self.link_bookings.visible = has_bookings or bookings_enabled
       self.link_bookings.text = "📅 My Bookings"
 
       # Orders - show if customer has orders OR ecommerce enabled
       has_orders = customer_data.get('has_orders', False)
-      ecommerce_enabled = features.get('ecommerce_enabled', False)
+      ecommerce_enabled = features.get('ecommerce', False)
       self.link_orders.visible = has_orders or ecommerce_enabled
       self.link_orders.text = "📦 My Orders"
 
       # Membership - show if customer is member OR memberships enabled
       is_member = customer_data.get('is_member', False)
-      memberships_enabled = features.get('memberships_enabled', False)
+      memberships_enabled = features.get('memberships', False)
       self.link_membership.visible = is_member or memberships_enabled
       self.link_membership.text = "👥 My Membership"
 
       # Reviews - show if reviews feature enabled
-      reviews_enabled = features.get('reviews_enabled', False)
+      reviews_enabled = features.get('reviews', False)
       self.link_reviews.visible = reviews_enabled
       self.link_reviews.text = "⭐ My Reviews"
 
@@ -232,6 +228,7 @@ class CustomerLayout(CustomerLayoutTemplate):
     """Logout and redirect"""
     if confirm("Are you sure you want to logout?"):
       anvil.users.logout()
+      app_bootstrap.clear()
       navigate("/")
 
   @handle("link_user_menu", "click")
@@ -8,6 +8,7 @@ import anvil.users
 import anvil.tables as tables
 import anvil.tables.query as q
 from anvil.tables import app_tables
+from ...shared import app_bootstrap
 
 
 
@@ -157,6 +158,7 @@ class BusinessProfileTab(BusinessProfileTabTemplate):
 
       if result['success']:
         Notification("Business profile saved successfully!", style="success").show()
+        app_bootstrap.clear()
       else:
         alert(f"Error: {result.get('error', 'Unknown error')}")
 
@@ -8,6 +8,7 @@ import anvil.users
 import anvil.tables as tables
 import anvil.tables.query as q
 from anvil.tables import app_tables
+from ...shared import app_bootstrap
 
 
 class FeaturesTab(FeaturesTabTemplate):
@@ -98,6 +99,7 @@ class FeaturesTab(FeaturesTabTemplate):
 
       if result['success']:
         Notification("Features saved successfully!", style="success").show()
+        app_bootstrap.clear()
       else:
         alert(f"Error: {result.get('error')}")
 
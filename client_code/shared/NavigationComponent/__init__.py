@@ -8,6 +8,7 @@ import anvil.users
 import anvil.tables as tables
 import anvil.tables.query as q
 from anvil.tables import app_tables
+from .. import app_bootstrap
 
 
 class NavigationComponent(NavigationComponentTemplate):
@@ -34,8 +35,7 @@ class NavigationComponent(NavigationComponentTemplate):
 
     try:
       # Get enabled features
-      result = anvil.server.call('get_enabled_features')
-      features = result.get('data', {}) if result.get('success') else {}
+      features = app_bootstrap.get_section('features', {})
 
       role = self.user.get('role', 'customer')
 
@@ -103,4 +103,5 @@ class NavigationComponent(NavigationComponentTemplate):
       open_form('auth.UserProfileForm')
     elif selection == 'logout':
       anvil.users.logout()
+      app_bootstrap.clear()
       open_form('auth.LoginForm')
\ No newline at end of file
@@ -9,6 +9,9 @@ import anvil.tables as tables
 import anvil.tables.query as q
 from anvil.tables import app_tables
 
+# Pages already downloaded this session: {slug: {'version': int, 'data': dict}}
+_page_cache = {}
+
 
 class PublicPageForm(PublicPageFormTemplate):
   """Public page display with dynamic component rendering"""
@@ -26,10 +29,19 @@ class PublicPageForm(PublicPageFormTemplate):
   def load_page(self):
     """Load and render page"""
     try:
-      result = anvil.server.call('get_page_by_slug', self.slug)
+      # Send our cached version so the server can skip the content if unchanged
+      cached = _page_cache.get(self.slug)
+      known_version = cached['version'] if cached else None
+
+      result = anvil.server.call('get_page_by_slug', self.slug, known_version)
 
       if result['success']:
-        page = result['data']
+        if result.get('not_modified'):
+          page = cached['data']
+        else:
+          page = result['data']
+          _page_cache[self.slug] = {'version': result['version'], 'data': page}
+
         components = page.get('components', [])
 
         # Clear container
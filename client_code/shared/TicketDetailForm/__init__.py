@@ -16,6 +16,9 @@ class TicketDetailForm(TicketDetailFormTemplate):
   def __init__(self, ticket_id=None, **properties):
     self.ticket_id = ticket_id
     self.ticket = None
+    self.messages = []
+    self.older_cursor = None
+    self.last_message_at = None
     self.init_components(**properties)
 
     # Check permissions
@@ -33,6 +36,11 @@ class TicketDetailForm(TicketDetailFormTemplate):
     # Configure internal note checkbox
     self.cb_internal_note.text = "Internal Note (staff only)"
 
+    # Configure load older button
+    self.btn_load_older.text = "Load earlier messages"
+    self.btn_load_older.role = "secondary-color"
+    self.btn_load_older.visible = False
+
     # Configure reply textarea
     self.txt_reply.placeholder = "Type your reply..."
     self.txt_reply.rows = 3
@@ -42,13 +50,14 @@ class TicketDetailForm(TicketDetailFormTemplate):
       self.load_ticket()
 
   def load_ticket(self):
-    """Load ticket details and messages"""
+    """Load ticket details and the latest page of messages"""
     try:
       result = anvil.server.call('get_ticket', self.ticket_id)
 
       if result['success']:
         self.ticket = result['data']['ticket']
-        messages = result['data']['messages']
+        self.older_cursor = result['data'].get('older_cursor')
+        self.last_message_at = result['data'].get('last_message_at')
 
         # Display ticket header
         self.lbl_ticket_number.text = f"Ticket {self.ticket['ticket_number']}"
@@ -85,7 +94,8 @@ class TicketDetailForm(TicketDetailFormTemplate):
         self.load_staff_list()
 
         # Load messages
-        self.rp_messages.items = messages
+        self.messages = result['data']['messages']
+        self.show_messages()
 
       else:
         alert(f"Error: {result.get('error', 'Unknown error')}")
@@ -94,6 +104,45 @@ class TicketDetailForm(TicketDetailFormTemplate):
       print(f"Error loading ticket: {e}")
       alert(f"Failed to load ticket: {str(e)}")
 
+  def show_messages(self):
+    """Display loaded messages"""
+    self.rp_messages.items = self.messages
+    self.btn_load_older.visible = self.older_cursor is not None
+
+  def load_older_messages(self):
+    """Prepend the previous page of the thread"""
+    try:
+      result = anvil.server.call('get_ticket_thread', self.ticket_id, self.older_cursor)
+
+      if result['success']:
+        self.older_cursor = result['data']['older_cursor']
+        self.messages = result['data']['messages'] + self.messages
+        self.show_messages()
+      else:
+        alert(f"Error: {result.get('error')}")
+
+    except Exception as e:
+      print(f"Error loading older messages: {e}")
+      alert(f"Failed to load messages: {str(e)}")
+
+  def load_new_messages(self):
+    """Append messages added since the last load"""
+    try:
+      result = anvil.server.call('get_ticket_messages_since', self.ticket_id, self.last_message_at)
+
+      if result['success']:
+        new_messages = result['data']['messages']
+        self.last_message_at = result['data']['last_message_at']
+
+        if new_messages:
+          self.messages = self.messages + new_messages
+          self.show_messages()
+      else:
+        print(f"Error loading new messages: {result.get('error')}")
+
+    except Exception as e:
+      print(f"Error loading new messages: {e}")
+
   def load_staff_list(self):
     """Load staff members for assignment dropdown"""
     try:
@@ -192,8 +241,8 @@ class TicketDetailForm(TicketDetailFormTemplate):
         self.txt_reply.text = ''
         self.cb_internal_note.checked = False
 
-        # Reload messages
-        self.load_ticket()
+        # Fetch only the new message(s)
+        self.load_new_messages()
 
       else:
         alert(f"Error: {result.get('error')}")
@@ -221,3 +270,8 @@ class TicketDetailForm(TicketDetailFormTemplate):
   def btn_send_reply_click(self, **event_args):
     """This method is called when the button is clicked"""
     pass
+
+  @handle("btn_load_older", "click")
+  def btn_load_older_click(self, **event_args):
+    """This method is called when the button is clicked"""
+    self.load_older_messages()
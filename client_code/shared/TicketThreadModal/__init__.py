@@ -12,6 +12,8 @@ from anvil.tables import app_tables
 class TicketThreadModal(TicketThreadModalTemplate):
   def __init__(self, ticket_id=None, **properties):
     self.ticket_id = ticket_id
+    self.messages = []
+    self.last_message_at = None
     self.init_components(**properties)
 
     # Configure message input
@@ -30,13 +32,35 @@ class TicketThreadModal(TicketThreadModalTemplate):
     self.load_messages()
 
   def load_messages(self):
-    """Load ticket messages"""
+    """Load the latest page of ticket messages"""
     try:
-      messages = anvil.server.call('get_ticket_messages', self.ticket_id)
-      self.rp_messages.items = messages
+      result = anvil.server.call('get_ticket_thread', self.ticket_id)
+
+      if result['success']:
+        self.messages = result['data']['messages']
+        self.last_message_at = result['data']['last_message_at']
+        self.rp_messages.items = self.messages
+      else:
+        alert(result['error'])
+
     except Exception as e:
       alert(f"Error loading messages: {str(e)}")
 
+  def load_new_messages(self):
+    """Append messages added since the last load"""
+    try:
+      result = anvil.server.call('get_ticket_messages_since', self.ticket_id, self.last_message_at)
+
+      if result['success']:
+        self.last_message_at = result['data']['last_message_at']
+
+        if result['data']['messages']:
+          self.messages = self.messages + result['data']['messages']
+          self.rp_messages.items = self.messages
+
+    except Exception as e:
+      print(f"Error loading new messages: {e}")
+
   def button_send_click(self, **event_args):
     """Send message"""
     if not self.txt_message.text:
@@ -47,7 +71,7 @@ class TicketThreadModal(TicketThreadModalTemplate):
 
       if result['success']:
         self.txt_message.text = ""
-        self.load_messages()
+        self.load_new_messages()
       else:
         alert(result['error'])
 
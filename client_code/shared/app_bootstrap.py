@@ -0,0 +1,73 @@
+import anvil.server
+import anvil.users
+
+# Client-side holder for the get_app_bootstrap payload.
+#
+# The shell (layouts, navigation, dashboard) reads from here instead of
+# making its own server calls, so a session pays for one round trip.
+
+_bootstrap = None
+
+
+def get_bootstrap(refresh=False):
+  """
+  Get the app bootstrap payload, fetching it once per session.
+
+  Args:
+    refresh (bool): Force a new server call
+
+  Returns:
+    dict: Bootstrap data, or {} if not logged in / the call failed
+  """
+  global _bootstrap
+
+  if _bootstrap is None or refresh:
+    if not anvil.users.get_user():
+      return {}
+
+    try:
+      result = anvil.server.call('get_app_bootstrap')
+    except Exception as e:
+      print(f"Error loading app bootstrap: {e}")
+      return {}
+
+    if not result.get('success'):
+      print(f"Error loading app bootstrap: {result.get('error')}")
+      return {}
+
+    _bootstrap = result['data']
+
+  return _bootstrap
+
+
+def get_section(name, default=None):
+  """
+  Get one section of the bootstrap payload.
+
+  Args:
+    name (str): Section key ('features', 'theme', 'navigation', ...)
+    default: Value returned when the section is missing
+
+  Returns:
+    Section value or default
+  """
+  value = get_bootstrap().get(name)
+  return value if value is not None else default
+
+
+def pop_dashboard_metrics():
+  """
+  Take the bootstrap dashboard metrics so they are only used for first paint.
+
+  Returns:
+    dict or None: Metrics data
+  """
+  if not _bootstrap:
+    return None
+  return _bootstrap.pop('dashboard_metrics', None)
+
+
+def clear():
+  """Forget the cached payload (call on logout or after settings change)"""
+  global _bootstrap
+  _bootstrap = None
@@ -10,7 +10,8 @@ import anvil.tables as tables
 import anvil.tables.query as q
 from anvil.tables import app_tables
 import anvil.server
-from datetime import datetime, timedelta
+from datetime import datetime
+from . import booking_cube
 
 @anvil.server.callable
 @anvil.users.login_required
@@ -27,10 +28,13 @@ def get_booking_stats():
     if user['role'] not in ['owner', 'manager']:
       return {'success': False, 'error': 'Access denied'}
 
-    # Get all bookings
-    bookings = list(app_tables.bookings.search())
+    # Status cells cover every booking once
+    by_status = booking_cube.get_cells(user, 'status')
 
-    if not bookings:
+    # Total bookings
+    total = sum(c['bookings'] for c in by_status.values())
+
+    if not total:
       return {
         'success': True,
         'data': {
@@ -41,20 +45,17 @@ def get_booking_stats():
         }
       }
 
-    # Total bookings
-    total = len(bookings)
-
     # Average booking value
-    total_value = sum(b.get('total_amount', 0) for b in bookings)
-    avg_value = total_value / total if total > 0 else 0
+    total_value = sum(c['revenue'] for c in by_status.values())
+    avg_value = total_value / total
 
     # Occupancy rate (bookings with status 'confirmed' or 'completed')
-    confirmed = len([b for b in bookings if b.get('status') in ['confirmed', 'completed']])
-    occupancy_rate = round((confirmed / total * 100), 1) if total > 0 else 0
+    confirmed = sum(by_status.get(s, {}).get('bookings', 0) for s in ['confirmed', 'completed'])
+    occupancy_rate = round((confirmed / total * 100), 1)
 
     # No-show rate
-    no_shows = len([b for b in bookings if b.get('status') == 'no_show'])
-    no_show_rate = round((no_shows / total * 100), 1) if total > 0 else 0
+    no_shows = by_status.get('no_show', {}).get('bookings', 0)
+    no_show_rate = round((no_shows / total * 100), 1)
 
     return {
       'success': True,
@@ -89,28 +90,23 @@ def get_booking_trend(months=12):
     if user['role'] not in ['owner', 'manager']:
       return {'success': False, 'error': 'Access denied'}
 
-    # Calculate date range
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=months * 30)
-
-    # Get bookings in range
-    bookings = list(app_tables.bookings.search(
-      created_at=q.greater_than_or_equal_to(start_date)
-    ))
+    keys = booking_cube.month_keys(months)
 
-    # Group by month
-    monthly_data = {}
-    for booking in bookings:
-      month_key = booking['created_at'].strftime('%Y-%m')
-      month_label = booking['created_at'].strftime('%b %Y')
+    # One cell per month
+    monthly = booking_cube.get_cells(
+      user,
+      'month',
+      bucket=q.greater_than_or_equal_to(keys[0])
+    )
 
-      if month_key not in monthly_data:
-        monthly_data[month_key] = {'month': month_label, 'bookings': 0}
-
-      monthly_data[month_key]['bookings'] += 1
-
-    # Sort by date
-    result = sorted(monthly_data.values(), key=lambda x: x['month'])
+    # Oldest first, including months with no bookings
+    result = [
+      {
+        'month': datetime.strptime(key, '%Y-%m').strftime('%b %Y'),
+        'bookings': monthly.get(key, {}).get('bookings', 0)
+      }
+      for key in keys
+    ]
 
     return {'success': True, 'data': result}
 
@@ -134,24 +130,16 @@ def get_peak_hours():
     if user['role'] not in ['owner', 'manager']:
       return {'success': False, 'error': 'Access denied'}
 
-    # Get all bookings
-    bookings = list(app_tables.bookings.search())
-
     # Initialize heatmap grid: [hours 9-17] x [days 0-6]
     heatmap = [[0 for _ in range(7)] for _ in range(9)]  # 9 hours x 7 days
 
-    for booking in bookings:
-      if booking.get('booking_date'):
-        # Get day of week (0=Monday, 6=Sunday)
-        day = booking['booking_date'].weekday()
-
-        # Get hour (assume booking_date includes time)
-        hour = booking['booking_date'].hour
+    # At most 7 x 24 cells, keyed '<weekday>:<hour>'
+    for bucket, cell in booking_cube.get_cells(user, 'weekday_hour').items():
+      day, hour = (int(part) for part in bucket.split(':'))
 
-        # Only count business hours (9 AM to 5 PM)
-        if 9 <= hour <= 17:
-          hour_index = hour - 9  # Convert to 0-indexed
-          heatmap[hour_index][day] += 1
+      # Only count business hours (9 AM to 5 PM)
+      if 9 <= hour <= 17:
+        heatmap[hour - 9][day] += cell['bookings']
 
     return {
       'success': True,
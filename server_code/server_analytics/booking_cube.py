@@ -0,0 +1,293 @@
+import anvil.google.auth, anvil.google.drive, anvil.google.mail
+from anvil.google.drive import app_files
+import anvil.stripe
+import anvil.secrets
+import anvil.files
+from anvil.files import data_files
+import anvil.email
+import anvil.users
+import anvil.tables as tables
+import anvil.tables.query as q
+from anvil.tables import app_tables
+import anvil.server
+
+from datetime import datetime, timedelta
+
+# Booking analytics cube.
+#
+# `booking_analytics` holds one counter row per (tenant, dimension, bucket)
+# with a booking count and revenue total. Rows are adjusted in the same
+# transaction as the booking write, so analytics reads a handful of rows
+# instead of scanning and bucketing every booking.
+#
+# Dimensions:
+#   month        - 'YYYY-MM' of created_at (booking trend)
+#   day          - 'YYYY-MM-DD' of start_datetime (period comparisons)
+#   weekday_hour - '<weekday>:<hour>' of start_datetime (peak hours)
+#   resource     - bookable resource row id
+#   status       - booking status (also gives the all-time total)
+#   day_status   - 'YYYY-MM-DD|<status>' (no-shows within a period)
+#   day_resource - 'YYYY-MM-DD|<resource id>' (top resources within a period)
+#   day_hour     - 'YYYY-MM-DD|<hour>' (peak times within a period)
+#
+# The day_* buckets start with the start_datetime day, so a bucket range
+# query selects one period and get_period_cells folds the days together.
+
+DIMENSIONS = [
+  'month', 'day', 'weekday_hour', 'resource', 'status',
+  'day_status', 'day_resource', 'day_hour'
+]
+
+
+def booking_buckets(booking):
+  """
+  Get the cube cells a booking contributes to.
+
+  Args:
+    booking (Row or dict): Booking row, or a snapshot() of one
+
+  Returns:
+    list: [(dimension, bucket)]
+  """
+  buckets = []
+
+  created_at = booking['created_at']
+  if created_at:
+    buckets.append(('month', created_at.strftime('%Y-%m')))
+
+  status = booking['status'] or 'pending'
+  resource = booking['resource_id']
+
+  start = booking['start_datetime']
+  if start:
+    day = start.strftime('%Y-%m-%d')
+    buckets.append(('day', day))
+    buckets.append(('weekday_hour', f"{start.weekday()}:{start.hour}"))
+    buckets.append(('day_status', f"{day}|{status}"))
+    buckets.append(('day_hour', f"{day}|{start.hour}"))
+    if resource:
+      buckets.append(('day_resource', f"{day}|{resource.get_id()}"))
+
+  if resource:
+    buckets.append(('resource', resource.get_id()))
+
+  buckets.append(('status', status))
+
+  return buckets
+
+
+def snapshot(booking):
+  """
+  Capture the fields the cube depends on before changing a booking.
+
+  Args:
+    booking (Row): tbl_bookings row
+
+  Returns:
+    dict: Field values to pass to on_booking_changed
+  """
+  return {
+    'client_id': booking['client_id'],
+    'created_at': booking['created_at'],
+    'start_datetime': booking['start_datetime'],
+    'resource_id': booking['resource_id'],
+    'status': booking['status'],
+    'total_amount': booking['total_amount']
+  }
+
+
+def on_booking_changed(booking, previous=None):
+  """
+  Move a booking's contribution between cube cells.
+
+  Call inside the transaction that creates or changes the booking.
+
+  Args:
+    booking (Row): tbl_bookings row after the change
+    previous (dict): snapshot() taken before the change, None for a new booking
+  """
+  if previous:
+    _apply(previous, -1)
+  _apply(booking, 1)
+
+
+def _apply(booking, sign):
+  """Add (sign=1) or remove (sign=-1) one booking from its cells"""
+  tenant = booking['client_id']
+  if not tenant:
+    return
+
+  amount = booking['total_amount'] or 0
+
+  for dimension, bucket in booking_buckets(booking):
+    _adjust(tenant, dimension, bucket, sign, sign * amount)
+
+
+def _adjust(tenant, dimension, bucket, count_delta, revenue_delta):
+  """Adjust one cube cell, creating it if missing"""
+  row = app_tables.booking_analytics.get(
+    client_id=tenant,
+    dimension=dimension,
+    bucket=bucket
+  )
+
+  if row:
+    row['bookings'] = max((row['bookings'] or 0) + count_delta, 0)
+    row['revenue'] = (row['revenue'] or 0) + revenue_delta
+    row['updated_at'] = datetime.now()
+  elif count_delta > 0:
+    app_tables.booking_analytics.add_row(
+      client_id=tenant,
+      dimension=dimension,
+      bucket=bucket,
+      bookings=count_delta,
+      revenue=revenue_delta,
+      updated_at=datetime.now()
+    )
+
+
+def get_cells(tenant, dimension, **bucket_filter):
+  """
+  Read the cube cells of one dimension.
+
+  Args:
+    tenant (Row): Business owner (client_id)
+    dimension (str): One of DIMENSIONS
+    bucket_filter: Optional 'bucket' query, e.g. bucket=q.greater_than_or_equal_to('2026-01')
+
+  Returns:
+    dict: {bucket: {'bookings': int, 'revenue': float}}
+  """
+  rows = app_tables.booking_analytics.search(
+    client_id=tenant,
+    dimension=dimension,
+    **bucket_filter
+  )
+
+  return {
+    row['bucket']: {'bookings': row['bookings'] or 0, 'revenue': row['revenue'] or 0}
+    for row in rows
+  }
+
+
+def get_period_totals(tenant, start_date, end_date):
+  """
+  Sum the day cells between two dates (inclusive).
+
+  Args:
+    tenant (Row): Business owner (client_id)
+    start_date (date or datetime): Period start
+    end_date (date or datetime): Period end
+
+  Returns:
+    dict: {'bookings': int, 'revenue': float}
+  """
+  cells = get_cells(
+    tenant,
+    'day',
+    bucket=q.all_of(
+      q.greater_than_or_equal_to(start_date.strftime('%Y-%m-%d')),
+      q.less_than_or_equal_to(end_date.strftime('%Y-%m-%d'))
+    )
+  )
+
+  return {
+    'bookings': sum(c['bookings'] for c in cells.values()),
+    'revenue': sum(c['revenue'] for c in cells.values())
+  }
+
+
+def get_period_cells(tenant, dimension, start_date, end_date):
+  """
+  Sum one day-bucketed dimension between two dates (inclusive).
+
+  Args:
+    tenant (Row): Business owner (client_id)
+    dimension (str): 'day_status', 'day_resource' or 'day_hour'
+    start_date (date or datetime): Period start
+    end_date (date or datetime): Period end
+
+  Returns:
+    dict: {key: {'bookings': int, 'revenue': float}} with the day prefix removed
+  """
+  # 'YYYY-MM-DD|x' sorts after its day and before the next day
+  cells = get_cells(
+    tenant,
+    dimension,
+    bucket=q.all_of(
+      q.greater_than_or_equal_to(start_date.strftime('%Y-%m-%d')),
+      q.less_than((end_date + timedelta(days=1)).strftime('%Y-%m-%d'))
+    )
+  )
+
+  totals = {}
+  for bucket, cell in cells.items():
+    key = bucket.split('|', 1)[1]
+    total = totals.setdefault(key, {'bookings': 0, 'revenue': 0})
+    total['bookings'] += cell['bookings']
+    total['revenue'] += cell['revenue']
+
+  return totals
+
+
+def month_keys(months, end_date=None):
+  """
+  Get 'YYYY-MM' keys for the last N calendar months, oldest first.
+
+  Args:
+    months (int): Number of months
+    end_date (datetime): Last month to include (default now)
+
+  Returns:
+    list: Month keys
+  """
+  end_date = end_date or datetime.now()
+  year, month = end_date.year, end_date.month
+  keys = []
+
+  for _ in range(months):
+    keys.append(f"{year:04d}-{month:02d}")
+    month -= 1
+    if month == 0:
+      year, month = year - 1, 12
+
+  keys.reverse()
+  return keys
+
+
+@anvil.server.background_task
+def rebuild_booking_cube():
+  """Recompute every cube cell from tbl_bookings"""
+  cells = {}
+
+  for booking in app_tables.tbl_bookings.search():
+    tenant = booking['client_id']
+    if not tenant:
+      continue
+
+    amount = booking['total_amount'] or 0
+    for dimension, bucket in booking_buckets(booking):
+      key = (tenant.get_id(), dimension, bucket)
+      cell = cells.setdefault(key, {'tenant': tenant, 'bookings': 0, 'revenue': 0})
+      cell['bookings'] += 1
+      cell['revenue'] += amount
+
+  _replace_cells(cells)
+  print(f"Rebuilt booking analytics cube: {len(cells)} cells")
+
+
+@tables.in_transaction
+def _replace_cells(cells):
+  """Swap the stored cube for freshly computed cells"""
+  app_tables.booking_analytics.search().delete_all_rows()
+
+  now = datetime.now()
+  for (_, dimension, bucket), cell in cells.items():
+    app_tables.booking_analytics.add_row(
+      client_id=cell['tenant'],
+      dimension=dimension,
+      bucket=bucket,
+      bookings=cell['bookings'],
+      revenue=cell['revenue'],
+      updated_at=now
+    )
@@ -11,9 +11,10 @@ import anvil.tables.query as q
 from anvil.tables import app_tables
 import anvil.server
 
-from datetime import datetime
+from datetime import datetime, timedelta
 from anvil.pdf import PDFRenderer
 import io
+from ..server_payments import accounting_reports
 
 @anvil.server.callable
 @anvil.users.login_required
@@ -218,32 +219,25 @@ def generate_financial_summary(start_date, end_date, filters):
     if user['role'] not in ['owner', 'manager']:
       return {'success': False, 'error': 'Access denied'}
 
-    # Get all transactions
-    transactions = list(app_tables.transactions.search(
-      created_at=q.between(start_date, end_date, min_inclusive=True, max_inclusive=True)
-    ))
-
-    total_income = sum(t['amount'] for t in transactions if t['amount'] > 0)
-    total_expenses = sum(abs(t['amount']) for t in transactions if t['amount'] < 0)
-    net_profit = total_income - total_expenses
+    # Read from ledger period snapshots and balances
+    pnl = accounting_reports.profit_and_loss(start_date, end_date)
 
     report = {
       'title': 'Financial Summary',
       'start_date': start_date.strftime('%Y-%m-%d'),
       'end_date': end_date.strftime('%Y-%m-%d'),
       'summary': {
-        'Total Income': f"${total_income:,.2f}",
-        'Total Expenses': f"${total_expenses:,.2f}",
-        'Net Profit': f"${net_profit:,.2f}"
+        'Total Income': f"${pnl['income']:,.2f}",
+        'Refunds': f"${pnl['refunds']:,.2f}",
+        'Total Expenses': f"${pnl['total_expenses']:,.2f}",
+        'Net Profit': f"${pnl['net_profit']:,.2f}"
       },
       'data': [
-        {
-          'Date': t['created_at'].strftime('%Y-%m-%d'),
-          'Description': t.get('description', 'N/A'),
-          'Type': 'Income' if t['amount'] > 0 else 'Expense',
-          'Amount': f"${abs(t['amount']):,.2f}"
-        }
-        for t in transactions
+        {'Account': 'Sales', 'Type': 'Income', 'Amount': f"${pnl['income']:,.2f}"},
+        {'Account': 'Refunds', 'Type': 'Income', 'Amount': f"-${pnl['refunds']:,.2f}"}
+      ] + [
+        {'Account': category.title(), 'Type': 'Expense', 'Amount': f"${amount:,.2f}"}
+        for category, amount in pnl['expenses'].items()
       ]
     }
 
@@ -284,35 +278,24 @@ def generate_tax_report(year, quarter, filters):
 
     start_month, end_month = quarter_months[quarter]
     start_date = datetime(year, start_month, 1)
-    end_date = datetime(year, end_month, 28)  # Simplified
+    end_date = (datetime(year + 1, 1, 1) if end_month == 12 else datetime(year, end_month + 1, 1)) - timedelta(days=1)
 
-    # Get taxable transactions
-    transactions = list(app_tables.transactions.search(
-      created_at=q.between(start_date, end_date, min_inclusive=True, max_inclusive=True),
-      taxable=True
-    ))
-
-    taxable_income = sum(t['amount'] for t in transactions if t['amount'] > 0)
-    tax_rate = 0.21  # Example rate
-    estimated_tax = taxable_income * tax_rate
+    # Tax posted to the ledger with each payment and refund
+    tax = accounting_reports.tax_summary(start_date, end_date)
 
     report = {
       'title': f'Tax Report - Q{quarter} {year}',
       'start_date': start_date.strftime('%Y-%m-%d'),
       'end_date': end_date.strftime('%Y-%m-%d'),
       'summary': {
-        'Taxable Income': f"${taxable_income:,.2f}",
-        'Tax Rate': f"{tax_rate * 100}%",
-        'Estimated Tax': f"${estimated_tax:,.2f}"
+        'Taxable Sales': f"${tax['taxable_sales']:,.2f}",
+        'Tax Collected': f"${tax['tax_collected']:,.2f}",
+        'Tax Refunded': f"${tax['tax_refunded']:,.2f}",
+        'Net Tax Due': f"${tax['net_tax']:,.2f}"
       },
       'data': [
-        {
-          'Date': t['created_at'].strftime('%Y-%m-%d'),
-          'Description': t.get('description', 'N/A'),
-          'Amount': f"${t['amount']:,.2f}",
-          'Tax': f"${t['amount'] * tax_rate:,.2f}"
-        }
-        for t in transactions
+        {'Item': 'Tax collected on payments', 'Amount': f"${tax['tax_collected']:,.2f}"},
+        {'Item': 'Tax reversed on refunds', 'Amount': f"-${tax['tax_refunded']:,.2f}"}
       ]
     }
 
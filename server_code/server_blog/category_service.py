@@ -11,15 +11,49 @@ import anvil.tables.query as q
 from anvil.tables import app_tables
 import anvil.server
 
-# This is a server module. It runs on the Anvil server,
-# rather than in the user's browser.
-#
-# To allow anvil.server.call() to call functions here, we mark
-# them with @anvil.server.callable.
-# Here is an example - you can replace it with your own:
-#
-# @anvil.server.callable
-# def say_hello(name):
-#   print("Hello, " + name + "!")
-#   return 42
+
+# Published post counts per blog category.
 #
+# `published_count` on each category is kept current by the blog read
+# model (see service.on_post_changed) so the public sidebar is a single
+# query instead of one posts search per category. Categories created before
+# the read model have no count until an admin runs the one-off backfill
+# (service.start_blog_read_model_rebuild); until then they are listed as
+# unknown rather than hidden.
+
+
+def adjust_published_count(category, delta):
+  """
+  Add delta to a category's published post count.
+
+  Args:
+    category (Row): Blog category row (None is ignored)
+    delta (int): +1 on publish, -1 on unpublish/delete
+  """
+  if not category:
+    return
+  category['published_count'] = max((category['published_count'] or 0) + delta, 0)
+
+
+def recount_category(category):
+  """
+  Recompute a category's published post count from the posts table.
+
+  Args:
+    category (Row): Blog category row
+
+  Returns:
+    int: Published post count
+  """
+  count = len(app_tables.tbl_blog_posts.search(category_id=category, status='published'))
+  category['published_count'] = count
+  return count
+
+
+@anvil.server.callable
+def get_public_blog_categories():
+  """Get categories that have published posts (or are not counted yet)"""
+  return list(app_tables.tbl_blog_categories.search(
+    tables.order_by('name'),
+    published_count=q.any_of(q.greater_than(0), None)
+  ))
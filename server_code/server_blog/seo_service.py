@@ -11,15 +11,97 @@ import anvil.tables.query as q
 from anvil.tables import app_tables
 import anvil.server
 
-# This is a server module. It runs on the Anvil server,
-# rather than in the user's browser.
-#
-# To allow anvil.server.call() to call functions here, we mark
-# them with @anvil.server.callable.
-# Here is an example - you can replace it with your own:
-#
-# @anvil.server.callable
-# def say_hello(name):
-#   print("Hello, " + name + "!")
-#   return 42
+import re
+
+# SEO metadata for published blog posts.
 #
+# Meta tags are computed once when a post is published (see
+# service.on_post_changed) and stored on the post, so public pages and the
+# sitemap don't re-derive them from the full content on every crawl.
+
+META_DESCRIPTION_LENGTH = 160
+
+
+def strip_html(text):
+  """Remove tags and collapse whitespace"""
+  text = re.sub(r'<[^>]+>', ' ', text or '')
+  return re.sub(r'\s+', ' ', text).strip()
+
+
+def build_post_seo_meta(post):
+  """
+  Build meta tags for a blog post.
+
+  Args:
+    post (Row): Blog post row
+
+  Returns:
+    dict: {'title': str, 'description': str, 'canonical_path': str}
+  """
+  description = strip_html(post['excerpt']) or strip_html(post['content'])
+  if len(description) > META_DESCRIPTION_LENGTH:
+    description = description[:META_DESCRIPTION_LENGTH - 3].rsplit(' ', 1)[0] + '...'
+
+  return {
+    'title': post['title'],
+    'description': description,
+    'canonical_path': f"/blog/{post['slug']}"
+  }
+
+
+@anvil.server.callable
+def get_post_seo_meta(slug):
+  """
+  Get stored meta tags for a published post.
+
+  Args:
+    slug (str): Post slug
+
+  Returns:
+    dict: {'success': bool, 'data': dict} or {'success': bool, 'error': str}
+  """
+  try:
+    post = app_tables.tbl_blog_posts.get(
+      q.fetch_only('seo_meta'),
+      slug=slug,
+      status='published'
+    )
+
+    if not post:
+      return {'success': False, 'error': 'Post not found'}
+
+    return {'success': True, 'data': post['seo_meta']}
+
+  except Exception as e:
+    print(f"Error getting SEO meta: {e}")
+    return {'success': False, 'error': str(e)}
+
+
+@anvil.server.callable
+def get_blog_sitemap():
+  """
+  Get sitemap entries for all published posts.
+
+  Returns:
+    dict: {'success': bool, 'data': list} or {'success': bool, 'error': str}
+  """
+  try:
+    posts = app_tables.tbl_blog_posts.search(
+      q.fetch_only('slug', 'updated_at', 'published_at'),
+      tables.order_by('published_at', ascending=False),
+      status='published'
+    )
+
+    entries = [
+      {
+        'path': f"/blog/{post['slug']}",
+        'last_modified': post['updated_at'] or post['published_at']
+      }
+      for post in posts
+    ]
+
+    return {'success': True, 'data': entries}
+
+  except Exception as e:
+    print(f"Error building sitemap: {e}")
+    return {'success': False, 'error': str(e)}
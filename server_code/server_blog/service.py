@@ -11,15 +11,238 @@ import anvil.tables.query as q
 from anvil.tables import app_tables
 import anvil.server
 
-# This is a server module. It runs on the Anvil server,
-# rather than in the user's browser.
-#
-# To allow anvil.server.call() to call functions here, we mark
-# them with @anvil.server.callable.
-# Here is an example - you can replace it with your own:
-#
-# @anvil.server.callable
-# def say_hello(name):
-#   print("Hello, " + name + "!")
-#   return 42
+import re
+from . import category_service
+from . import seo_service
+
+# Blog read model.
 #
+# Public listings and search read precomputed data instead of loading every
+# published post:
+#   - published_count on categories (category_service)
+#   - seo_meta on posts (seo_service), also used as the listing excerpt fallback
+#   - blog_search_terms: one row per (published post, term) from the title,
+#     excerpt and content, so search is an indexed term lookup
+# on_post_changed() / on_post_deleted() keep these current on every save.
+
+DEFAULT_PAGE_SIZE = 10
+MIN_TERM_LENGTH = 2
+STOP_WORDS = {
+  'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in',
+  'is', 'it', 'of', 'on', 'or', 'that', 'the', 'this', 'to', 'with'
+}
+
+LISTING_COLUMNS = q.fetch_only(
+  'title', 'slug', 'excerpt', 'featured_image', 'published_at', 'seo_meta',
+  category_id=q.fetch_only('name')
+)
+
+
+def tokenize(text):
+  """
+  Split text into unique lower-case search terms.
+
+  Args:
+    text (str): Plain text or HTML
+
+  Returns:
+    set: Search terms
+  """
+  words = re.findall(r'[a-z0-9]+', seo_service.strip_html(text).lower())
+  return {w for w in words if len(w) >= MIN_TERM_LENGTH and w not in STOP_WORDS}
+
+
+def index_post(post):
+  """Replace a post's search terms (published posts only)"""
+  unindex_post(post)
+
+  if post['status'] != 'published':
+    return
+
+  terms = tokenize(post['title']) | tokenize(post['excerpt']) | tokenize(post['content'])
+  for term in terms:
+    app_tables.blog_search_terms.add_row(post_id=post, term=term)
+
+
+def unindex_post(post):
+  """Remove a post's search terms"""
+  app_tables.blog_search_terms.search(post_id=post).delete_all_rows()
+
+
+def on_post_changed(post, previous_status=None, previous_category=None):
+  """
+  Update the read model after a post is created or edited.
+
+  Args:
+    post (Row): Saved blog post
+    previous_status (str): Status before the save (None for new posts)
+    previous_category (Row): Category before the save
+  """
+  was_published = previous_status == 'published'
+  is_published = post['status'] == 'published'
+
+  if was_published:
+    category_service.adjust_published_count(previous_category, -1)
+  if is_published:
+    category_service.adjust_published_count(post['category_id'], +1)
+    post['seo_meta'] = seo_service.build_post_seo_meta(post)
+
+  index_post(post)
+
+
+def on_post_deleted(post):
+  """Update the read model before a post is deleted"""
+  if post['status'] == 'published':
+    category_service.adjust_published_count(post['category_id'], -1)
+  unindex_post(post)
+
+
+def _search_posts(search_term):
+  """
+  Find published posts containing every term (prefix match on the last one).
+
+  Returns:
+    dict: {post id: post row with only published_at and category_id fetched}
+  """
+  terms = sorted(tokenize(search_term))
+  if not terms:
+    return {}
+
+  matches = None
+  last_word = re.findall(r'[a-z0-9]+', search_term.lower())[-1]
+  columns = q.fetch_only(post_id=q.fetch_only('published_at', 'category_id'))
+
+  for term in terms:
+    if term == last_word:
+      # Still typing - treat the last word as a prefix
+      rows = app_tables.blog_search_terms.search(columns, term=q.like(f"{term}%"))
+    else:
+      rows = app_tables.blog_search_terms.search(columns, term=term)
+
+    posts = {row['post_id'].get_id(): row['post_id'] for row in rows}
+    if matches is None:
+      matches = posts
+    else:
+      matches = {post_id: post for post_id, post in matches.items() if post_id in posts}
+    if not matches:
+      break
+
+  return matches
+
+
+def _listing_item(post):
+  """Listing card data without following links or loading content"""
+  category = post['category_id']
+  excerpt = post['excerpt'] or (post['seo_meta'] or {}).get('description', '')
+
+  return {
+    'id': post.get_id(),
+    'title': post['title'],
+    'slug': post['slug'],
+    'excerpt': excerpt,
+    'featured_image': post['featured_image'],
+    'published_at': post['published_at'],
+    'category_name': category['name'] if category else 'Uncategorized'
+  }
+
+
+@anvil.server.callable
+def get_public_blog_posts(category_id=None, search_term=None, page=1, page_size=DEFAULT_PAGE_SIZE):
+  """
+  Get a page of published blog posts, newest first.
+
+  Args:
+    category_id (str): Category row ID to filter by
+    search_term (str): Words to search for in title, excerpt and content
+    page (int): 1-based page number
+    page_size (int): Posts per page
+
+  Returns:
+    dict: {'posts': list, 'total': int, 'page': int, 'has_more': bool}
+  """
+  query = {'status': 'published'}
+
+  if category_id:
+    query['category_id'] = app_tables.tbl_blog_categories.get_by_id(category_id)
+
+  start = (page - 1) * page_size
+
+  if search_term and search_term.strip():
+    # The index narrows and orders the matches, then only the page is loaded
+    matches = [
+      p for p in _search_posts(search_term).values()
+      if not category_id or p['category_id'] == query['category_id']
+    ]
+    matches.sort(key=lambda p: p['published_at'], reverse=True)
+    total = len(matches)
+    page_posts = [
+      app_tables.tbl_blog_posts.get_by_id(p.get_id(), LISTING_COLUMNS)
+      for p in matches[start:start + page_size]
+    ]
+    page_posts = [p for p in page_posts if p]
+  else:
+    results = app_tables.tbl_blog_posts.search(
+      LISTING_COLUMNS,
+      tables.order_by('published_at', ascending=False),
+      **query
+    )
+    total = len(results)
+    page_posts = results[start:start + page_size]
+
+  return {
+    'posts': [_listing_item(p) for p in page_posts],
+    'total': total,
+    'page': page,
+    'has_more': start + page_size < total
+  }
+
+
+@anvil.server.callable
+@anvil.users.login_required
+def start_blog_read_model_rebuild():
+  """
+  Launch the one-off blog read model backfill (owner only).
+
+  Returns:
+    dict: {'success': bool} or {'success': bool, 'error': str}
+  """
+  try:
+    user = anvil.users.get_user()
+
+    if user['role'] != 'owner':
+      return {'success': False, 'error': 'Access denied'}
+
+    anvil.server.launch_background_task('rebuild_blog_read_model')
+
+    return {'success': True}
+
+  except Exception as e:
+    print(f"Error starting blog rebuild: {e}")
+    return {'success': False, 'error': str(e)}
+
+
+@anvil.server.background_task
+def rebuild_blog_read_model():
+  """
+  Recompute category counts, SEO meta and the search index.
+
+  Each category and post is refreshed in its own transaction, so public
+  search keeps working while the rebuild runs.
+  """
+  for category in app_tables.tbl_blog_categories.search():
+    _recount(category)
+
+  for post in app_tables.tbl_blog_posts.search():
+    _reindex(post)
+
+
+@tables.in_transaction
+def _recount(category):
+  category_service.recount_category(category)
+
+
+@tables.in_transaction
+def _reindex(post):
+  if post['status'] == 'published':
+    post['seo_meta'] = seo_service.build_post_seo_meta(post)
+  index_post(post)
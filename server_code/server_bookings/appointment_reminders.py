@@ -11,15 +11,243 @@ import anvil.tables.query as q
 from anvil.tables import app_tables
 import anvil.server
 
-# This is a server module. It runs on the Anvil server,
-# rather than in the user's browser.
-#
-# To allow anvil.server.call() to call functions here, we mark
-# them with @anvil.server.callable.
-# Here is an example - you can replace it with your own:
-#
-# @anvil.server.callable
-# def say_hello(name):
-#   print("Hello, " + name + "!")
-#   return 42
+from datetime import datetime, timedelta
+from ..server_emails import transactional_email_service as email_service
+
+# Appointment reminders.
 #
+# Booking writes call sync_reminders(), which keeps one `reminder_jobs` row
+# per reminder still to be sent, with the time it is due. The
+# send_due_reminders task (every 5 minutes) claims due jobs in batches,
+# ordered by due_at, and deletes each job once handled. The queue only ever
+# holds future reminders, so the scan cost does not grow with booking
+# history. Emails carry an idempotency key per booking, reminder and start
+# time, so a retried job never sends twice; moving a booking produces a
+# new key and a new reminder.
+
+# Reminder kind -> how long before the start it is sent
+REMINDER_OFFSETS = {
+  '24h': timedelta(hours=24),
+  '1h': timedelta(hours=1)
+}
+
+ACTIVE_STATUSES = ['pending', 'confirmed']
+
+BATCH_SIZE = 200
+MAX_BATCHES_PER_RUN = 50
+
+MAX_ATTEMPTS = 3
+RETRY_DELAY = timedelta(minutes=10)
+
+# Claims older than this belong to a worker that died
+CLAIM_TIMEOUT = timedelta(minutes=30)
+
+PENDING = 'pending'
+CLAIMED = 'claimed'
+
+
+def _is_active(booking):
+  """Whether a booking should get reminders at all"""
+  return bool(
+    booking['start_datetime']
+    and booking['customer_id']
+    and booking['status'] in ACTIVE_STATUSES
+  )
+
+
+def _due_times(booking):
+  """Reminder kind -> due_at for reminders that are still in the future"""
+  if not _is_active(booking):
+    return {}
+
+  start = booking['start_datetime']
+  now = datetime.now(start.tzinfo)
+  due = {}
+  for kind, offset in REMINDER_OFFSETS.items():
+    due_at = start - offset
+    if due_at > now:
+      due[kind] = due_at
+  return due
+
+
+def _is_current(job, booking):
+  """Whether a queued job still matches its booking's status and start time"""
+  return bool(booking) and _is_active(booking) and job['start_datetime'] == booking['start_datetime']
+
+
+def queue_reminders(bookings, skip_kinds=()):
+  """
+  Queue the future reminders of new bookings in a single add_rows.
+
+  Args:
+    bookings (list): tbl_bookings rows with no jobs queued yet
+    skip_kinds (iterable): Reminder kinds that are already queued
+  """
+  now = datetime.now()
+  new_jobs = [
+    {
+      'booking_id': booking,
+      'kind': kind,
+      'start_datetime': booking['start_datetime'],
+      'due_at': due_at,
+      'status': PENDING,
+      'attempts': 0,
+      'created_at': now
+    }
+    for booking in bookings
+    for kind, due_at in _due_times(booking).items()
+    if kind not in skip_kinds
+  ]
+  if new_jobs:
+    app_tables.reminder_jobs.add_rows(new_jobs)
+
+
+def sync_reminders(booking):
+  """
+  Bring a booking's queued reminders in line with its status and start time.
+
+  Call after creating, rescheduling or cancelling a booking. Reminders
+  whose due time has already passed are not queued.
+
+  Args:
+    booking (Row): tbl_bookings row
+  """
+  kept = set()
+  for job in app_tables.reminder_jobs.search(booking_id=booking):
+    if _is_current(job, booking):
+      kept.add(job['kind'])
+    elif job['status'] != CLAIMED:
+      # Claimed jobs are re-checked (and dropped) by the worker
+      job.delete()
+
+  queue_reminders([booking], skip_kinds=kept)
+
+
+@tables.in_transaction
+def _claim_batch():
+  """
+  Claim the next batch of due jobs.
+
+  Returns:
+    list: Claimed reminder_jobs rows, earliest due first
+  """
+  now = datetime.now()
+  jobs = list(app_tables.reminder_jobs.search(
+    tables.order_by('due_at'),
+    status=PENDING,
+    due_at=q.less_than_or_equal_to(now)
+  )[:BATCH_SIZE])
+
+  for job in jobs:
+    job.update(status=CLAIMED, claimed_at=now, attempts=(job['attempts'] or 0) + 1)
+
+  return jobs
+
+
+def _release_stale_claims():
+  """Return jobs claimed by a worker that died to the queue"""
+  cutoff = datetime.now() - CLAIM_TIMEOUT
+  for job in app_tables.reminder_jobs.search(status=CLAIMED, claimed_at=q.less_than(cutoff)):
+    job['status'] = PENDING
+
+
+def _idempotency_key(job):
+  """One key per booking, reminder kind and start time"""
+  return f"reminder:{job['booking_id'].get_id()}:{job['kind']}:{job['start_datetime'].isoformat()}"
+
+
+def _reminder_message(booking, kind):
+  """Subject and text body of a reminder"""
+  service = booking['service_id']
+  resource = booking['resource_id']
+  what = (service['service_name'] if service else None) or (resource['resource_name'] if resource else None) or 'appointment'
+  when = booking['start_datetime'].strftime('%A %d %B at %H:%M')
+  lead = 'tomorrow' if kind == '24h' else 'in one hour'
+
+  subject = f"Reminder: your {what} is {lead}"
+  text = (
+    f"This is a reminder that your {what} (booking {booking['booking_number']}) "
+    f"starts {when}.\n\n"
+    f"If you can no longer make it, please let us know."
+  )
+  return subject, text
+
+
+def _retry_or_drop(job):
+  """Requeue a job after a failed attempt, or drop it once attempts run out"""
+  if job['attempts'] < MAX_ATTEMPTS:
+    job.update(status=PENDING, due_at=datetime.now() + RETRY_DELAY)
+    return 'retry'
+
+  job.delete()
+  return 'failed'
+
+
+def _send(job):
+  """
+  Send one claimed reminder.
+
+  Returns:
+    str: Outcome ('sent', 'duplicate', 'skipped', 'retry' or 'failed')
+  """
+  booking = job['booking_id']
+
+  # Booking deleted, cancelled or moved since the job was queued
+  if not _is_current(job, booking):
+    job.delete()
+    return 'skipped'
+
+  subject, text = _reminder_message(booking, job['kind'])
+  result = email_service.send_email(
+    booking['customer_id']['email'],
+    subject,
+    text,
+    idempotency_key=_idempotency_key(job),
+    template_id=f"reminder_{job['kind']}"
+  )
+
+  if result == email_service.FAILED:
+    return _retry_or_drop(job)
+
+  job.delete()
+  return result
+
+
+@anvil.server.background_task
+def send_due_reminders():
+  """Send reminders that are due (run every 5 minutes)"""
+  _release_stale_claims()
+
+  outcomes = {}
+  for _ in range(MAX_BATCHES_PER_RUN):
+    jobs = _claim_batch()
+
+    for job in jobs:
+      try:
+        outcome = _send(job)
+      except Exception as e:
+        print(f"Error sending reminder: {e}")
+        outcome = _retry_or_drop(job)
+      outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    if len(jobs) < BATCH_SIZE:
+      break
+
+  if outcomes:
+    print(f"Reminders processed: {outcomes}")
+
+
+@anvil.server.background_task
+def rebuild_reminder_queue():
+  """Queue reminders for every upcoming booking (run once after deploying)"""
+  queued = 0
+  now = datetime.now()
+
+  for booking in app_tables.tbl_bookings.search(
+    status=q.any_of(*ACTIVE_STATUSES),
+    start_datetime=q.greater_than(now)
+  ):
+    sync_reminders(booking)
+    queued += 1
+
+  print(f"Synced reminders for {queued} bookings")
@@ -11,15 +11,583 @@ import anvil.tables.query as q
 from anvil.tables import app_tables
 import anvil.server
 
-# This is a server module. It runs on the Anvil server,
-# rather than in the user's browser.
-#
-# To allow anvil.server.call() to call functions here, we mark
-# them with @anvil.server.callable.
-# Here is an example - you can replace it with your own:
+from datetime import datetime, date, time, timedelta
+
+# Hospitality rate engine.
 #
-# @anvil.server.callable
-# def say_hello(name):
-#   print("Hello, " + name + "!")
-#   return 42
+# Rates come from `rate_rules` (per tenant, optionally per room):
+#   season         - nightly_rate replaces the room's daily_rate between dates
+#   weekday        - adjustment_pct on the listed weekdays (0 = Monday)
+#   length_of_stay - adjustment_pct on the stay total from min_nights up
+#   occupancy      - adjustment_pct per night once the tenant's occupancy
+#                    reaches min_occupancy_pct
 #
+# Season and weekday rules only depend on the room and the night, so their
+# result is precomputed into `room_night_prices` for CALENDAR_DAYS ahead.
+# A quote sums cached nights and applies the stay-level rules; occupancy
+# comes from one bounded bookings query shared by every room in the search.
+# Saving a rule recomputes only the nights inside its date range (old and
+# new), for the rooms it covers.
+
+CALENDAR_DAYS = 365
+
+# Nights re-evaluated at the end of the window by the daily refresh, so a
+# missed run leaves no gap
+REFRESH_OVERLAP_DAYS = 7
+
+MAX_STAY_NIGHTS = 60
+
+# Rule changes touching more room-nights than this are recomputed in the background
+SYNC_RECOMPUTE_NIGHTS = 2000
+
+RULE_TYPES = ['season', 'weekday', 'length_of_stay', 'occupancy']
+CALENDAR_RULE_TYPES = ['season', 'weekday']
+
+OCCUPYING_STATUSES = ['pending', 'confirmed', 'checked_in']
+
+RULE_FIELDS = [
+  'rule_type', 'name', 'start_date', 'end_date', 'nightly_rate', 'weekdays',
+  'adjustment_pct', 'min_nights', 'min_occupancy_pct', 'priority', 'is_active'
+]
+
+
+def _window():
+  """First night and end (exclusive) of the precomputed calendar"""
+  today = date.today()
+  return today, today + timedelta(days=CALENDAR_DAYS)
+
+
+def _nights(start, end):
+  """Nights from start up to (not including) end"""
+  return [start + timedelta(days=i) for i in range((end - start).days)]
+
+
+def _rule_dict(rule):
+  """Plain-dict copy of a rate_rules row"""
+  data = {field: rule[field] for field in RULE_FIELDS}
+  data['resource_id'] = rule['resource_id']
+  return data
+
+
+def load_rules(tenant):
+  """
+  Active rate rules of a tenant.
+
+  Args:
+    tenant (Row): Business owner user row
+
+  Returns:
+    list: Rule dicts
+  """
+  return [_rule_dict(r) for r in app_tables.rate_rules.search(client_id=tenant, is_active=True)]
+
+
+def _rooms(tenant):
+  """Active room resources of a tenant"""
+  return list(app_tables.tbl_bookable_resources.search(
+    client_id=tenant,
+    resource_type='room',
+    is_active=True
+  ))
+
+
+def _applies(rule, room, night):
+  """Whether a rule covers a room on a night"""
+  if rule['resource_id'] and rule['resource_id'] != room:
+    return False
+  if rule['start_date'] and night < rule['start_date']:
+    return False
+  if rule['end_date'] and night > rule['end_date']:
+    return False
+  return True
+
+
+def nightly_base(room, night, rules):
+  """
+  Price of one night from season and weekday rules.
+
+  Room-specific seasons win over tenant-wide ones, then higher priority,
+  then the later-starting season.
+
+  Args:
+    room (Row): tbl_bookable_resources row
+    night (date): Night (check-in date of that night)
+    rules (list): Rule dicts from load_rules()
+
+  Returns:
+    float: Nightly price
+  """
+  seasons = [r for r in rules if r['rule_type'] == 'season' and _applies(r, room, night)]
+
+  if seasons:
+    season = max(seasons, key=lambda r: (
+      r['resource_id'] is not None,
+      r['priority'] or 0,
+      r['start_date'] or date.min
+    ))
+    price = season['nightly_rate'] or 0
+  else:
+    price = room['daily_rate'] or 0
+
+  for rule in rules:
+    if (rule['rule_type'] == 'weekday'
+        and night.weekday() in (rule['weekdays'] or [])
+        and _applies(rule, room, night)):
+      price *= 1 + (rule['adjustment_pct'] or 0) / 100
+
+  return round(price, 2)
+
+
+def recompute_calendar(tenant, start, end, rooms=None, rules=None):
+  """
+  Recompute cached nightly prices for a date range.
+
+  Only rows whose price changed are written.
+
+  Args:
+    tenant (Row): Business owner user row
+    start (date): First night
+    end (date): End of the range (exclusive)
+    rooms (list): Rooms to recompute (default: every room of the tenant)
+    rules (list): Rule dicts (default: load_rules(tenant))
+
+  Returns:
+    int: Number of nights written
+  """
+  window_start, window_end = _window()
+  start = max(start, window_start)
+  end = min(end, window_end)
+
+  rooms = _rooms(tenant) if rooms is None else rooms
+  if start >= end or not rooms:
+    return 0
+
+  rules = load_rules(tenant) if rules is None else rules
+
+  existing = {
+    (row['resource_id'].get_id(), row['night']): row
+    for row in app_tables.room_night_prices.search(
+      resource_id=q.any_of(*rooms),
+      night=q.all_of(q.greater_than_or_equal_to(start), q.less_than(end))
+    )
+  }
+
+  now = datetime.now()
+  new_rows = []
+  written = 0
+
+  for room in rooms:
+    for night in _nights(start, end):
+      price = nightly_base(room, night, rules)
+      row = existing.get((room.get_id(), night))
+
+      if row is None:
+        new_rows.append({
+          'client_id': tenant,
+          'resource_id': room,
+          'night': night,
+          'price': price,
+          'computed_at': now
+        })
+      elif row['price'] != price:
+        row.update(price=price, computed_at=now)
+      else:
+        continue
+      written += 1
+
+  if new_rows:
+    app_tables.room_night_prices.add_rows(new_rows)
+
+  return written
+
+
+def _affected_range(rule):
+  """Calendar nights a season/weekday rule can change, as (start, end)"""
+  window_start, window_end = _window()
+  start = rule['start_date'] or window_start
+  end = rule['end_date'] + timedelta(days=1) if rule['end_date'] else window_end
+  return start, end
+
+
+def _invalidate(tenant, rules_changed):
+  """
+  Recompute the nights touched by changed rules.
+
+  Args:
+    tenant (Row): Business owner user row
+    rules_changed (list): Rule dicts (before and/or after the change)
+  """
+  ranges = [
+    (_affected_range(r), r['resource_id'])
+    for r in rules_changed
+    if r and r['rule_type'] in CALENDAR_RULE_TYPES
+  ]
+  if not ranges:
+    return
+
+  start = min(r[0][0] for r in ranges)
+  end = max(r[0][1] for r in ranges)
+
+  # A tenant-wide rule touches every room
+  if any(resource is None for _, resource in ranges):
+    rooms = _rooms(tenant)
+  else:
+    rooms = list({resource.get_id(): resource for _, resource in ranges}.values())
+
+  window_start, window_end = _window()
+  nights = (min(end, window_end) - max(start, window_start)).days
+  if nights <= 0:
+    return
+
+  if nights * len(rooms) > SYNC_RECOMPUTE_NIGHTS:
+    anvil.server.launch_background_task('recompute_price_range', tenant, start, end, rooms)
+  else:
+    recompute_calendar(tenant, start, end, rooms)
+
+
+@anvil.server.background_task
+def recompute_price_range(tenant, start, end, rooms=None):
+  """Recompute a range of the price calendar (launched for large rule changes)"""
+  written = recompute_calendar(tenant, start, end, rooms)
+  print(f"Recomputed {written} room-nights from {start} to {end}")
+
+
+def _occupancy(tenant, check_in, check_out, rooms):
+  """
+  Booked rooms per night for a tenant.
+
+  Only bookings of the given rooms count, so appointments and other
+  resources never inflate occupancy.
+
+  Args:
+    rooms (list): The tenant's room resources
+
+  Returns:
+    tuple: ({night: rooms booked}, set of booked room ids per night)
+  """
+  booked = {}
+
+  if not rooms:
+    return {}, booked
+
+  bookings = app_tables.tbl_bookings.search(
+    q.fetch_only('start_datetime', 'end_datetime', 'resource_id'),
+    client_id=tenant,
+    resource_id=q.any_of(*rooms),
+    status=q.any_of(*OCCUPYING_STATUSES),
+    start_datetime=q.less_than(datetime.combine(check_out, time.min)),
+    end_datetime=q.greater_than(datetime.combine(check_in, time.min))
+  )
+
+  for booking in bookings:
+    first = max(booking['start_datetime'].date(), check_in)
+    last = min(booking['end_datetime'].date(), check_out)
+    room_id = booking['resource_id'].get_id()
+
+    for night in _nights(first, last):
+      booked.setdefault(night, set()).add(room_id)
+
+  counts = {night: len(room_ids) for night, room_ids in booked.items()}
+  return counts, booked
+
+
+def _occupancy_pct(rules, room, night, occupancy_pct):
+  """Adjustment from the highest occupancy threshold reached on a night"""
+  reached = [
+    r for r in rules
+    if r['rule_type'] == 'occupancy'
+    and _applies(r, room, night)
+    and occupancy_pct >= (r['min_occupancy_pct'] or 0)
+  ]
+  if not reached:
+    return 0
+  return max(reached, key=lambda r: r['min_occupancy_pct'] or 0)['adjustment_pct'] or 0
+
+
+def _length_of_stay_pct(rules, room, check_in, nights):
+  """Adjustment from the longest length-of-stay rule the stay qualifies for"""
+  qualifying = [
+    r for r in rules
+    if r['rule_type'] == 'length_of_stay'
+    and _applies(r, room, check_in)
+    and nights >= (r['min_nights'] or 0)
+  ]
+  if not qualifying:
+    return 0
+  return max(qualifying, key=lambda r: r['min_nights'] or 0)['adjustment_pct'] or 0
+
+
+def quote_rooms(tenant, check_in, check_out, rooms=None):
+  """
+  Price a stay for several rooms at once.
+
+  Uses one calendar query, one bookings query (occupancy and availability)
+  and one rules query regardless of how many rooms or nights are quoted.
+
+  Args:
+    tenant (Row): Business owner user row
+    check_in (date): Arrival date
+    check_out (date): Departure date
+    rooms (list): Rooms to quote (default: every room of the tenant)
+
+  Returns:
+    list: {'resource_id', 'name', 'available', 'nightly', 'subtotal',
+           'length_of_stay_pct', 'total'} per room, available and cheapest first
+  """
+  nights = _nights(check_in, check_out)
+  all_rooms = _rooms(tenant)
+  rooms = all_rooms if rooms is None else rooms
+
+  if not nights or not rooms:
+    return []
+
+  rules = load_rules(tenant)
+
+  cached = {
+    (row['resource_id'].get_id(), row['night']): row['price']
+    for row in app_tables.room_night_prices.search(
+      q.fetch_only('resource_id', 'night', 'price'),
+      resource_id=q.any_of(*rooms),
+      night=q.all_of(q.greater_than_or_equal_to(check_in), q.less_than(check_out))
+    )
+  }
+
+  counts, booked = _occupancy(tenant, check_in, check_out, all_rooms)
+  room_total = len(all_rooms) or 1
+
+  quotes = []
+  for room in rooms:
+    room_id = room.get_id()
+    nightly = []
+
+    for night in nights:
+      # Nights beyond the calendar window are evaluated directly
+      price = cached.get((room_id, night))
+      if price is None:
+        price = nightly_base(room, night, rules)
+
+      occupancy_pct = counts.get(night, 0) * 100 / room_total
+      price *= 1 + _occupancy_pct(rules, room, night, occupancy_pct) / 100
+      nightly.append({'night': night, 'price': round(price, 2)})
+
+    subtotal = round(sum(n['price'] for n in nightly), 2)
+    los_pct = _length_of_stay_pct(rules, room, check_in, len(nights))
+
+    quotes.append({
+      'resource_id': room_id,
+      'name': room['resource_name'],
+      'available': not any(room_id in booked.get(night, ()) for night in nights),
+      'nightly': nightly,
+      'subtotal': subtotal,
+      'length_of_stay_pct': los_pct,
+      'total': round(subtotal * (1 + los_pct / 100), 2)
+    })
+
+  quotes.sort(key=lambda x: (not x['available'], x['total']))
+  return quotes
+
+
+@anvil.server.callable
+def search_room_rates(client_id, check_in, check_out, resource_ids=None):
+  """
+  Quote a stay across a business's rooms (public booking search).
+
+  Args:
+    client_id (str): Business owner user ID
+    check_in (date): Arrival date
+    check_out (date): Departure date
+    resource_ids (list): Limit to these rooms (default: all rooms)
+
+  Returns:
+    dict: {'success': bool, 'data': list} or {'success': bool, 'error': str}
+  """
+  try:
+    nights = (check_out - check_in).days
+
+    if nights < 1:
+      return {'success': False, 'error': 'Check-out must be after check-in'}
+
+    if nights > MAX_STAY_NIGHTS:
+      return {'success': False, 'error': f'Stays are limited to {MAX_STAY_NIGHTS} nights'}
+
+    if check_in < date.today():
+      return {'success': False, 'error': 'Check-in date is in the past'}
+
+    tenant = app_tables.users.get_by_id(client_id)
+
+    if not tenant:
+      return {'success': False, 'error': 'Business not found'}
+
+    rooms = None
+    if resource_ids:
+      wanted = set(resource_ids)
+      rooms = [r for r in _rooms(tenant) if r.get_id() in wanted]
+
+    return {'success': True, 'data': quote_rooms(tenant, check_in, check_out, rooms)}
+
+  except Exception as e:
+    print(f"Error searching room rates: {e}")
+    return {'success': False, 'error': str(e)}
+
+
+@anvil.server.callable
+@anvil.users.login_required
+def get_rate_rules():
+  """
+  Get the current business's rate rules.
+
+  Returns:
+    dict: {'success': bool, 'data': list} or {'success': bool, 'error': str}
+  """
+  try:
+    user = anvil.users.get_user()
+
+    if user['role'] not in ['owner', 'manager']:
+      return {'success': False, 'error': 'Access denied'}
+
+    rules = []
+    for rule in app_tables.rate_rules.search(
+      tables.order_by('rule_type'),
+      tables.order_by('start_date'),
+      client_id=user
+    ):
+      data = _rule_dict(rule)
+      data['rule_id'] = rule.get_id()
+      data['resource_id'] = rule['resource_id'].get_id() if rule['resource_id'] else None
+      rules.append(data)
+
+    return {'success': True, 'data': rules}
+
+  except Exception as e:
+    print(f"Error getting rate rules: {e}")
+    return {'success': False, 'error': str(e)}
+
+
+@anvil.server.callable
+@anvil.users.login_required
+def save_rate_rule(rule_id, rule_data):
+  """
+  Create or update a rate rule and refresh the affected calendar nights.
+
+  Args:
+    rule_id (str): Rule ID, or None to create
+    rule_data (dict): Rule fields (see RULE_FIELDS) plus optional 'resource_id'
+
+  Returns:
+    dict: {'success': bool, 'rule_id': str} or {'success': bool, 'error': str}
+  """
+  try:
+    user = anvil.users.get_user()
+
+    if user['role'] not in ['owner', 'manager']:
+      return {'success': False, 'error': 'Access denied'}
+
+    if rule_data.get('rule_type') not in RULE_TYPES:
+      return {'success': False, 'error': f"Rule type must be one of {', '.join(RULE_TYPES)}"}
+
+    values = {field: rule_data.get(field) for field in RULE_FIELDS}
+    values['is_active'] = rule_data.get('is_active', True)
+
+    room_id = rule_data.get('resource_id')
+    values['resource_id'] = app_tables.tbl_bookable_resources.get_by_id(room_id) if room_id else None
+
+    if room_id and (not values['resource_id'] or values['resource_id']['client_id'] != user):
+      return {'success': False, 'error': 'Room not found'}
+
+    if values['start_date'] and values['end_date'] and values['end_date'] < values['start_date']:
+      return {'success': False, 'error': 'End date is before start date'}
+
+    if rule_id:
+      rule = app_tables.rate_rules.get_by_id(rule_id)
+
+      if not rule or rule['client_id'] != user:
+        return {'success': False, 'error': 'Rule not found'}
+
+      before = _rule_dict(rule)
+      rule.update(updated_at=datetime.now(), **values)
+    else:
+      before = None
+      rule = app_tables.rate_rules.add_row(client_id=user, updated_at=datetime.now(), **values)
+
+    _invalidate(user, [before, _rule_dict(rule)])
+
+    return {'success': True, 'rule_id': rule.get_id()}
+
+  except Exception as e:
+    print(f"Error saving rate rule: {e}")
+    return {'success': False, 'error': str(e)}
+
+
+@anvil.server.callable
+@anvil.users.login_required
+def delete_rate_rule(rule_id):
+  """
+  Delete a rate rule and refresh the nights it covered.
+
+  Args:
+    rule_id (str): Rule ID
+
+  Returns:
+    dict: {'success': bool} or {'success': bool, 'error': str}
+  """
+  try:
+    user = anvil.users.get_user()
+
+    if user['role'] not in ['owner', 'manager']:
+      return {'success': False, 'error': 'Access denied'}
+
+    rule = app_tables.rate_rules.get_by_id(rule_id)
+
+    if not rule or rule['client_id'] != user:
+      return {'success': False, 'error': 'Rule not found'}
+
+    before = _rule_dict(rule)
+    rule.delete()
+
+    _invalidate(user, [before])
+
+    return {'success': True}
+
+  except Exception as e:
+    print(f"Error deleting rate rule: {e}")
+    return {'success': False, 'error': str(e)}
+
+
+def _tenants_with_rooms():
+  """Tenant -> rooms for every active room resource"""
+  tenants = {}
+  for room in app_tables.tbl_bookable_resources.search(resource_type='room', is_active=True):
+    if room['client_id']:
+      tenants.setdefault(room['client_id'].get_id(), (room['client_id'], []))[1].append(room)
+  return tenants.values()
+
+
+@anvil.server.background_task
+def refresh_price_calendar():
+  """Roll the price calendar forward and drop past nights (run daily)"""
+  window_start, window_end = _window()
+  written = 0
+
+  for tenant, rooms in _tenants_with_rooms():
+    written += recompute_calendar(
+      tenant,
+      window_end - timedelta(days=REFRESH_OVERLAP_DAYS),
+      window_end,
+      rooms
+    )
+
+  app_tables.room_night_prices.search(night=q.less_than(window_start)).delete_all_rows()
+
+  print(f"Price calendar refreshed ({written} room-nights written)")
+
+
+@anvil.server.background_task
+def rebuild_price_calendar():
+  """Recompute the whole price calendar (after changing room base rates)"""
+  window_start, window_end = _window()
+  written = 0
+
+  for tenant, rooms in _tenants_with_rooms():
+    written += recompute_calendar(tenant, window_start, window_end, rooms)
+
+  print(f"Price calendar rebuilt ({written} room-nights written)")
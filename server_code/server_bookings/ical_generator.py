@@ -11,15 +11,317 @@ import anvil.tables.query as q
 from anvil.tables import app_tables
 import anvil.server
 
-# This is a server module. It runs on the Anvil server,
-# rather than in the user's browser.
-#
-# To allow anvil.server.call() to call functions here, we mark
-# them with @anvil.server.callable.
-# Here is an example - you can replace it with your own:
-#
-# @anvil.server.callable
-# def say_hello(name):
-#   print("Hello, " + name + "!")
-#   return 42
+from datetime import datetime, timedelta, timezone
+import hashlib
+import secrets
+
+# iCalendar subscription feeds.
 #
+# Each feed (one resource, one staff member or one customer) has a secret
+# token and is served from the /ical/:feed HTTP endpoint. A feed covers a
+# bounded window around today. Serialised VEVENT blocks are cached in
+# `ical_event_cache` keyed by booking and updated_at, so a poll only
+# re-serialises bookings that changed since the last one. The ETag is a
+# hash of the (booking, updated_at) pairs in the window, so an unchanged
+# feed is answered with 304 before any event is loaded.
+
+FEED_PAST_DAYS = 30
+FEED_FUTURE_DAYS = 180
+MAX_FEED_EVENTS = 1000
+
+# Suggested client refresh interval
+REFRESH_MINUTES = 15
+
+# Feed scope -> tbl_bookings link column
+SCOPE_COLUMNS = {
+  'resource': 'resource_id',
+  'staff': 'staff_id',
+  'customer': 'customer_id'
+}
+
+EXCLUDED_STATUSES = ['cancelled']
+
+STAFF_ROLES = ['owner', 'manager', 'staff']
+
+PRODID = '-//MyBizz//Bookings//EN'
+
+
+def _escape(text):
+  """Escape a TEXT value (RFC 5545 3.3.11)"""
+  return (str(text or '')
+          .replace('\\', '\\\\')
+          .replace(';', '\\;')
+          .replace(',', '\\,')
+          .replace('\r\n', '\\n')
+          .replace('\n', '\\n'))
+
+
+def _fold(line):
+  """Fold a content line to 75 octets (RFC 5545 3.1)"""
+  data = line.encode('utf-8')
+  if len(data) <= 75:
+    return line
+
+  parts = []
+  while data:
+    limit = 75 if not parts else 74
+    cut = min(limit, len(data))
+    # Don't split a multi-byte character
+    while cut < len(data) and (data[cut] & 0xC0) == 0x80:
+      cut -= 1
+    parts.append(data[:cut].decode('utf-8'))
+    data = data[cut:]
+
+  return '\r\n '.join(parts)
+
+
+def _format_datetime(value):
+  """DATE-TIME value: UTC when timezone-aware, floating otherwise"""
+  if value.tzinfo:
+    return value.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+  return value.strftime('%Y%m%dT%H%M%S')
+
+
+def _version(booking):
+  """Cache version of a booking (updated_at, or created_at if never updated)"""
+  return booking['updated_at'] or booking['created_at']
+
+
+def serialize_event(booking):
+  """
+  Serialise one booking as a VEVENT block.
+
+  Args:
+    booking (Row): tbl_bookings row
+
+  Returns:
+    str: CRLF-terminated VEVENT lines
+  """
+  service = booking['service_id']
+  resource = booking['resource_id']
+  staff = booking['staff_id']
+  customer = booking['customer_id']
+
+  title = (service['service_name'] if service else None) or (booking['booking_type'] or 'Booking').capitalize()
+  start = booking['start_datetime']
+  end = booking['end_datetime'] or start + timedelta(hours=1)
+
+  details = [f"Booking {booking['booking_number']}"]
+  if customer:
+    details.append(f"Customer: {customer['email']}")
+  if staff:
+    details.append(f"Staff: {staff['email']}")
+
+  lines = [
+    'BEGIN:VEVENT',
+    f"UID:booking-{booking.get_id()}@mybizz",
+    f"DTSTAMP:{_format_datetime(_version(booking) or datetime.now(timezone.utc))}",
+    f"DTSTART:{_format_datetime(start)}",
+    f"DTEND:{_format_datetime(end)}",
+    f"SUMMARY:{_escape(title)}",
+    f"DESCRIPTION:{_escape(chr(10).join(details))}",
+    f"STATUS:{'TENTATIVE' if booking['status'] == 'pending' else 'CONFIRMED'}"
+  ]
+  if resource:
+    lines.append(f"LOCATION:{_escape(resource['resource_name'])}")
+  lines.append('END:VEVENT')
+
+  return ''.join(_fold(line) + '\r\n' for line in lines)
+
+
+def feed_target(feed):
+  """Row a feed follows (a bookable resource or a user)"""
+  if feed['scope'] == 'resource':
+    return feed['resource_id']
+  return feed['user_id']
+
+
+def _feed_bookings(feed):
+  """Bookings in a feed's window, fetching only what the ETag needs"""
+  now = datetime.now()
+  return list(app_tables.tbl_bookings.search(
+    q.fetch_only('updated_at', 'created_at'),
+    tables.order_by('start_datetime'),
+    start_datetime=q.all_of(
+      q.greater_than_or_equal_to(now - timedelta(days=FEED_PAST_DAYS)),
+      q.less_than(now + timedelta(days=FEED_FUTURE_DAYS))
+    ),
+    status=q.none_of(*EXCLUDED_STATUSES),
+    **{SCOPE_COLUMNS[feed['scope']]: feed_target(feed)}
+  )[:MAX_FEED_EVENTS])
+
+
+def feed_etag(feed, bookings):
+  """
+  Entity tag for a feed: changes when any booking in the window is added,
+  removed or updated.
+  """
+  digest = hashlib.sha1(feed['token'].encode('utf-8'))
+  for booking in bookings:
+    version = _version(booking)
+    digest.update(f"{booking.get_id()}:{version.isoformat() if version else ''};".encode('utf-8'))
+  return f'"{digest.hexdigest()}"'
+
+
+def _cached_events(bookings):
+  """
+  VEVENT blocks for bookings, re-serialising only those whose cache entry
+  is missing or older than the booking.
+
+  Returns:
+    list: VEVENT strings in booking order
+  """
+  if not bookings:
+    return []
+
+  cached = {
+    row['booking_id'].get_id(): row
+    for row in app_tables.ical_event_cache.search(booking_id=q.any_of(*bookings))
+  }
+
+  events = []
+  for booking in bookings:
+    version = _version(booking)
+    entry = cached.get(booking.get_id())
+
+    if entry and entry['updated_at'] == version:
+      events.append(entry['vevent'])
+      continue
+
+    vevent = serialize_event(booking)
+    if entry:
+      entry.update(updated_at=version, start_datetime=booking['start_datetime'], vevent=vevent)
+    else:
+      app_tables.ical_event_cache.add_row(
+        booking_id=booking,
+        updated_at=version,
+        start_datetime=booking['start_datetime'],
+        vevent=vevent
+      )
+    events.append(vevent)
+
+  return events
+
+
+def render_feed(feed, events):
+  """Wrap VEVENT blocks in a VCALENDAR"""
+  header = [
+    'BEGIN:VCALENDAR',
+    'VERSION:2.0',
+    f"PRODID:{PRODID}",
+    'CALSCALE:GREGORIAN',
+    'METHOD:PUBLISH',
+    f"X-WR-CALNAME:{_escape(feed['name'])}",
+    f"REFRESH-INTERVAL;VALUE=DURATION:PT{REFRESH_MINUTES}M",
+    f"X-PUBLISHED-TTL:PT{REFRESH_MINUTES}M"
+  ]
+  return (''.join(_fold(line) + '\r\n' for line in header)
+          + ''.join(events)
+          + 'END:VCALENDAR\r\n')
+
+
+@anvil.server.http_endpoint('/ical/:feed_file')
+def ical_feed(feed_file, **params):
+  """Serve an .ics feed, answering If-None-Match with 304 when unchanged"""
+  token = feed_file[:-4] if feed_file.endswith('.ics') else feed_file
+  feed = app_tables.ical_feeds.get(token=token)
+
+  if not feed or not feed_target(feed):
+    return anvil.server.HttpResponse(404, 'Feed not found')
+
+  bookings = _feed_bookings(feed)
+  etag = feed_etag(feed, bookings)
+
+  if anvil.server.request.headers.get('if-none-match') == etag:
+    response = anvil.server.HttpResponse(304)
+  else:
+    response = anvil.server.HttpResponse(200, render_feed(feed, _cached_events(bookings)))
+    response.headers['Content-Type'] = 'text/calendar; charset=utf-8'
+
+  response.headers['ETag'] = etag
+  response.headers['Cache-Control'] = f'private, max-age={REFRESH_MINUTES * 60}'
+  return response
+
+
+def _feed_target(user, scope, target_id):
+  """
+  Resolve and authorise the row a new feed follows.
+
+  Returns:
+    tuple: (target row or None, feed name, error or None)
+  """
+  if scope == 'customer':
+    return user, 'My bookings', None
+
+  if user['role'] not in STAFF_ROLES:
+    return None, None, 'Access denied'
+
+  if scope == 'staff':
+    staff = app_tables.users.get_by_id(target_id) if target_id else user
+    if not staff:
+      return None, None, 'Staff member not found'
+    return staff, f"Bookings - {staff['email'].split('@')[0]}", None
+
+  resource = app_tables.tbl_bookable_resources.get_by_id(target_id) if target_id else None
+  if not resource:
+    return None, None, 'Resource not found'
+  return resource, f"Bookings - {resource['resource_name']}", None
+
+
+@anvil.server.callable
+@anvil.users.login_required
+def get_ical_feed_url(scope, target_id=None, regenerate=False):
+  """
+  Get (creating if needed) the subscription URL of a calendar feed.
+
+  Args:
+    scope (str): 'resource', 'staff' or 'customer' (always the current user)
+    target_id (str): Resource or staff user ID (defaults to the current user for 'staff')
+    regenerate (bool): Issue a new token, invalidating the old URL
+
+  Returns:
+    dict: {'success': bool, 'url': str} or {'success': bool, 'error': str}
+  """
+  try:
+    user = anvil.users.get_user()
+
+    if scope not in SCOPE_COLUMNS:
+      return {'success': False, 'error': f'Unknown feed scope: {scope}'}
+
+    target, name, error = _feed_target(user, scope, target_id)
+    if error:
+      return {'success': False, 'error': error}
+
+    target_column = 'resource_id' if scope == 'resource' else 'user_id'
+    feed = app_tables.ical_feeds.get(scope=scope, created_by=user, **{target_column: target})
+
+    if not feed:
+      feed = app_tables.ical_feeds.add_row(
+        token=secrets.token_urlsafe(24),
+        scope=scope,
+        name=name,
+        created_by=user,
+        created_at=datetime.now(),
+        **{target_column: target}
+      )
+    elif regenerate:
+      feed['token'] = secrets.token_urlsafe(24)
+
+    url = f"{anvil.server.get_api_origin()}/ical/{feed['token']}.ics"
+    return {'success': True, 'url': url}
+
+  except Exception as e:
+    print(f"Error getting calendar feed: {e}")
+    return {'success': False, 'error': str(e)}
+
+
+@anvil.server.background_task
+def prune_ical_cache():
+  """Delete cached events that have left every feed window (run daily)"""
+  cutoff = datetime.now() - timedelta(days=FEED_PAST_DAYS)
+  stale = app_tables.ical_event_cache.search(start_datetime=q.less_than(cutoff))
+  count = len(stale)
+  stale.delete_all_rows()
+
+  if count:
+    print(f"Pruned {count} cached calendar events")
@@ -11,15 +11,341 @@ import anvil.tables.query as q
 from anvil.tables import app_tables
 import anvil.server
 
-# This is a server module. It runs on the Anvil server,
-# rather than in the user's browser.
-#
-# To allow anvil.server.call() to call functions here, we mark
-# them with @anvil.server.callable.
-# Here is an example - you can replace it with your own:
+from datetime import datetime, date
+from ..server_shared import config as config_cache
+from ..server_shared import validators
+
+# Booking metadata validation.
 #
-# @anvil.server.callable
-# def say_hello(name):
-#   print("Hello, " + name + "!")
-#   return 42
+# Each booking type may have a row in `tbl_booking_metadata_schemas` whose
+# field_definitions list the metadata fields:
+#   {'required_fields': [field, ...], 'optional_fields': [field, ...]}
+# where a field is {'field': str, 'type': 'string'|'number'|'date'|'boolean',
+# 'required': bool, 'options': list, 'max_length': int, 'min': n, 'max': n}.
 #
+# A schema is compiled once into a validator (a list of per-field checks)
+# and cached by (booking_type, version); schema rows themselves are cached
+# per server process. Saving a schema bumps its version, so stale
+# validators are never reused.
+
+FIELD_TYPES = ['string', 'number', 'date', 'boolean']
+
+SCHEMA_CACHE_TTL = 300
+
+_compiled = {}
+
+
+class MetadataValidationError(Exception):
+  """Raised by validate_or_raise; .errors lists the problems"""
+
+  def __init__(self, errors):
+    super().__init__('; '.join(errors))
+    self.errors = errors
+
+
+def _schema_cache_key(booking_type):
+  return f"metadata_schema:{booking_type}"
+
+
+def _field_list(field_definitions):
+  """Normalise field_definitions to a list of field dicts"""
+  if not field_definitions:
+    return []
+
+  if isinstance(field_definitions, list):
+    return field_definitions
+
+  fields = [dict(f, required=True) for f in field_definitions.get('required_fields', [])]
+  fields += field_definitions.get('optional_fields', [])
+  return fields
+
+
+def get_schema(booking_type):
+  """
+  Active schema of a booking type, cached per server process.
+
+  Args:
+    booking_type (str): Booking type
+
+  Returns:
+    dict or None: {'booking_type', 'schema_name', 'version', 'fields'}
+  """
+  def load():
+    row = app_tables.tbl_booking_metadata_schemas.get(booking_type=booking_type, is_active=True)
+    if not row:
+      return None
+    return {
+      'booking_type': booking_type,
+      'schema_name': row['schema_name'],
+      'version': row['version'] or 1,
+      'fields': _field_list(row['field_definitions'])
+    }
+
+  return config_cache.get_cached(_schema_cache_key(booking_type), load, ttl=SCHEMA_CACHE_TTL)
+
+
+def _coerce(field_type, value):
+  """
+  Convert a submitted value to the field's type.
+
+  Returns:
+    tuple: (value, error or None)
+  """
+  if field_type == 'number':
+    if isinstance(value, bool):
+      return value, 'must be a number'
+    if isinstance(value, (int, float)):
+      return value, None
+    try:
+      number = float(str(value).strip())
+    except ValueError:
+      return value, 'must be a number'
+    return int(number) if number.is_integer() else number, None
+
+  if field_type == 'date':
+    # Stored as ISO text: metadata is a simpleObject column
+    if isinstance(value, datetime):
+      return value.date().isoformat(), None
+    if isinstance(value, date):
+      return value.isoformat(), None
+    try:
+      return date.fromisoformat(str(value).strip()).isoformat(), None
+    except ValueError:
+      return value, 'must be a date (YYYY-MM-DD)'
+
+  if field_type == 'boolean':
+    if isinstance(value, bool):
+      return value, None
+    if str(value).strip().lower() in ['true', 'yes', '1']:
+      return True, None
+    if str(value).strip().lower() in ['false', 'no', '0']:
+      return False, None
+    return value, 'must be yes or no'
+
+  return str(value).strip(), None
+
+
+def _compile_field(field):
+  """Build the check for one field definition"""
+  name = field['field']
+  label = name.replace('_', ' ').title()
+  field_type = field.get('type', 'string')
+  required = field.get('required', False)
+  options = field.get('options')
+  max_length = field.get('max_length')
+  minimum = field.get('min')
+  maximum = field.get('max')
+
+  if field_type not in FIELD_TYPES:
+    field_type = 'string'
+
+  def check(metadata, cleaned, errors):
+    value = metadata.get(name)
+
+    if value is None or (isinstance(value, str) and not value.strip()):
+      if required:
+        errors.append(validators.validate_required(None, label))
+      return
+
+    value, error = _coerce(field_type, value)
+    if error:
+      errors.append(f"{label} {error}")
+      return
+
+    error = None
+    if options and value not in options:
+      # Options may be numbers, so stringify them for the message
+      error = f"{label} must be one of: {', '.join(str(o) for o in options)}"
+    if not error and max_length and isinstance(value, str):
+      error = validators.validate_max_length(value, label, max_length)
+    if not error and minimum is not None and value < minimum:
+      error = f"{label} must be at least {minimum}"
+    if not error and maximum is not None and value > maximum:
+      error = f"{label} must be at most {maximum}"
+
+    if error:
+      errors.append(error)
+    else:
+      cleaned[name] = value
+
+  return check
+
+
+def compile_schema(fields):
+  """
+  Compile field definitions into a validator.
+
+  Args:
+    fields (list): Field dicts
+
+  Returns:
+    callable: validator(metadata) -> (cleaned metadata, list of errors).
+      Fields not in the schema are passed through unchanged.
+  """
+  checks = [_compile_field(f) for f in fields if f.get('field')]
+  known = {f['field'] for f in fields if f.get('field')}
+
+  def validate(metadata):
+    metadata = metadata or {}
+    cleaned = {k: v for k, v in metadata.items() if k not in known}
+    errors = []
+    for check in checks:
+      check(metadata, cleaned, errors)
+    return cleaned, errors
+
+  return validate
+
+
+def get_validator(booking_type):
+  """
+  Compiled validator for a booking type.
+
+  Args:
+    booking_type (str): Booking type
+
+  Returns:
+    callable or None: See compile_schema(); None when the type has no schema
+  """
+  schema = get_schema(booking_type)
+  if not schema:
+    return None
+
+  key = (booking_type, schema['version'])
+  if key not in _compiled:
+    _compiled[key] = compile_schema(schema['fields'])
+  return _compiled[key]
+
+
+def validate_metadata(booking_type, metadata):
+  """
+  Validate one booking's metadata.
+
+  Args:
+    booking_type (str): Booking type
+    metadata (dict): Submitted metadata
+
+  Returns:
+    tuple: (cleaned metadata, list of errors)
+  """
+  validator = get_validator(booking_type)
+  if not validator:
+    return dict(metadata or {}), []
+  return validator(metadata)
+
+
+def validate_or_raise(booking_type, metadata):
+  """
+  Validate metadata, raising MetadataValidationError when invalid.
+
+  Returns:
+    dict: Cleaned metadata
+  """
+  cleaned, errors = validate_metadata(booking_type, metadata)
+  if errors:
+    raise MetadataValidationError(errors)
+  return cleaned
+
+
+def validate_many(bookings_data):
+  """
+  Validate the metadata of many bookings, resolving each schema once.
+
+  Args:
+    bookings_data (list): Dicts with 'booking_type' and 'metadata'
+
+  Returns:
+    list: (cleaned metadata, list of errors) per booking, in input order
+  """
+  validator_by_type = {}
+  results = []
+
+  for data in bookings_data:
+    booking_type = data.get('booking_type')
+    if booking_type not in validator_by_type:
+      validator_by_type[booking_type] = get_validator(booking_type)
+
+    validator = validator_by_type[booking_type]
+    metadata = data.get('metadata')
+    results.append(validator(metadata) if validator else (dict(metadata or {}), []))
+
+  return results
+
+
+@anvil.server.callable
+def get_booking_metadata_schema(booking_type):
+  """
+  Get the metadata fields of a booking type.
+
+  Args:
+    booking_type (str): Booking type
+
+  Returns:
+    dict or None: {'booking_type', 'schema_name', 'version', 'required_fields', 'optional_fields'}
+  """
+  schema = get_schema(booking_type)
+  if not schema:
+    return None
+
+  return {
+    'booking_type': booking_type,
+    'schema_name': schema['schema_name'],
+    'version': schema['version'],
+    'required_fields': [f for f in schema['fields'] if f.get('required')],
+    'optional_fields': [f for f in schema['fields'] if not f.get('required')]
+  }
+
+
+@anvil.server.callable
+@anvil.users.login_required
+def save_booking_metadata_schema(booking_type, field_definitions, schema_name=None):
+  """
+  Create or replace the metadata schema of a booking type.
+
+  Args:
+    booking_type (str): Booking type
+    field_definitions (dict or list): See module comment
+    schema_name (str): Display name
+
+  Returns:
+    dict: {'success': bool, 'version': int} or {'success': bool, 'error': str}
+  """
+  try:
+    user = anvil.users.get_user()
+
+    if user['role'] != 'owner':
+      return {'success': False, 'error': 'Access denied'}
+
+    fields = _field_list(field_definitions)
+    for field in fields:
+      if not field.get('field'):
+        return {'success': False, 'error': 'Every field needs a name'}
+      if field.get('type', 'string') not in FIELD_TYPES:
+        return {'success': False, 'error': f"Unknown field type: {field.get('type')}"}
+
+    row = app_tables.tbl_booking_metadata_schemas.get(booking_type=booking_type)
+
+    if row:
+      row.update(
+        field_definitions=field_definitions,
+        schema_name=schema_name or row['schema_name'],
+        version=(row['version'] or 1) + 1,
+        is_active=True,
+        updated_at=datetime.now()
+      )
+    else:
+      row = app_tables.tbl_booking_metadata_schemas.add_row(
+        booking_type=booking_type,
+        schema_name=schema_name or booking_type.title(),
+        field_definitions=field_definitions,
+        version=1,
+        is_active=True,
+        updated_at=datetime.now()
+      )
+
+    config_cache.drop_cached(_schema_cache_key(booking_type))
+
+    return {'success': True, 'version': row['version']}
+
+  except Exception as e:
+    print(f"Error saving metadata schema: {e}")
+    return {'success': False, 'error': str(e)}
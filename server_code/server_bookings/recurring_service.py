@@ -11,15 +11,597 @@ import anvil.tables.query as q
 from anvil.tables import app_tables
 import anvil.server
 
-# This is a server module. It runs on the Anvil server,
-# rather than in the user's browser.
-#
-# To allow anvil.server.call() to call functions here, we mark
-# them with @anvil.server.callable.
-# Here is an example - you can replace it with your own:
+from datetime import datetime, date, time, timedelta
+from ..server_analytics import booking_cube
+from ..server_customers import customer_summary
+from ..server_customers import portal_service
+from . import appointment_reminders
+
+# Recurring bookings.
 #
-# @anvil.server.callable
-# def say_hello(name):
-#   print("Hello, " + name + "!")
-#   return 42
+# A `booking_series` row holds the recurrence rule and a booking template.
+# Occurrences are generated lazily from the rule, checked against existing
+# bookings and availability for the whole window in one pass, and inserted
+# with a single add_rows call. Every series is materialised
+# MATERIALIZE_DAYS ahead and extended by extend_booking_series until its
+# rule runs out. "This and following" changes cancel the still-active tail
+# bookings; bookings already checked in, completed etc. are kept.
 #
+# Rules are dicts (or RRULE strings, see parse_rrule):
+#   {'freq': 'daily'|'weekly', 'interval': 1, 'by_weekday': [0, 2],
+#    'count': 10, 'until': date}
+
+MAX_OCCURRENCES = 500
+MATERIALIZE_DAYS = 365
+
+ACTIVE_STATUSES = ['pending', 'confirmed']
+
+RRULE_WEEKDAYS = ['MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU']
+
+# Roles allowed to create series (customers book single appointments)
+STAFF_ROLES = ['owner', 'manager', 'staff']
+
+
+def parse_rrule(text):
+  """
+  Parse an RRULE string into a rule dict.
+
+  Supports FREQ (DAILY/WEEKLY), INTERVAL, BYDAY, COUNT and UNTIL
+  (e.g. 'FREQ=WEEKLY;BYDAY=MO,WE;COUNT=20').
+  """
+  rule = {'interval': 1}
+
+  for part in text.replace('RRULE:', '').split(';'):
+    if '=' not in part:
+      continue
+    key, value = part.split('=', 1)
+    key = key.strip().upper()
+    value = value.strip().upper()
+
+    if key == 'FREQ':
+      rule['freq'] = value.lower()
+    elif key == 'INTERVAL':
+      rule['interval'] = int(value)
+    elif key == 'BYDAY':
+      rule['by_weekday'] = [RRULE_WEEKDAYS.index(d[-2:]) for d in value.split(',')]
+    elif key == 'COUNT':
+      rule['count'] = int(value)
+    elif key == 'UNTIL':
+      rule['until'] = datetime.strptime(value[:8], '%Y%m%d').date()
+
+  return normalize_rule(rule)
+
+
+def normalize_rule(rule):
+  """Validate a rule dict (or parse an RRULE string) and fill defaults"""
+  if isinstance(rule, str):
+    return parse_rrule(rule)
+
+  rule = dict(rule)
+  if rule.get('freq') not in ['daily', 'weekly']:
+    raise ValueError(f"Unsupported frequency: {rule.get('freq')}")
+
+  rule['interval'] = max(int(rule.get('interval') or 1), 1)
+
+  if isinstance(rule.get('until'), datetime):
+    rule['until'] = rule['until'].date()
+  elif isinstance(rule.get('until'), str):
+    rule['until'] = date.fromisoformat(rule['until'])
+
+  if rule.get('by_weekday'):
+    rule['by_weekday'] = sorted(set(int(d) for d in rule['by_weekday']))
+
+  return rule
+
+
+def storable_rule(rule):
+  """Rule dict safe for a simpleObject column (dates as ISO strings)"""
+  rule = dict(rule)
+  if isinstance(rule.get('until'), date):
+    rule['until'] = rule['until'].isoformat()
+  return rule
+
+
+def iter_occurrences(rule, dtstart):
+  """
+  Yield occurrence start datetimes in order (lazily, may be unbounded).
+
+  Args:
+    rule (dict): Normalised rule
+    dtstart (datetime): First occurrence; its time of day is reused
+  """
+  interval = rule['interval']
+  until = rule.get('until')
+  count = rule.get('count')
+  produced = 0
+
+  if rule['freq'] == 'daily':
+    candidates = (dtstart + timedelta(days=i * interval) for i in range(10 ** 6))
+  else:
+    weekdays = rule.get('by_weekday') or [dtstart.weekday()]
+    week_start = dtstart - timedelta(days=dtstart.weekday())
+    candidates = (
+      week_start + timedelta(weeks=w * interval, days=d)
+      for w in range(10 ** 6)
+      for d in weekdays
+    )
+
+  for start in candidates:
+    if start < dtstart:
+      continue
+    if until and start.date() > until:
+      return
+    if count and produced >= count:
+      return
+    produced += 1
+    yield start
+
+
+def expand(rule, dtstart, window_start=None, window_end=None, limit=MAX_OCCURRENCES):
+  """
+  List occurrences inside a window.
+
+  Args:
+    rule (dict): Normalised rule
+    dtstart (datetime): Series start
+    window_start (datetime): Skip occurrences before this
+    window_end (datetime): Stop at this (exclusive)
+    limit (int): Maximum occurrences returned
+
+  Returns:
+    list: Occurrence start datetimes
+  """
+  occurrences = []
+  for start in iter_occurrences(rule, dtstart):
+    if window_end and start >= window_end:
+      break
+    if window_start and start < window_start:
+      continue
+    occurrences.append(start)
+    if len(occurrences) >= limit:
+      break
+  return occurrences
+
+
+def _parse_clock(value):
+  hours, minutes = value.split(':')[:2]
+  return time(int(hours), int(minutes))
+
+
+def find_conflicts(resource, occurrences, duration):
+  """
+  Check a whole series against bookings and availability in one pass.
+
+  Loads the resource's overlapping bookings, weekly rules and date
+  exceptions once for the series window, then sweeps the sorted
+  occurrences against them.
+
+  Args:
+    resource (Row): Bookable resource
+    occurrences (list): Sorted occurrence start datetimes
+    duration (timedelta): Length of each occurrence
+
+  Returns:
+    list: [{'start': datetime, 'reason': str}]
+  """
+  if not occurrences or not resource:
+    return []
+
+  window_start = occurrences[0]
+  window_end = occurrences[-1] + duration
+
+  existing = list(app_tables.tbl_bookings.search(
+    tables.order_by('start_datetime'),
+    resource_id=resource,
+    status=q.any_of(*ACTIVE_STATUSES),
+    start_datetime=q.less_than(window_end),
+    end_datetime=q.greater_than(window_start)
+  ))
+
+  rules = {}
+  for rule in app_tables.availability_rules.search(resource_id=resource, is_active=True):
+    rules.setdefault(rule['day_of_week'], []).append(
+      (_parse_clock(rule['start_time']), _parse_clock(rule['end_time']))
+    )
+
+  exceptions = {}
+  for exception in app_tables.availability_exceptions.search(
+    resource_id=resource,
+    exception_date=q.all_of(
+      q.greater_than_or_equal_to(window_start.date()),
+      q.less_than_or_equal_to(window_end.date())
+    )
+  ):
+    exceptions.setdefault(exception['exception_date'], []).append(exception)
+
+  conflicts = []
+  i = 0
+
+  for start in occurrences:
+    end = start + duration
+
+    # Bookings ending before this occurrence can't clash with later ones either
+    while i < len(existing) and existing[i]['end_datetime'] <= start:
+      i += 1
+
+    j = i
+    while j < len(existing) and existing[j]['start_datetime'] < end:
+      if existing[j]['end_datetime'] > start:
+        conflicts.append({'start': start, 'reason': f"Conflicts with booking {existing[j]['booking_number']}"})
+        break
+      j += 1
+    else:
+      reason = _availability_problem(start, end, rules, exceptions.get(start.date(), []))
+      if reason:
+        conflicts.append({'start': start, 'reason': reason})
+
+  return conflicts
+
+
+def _availability_problem(start, end, rules, exceptions):
+  """Reason the slot is outside availability, or None"""
+  slot = (start.time(), end.time())
+
+  for exception in exceptions:
+    window = (_parse_clock(exception['start_time'] or '00:00'), _parse_clock(exception['end_time'] or '23:59'))
+    overlaps = slot[0] < window[1] and slot[1] > window[0]
+    if overlaps and not exception['is_available']:
+      return exception['reason'] or 'Resource unavailable'
+    if exception['is_available'] and window[0] <= slot[0] and slot[1] <= window[1]:
+      return None
+
+  # No weekly rules means the resource is always open
+  day_rules = rules.get(start.weekday())
+  if not rules or (day_rules and any(s <= slot[0] and slot[1] <= e for s, e in day_rules)):
+    return None
+
+  return 'Outside availability hours'
+
+
+def _booking_rows(series, occurrences, number_offset):
+  """Booking dicts for a list of occurrences"""
+  template = series['template'] or {}
+  duration = timedelta(minutes=series['duration_minutes'])
+  prefix = f"RB-{series['created_at'].strftime('%Y%m%d%H%M%S')}"
+
+  return [dict(
+    template,
+    client_id=series['client_id'],
+    customer_id=series['customer_id'],
+    resource_id=series['resource_id'],
+    series_id=series,
+    start_datetime=start,
+    end_datetime=start + duration,
+    status=template.get('status', 'confirmed'),
+    created_at=datetime.now(),
+    booking_number=f"{prefix}-{number_offset + n + 1:03d}"
+  ) for n, start in enumerate(occurrences)]
+
+
+def _materialize(series, occurrences, skip_conflicts):
+  """
+  Conflict-check and insert occurrences for a series.
+
+  Returns:
+    dict: {'created': int, 'skipped': list} or {'conflicts': list} when blocked
+  """
+  duration = timedelta(minutes=series['duration_minutes'])
+  conflicts = find_conflicts(series['resource_id'], occurrences, duration)
+
+  if conflicts and not skip_conflicts:
+    return {'conflicts': conflicts}
+
+  blocked = {c['start'] for c in conflicts}
+  occurrences = [o for o in occurrences if o not in blocked]
+
+  number_offset = len(app_tables.tbl_bookings.search(series_id=series))
+  bookings = app_tables.tbl_bookings.add_rows(_booking_rows(series, occurrences, number_offset))
+
+  for booking in bookings:
+    booking_cube.on_booking_changed(booking)
+    customer_summary.record('booking', booking)
+
+  appointment_reminders.queue_reminders(bookings)
+  portal_service.invalidate(series['customer_id'])
+
+  return {'created': len(bookings), 'skipped': conflicts}
+
+
+def _horizon(dtstart):
+  """End of the materialised window for a series starting at dtstart"""
+  return max(datetime.now(), dtstart) + timedelta(days=MATERIALIZE_DAYS)
+
+
+@anvil.server.callable
+@anvil.users.login_required
+def create_booking_series(series_data):
+  """
+  Create a recurring booking series in one transaction.
+
+  Args:
+    series_data (dict): {
+      'rule': dict or RRULE str, 'start_datetime': datetime, 'duration_minutes': int,
+      'resource_id': str, 'customer_id': str,
+      'booking': dict of extra booking fields (booking_type, total_amount, ...),
+      'skip_conflicts': bool (create the free occurrences instead of failing)
+    }
+
+  Returns:
+    dict: {'success': bool, 'series_id': str, 'created': int, 'skipped': list}
+          or {'success': False, 'error': str, 'conflicts': list}
+  """
+  try:
+    user = anvil.users.get_user()
+
+    if user['role'] not in STAFF_ROLES:
+      return {'success': False, 'error': 'Access denied'}
+
+    result = _create_series(user, series_data)
+    result['success'] = True
+    return result
+
+  except SeriesConflict as e:
+    return {'success': False, 'error': f"{len(e.conflicts)} occurrences conflict", 'conflicts': e.conflicts}
+
+  except Exception as e:
+    print(f"Error creating booking series: {e}")
+    return {'success': False, 'error': str(e)}
+
+
+class SeriesConflict(Exception):
+  """Raised inside the series transaction so nothing is saved"""
+
+  def __init__(self, conflicts):
+    super().__init__(f"{len(conflicts)} occurrences conflict")
+    self.conflicts = conflicts
+
+
+@tables.in_transaction
+def _create_series(user, series_data):
+  rule = normalize_rule(series_data['rule'])
+  dtstart = series_data['start_datetime']
+  resource = app_tables.tbl_bookable_resources.get_by_id(series_data['resource_id']) if series_data.get('resource_id') else None
+  customer = app_tables.users.get_by_id(series_data['customer_id']) if series_data.get('customer_id') else None
+
+  occurrences = expand(rule, dtstart, window_end=_horizon(dtstart))
+  if not occurrences:
+    raise ValueError('Rule produces no occurrences')
+
+  series = app_tables.booking_series.add_row(
+    client_id=user,
+    customer_id=customer,
+    resource_id=resource,
+    rule=storable_rule(rule),
+    dtstart=dtstart,
+    duration_minutes=series_data['duration_minutes'],
+    template=series_data.get('booking') or {},
+    materialized_until=occurrences[-1],
+    status='active',
+    created_at=datetime.now()
+  )
+
+  result = _materialize(series, occurrences, series_data.get('skip_conflicts'))
+  if 'conflicts' in result:
+    raise SeriesConflict(result['conflicts'])
+
+  return {'series_id': series.get_id(), 'created': result['created'], 'skipped': result['skipped']}
+
+
+@anvil.server.callable
+@anvil.users.login_required
+def preview_booking_series(series_data, window_start=None, window_end=None):
+  """
+  Expand and conflict-check a rule without saving anything.
+
+  Returns:
+    dict: {'success': bool, 'occurrences': list, 'conflicts': list}
+  """
+  try:
+    rule = normalize_rule(series_data['rule'])
+    resource = app_tables.tbl_bookable_resources.get_by_id(series_data['resource_id']) if series_data.get('resource_id') else None
+    window_end = window_end or _horizon(series_data['start_datetime'])
+
+    occurrences = expand(rule, series_data['start_datetime'], window_start, window_end)
+    conflicts = find_conflicts(resource, occurrences, timedelta(minutes=series_data['duration_minutes']))
+
+    return {'success': True, 'occurrences': occurrences, 'conflicts': conflicts}
+
+  except Exception as e:
+    print(f"Error previewing booking series: {e}")
+    return {'success': False, 'error': str(e)}
+
+
+def _split_tail(booking):
+  """
+  End a booking's series just before it and cancel the active tail.
+
+  Tail bookings no longer pending or confirmed (checked in, completed,
+  paid, ...) are left as they are.
+
+  Returns:
+    tuple: (old series row, number of tail bookings cancelled,
+            start datetimes of the tail bookings kept)
+  """
+  series = booking['series_id']
+  split_at = booking['start_datetime']
+
+  tail = app_tables.tbl_bookings.search(
+    series_id=series,
+    start_datetime=q.greater_than_or_equal_to(split_at)
+  )
+
+  cancelled = 0
+  kept = set()
+  for tail_booking in tail:
+    if tail_booking['status'] not in ACTIVE_STATUSES:
+      kept.add(tail_booking['start_datetime'])
+      continue
+
+    previous = booking_cube.snapshot(tail_booking)
+    tail_booking.update(status='cancelled', updated_at=datetime.now())
+    booking_cube.on_booking_changed(tail_booking, previous)
+    appointment_reminders.sync_reminders(tail_booking)
+    cancelled += 1
+
+  portal_service.invalidate(series['customer_id'])
+
+  rule = dict(series['rule'])
+  rule.pop('count', None)
+  rule['until'] = (split_at - timedelta(days=1)).date()
+  series.update(
+    rule=storable_rule(rule),
+    status='split' if split_at > series['dtstart'] else 'cancelled'
+  )
+
+  return series, cancelled, kept
+
+
+@anvil.server.callable
+@anvil.users.login_required
+def update_series_from(booking_id, changes):
+  """
+  Change "this and following" occurrences of a series.
+
+  Only the tail from this booking on is rewritten: earlier bookings are
+  untouched, the old series is ended before this occurrence, its active
+  tail bookings are cancelled, and a new series carries the changed
+  rule/time/template forward (skipping slots of tail bookings kept).
+
+  Args:
+    booking_id (str): First occurrence to change
+    changes (dict): Any of 'rule', 'start_datetime', 'duration_minutes',
+                    'booking' (template fields), 'skip_conflicts'
+
+  Returns:
+    dict: {'success': bool, 'series_id': str, 'created': int, 'cancelled': int}
+          or {'success': False, 'error': str, 'conflicts': list}
+  """
+  try:
+    user = anvil.users.get_user()
+
+    booking = app_tables.tbl_bookings.get_by_id(booking_id)
+    if not booking or not booking['series_id'] or booking['client_id'] != user:
+      return {'success': False, 'error': 'Series booking not found'}
+
+    result = _rewrite_tail(booking, changes)
+    result['success'] = True
+    return result
+
+  except SeriesConflict as e:
+    return {'success': False, 'error': f"{len(e.conflicts)} occurrences conflict", 'conflicts': e.conflicts}
+
+  except Exception as e:
+    print(f"Error updating booking series: {e}")
+    return {'success': False, 'error': str(e)}
+
+
+@tables.in_transaction
+def _rewrite_tail(booking, changes):
+  old_series = booking['series_id']
+  old_rule = normalize_rule(old_series['rule'])
+
+  rule = dict(old_rule)
+  if old_rule.get('count'):
+    # Keep the total number of sessions when only the tail changes
+    occurrence_index = len(app_tables.tbl_bookings.search(
+      series_id=old_series,
+      start_datetime=q.less_than(booking['start_datetime'])
+    ))
+    rule['count'] = max(old_rule['count'] - occurrence_index, 1)
+  if changes.get('rule'):
+    rule = changes['rule']
+  rule = normalize_rule(rule)
+
+  dtstart = changes.get('start_datetime') or booking['start_datetime']
+  template = dict(old_series['template'] or {}, **(changes.get('booking') or {}))
+
+  _, cancelled, kept = _split_tail(booking)
+
+  occurrences = [o for o in expand(rule, dtstart, window_end=_horizon(dtstart)) if o not in kept]
+
+  new_series = app_tables.booking_series.add_row(
+    client_id=old_series['client_id'],
+    customer_id=old_series['customer_id'],
+    resource_id=old_series['resource_id'],
+    rule=storable_rule(rule),
+    dtstart=dtstart,
+    duration_minutes=changes.get('duration_minutes') or old_series['duration_minutes'],
+    template=template,
+    materialized_until=occurrences[-1] if occurrences else dtstart,
+    status='active',
+    parent_series=old_series,
+    created_at=datetime.now()
+  )
+
+  result = _materialize(new_series, occurrences, changes.get('skip_conflicts'))
+  if 'conflicts' in result:
+    raise SeriesConflict(result['conflicts'])
+
+  return {
+    'series_id': new_series.get_id(),
+    'created': result['created'],
+    'cancelled': cancelled,
+    'skipped': result['skipped']
+  }
+
+
+@anvil.server.callable
+@anvil.users.login_required
+def cancel_series_from(booking_id):
+  """
+  Cancel "this and following" occurrences of a series.
+
+  Returns:
+    dict: {'success': bool, 'cancelled': int} or {'success': False, 'error': str}
+  """
+  try:
+    user = anvil.users.get_user()
+
+    booking = app_tables.tbl_bookings.get_by_id(booking_id)
+    if not booking or not booking['series_id'] or booking['client_id'] != user:
+      return {'success': False, 'error': 'Series booking not found'}
+
+    return {'success': True, 'cancelled': _cancel_tail(booking)}
+
+  except Exception as e:
+    print(f"Error cancelling booking series: {e}")
+    return {'success': False, 'error': str(e)}
+
+
+@tables.in_transaction
+def _cancel_tail(booking):
+  _, cancelled, _ = _split_tail(booking)
+  return cancelled
+
+
+@anvil.server.background_task
+def extend_booking_series():
+  """Materialise the next window of every active series (run daily)"""
+  horizon = datetime.now() + timedelta(days=MATERIALIZE_DAYS)
+
+  for series in app_tables.booking_series.search(
+    status='active',
+    materialized_until=q.less_than(horizon)
+  ):
+    _extend_series(series, horizon)
+
+
+@tables.in_transaction
+def _extend_series(series, horizon):
+  """
+  Add one series' occurrences up to the horizon, skipping conflicts.
+
+  A count/until series whose rule has no occurrences left is marked
+  'completed' so it is not scanned again.
+  """
+  rule = normalize_rule(series['rule'])
+  window_start = series['materialized_until'] + timedelta(seconds=1)
+  occurrences = expand(rule, series['dtstart'], window_start, horizon)
+
+  if not occurrences:
+    if (rule.get('count') or rule.get('until')) and not expand(rule, series['dtstart'], window_start, limit=1):
+      series['status'] = 'completed'
+    return
+
+  _materialize(series, occurrences, skip_conflicts=True)
+  series['materialized_until'] = occurrences[-1]
@@ -10,6 +10,7 @@ import anvil.tables as tables
 import anvil.tables.query as q
 from anvil.tables import app_tables
 import anvil.server
+from . import customer_summary
 
 @anvil.server.callable
 def get_customer_activity(user_id):
@@ -27,17 +28,10 @@ def get_customer_activity(user_id):
   }
 
   try:
-    # Check for bookings
-    bookings = list(app_tables.tbl_bookings.search(
-      customer_id=user
-    ))
-    activity['has_bookings'] = len(bookings) > 0
-
-    # Check for orders
-    orders = list(app_tables.tbl_orders.search(
-      customer_id=user
-    ))
-    activity['has_orders'] = len(orders) > 0
+    # Bookings and orders from the customer summary
+    summary = customer_summary.get_summary(user)
+    activity['has_bookings'] = summary['bookings_count'] > 0
+    activity['has_orders'] = summary['orders_count'] > 0
 
     # Check for membership
     membership = app_tables.tbl_memberships.get(
@@ -0,0 +1,402 @@
+import anvil.google.auth, anvil.google.drive, anvil.google.mail
+from anvil.google.drive import app_files
+import anvil.stripe
+import anvil.secrets
+import anvil.files
+from anvil.files import data_files
+import anvil.email
+import anvil.users
+import anvil.tables as tables
+import anvil.tables.query as q
+from anvil.tables import app_tables
+import anvil.server
+
+from datetime import datetime
+import re
+
+# Contact directory.
+#
+# Search, tag filtering and facet counts run against small index tables
+# that are kept in step with the contacts table:
+#   contact_search_terms - one row per (contact, term) for name/email/phone
+#                          tokens, matched by prefix with q.like('term%')
+#   contact_tags         - one row per (contact, tag)
+#   contact_facet_counts - counts per status and lifecycle stage
+#
+# Listing returns one page of lightweight projections (only the requested
+# fields) instead of every contact as a full dict.
+
+FACETS = ['status', 'lifecycle_stage']
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Projection field -> extractor
+FIELD_EXTRACTORS = {
+  'contact_id': lambda c: c.get_id(),
+  'first_name': lambda c: c['first_name'],
+  'last_name': lambda c: c['last_name'],
+  'full_name': lambda c: f"{c['first_name'] or ''} {c['last_name'] or ''}".strip(),
+  'email': lambda c: c['email'],
+  'phone': lambda c: c['phone'],
+  'status': lambda c: c['status'],
+  'lifecycle_stage': lambda c: c['lifecycle_stage'],
+  'source': lambda c: c['source'],
+  'tags': lambda c: c['tags'] or [],
+  'total_spent': lambda c: c['total_spent'] or 0,
+  'total_transactions': lambda c: c['total_transactions'] or 0,
+  'last_contact_date': lambda c: c['last_contact_date'],
+  'customer_since': lambda c: c['date_added']
+}
+
+DEFAULT_FIELDS = ['contact_id', 'full_name', 'email', 'phone', 'status', 'lifecycle_stage', 'last_contact_date']
+
+# Shortest search token that hits the term index
+MIN_TERM_LENGTH = 2
+
+
+def normalize_term(text):
+  """Lowercase and strip characters that are not letters, digits, @ or ."""
+  return re.sub(r'[^a-z0-9@.]', '', (text or '').lower())
+
+
+def contact_terms(contact):
+  """
+  Get the search terms for a contact.
+
+  Args:
+    contact (Row): contacts row
+
+  Returns:
+    set: Terms (name tokens, email and its parts, phone digits)
+  """
+  terms = set()
+
+  for field in ['first_name', 'last_name']:
+    for token in (contact[field] or '').split():
+      terms.add(normalize_term(token))
+
+  email = (contact['email'] or '').strip().lower()
+  if email:
+    terms.add(email)
+    local, _, domain = email.partition('@')
+    terms.add(local)
+    terms.update(re.split(r'[._+-]', local))
+    terms.add(domain)
+
+  phone_digits = re.sub(r'\D', '', contact['phone'] or '')
+  if phone_digits:
+    terms.add(phone_digits)
+    # Local number without country/area prefix, so "5551234" finds "+1 212 555 1234"
+    if len(phone_digits) > 7:
+      terms.add(phone_digits[-7:])
+
+  return {t for t in terms if len(t) >= MIN_TERM_LENGTH}
+
+
+def query_tokens(search_text):
+  """Split a search box value into normalised tokens"""
+  tokens = []
+  for token in (search_text or '').split():
+    token = token.lower()
+    # Phone numbers are indexed as digits only
+    if re.fullmatch(r'[\d\s()+-]+', token):
+      token = re.sub(r'\D', '', token)
+    else:
+      token = normalize_term(token)
+    if len(token) >= MIN_TERM_LENGTH:
+      tokens.append(token)
+  return tokens
+
+
+def snapshot(contact):
+  """
+  Capture faceted fields before changing a contact.
+
+  Args:
+    contact (Row): contacts row
+
+  Returns:
+    dict: Values to pass to on_contact_changed
+  """
+  return {facet: contact[facet] for facet in FACETS}
+
+
+def on_contact_changed(contact, previous=None):
+  """
+  Refresh a contact's index rows and facet counts.
+
+  Call inside the transaction that creates or changes the contact.
+
+  Args:
+    contact (Row): contacts row after the change
+    previous (dict): snapshot() taken before the change, None for a new contact
+  """
+  index_contact(contact)
+
+  tenant = contact['instance_id']
+  for facet in FACETS:
+    old_value = previous.get(facet) if previous else None
+    new_value = contact[facet]
+    if previous is not None and old_value == new_value:
+      continue
+    if previous is not None and old_value:
+      _adjust_facet(tenant, facet, old_value, -1)
+    if new_value:
+      _adjust_facet(tenant, facet, new_value, 1)
+
+
+def index_contact(contact):
+  """Bring a contact's search term and tag rows in line with the contact"""
+  tenant = contact['instance_id']
+
+  _sync_index(app_tables.contact_search_terms, 'term', tenant, contact, contact_terms(contact))
+  _sync_index(app_tables.contact_tags, 'tag', tenant, contact, set(contact['tags'] or []))
+
+
+def _sync_index(table, column, tenant, contact, wanted):
+  """Delete stale and add missing index rows (unchanged contacts write nothing)"""
+  existing = set()
+
+  for row in table.search(contact=contact):
+    if row[column] in wanted and row[column] not in existing:
+      existing.add(row[column])
+    else:
+      row.delete()
+
+  for value in wanted - existing:
+    table.add_row(instance_id=tenant, contact=contact, **{column: value})
+
+
+def _adjust_facet(tenant, facet, value, delta):
+  """Adjust one facet count, creating it if missing"""
+  row = app_tables.contact_facet_counts.get(instance_id=tenant, facet=facet, value=value)
+  if row:
+    row['count'] = max((row['count'] or 0) + delta, 0)
+  elif delta > 0:
+    app_tables.contact_facet_counts.add_row(instance_id=tenant, facet=facet, value=value, count=delta)
+
+
+# Contact columns read through the index rows to filter, sort and page
+# matches without loading whole contacts
+SORT_FETCH = q.fetch_only(contact=q.fetch_only('last_contact_date', 'status', 'lifecycle_stage'))
+
+
+def _contacts_for_terms(tenant, tokens):
+  """Contacts matching every token by prefix, as {id: row with sort columns}"""
+  matched = None
+
+  for token in tokens:
+    rows = app_tables.contact_search_terms.search(
+      SORT_FETCH,
+      instance_id=tenant,
+      term=q.like(f"{token}%")
+    )
+    found = {row['contact'].get_id(): row['contact'] for row in rows}
+    matched = found if matched is None else {k: v for k, v in matched.items() if k in found}
+    if not matched:
+      return {}
+
+  return matched
+
+
+def _contacts_for_tags(tenant, tags, match_all):
+  """Contacts having any (or all) of the tags, as {id: row with sort columns}"""
+  if match_all:
+    matched = None
+    for tag in tags:
+      found = {row['contact'].get_id(): row['contact'] for row in app_tables.contact_tags.search(
+        SORT_FETCH, instance_id=tenant, tag=tag
+      )}
+      matched = found if matched is None else {k: v for k, v in matched.items() if k in found}
+    return matched or {}
+
+  return {row['contact'].get_id(): row['contact'] for row in app_tables.contact_tags.search(
+    SORT_FETCH, instance_id=tenant, tag=q.any_of(*tags)
+  )}
+
+
+def project(contact, fields):
+  """Build a dict with only the requested fields"""
+  return {field: FIELD_EXTRACTORS[field](contact) for field in fields}
+
+
+def search_directory(tenant, search=None, tags=None, match_all_tags=False, status=None,
+                     lifecycle_stage=None, fields=None, page=1, page_size=DEFAULT_PAGE_SIZE):
+  """
+  Search a tenant's contacts, newest contact first.
+
+  Args:
+    tenant (Row): Business owner (instance_id)
+    search (str): Name, email or phone text (prefix match per word)
+    tags (list): Tag filter
+    match_all_tags (bool): Require every tag instead of any
+    status (str or list): Status filter
+    lifecycle_stage (str or list): Lifecycle stage filter
+    fields (list): Projection fields (default DEFAULT_FIELDS)
+    page (int): 1-based page number
+    page_size (int): Contacts per page (capped at MAX_PAGE_SIZE)
+
+  Returns:
+    dict: {'contacts': list, 'total': int, 'page': int, 'has_more': bool}
+  """
+  fields = [f for f in (fields or DEFAULT_FIELDS) if f in FIELD_EXTRACTORS]
+  page = max(int(page or 1), 1)
+  page_size = max(1, min(int(page_size or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+  start = (page - 1) * page_size
+
+  query = {'instance_id': tenant}
+  if status:
+    query['status'] = q.any_of(*status) if isinstance(status, list) else status
+  if lifecycle_stage:
+    query['lifecycle_stage'] = q.any_of(*lifecycle_stage) if isinstance(lifecycle_stage, list) else lifecycle_stage
+
+  tokens = query_tokens(search)
+
+  if not tokens and not tags:
+    # Plain listing - ordered, sliced query
+    results = app_tables.contacts.search(
+      tables.order_by('last_contact_date', ascending=False),
+      **query
+    )
+    total = len(results)
+    contacts = results[start:start + page_size]
+
+  else:
+    # Narrow, filter and sort on the index rows, then load only the page
+    candidates = None
+    if tokens:
+      candidates = _contacts_for_terms(tenant, tokens)
+    if tags and candidates != {}:
+      tagged = _contacts_for_tags(tenant, tags, match_all_tags)
+      candidates = tagged if candidates is None else {k: v for k, v in candidates.items() if k in tagged}
+
+    matches = [c for c in candidates.values() if _matches(c, status, lifecycle_stage)]
+    matches.sort(key=lambda c: c['last_contact_date'] or datetime.min, reverse=True)
+
+    total = len(matches)
+    contacts = [app_tables.contacts.get_by_id(c.get_id()) for c in matches[start:start + page_size]]
+    contacts = [c for c in contacts if c]
+
+  return {
+    'contacts': [project(c, fields) for c in contacts],
+    'total': total,
+    'page': page,
+    'has_more': start + page_size < total
+  }
+
+
+def _matches(contact, status, lifecycle_stage):
+  """Apply status/lifecycle filters to an index candidate"""
+  for field, wanted in [('status', status), ('lifecycle_stage', lifecycle_stage)]:
+    if not wanted:
+      continue
+    allowed = wanted if isinstance(wanted, list) else [wanted]
+    if contact[field] not in allowed:
+      return False
+  return True
+
+
+def get_facets(tenant):
+  """
+  Get status and lifecycle stage counts.
+
+  Args:
+    tenant (Row): Business owner (instance_id)
+
+  Returns:
+    dict: {'status': {value: count}, 'lifecycle_stage': {value: count}}
+  """
+  facets = {facet: {} for facet in FACETS}
+  for row in app_tables.contact_facet_counts.search(instance_id=tenant):
+    if row['count']:
+      facets.setdefault(row['facet'], {})[row['value']] = row['count']
+  return facets
+
+
+@anvil.server.callable
+def search_contacts(search=None, tags=None, match_all_tags=False, status=None, lifecycle_stage=None,
+                    fields=None, page=1, page_size=DEFAULT_PAGE_SIZE, include_facets=False):
+  """
+  Search the current user's contacts.
+
+  Returns:
+    dict: {'success': bool, 'contacts': list, 'total': int, 'page': int, 'has_more': bool,
+           'facets': dict (if include_facets)} or {'success': False, 'error': str}
+  """
+  try:
+    user = anvil.users.get_user()
+    if not user:
+      return {'success': False, 'error': 'Not authenticated'}
+
+    result = search_directory(
+      user,
+      search=search,
+      tags=tags,
+      match_all_tags=match_all_tags,
+      status=status,
+      lifecycle_stage=lifecycle_stage,
+      fields=fields,
+      page=page,
+      page_size=page_size
+    )
+
+    if include_facets:
+      result['facets'] = get_facets(user)
+
+    result['success'] = True
+    return result
+
+  except Exception as e:
+    print(f"Error searching contacts: {e}")
+    return {'success': False, 'error': str(e)}
+
+
+@anvil.server.callable
+def get_contact_facets():
+  """Get contact counts by status and lifecycle stage"""
+  try:
+    user = anvil.users.get_user()
+    if not user:
+      return {'success': False, 'error': 'Not authenticated'}
+
+    return {'success': True, 'facets': get_facets(user)}
+
+  except Exception as e:
+    print(f"Error getting contact facets: {e}")
+    return {'success': False, 'error': str(e)}
+
+
+@anvil.server.background_task
+def rebuild_contact_directory():
+  """Rebuild search terms, tags and facet counts for every contact"""
+  app_tables.contact_search_terms.search().delete_all_rows()
+  app_tables.contact_tags.search().delete_all_rows()
+  app_tables.contact_facet_counts.search().delete_all_rows()
+
+  counts = {}
+  indexed = 0
+
+  for contact in app_tables.contacts.search():
+    tenant = contact['instance_id']
+    if not tenant:
+      continue
+
+    index_contact(contact)
+    indexed += 1
+
+    for facet in FACETS:
+      if contact[facet]:
+        key = (tenant.get_id(), facet, contact[facet])
+        entry = counts.setdefault(key, {'tenant': tenant, 'count': 0})
+        entry['count'] += 1
+
+  for (_, facet, value), entry in counts.items():
+    app_tables.contact_facet_counts.add_row(
+      instance_id=entry['tenant'],
+      facet=facet,
+      value=value,
+      count=entry['count']
+    )
+
+  print(f"Rebuilt contact directory for {indexed} contacts")
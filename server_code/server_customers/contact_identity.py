@@ -0,0 +1,315 @@
+import anvil.google.auth, anvil.google.drive, anvil.google.mail
+from anvil.google.drive import app_files
+import anvil.stripe
+import anvil.secrets
+import anvil.files
+from anvil.files import data_files
+import anvil.email
+import anvil.users
+import anvil.tables as tables
+import anvil.tables.query as q
+from anvil.tables import app_tables
+import anvil.server
+
+from datetime import datetime
+from . import contact_directory
+
+# Contact identity.
+#
+# Contacts are keyed per tenant by `email_key` (trimmed, lowercased email),
+# so "Jane@Example.com " and "jane@example.com" resolve to the same contact.
+# Get-or-create runs inside a transaction, and purchase metrics are written
+# with a single row update, so concurrent webhooks neither create duplicates
+# nor lose increments (conflicting transactions are retried by Anvil).
+
+# Transactions replayed per database transaction
+REPLAY_CHUNK_SIZE = 200
+
+
+def normalize_email(email):
+  """
+  Normalise an email address for identity matching.
+
+  Args:
+    email (str): Raw email
+
+  Returns:
+    str: Trimmed, lowercased email, or '' if empty
+  """
+  return (email or '').strip().lower()
+
+
+def find_contact(tenant, email):
+  """
+  Find a tenant's contact by email.
+
+  Falls back to the raw email column for contacts created before email_key
+  existed, and backfills the key when found that way.
+
+  Args:
+    tenant (Row): Business owner (instance_id)
+    email (str): Email address (any case/whitespace)
+
+  Returns:
+    Row or None: contacts row
+  """
+  email_key = normalize_email(email)
+  if not email_key:
+    return None
+
+  contact = app_tables.contacts.get(instance_id=tenant, email_key=email_key)
+  if contact:
+    return contact
+
+  # ilike treats '_' as a wildcard, so confirm the match
+  for legacy in app_tables.contacts.search(instance_id=tenant, email_key=None, email=q.ilike(email_key)):
+    if normalize_email(legacy['email']) == email_key:
+      legacy['email_key'] = email_key
+      return legacy
+
+  return None
+
+
+def upsert_contact(tenant, email, defaults=None):
+  """
+  Get a tenant's contact by email, creating it if missing.
+
+  Call inside a transaction.
+
+  Args:
+    tenant (Row): Business owner (instance_id)
+    email (str): Email address
+    defaults (dict): Column values for a new contact
+
+  Returns:
+    tuple: (contacts row, created)
+  """
+  email_key = normalize_email(email)
+  if not email_key:
+    raise ValueError("Email is required")
+
+  contact = find_contact(tenant, email_key)
+  if contact:
+    return contact, False
+
+  now = datetime.now()
+  values = {
+    'first_name': '',
+    'last_name': '',
+    'phone': '',
+    'status': 'Lead',
+    'source': 'Manual Entry',
+    'date_added': now,
+    'last_contact_date': now,
+    'total_spent': 0,
+    'total_transactions': 0,
+    'average_order_value': 0,
+    'lifecycle_stage': 'New',
+    'tags': [],
+    'internal_notes': '',
+    'preferences': {},
+    'created_at': now,
+    'updated_at': now
+  }
+  values.update(defaults or {})
+
+  contact = app_tables.contacts.add_row(
+    instance_id=tenant,
+    email=email.strip(),
+    email_key=email_key,
+    **values
+  )
+  contact_directory.on_contact_changed(contact)
+
+  return contact, True
+
+
+def apply_purchase_metrics(contact, amount, count=1, when=None):
+  """
+  Add purchases to a contact's metrics in a single row write.
+
+  Call inside a transaction.
+
+  Args:
+    contact (Row): contacts row
+    amount (float): Total amount of the purchases
+    count (int): Number of purchases
+    when (datetime): Latest purchase time (default now)
+  """
+  previous = contact_directory.snapshot(contact)
+
+  total_spent = (contact['total_spent'] or 0) + amount
+  total_transactions = (contact['total_transactions'] or 0) + count
+  last_contact = max(filter(None, [contact['last_contact_date'], when or datetime.now()]))
+
+  contact.update(
+    total_spent=total_spent,
+    total_transactions=total_transactions,
+    average_order_value=total_spent / total_transactions if total_transactions else 0,
+    last_contact_date=last_contact,
+    status='Customer',
+    updated_at=datetime.now()
+  )
+
+  contact_directory.on_contact_changed(contact, previous)
+
+
+@tables.in_transaction
+def record_transaction(tenant, email, transaction_type, transaction_id, amount):
+  """
+  Upsert the contact for a transaction and apply it to their metrics.
+
+  A transaction already recorded for the contact (same type and id, e.g. a
+  retried webhook) is ignored.
+
+  Args:
+    tenant (Row): Business owner (instance_id)
+    email (str): Customer email
+    transaction_type (str): 'booking', 'order', ...
+    transaction_id: Booking/order id
+    amount (float): Transaction amount
+
+  Returns:
+    Row: contacts row
+  """
+  contact, created = upsert_contact(tenant, email, {
+    'status': 'Customer',
+    'source': f'{transaction_type}_widget'
+  })
+
+  related_id = str(transaction_id)
+
+  if not created and app_tables.contact_events.get(
+    contact_id=contact,
+    event_type=transaction_type,
+    related_id=related_id
+  ):
+    return contact
+
+  apply_purchase_metrics(contact, amount)
+
+  app_tables.contact_events.add_row(
+    contact_id=contact,
+    event_type=transaction_type,
+    event_date=datetime.now(),
+    event_data={'amount': amount},
+    related_id=related_id,
+    user_visible=True
+  )
+
+  return contact
+
+
+def replay_transactions(tenant, transactions):
+  """
+  Apply historical transactions in bulk.
+
+  Transactions are grouped by contact, so each contact gets one upsert and
+  one metrics write per chunk, however many transactions it has. Events are
+  not logged and duplicates are not checked, so replay each history once.
+
+  Args:
+    tenant (Row): Business owner (instance_id)
+    transactions (list): [{'email', 'transaction_type', 'amount', 'date'}]
+
+  Returns:
+    dict: {'contacts': int, 'transactions': int, 'skipped': int}
+  """
+  grouped = {}
+  skipped = 0
+
+  for transaction in transactions:
+    email_key = normalize_email(transaction.get('email'))
+    if not email_key:
+      skipped += 1
+      continue
+
+    entry = grouped.setdefault(email_key, {
+      'email': transaction['email'],
+      'source': f"{transaction.get('transaction_type', 'import')}_widget",
+      'amount': 0,
+      'count': 0,
+      'last_date': None
+    })
+    entry['amount'] += transaction.get('amount') or 0
+    entry['count'] += 1
+    date = transaction.get('date')
+    if date and (entry['last_date'] is None or date > entry['last_date']):
+      entry['last_date'] = date
+
+  entries = list(grouped.values())
+  for start in range(0, len(entries), REPLAY_CHUNK_SIZE):
+    _replay_chunk(tenant, entries[start:start + REPLAY_CHUNK_SIZE])
+
+  return {
+    'contacts': len(entries),
+    'transactions': sum(e['count'] for e in entries),
+    'skipped': skipped
+  }
+
+
+@tables.in_transaction
+def _replay_chunk(tenant, entries):
+  """Upsert and update one chunk of grouped transactions"""
+  for entry in entries:
+    contact, _ = upsert_contact(tenant, entry['email'], {
+      'status': 'Customer',
+      'source': entry['source']
+    })
+    apply_purchase_metrics(contact, entry['amount'], entry['count'], entry['last_date'])
+
+
+@anvil.server.background_task
+def replay_transaction_history(tenant, transactions):
+  """Background wrapper for replay_transactions"""
+  result = replay_transactions(tenant, transactions)
+  print(f"Replayed {result['transactions']} transactions into {result['contacts']} contacts")
+  return result
+
+
+@anvil.server.background_task
+def backfill_contact_email_keys():
+  """Set email_key on contacts created before it existed"""
+  updated = 0
+  for contact in app_tables.contacts.search(email_key=None):
+    email_key = normalize_email(contact['email'])
+    if email_key:
+      contact['email_key'] = email_key
+      updated += 1
+  print(f"Backfilled email_key on {updated} contacts")
+
+
+def get_or_create_user(email, defaults=None):
+  """
+  Get a user by normalised email, creating a guest customer if missing.
+
+  Call inside a transaction.
+
+  Args:
+    email (str): Email address
+    defaults (dict): Extra column values for a new user
+
+  Returns:
+    Row: users row
+  """
+  email_key = normalize_email(email)
+  if not email_key:
+    raise ValueError("Email is required")
+
+  user = app_tables.users.get(email=email_key)
+  if user:
+    return user
+
+  # Accounts stored with different case ('_' is an ilike wildcard, so confirm)
+  for candidate in app_tables.users.search(email=q.ilike(email_key)):
+    if normalize_email(candidate['email']) == email_key:
+      return candidate
+
+  values = {
+    'role': 'customer',
+    'account_status': 'active',
+    'created_at': datetime.now()
+  }
+  values.update(defaults or {})
+
+  return app_tables.users.add_row(email=email_key, **values)
@@ -0,0 +1,353 @@
+import anvil.google.auth, anvil.google.drive, anvil.google.mail
+from anvil.google.drive import app_files
+import anvil.stripe
+import anvil.secrets
+import anvil.files
+from anvil.files import data_files
+import anvil.email
+import anvil.users
+import anvil.tables as tables
+import anvil.tables.query as q
+from anvil.tables import app_tables
+import anvil.server
+
+import anvil.media
+import csv
+import io
+import itertools
+from datetime import datetime, timedelta
+from . import contact_directory
+from . import contact_identity
+from ..server_shared import validators
+
+# Bulk CSV contact import.
+#
+# start_contact_import stores the uploaded CSV on a `contact_imports` row and
+# launches run_contact_import, which streams the file row by row and
+# upserts contacts in chunks. Each chunk commits together with the import's
+# progress counters, so an interrupted import resumes after the last
+# committed chunk. Row errors go to `contact_import_errors` and are written
+# out as a CSV report when the import finishes.
+#
+# heartbeat_at is refreshed when an import is queued, starts and commits a
+# chunk. A queued or running import can only be resumed once its heartbeat
+# is older than HEARTBEAT_TIMEOUT, so a live task is never run twice.
+
+CHUNK_SIZE = 250
+
+# A queued/running import with no heartbeat for this long has lost its task
+HEARTBEAT_TIMEOUT = timedelta(minutes=10)
+
+# Normalised CSV header -> contact field
+HEADER_ALIASES = {
+  'email': 'email',
+  'emailaddress': 'email',
+  'e-mail': 'email',
+  'firstname': 'first_name',
+  'first': 'first_name',
+  'givenname': 'first_name',
+  'lastname': 'last_name',
+  'last': 'last_name',
+  'surname': 'last_name',
+  'familyname': 'last_name',
+  'phone': 'phone',
+  'phonenumber': 'phone',
+  'mobile': 'phone',
+  'tags': 'tags',
+  'source': 'source',
+  'notes': 'internal_notes'
+}
+
+ERROR_REPORT_COLUMNS = ['row', 'email', 'error']
+
+
+def _map_header(header):
+  key = (header or '').strip().lower().replace('_', '').replace(' ', '')
+  return HEADER_ALIASES.get(key)
+
+
+def _parse_row(raw):
+  """Map a csv.DictReader row to contact fields"""
+  data = {}
+  for header, value in raw.items():
+    field = _map_header(header)
+    if field and value is not None:
+      data[field] = value.strip()
+
+  if data.get('tags'):
+    data['tags'] = [t.strip() for t in data['tags'].replace(';', ',').split(',') if t.strip()]
+
+  return data
+
+
+@anvil.server.callable
+def start_contact_import(file, update_existing=True, default_tags=None):
+  """
+  Upload a contacts CSV and start importing it in the background.
+
+  Args:
+    file (Media): CSV with a header row (email required; first_name,
+                  last_name, phone, tags, source, notes optional)
+    update_existing (bool): Fill in blank fields and merge tags on existing contacts
+    default_tags (list): Tags added to every imported contact
+
+  Returns:
+    dict: {'success': bool, 'import_id': str} or {'success': False, 'error': str}
+  """
+  try:
+    user = anvil.users.get_user()
+    if not user:
+      return {'success': False, 'error': 'Not authenticated'}
+
+    filename = file.name or 'contacts.csv'
+    if not filename.lower().endswith('.csv'):
+      return {'success': False, 'error': 'Only .csv files are allowed'}
+
+    contact_import = app_tables.contact_imports.add_row(
+      instance_id=user,
+      filename=filename,
+      file=file,
+      options={
+        'update_existing': update_existing,
+        'default_tags': default_tags or []
+      },
+      status='queued',
+      heartbeat_at=datetime.now(),
+      processed_rows=0,
+      created_count=0,
+      updated_count=0,
+      skipped_count=0,
+      error_count=0,
+      created_at=datetime.now()
+    )
+
+    anvil.server.launch_background_task('run_contact_import', contact_import.get_id())
+
+    return {'success': True, 'import_id': contact_import.get_id()}
+
+  except Exception as e:
+    print(f"Error starting contact import: {e}")
+    return {'success': False, 'error': str(e)}
+
+
+@anvil.server.callable
+def get_contact_import_status(import_id):
+  """
+  Get progress of a contact import.
+
+  Returns:
+    dict: {'success': bool, 'import': dict} or {'success': False, 'error': str}
+  """
+  try:
+    user = anvil.users.get_user()
+    if not user:
+      return {'success': False, 'error': 'Not authenticated'}
+
+    contact_import = app_tables.contact_imports.get_by_id(import_id)
+    if not contact_import or contact_import['instance_id'] != user:
+      return {'success': False, 'error': 'Import not found'}
+
+    return {
+      'success': True,
+      'import': {
+        'import_id': import_id,
+        'filename': contact_import['filename'],
+        'status': contact_import['status'],
+        'processed_rows': contact_import['processed_rows'],
+        'created_count': contact_import['created_count'],
+        'updated_count': contact_import['updated_count'],
+        'skipped_count': contact_import['skipped_count'],
+        'error_count': contact_import['error_count'],
+        'error_report': contact_import['error_report'],
+        'last_error': contact_import['last_error'],
+        'started_at': contact_import['started_at'],
+        'completed_at': contact_import['completed_at']
+      }
+    }
+
+  except Exception as e:
+    print(f"Error getting contact import status: {e}")
+    return {'success': False, 'error': str(e)}
+
+
+@anvil.server.callable
+def resume_contact_import(import_id):
+  """Restart a failed or interrupted import from its last committed chunk"""
+  try:
+    user = anvil.users.get_user()
+    if not user:
+      return {'success': False, 'error': 'Not authenticated'}
+
+    contact_import = app_tables.contact_imports.get_by_id(import_id)
+    if not contact_import or contact_import['instance_id'] != user:
+      return {'success': False, 'error': 'Import not found'}
+
+    _requeue(import_id)
+    anvil.server.launch_background_task('run_contact_import', import_id)
+
+    return {'success': True}
+
+  except Exception as e:
+    print(f"Error resuming contact import: {e}")
+    return {'success': False, 'error': str(e)}
+
+
+@tables.in_transaction
+def _requeue(import_id):
+  """Queue an import again unless it is finished or its task is still alive"""
+  # Re-read inside the transaction so two resumes can't both pass the check
+  contact_import = app_tables.contact_imports.get_by_id(import_id)
+  status = contact_import['status']
+
+  if status == 'completed':
+    raise ValueError('Import already completed')
+
+  if status in ['queued', 'running']:
+    heartbeat = contact_import['heartbeat_at'] or contact_import['created_at']
+    if heartbeat and datetime.now() - heartbeat < HEARTBEAT_TIMEOUT:
+      raise ValueError('Import is already in progress')
+
+  contact_import.update(status='queued', heartbeat_at=datetime.now())
+
+
+@anvil.server.background_task
+def run_contact_import(import_id):
+  """Stream an import's CSV and upsert contacts chunk by chunk"""
+  contact_import = app_tables.contact_imports.get_by_id(import_id)
+  if not contact_import or contact_import['status'] == 'completed':
+    return
+
+  contact_import.update(
+    status='running',
+    started_at=contact_import['started_at'] or datetime.now(),
+    heartbeat_at=datetime.now()
+  )
+
+  try:
+    # Rows already committed by an earlier run are skipped
+    resume_from = contact_import['processed_rows'] or 0
+
+    with anvil.media.TempFile(contact_import['file']) as path:
+      with open(path, newline='', encoding='utf-8-sig') as csv_file:
+        reader = csv.DictReader(csv_file)
+
+        if 'email' not in [_map_header(h) for h in (reader.fieldnames or [])]:
+          raise ValueError("CSV must have an email column")
+
+        # Data rows are numbered from 2 (row 1 is the header)
+        numbered = enumerate(reader, start=2)
+        rows = itertools.islice(numbered, resume_from, None)
+
+        while True:
+          chunk = list(itertools.islice(rows, CHUNK_SIZE))
+          if not chunk:
+            break
+          _import_chunk(contact_import, chunk)
+          anvil.server.task_state['processed_rows'] = contact_import['processed_rows']
+
+    contact_import.update(
+      status='completed',
+      error_report=_build_error_report(contact_import),
+      completed_at=datetime.now()
+    )
+
+  except Exception as e:
+    print(f"Error running contact import: {e}")
+    contact_import.update(status='failed', last_error=str(e))
+
+
+@tables.in_transaction
+def _import_chunk(contact_import, chunk):
+  """Validate and upsert one chunk, committing progress with it"""
+  tenant = contact_import['instance_id']
+  options = contact_import['options'] or {}
+  default_tags = options.get('default_tags') or []
+
+  created = updated = skipped = errors = 0
+
+  for row_number, raw in chunk:
+    data = _parse_row(raw)
+
+    problems = validators.validate_contact(data)
+    if problems:
+      errors += 1
+      app_tables.contact_import_errors.add_row(
+        import_id=contact_import,
+        row_number=row_number,
+        email=data.get('email', ''),
+        error='; '.join(problems)
+      )
+      continue
+
+    # Repeated emails (in the file or already in the CRM) resolve to one contact
+    tags = sorted(set((data.get('tags') or []) + default_tags))
+
+    contact, was_created = contact_identity.upsert_contact(tenant, data['email'], {
+      'first_name': data.get('first_name', ''),
+      'last_name': data.get('last_name', ''),
+      'phone': data.get('phone', ''),
+      'source': data.get('source') or 'CSV Import',
+      'tags': tags,
+      'internal_notes': data.get('internal_notes', '')
+    })
+
+    if was_created:
+      created += 1
+    elif options.get('update_existing', True) and _merge_into(contact, data, tags):
+      updated += 1
+    else:
+      skipped += 1
+
+  contact_import.update(
+    processed_rows=(contact_import['processed_rows'] or 0) + len(chunk),
+    created_count=(contact_import['created_count'] or 0) + created,
+    updated_count=(contact_import['updated_count'] or 0) + updated,
+    skipped_count=(contact_import['skipped_count'] or 0) + skipped,
+    error_count=(contact_import['error_count'] or 0) + errors,
+    heartbeat_at=datetime.now()
+  )
+
+
+def _merge_into(contact, data, tags):
+  """
+  Fill blank fields and merge tags on an existing contact.
+
+  Returns:
+    bool: True if anything changed
+  """
+  changes = {}
+
+  for field in ['first_name', 'last_name', 'phone']:
+    if data.get(field) and not contact[field]:
+      changes[field] = data[field]
+
+  merged_tags = sorted(set(contact['tags'] or []) | set(tags))
+  if merged_tags != sorted(contact['tags'] or []):
+    changes['tags'] = merged_tags
+
+  if not changes:
+    return False
+
+  previous = contact_directory.snapshot(contact)
+  contact.update(updated_at=datetime.now(), **changes)
+  contact_directory.on_contact_changed(contact, previous)
+  return True
+
+
+def _build_error_report(contact_import):
+  """CSV Media of the import's row errors, or None if there were none"""
+  if not contact_import['error_count']:
+    return None
+
+  output = io.StringIO()
+  writer = csv.writer(output)
+  writer.writerow(ERROR_REPORT_COLUMNS)
+
+  for error in app_tables.contact_import_errors.search(
+    tables.order_by('row_number'),
+    import_id=contact_import
+  ):
+    writer.writerow([error['row_number'], error['email'], error['error']])
+
+  name = contact_import['filename'].rsplit('.', 1)[0]
+  return anvil.BlobMedia('text/csv', output.getvalue().encode('utf-8'), name=f"{name}-errors.csv")
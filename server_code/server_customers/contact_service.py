@@ -11,66 +11,41 @@ import anvil.tables.query as q
 from anvil.tables import app_tables
 import anvil.server
 from datetime import datetime, timedelta
+from . import contact_directory
+from . import contact_identity
 
 
 ## Function: get_all_contacts()
 
 **Server:** server_customers/contact_service.py  
-**Purpose:** Get all contacts with optional filtering  
-**Returns:** {'success': bool, 'contacts': list} or {'success': False, 'error': str}
+**Purpose:** Get one page of contacts with optional search, tag and status filtering  
+**Parameters:** filters (dict with search, tags, status, lifecycle_stage, fields, page, page_size)  
+**Returns:** {'success': bool, 'contacts': list, 'total': int, 'page': int, 'has_more': bool} or {'success': False, 'error': str}
 
 ```python
 @anvil.server.callable
 def get_all_contacts(filters=None):
-  """Get all contacts with optional filtering"""
+  """Get a page of contacts (see contact_directory.search_directory)"""
   try:
     user = anvil.users.get_user()
     if not user:
       return {'success': False, 'error': 'Not authenticated'}
 
-    # Base query
-    query = {'instance_id': user}
-
-    # Apply filters
-    if filters:
-      if filters.get('status'):
-        query['status'] = filters['status']
-      if filters.get('tags'):
-        # Search for contacts with specific tags
-        # TODO: Implement tag filtering
-        pass
-      if filters.get('search'):
-        search_term = filters['search'].lower()
-        # Search in name and email
-        # TODO: Implement search logic
-        pass
-
-    contacts = app_tables.contacts.search(
-      tables.order_by('last_contact_date', ascending=False),
-      **query
+    filters = filters or {}
+
+    result = contact_directory.search_directory(
+      user,
+      search=filters.get('search'),
+      tags=filters.get('tags'),
+      status=filters.get('status'),
+      lifecycle_stage=filters.get('lifecycle_stage'),
+      fields=filters.get('fields'),
+      page=filters.get('page', 1),
+      page_size=filters.get('page_size', contact_directory.DEFAULT_PAGE_SIZE)
     )
+    result['success'] = True
 
-    # Convert to list with calculated fields
-    contact_list = []
-    for contact in contacts:
-      contact_list.append({
-        'contact_id': contact.get_id(),
-        'first_name': contact['first_name'],
-        'last_name': contact['last_name'],
-        'full_name': f"{contact['first_name']} {contact['last_name']}",
-        'email': contact['email'],
-        'phone': contact['phone'],
-        'status': contact['status'],
-        'total_spent': contact['total_spent'] or 0,
-        'total_transactions': contact['total_transactions'] or 0,
-        'last_contact_date': contact['last_contact_date'],
-        'customer_since': contact['date_added'],
-        'source': contact['source'],
-        'tags': contact['tags'] or [],
-        'lifecycle_stage': contact['lifecycle_stage']
-      })
-
-    return {'success': True, 'contacts': contact_list}
+    return result
 
   except Exception as e:
     print(f"Error getting contacts: {e}")
@@ -167,51 +142,59 @@ def create_contact(contact_data):
     if not contact_data.get('email'):
       return {'success': False, 'error': 'Email is required'}
 
-    # Check for duplicate
-    existing = app_tables.contacts.get(
-      instance_id=user,
-      email=contact_data['email']
-    )
-    if existing:
-      return {'success': False, 'error': 'Contact with this email already exists'}
-
-    # Create contact
-    contact = app_tables.contacts.add_row(
-      instance_id=user,
-      first_name=contact_data['first_name'],
-      last_name=contact_data['last_name'],
-      email=contact_data['email'],
-      phone=contact_data.get('phone', ''),
-      status='Lead',  # New contacts start as leads
-      source=contact_data.get('source', 'Manual Entry'),
-      date_added=datetime.now(),
-      last_contact_date=datetime.now(),
-      total_spent=0,
-      total_transactions=0,
-      average_order_value=0,
-      lifecycle_stage='New',
-      tags=contact_data.get('tags', []),
-      internal_notes=contact_data.get('notes', ''),
-      preferences={},
-      created_at=datetime.now(),
-      updated_at=datetime.now()
-    )
-
-    # Create initial event
-    app_tables.contact_events.add_row(
-      contact_id=contact,
-      event_type='created',
-      event_date=datetime.now(),
-      event_data={'source': contact_data.get('source', 'Manual Entry')},
-      related_id=None,
-      user_visible=True
-    )
+    contact = _add_contact(user, contact_data)
 
     return {'success': True, 'contact_id': contact.get_id()}
 
   except Exception as e:
     print(f"Error creating contact: {e}")
     return {'success': False, 'error': str(e)}
+
+
+@tables.in_transaction
+def _add_contact(user, contact_data):
+  """Add the contact with its directory rows and first event (raises to roll back)"""
+  # Check for duplicate (case/whitespace-insensitive)
+  existing = contact_identity.find_contact(user, contact_data['email'])
+  if existing:
+    raise ValueError('Contact with this email already exists')
+
+  # Create contact
+  contact = app_tables.contacts.add_row(
+    instance_id=user,
+    first_name=contact_data['first_name'],
+    last_name=contact_data['last_name'],
+    email=contact_data['email'].strip(),
+    email_key=contact_identity.normalize_email(contact_data['email']),
+    phone=contact_data.get('phone', ''),
+    status='Lead',  # New contacts start as leads
+    source=contact_data.get('source', 'Manual Entry'),
+    date_added=datetime.now(),
+    last_contact_date=datetime.now(),
+    total_spent=0,
+    total_transactions=0,
+    average_order_value=0,
+    lifecycle_stage='New',
+    tags=contact_data.get('tags', []),
+    internal_notes=contact_data.get('notes', ''),
+    preferences={},
+    created_at=datetime.now(),
+    updated_at=datetime.now()
+  )
+
+  contact_directory.on_contact_changed(contact)
+
+  # Create initial event
+  app_tables.contact_events.add_row(
+    contact_id=contact,
+    event_type='created',
+    event_date=datetime.now(),
+    event_data={'source': contact_data.get('source', 'Manual Entry')},
+    related_id=None,
+    user_visible=True
+  )
+
+  return contact
 ```
 
 ---
@@ -238,12 +221,14 @@ try:
 
     # Update allowed fields
   allowed_fields = ['first_name', 'last_name', 'phone', 'status', 'tags', 'internal_notes', 'preferences']
+  previous = contact_directory.snapshot(contact)
 
   for field, value in updates.items():
     if field in allowed_fields:
       contact[field] = value
 
   contact['updated_at'] = datetime.now()
+  contact_directory.on_contact_changed(contact, previous)
 
   return {'success': True, 'contact': contact}
 
@@ -275,8 +260,10 @@ def delete_contact(contact_id):
       return {'success': False, 'error': 'Contact not found'}
     
     # Soft delete - mark as inactive
+    previous = contact_directory.snapshot(contact)
     contact['status'] = 'Inactive'
     contact['updated_at'] = datetime.now()
+    contact_directory.on_contact_changed(contact, previous)
     
     # Log event
     app_tables.contact_events.add_row(
@@ -342,7 +329,7 @@ def add_note_to_contact(contact_id, note_text):
 ## Function: update_contact_from_transaction()
 
 **Server:** server_customers/contact_service.py  
-**Purpose:** Update contact when transaction occurs (booking/order)  
+**Purpose:** Update contact when transaction occurs (booking/order); retried transactions are ignored  
 **Parameters:** email, transaction_type, transaction_id, amount  
 **Returns:** {'success': bool, 'contact_id': row_id} or error
 
@@ -355,50 +342,13 @@ def update_contact_from_transaction(email, transaction_type, transaction_id, amo
     if not user:
       return {'success': False, 'error': 'Not authenticated'}
     
-    # Get or create contact
-    contact = app_tables.contacts.get(
-      instance_id=user,
-      email=email
-    )
-    
-    if not contact:
-      # Create new contact from transaction
-      contact = app_tables.contacts.add_row(
-        instance_id=user,
-        email=email,
-        first_name='',
-        last_name='',
-        phone='',
-        status='Customer',
-        source=f'{transaction_type}_widget',
-        date_added=datetime.now(),
-        last_contact_date=datetime.now(),
-        total_spent=0,
-        total_transactions=0,
-        average_order_value=0,
-        lifecycle_stage='New',
-        tags=[],
-        internal_notes='',
-        preferences={},
-        created_at=datetime.now(),
-        updated_at=datetime.now()
-      )
-    
-    # Update metrics
-    contact['total_spent'] = (contact['total_spent'] or 0) + amount
-    contact['total_transactions'] = (contact['total_transactions'] or 0) + 1
-    contact['average_order_value'] = contact['total_spent'] / contact['total_transactions']
-    contact['last_contact_date'] = datetime.now()
-    contact['status'] = 'Customer'
-    
-    # Log event
-    app_tables.contact_events.add_row(
-      contact_id=contact,
-      event_type=transaction_type,
-      event_date=datetime.now(),
-      event_data={'amount': amount},
-      related_id=str(transaction_id),
-      user_visible=True
+    # Upsert by normalised email and apply metrics in one transaction
+    contact = contact_identity.record_transaction(
+      user,
+      email,
+      transaction_type,
+      transaction_id,
+      amount
     )
     
     return {'success': True, 'contact_id': contact.get_id()}
@@ -0,0 +1,322 @@
+import anvil.google.auth, anvil.google.drive, anvil.google.mail
+from anvil.google.drive import app_files
+import anvil.stripe
+import anvil.secrets
+import anvil.files
+from anvil.files import data_files
+import anvil.email
+import anvil.users
+import anvil.tables as tables
+import anvil.tables.query as q
+from anvil.tables import app_tables
+import anvil.server
+
+from datetime import datetime
+from ..server_shared.ticket_queue import OPEN_STATUSES
+
+# Customer 360 summary.
+#
+# One `customer_summaries` row per customer holds lifetime spend, a count
+# per entity type, first/last activity and the open-ticket count. Writers
+# call record() / forget() / on_ticket_status_changed() in the same
+# transaction as the write, so opening a profile reads one row instead of
+# the customer's whole order, booking, ticket and review history.
+
+# Rows returned by each profile tab
+TAB_LIMIT = 10
+
+# Entity type -> summary count column
+COUNT_COLUMNS = {
+  'order': 'orders_count',
+  'booking': 'bookings_count',
+  'ticket': 'tickets_count',
+  'review': 'reviews_count'
+}
+
+
+def _entity_tables():
+  """Source tables keyed by entity type"""
+  return {
+    'order': app_tables.orders,
+    'booking': app_tables.tbl_bookings,
+    'ticket': app_tables.support_tickets,
+    'review': app_tables.reviews
+  }
+
+
+def _empty_summary():
+  """Column values for a customer with no activity"""
+  values = {column: 0 for column in COUNT_COLUMNS.values()}
+  values.update(
+    total_spent=0,
+    open_tickets_count=0,
+    first_activity_at=None,
+    last_activity_at=None
+  )
+  return values
+
+
+def _get_or_create(customer):
+  """Get a customer's summary row, creating an empty one if missing"""
+  row = app_tables.customer_summaries.get(customer_id=customer)
+  if not row:
+    row = app_tables.customer_summaries.add_row(
+      customer_id=customer,
+      updated_at=datetime.now(),
+      **_empty_summary()
+    )
+  return row
+
+
+def _spend(entity, row):
+  """Lifetime spend contributed by one entity row"""
+  if entity != 'order':
+    return 0
+  return row['total_amount'] or 0
+
+
+def _is_open_ticket(entity, status):
+  """Whether a row counts towards open_tickets_count"""
+  return entity == 'ticket' and status in OPEN_STATUSES
+
+
+def record(entity, row, customer=None):
+  """
+  Add a newly created order, booking, ticket or review to its customer's summary.
+
+  Args:
+    entity (str): 'order', 'booking', 'ticket' or 'review'
+    row (Row): Created row
+    customer (Row): Customer to credit (defaults to row['customer_id'])
+  """
+  customer = customer or row['customer_id']
+  if not customer:
+    return
+
+  summary = _get_or_create(customer)
+  at = row['created_at'] or datetime.now()
+  column = COUNT_COLUMNS[entity]
+
+  updates = {
+    column: (summary[column] or 0) + 1,
+    'total_spent': (summary['total_spent'] or 0) + _spend(entity, row),
+    'updated_at': datetime.now()
+  }
+
+  if _is_open_ticket(entity, row['status']):
+    updates['open_tickets_count'] = (summary['open_tickets_count'] or 0) + 1
+
+  if not summary['first_activity_at'] or at < summary['first_activity_at']:
+    updates['first_activity_at'] = at
+  if not summary['last_activity_at'] or at > summary['last_activity_at']:
+    updates['last_activity_at'] = at
+
+  summary.update(**updates)
+
+
+def forget(entity, row, customer=None):
+  """
+  Remove a row's contribution before deleting it (or moving it to another customer).
+
+  First/last activity are left as they are; rebuild_customer_summaries
+  recomputes them.
+
+  Args:
+    entity (str): 'order', 'booking', 'ticket' or 'review'
+    row (Row): Row being removed
+    customer (Row): Customer to debit (defaults to row['customer_id'])
+  """
+  customer = customer or row['customer_id']
+  if not customer:
+    return
+
+  summary = app_tables.customer_summaries.get(customer_id=customer)
+  if not summary:
+    return
+
+  column = COUNT_COLUMNS[entity]
+  updates = {
+    column: max((summary[column] or 0) - 1, 0),
+    'total_spent': (summary['total_spent'] or 0) - _spend(entity, row),
+    'updated_at': datetime.now()
+  }
+
+  if _is_open_ticket(entity, row['status']):
+    updates['open_tickets_count'] = max((summary['open_tickets_count'] or 0) - 1, 0)
+
+  summary.update(**updates)
+
+
+def on_ticket_status_changed(ticket, previous_status):
+  """
+  Keep the open-ticket count in step after a ticket's status changes.
+
+  Args:
+    ticket (Row): Updated ticket
+    previous_status (str): Status before the change
+  """
+  was_open = previous_status in OPEN_STATUSES
+  is_open = ticket['status'] in OPEN_STATUSES
+
+  if was_open == is_open or not ticket['customer_id']:
+    return
+
+  summary = _get_or_create(ticket['customer_id'])
+  delta = 1 if is_open else -1
+  summary.update(
+    open_tickets_count=max((summary['open_tickets_count'] or 0) + delta, 0),
+    updated_at=datetime.now()
+  )
+
+
+def get_summary(customer):
+  """
+  Get a customer's 360 summary.
+
+  Customers without a summary row yet (created before the read model
+  existed) are computed once and stored.
+
+  Args:
+    customer (Row): Customer user row
+
+  Returns:
+    dict: Summary values
+  """
+  row = app_tables.customer_summaries.get(customer_id=customer)
+
+  if not row:
+    row = _store_summary(customer)
+
+  return {
+    'orders_count': row['orders_count'] or 0,
+    'total_spent': row['total_spent'] or 0,
+    'bookings_count': row['bookings_count'] or 0,
+    'tickets_count': row['tickets_count'] or 0,
+    'open_tickets_count': row['open_tickets_count'] or 0,
+    'reviews_count': row['reviews_count'] or 0,
+    'first_activity_at': row['first_activity_at'],
+    'last_activity_at': row['last_activity_at']
+  }
+
+
+@tables.in_transaction
+def _store_summary(customer):
+  """
+  Compute and save a customer's summary row.
+
+  The lookup and the write share one transaction, so concurrent first
+  views (or a rebuild) never leave two rows for the customer.
+
+  Returns:
+    Row: customer_summaries row
+  """
+  values = dict(compute_summary(customer), updated_at=datetime.now())
+
+  # Search rather than get() so duplicates from before this fix are cleared
+  rows = list(app_tables.customer_summaries.search(customer_id=customer))
+  for extra in rows[1:]:
+    extra.delete()
+
+  if rows:
+    rows[0].update(**values)
+    return rows[0]
+  return app_tables.customer_summaries.add_row(customer_id=customer, **values)
+
+
+def compute_summary(customer):
+  """
+  Compute a customer's summary from the source tables.
+
+  Counts use len() on the search so rows are not loaded; only order
+  totals and the oldest/newest row of each type are fetched.
+
+  Args:
+    customer (Row): Customer user row
+
+  Returns:
+    dict: Column values for customer_summaries
+  """
+  values = _empty_summary()
+  first_seen = []
+  last_seen = []
+
+  for entity, table in _entity_tables().items():
+    rows = table.search(customer_id=customer)
+    values[COUNT_COLUMNS[entity]] = len(rows)
+
+    if not len(rows):
+      continue
+
+    oldest = table.search(
+      q.fetch_only('created_at'),
+      tables.order_by('created_at'),
+      customer_id=customer
+    )[:1]
+    newest = table.search(
+      q.fetch_only('created_at'),
+      tables.order_by('created_at', ascending=False),
+      customer_id=customer
+    )[:1]
+    first_seen += [r['created_at'] for r in oldest if r['created_at']]
+    last_seen += [r['created_at'] for r in newest if r['created_at']]
+
+  values['total_spent'] = sum(
+    o['total_amount'] or 0
+    for o in app_tables.orders.search(q.fetch_only('total_amount'), customer_id=customer)
+  )
+  values['open_tickets_count'] = len(app_tables.support_tickets.search(
+    customer_id=customer,
+    status=q.any_of(*OPEN_STATUSES)
+  ))
+  values['first_activity_at'] = min(first_seen) if first_seen else None
+  values['last_activity_at'] = max(last_seen) if last_seen else None
+
+  return values
+
+
+def latest(entity, customer, order_column='created_at', limit=TAB_LIMIT, columns=None):
+  """
+  Get a customer's most recent rows of one type for a profile tab.
+
+  Args:
+    entity (str): 'order', 'booking', 'ticket' or 'review'
+    customer (Row): Customer user row
+    order_column (str): Column to sort newest-first by
+    limit (int): Rows to return
+    columns (list): Columns to fetch (None for all)
+
+  Returns:
+    list: Rows, newest first
+  """
+  table = _entity_tables()[entity]
+  args = [tables.order_by(order_column, ascending=False)]
+  if columns:
+    args.insert(0, q.fetch_only(*columns))
+
+  return list(table.search(*args, customer_id=customer)[:limit])
+
+
+@anvil.server.background_task
+def rebuild_customer_summaries():
+  """
+  Recompute every customer summary from the source tables.
+
+  Each customer is recomputed and upserted in its own transaction, so
+  record() calls made while the rebuild runs are never lost.
+  """
+  customers = {}
+
+  for table in _entity_tables().values():
+    for row in table.search(q.fetch_only('customer_id')):
+      if row['customer_id']:
+        customers[row['customer_id'].get_id()] = row['customer_id']
+
+  # Customers whose rows have all been deleted still need resetting
+  for row in app_tables.customer_summaries.search(q.fetch_only('customer_id')):
+    if row['customer_id']:
+      customers[row['customer_id'].get_id()] = row['customer_id']
+
+  for customer in customers.values():
+    _store_summary(customer)
+
+  print(f"Rebuilt summaries for {len(customers)} customers")
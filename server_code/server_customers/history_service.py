@@ -11,15 +11,353 @@ import anvil.tables.query as q
 from anvil.tables import app_tables
 import anvil.server
 
-# This is a server module. It runs on the Anvil server,
-# rather than in the user's browser.
-#
-# To allow anvil.server.call() to call functions here, we mark
-# them with @anvil.server.callable.
-# Here is an example - you can replace it with your own:
-#
-# @anvil.server.callable
-# def say_hello(name):
-#   print("Hello, " + name + "!")
-#   return 42
+from datetime import datetime
+
+# Guest history.
 #
+# Stay statistics live in one `guest_stats` row per guest and are updated
+# by record_stay() when a guest checks out, so opening a guest's history
+# does not walk every booking they ever made. Bookings and notes are
+# served a page at a time.
+
+# Booking statuses that count as a completed stay
+STAY_STATUSES = ['checked_out', 'completed']
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+STAFF_ROLES = ['owner', 'manager', 'staff']
+
+
+def _nights(booking):
+  """Nights between a booking's start and end dates"""
+  if not booking['start_datetime'] or not booking['end_datetime']:
+    return 0
+  return max((booking['end_datetime'].date() - booking['start_datetime'].date()).days, 0)
+
+
+def _revenue(booking):
+  """Amount a stay contributed (final checkout amount when known)"""
+  if booking['final_amount'] is not None:
+    return booking['final_amount']
+  return booking['total_amount'] or 0
+
+
+def _room_name(booking):
+  """Room number of a booking's resource, if any"""
+  room = booking['resource_id']
+  return room['room_number'] if room else None
+
+
+def _empty_stats():
+  """Stats for a guest with no completed stays"""
+  return {
+    'total_stays': 0,
+    'total_nights': 0,
+    'total_revenue': 0,
+    'last_visit': None,
+    'room_counts': {}
+  }
+
+
+def _add_stay(stats, booking):
+  """Add one stay to a stats dict in place"""
+  stats['total_stays'] += 1
+  stats['total_nights'] += _nights(booking)
+  stats['total_revenue'] += _revenue(booking)
+
+  start = booking['start_datetime']
+  if start and (not stats['last_visit'] or start > stats['last_visit']):
+    stats['last_visit'] = start
+
+  room = _room_name(booking)
+  if room:
+    stats['room_counts'][room] = stats['room_counts'].get(room, 0) + 1
+
+
+def _stay_bookings(guest=None):
+  """Completed stays, fetching only the columns the stats need"""
+  query = {'status': q.any_of(*STAY_STATUSES)}
+  if guest is not None:
+    query['customer_id'] = guest
+
+  return app_tables.tbl_bookings.search(
+    q.fetch_only(
+      'customer_id', 'start_datetime', 'end_datetime', 'final_amount', 'total_amount',
+      resource_id=q.fetch_only('room_number')
+    ),
+    **query
+  )
+
+
+def record_stay(booking):
+  """
+  Add a checked-out booking to its guest's stay statistics.
+
+  Call in the same transaction as the check-out.
+
+  Args:
+    booking (Row): Booking that has just been checked out
+  """
+  guest = booking['customer_id']
+  if not guest:
+    return
+
+  row = app_tables.guest_stats.get(guest_id=guest)
+  if not row:
+    # First stay seen for this guest - compute from history (includes this one)
+    _store_stats(guest)
+    return
+
+  stats = {
+    'total_stays': row['total_stays'] or 0,
+    'total_nights': row['total_nights'] or 0,
+    'total_revenue': row['total_revenue'] or 0,
+    'last_visit': row['last_visit'],
+    'room_counts': dict(row['room_counts'] or {})
+  }
+  _add_stay(stats, booking)
+
+  row.update(updated_at=datetime.now(), **stats)
+
+
+def compute_stats(guest):
+  """
+  Compute a guest's stay statistics from their completed bookings.
+
+  Args:
+    guest (Row): Guest user row
+
+  Returns:
+    dict: total_stays, total_nights, total_revenue, last_visit, room_counts
+  """
+  stats = _empty_stats()
+  for booking in _stay_bookings(guest):
+    _add_stay(stats, booking)
+  return stats
+
+
+@tables.in_transaction
+def _store_stats(guest):
+  """
+  Compute and save a guest's stats row.
+
+  The lookup and the write share one transaction, so concurrent first
+  views (or a check-out during a rebuild) never leave two rows.
+  """
+  stats = dict(compute_stats(guest), updated_at=datetime.now())
+
+  # Search rather than get() so duplicates from before this fix are cleared
+  rows = list(app_tables.guest_stats.search(guest_id=guest))
+  for extra in rows[1:]:
+    extra.delete()
+
+  if rows:
+    rows[0].update(**stats)
+    return rows[0]
+  return app_tables.guest_stats.add_row(guest_id=guest, **stats)
+
+
+def get_stats(guest):
+  """
+  Get a guest's stay statistics, computing them once if missing.
+
+  Args:
+    guest (Row): Guest user row
+
+  Returns:
+    dict: {'total_stays', 'total_nights', 'total_revenue', 'last_visit', 'favorite_room'}
+  """
+  row = app_tables.guest_stats.get(guest_id=guest)
+  if not row:
+    row = _store_stats(guest)
+
+  room_counts = row['room_counts'] or {}
+  favorite_room = max(room_counts.items(), key=lambda x: x[1])[0] if room_counts else 'None'
+
+  return {
+    'total_stays': row['total_stays'] or 0,
+    'total_nights': row['total_nights'] or 0,
+    'total_revenue': row['total_revenue'] or 0,
+    'last_visit': row['last_visit'],
+    'favorite_room': favorite_room
+  }
+
+
+def _page_bounds(page, page_size):
+  """Normalise page arguments to (page, page_size, start)"""
+  page = max(int(page or 1), 1)
+  page_size = max(1, min(int(page_size or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+  return page, page_size, (page - 1) * page_size
+
+
+def booking_page(guest, page=1, page_size=DEFAULT_PAGE_SIZE):
+  """
+  Get one page of a guest's bookings, newest first.
+
+  Args:
+    guest (Row): Guest user row
+    page (int): 1-based page number
+    page_size (int): Bookings per page (capped at MAX_PAGE_SIZE)
+
+  Returns:
+    dict: {'bookings': list, 'total': int, 'page': int, 'has_more': bool}
+  """
+  page, page_size, start = _page_bounds(page, page_size)
+
+  results = app_tables.tbl_bookings.search(
+    q.fetch_only(
+      'start_datetime', 'end_datetime', 'total_amount', 'status',
+      resource_id=q.fetch_only('room_number')
+    ),
+    tables.order_by('start_datetime', ascending=False),
+    customer_id=guest
+  )
+  total = len(results)
+
+  bookings = [{
+    'start_date': b['start_datetime'],
+    'end_date': b['end_datetime'],
+    'nights': _nights(b),
+    'room_name': _room_name(b) or 'Unknown',
+    'amount': b['total_amount'] or 0,
+    'status': b['status']
+  } for b in results[start:start + page_size]]
+
+  return {
+    'bookings': bookings,
+    'total': total,
+    'page': page,
+    'has_more': start + page_size < total
+  }
+
+
+def note_page(guest, include_confidential=False, page=1, page_size=DEFAULT_PAGE_SIZE):
+  """
+  Get one page of a guest's notes, newest first.
+
+  Args:
+    guest (Row): Guest user row
+    include_confidential (bool): Include confidential notes
+    page (int): 1-based page number
+    page_size (int): Notes per page (capped at MAX_PAGE_SIZE)
+
+  Returns:
+    dict: {'notes': list, 'total': int, 'page': int, 'has_more': bool}
+  """
+  page, page_size, start = _page_bounds(page, page_size)
+
+  query = {'customer_id': guest}
+  if not include_confidential:
+    query['is_confidential'] = q.not_(True)
+
+  results = app_tables.tbl_client_notes.search(
+    q.fetch_only('note', 'created_at'),
+    tables.order_by('created_at', ascending=False),
+    **query
+  )
+  total = len(results)
+
+  notes = [{
+    'note': n['note'],
+    'created_at': n['created_at']
+  } for n in results[start:start + page_size]]
+
+  return {
+    'notes': notes,
+    'total': total,
+    'page': page,
+    'has_more': start + page_size < total
+  }
+
+
+@anvil.server.callable
+@anvil.users.login_required
+def get_guest_bookings(guest_id, page=1, page_size=DEFAULT_PAGE_SIZE):
+  """
+  Get a page of a guest's booking history.
+
+  Args:
+    guest_id (str): Guest user ID
+    page (int): 1-based page number
+    page_size (int): Bookings per page
+
+  Returns:
+    dict: {'success': bool, 'data': dict} or {'success': bool, 'error': str}
+  """
+  try:
+    user = anvil.users.get_user()
+
+    if user['role'] not in STAFF_ROLES:
+      return {'success': False, 'error': 'Access denied'}
+
+    guest = app_tables.users.get_by_id(guest_id)
+
+    if not guest:
+      return {'success': False, 'error': 'Guest not found'}
+
+    return {'success': True, 'data': booking_page(guest, page, page_size)}
+
+  except Exception as e:
+    print(f"Error getting guest bookings: {e}")
+    return {'success': False, 'error': str(e)}
+
+
+@anvil.server.callable
+@anvil.users.login_required
+def get_guest_notes(guest_id, page=1, page_size=DEFAULT_PAGE_SIZE):
+  """
+  Get a page of a guest's notes.
+
+  Confidential notes are only included for owners and managers.
+
+  Args:
+    guest_id (str): Guest user ID
+    page (int): 1-based page number
+    page_size (int): Notes per page
+
+  Returns:
+    dict: {'success': bool, 'data': dict} or {'success': bool, 'error': str}
+  """
+  try:
+    user = anvil.users.get_user()
+
+    if user['role'] not in STAFF_ROLES:
+      return {'success': False, 'error': 'Access denied'}
+
+    guest = app_tables.users.get_by_id(guest_id)
+
+    if not guest:
+      return {'success': False, 'error': 'Guest not found'}
+
+    include_confidential = user['role'] in ['owner', 'manager']
+    return {'success': True, 'data': note_page(guest, include_confidential, page, page_size)}
+
+  except Exception as e:
+    print(f"Error getting guest notes: {e}")
+    return {'success': False, 'error': str(e)}
+
+
+@anvil.server.background_task
+def rebuild_guest_stats():
+  """
+  Recompute every guest's stay statistics.
+
+  Each guest is recomputed and upserted in its own transaction, so stays
+  recorded at check-out while the rebuild runs are never lost.
+  """
+  guests = {}
+
+  for booking in _stay_bookings():
+    if booking['customer_id']:
+      guests[booking['customer_id'].get_id()] = booking['customer_id']
+
+  # Guests whose stays no longer count still need resetting
+  for row in app_tables.guest_stats.search(q.fetch_only('guest_id')):
+    if row['guest_id']:
+      guests[row['guest_id'].get_id()] = row['guest_id']
+
+  for guest in guests.values():
+    _store_stats(guest)
+
+  print(f"Rebuilt stay statistics for {len(guests)} guests")
@@ -0,0 +1,328 @@
+import anvil.google.auth, anvil.google.drive, anvil.google.mail
+from anvil.google.drive import app_files
+import anvil.stripe
+import anvil.secrets
+import anvil.files
+from anvil.files import data_files
+import anvil.email
+import anvil.users
+import anvil.tables as tables
+import anvil.tables.query as q
+from anvil.tables import app_tables
+import anvil.server
+
+from datetime import datetime
+from ..server_shared import config as config_cache
+
+# Client portal data.
+#
+# The portal shows upcoming bookings plus the most recent page of past
+# bookings, invoices and shared documents; older pages are loaded with a
+# backwards cursor (the sort value of the last row shown). Linked services
+# and staff are fetched inside the booking search with nested fetch_only,
+# so a page costs one query instead of one per booking. The booking
+# sections of the first-load payload are cached per customer and dropped
+# whenever one of their bookings changes. The cache is per server process
+# and only booking writers invalidate it, so invoices and shared documents
+# are always read fresh.
+
+PORTAL_PAGE_SIZE = 5
+MAX_PAGE_SIZE = 50
+UPCOMING_LIMIT = 20
+
+# Seconds a customer's portal payload is reused
+PORTAL_CACHE_TTL = 120
+
+UPCOMING_STATUSES = ['pending', 'confirmed']
+PAST_STATUSES = ['completed', 'cancelled']
+
+
+def _cache_key(user):
+  """Cache key for a customer's cached booking sections"""
+  return f"portal:{user.get_id()}"
+
+
+def invalidate(customer):
+  """
+  Drop a customer's cached booking sections.
+
+  Call after creating or changing one of the customer's bookings.
+
+  Args:
+    customer (Row): Customer user row (None is ignored)
+  """
+  if customer:
+    config_cache.drop_cached(_cache_key(customer))
+
+
+def _linked(row, column, field, default):
+  """Value of a field on a linked row, or default when the link is empty"""
+  linked = row[column]
+  if not linked:
+    return default
+  return linked[field] or default
+
+
+def _booking_fetch():
+  """Booking columns the portal shows, with linked service and staff"""
+  return q.fetch_only(
+    'start_datetime', 'status',
+    service_id=q.fetch_only('service_name'),
+    staff_id=q.fetch_only('email')
+  )
+
+
+def _limit(limit):
+  """Clamp a requested page size"""
+  return max(1, min(int(limit or PORTAL_PAGE_SIZE), MAX_PAGE_SIZE))
+
+
+def _page(table, order_column, fetch, to_item, query, before=None, limit=PORTAL_PAGE_SIZE):
+  """
+  Load one newest-first page with a backwards cursor.
+
+  Args:
+    table: App table to search
+    order_column (str): Date column to sort and page by
+    fetch: q.fetch_only(...) for the columns to_item reads
+    to_item (callable): Row -> dict for the client
+    query (dict): Search kwargs
+    before (datetime): next_cursor of the previous page
+    limit (int): Page size
+
+  Returns:
+    dict: {'items': list, 'next_cursor': datetime or None}
+  """
+  limit = _limit(limit)
+  query = dict(query)
+  if before:
+    query[order_column] = q.less_than(before)
+
+  # Fetch one extra row to know whether another page exists
+  rows = list(table.search(
+    fetch,
+    tables.order_by(order_column, ascending=False),
+    **query
+  )[:limit + 1])
+
+  has_more = len(rows) > limit
+  rows = rows[:limit]
+
+  return {
+    'items': [to_item(r) for r in rows],
+    'next_cursor': rows[-1][order_column] if has_more else None
+  }
+
+
+def _upcoming_item(booking):
+  """Upcoming appointment row for the portal"""
+  return {
+    'booking_id': booking.get_id(),
+    'datetime': booking['start_datetime'],
+    'service_name': _linked(booking, 'service_id', 'service_name', 'Appointment'),
+    'staff_name': _linked(booking, 'staff_id', 'email', 'Staff').split('@')[0]
+  }
+
+
+def _past_item(booking):
+  """Past appointment row for the portal"""
+  return {
+    'datetime': booking['start_datetime'],
+    'service_name': _linked(booking, 'service_id', 'service_name', 'Appointment'),
+    'status': booking['status']
+  }
+
+
+def _invoice_item(invoice):
+  """Invoice row for the portal; the PDF is fetched with invoice_service.get_invoice_pdf(invoice_id)"""
+  return {
+    'invoice_id': invoice.get_id(),
+    'number': invoice['invoice_number'],
+    'date': invoice['invoice_date'],
+    'amount': invoice['total_amount'] or 0,
+    'status': invoice['status'] or 'draft',
+    'has_pdf': True
+  }
+
+
+def _document_item(document):
+  """Shared document row for the portal"""
+  return {
+    'name': document['name'],
+    'shared_date': document['shared_at'],
+    'file': document['file']
+  }
+
+
+def upcoming_bookings(user):
+  """
+  Get a customer's next bookings, soonest first.
+
+  Args:
+    user (Row): Customer user row
+
+  Returns:
+    list: Upcoming booking dicts (at most UPCOMING_LIMIT)
+  """
+  bookings = app_tables.tbl_bookings.search(
+    _booking_fetch(),
+    tables.order_by('start_datetime'),
+    customer_id=user,
+    status=q.any_of(*UPCOMING_STATUSES),
+    start_datetime=q.greater_than(datetime.now())
+  )[:UPCOMING_LIMIT]
+
+  return [_upcoming_item(b) for b in bookings]
+
+
+def past_bookings_page(user, before=None, limit=PORTAL_PAGE_SIZE):
+  """
+  Get one page of a customer's completed or cancelled bookings.
+
+  Args:
+    user (Row): Customer user row
+    before (datetime): Cursor from the previous page
+    limit (int): Page size
+
+  Returns:
+    dict: {'items': list, 'next_cursor': datetime or None}
+  """
+  return _page(
+    app_tables.tbl_bookings, 'start_datetime', _booking_fetch(), _past_item,
+    {'customer_id': user, 'status': q.any_of(*PAST_STATUSES)},
+    before, limit
+  )
+
+
+def invoices_page(user, before=None, limit=PORTAL_PAGE_SIZE):
+  """
+  Get one page of a customer's invoices.
+
+  Invoices link to the customers record, which is looked up from the user.
+
+  Args:
+    user (Row): Customer user row
+    before (datetime): Cursor from the previous page
+    limit (int): Page size
+
+  Returns:
+    dict: {'items': list, 'next_cursor': datetime or None}
+  """
+  customer = app_tables.customers.get(user_id=user)
+  if not customer:
+    return {'items': [], 'next_cursor': None}
+
+  return _page(
+    app_tables.invoice, 'invoice_date',
+    q.fetch_only('invoice_number', 'invoice_date', 'total_amount', 'status'),
+    _invoice_item,
+    {'customer_id': customer},
+    before, limit
+  )
+
+
+def documents_page(user, before=None, limit=PORTAL_PAGE_SIZE):
+  """
+  Get one page of documents shared with a customer.
+
+  Args:
+    user (Row): Customer user row
+    before (datetime): Cursor from the previous page
+    limit (int): Page size
+
+  Returns:
+    dict: {'items': list, 'next_cursor': datetime or None}
+  """
+  return _page(
+    app_tables.shared_documents, 'shared_at',
+    q.fetch_only('name', 'shared_at', 'file'),
+    _document_item,
+    {'customer_id': user},
+    before, limit
+  )
+
+
+def build_booking_sections(user):
+  """
+  Build the booking sections of the first-load portal payload.
+
+  Args:
+    user (Row): Customer user row
+
+  Returns:
+    dict: upcoming list plus the first page of past bookings and its cursor
+  """
+  past = past_bookings_page(user)
+
+  return {
+    'upcoming': upcoming_bookings(user),
+    'past': past['items'],
+    'past_cursor': past['next_cursor']
+  }
+
+
+def get_portal_data(user):
+  """
+  Get the first-load portal payload for a customer.
+
+  Booking sections come from cache when possible; invoices and documents
+  are always loaded.
+
+  Args:
+    user (Row): Customer user row
+
+  Returns:
+    dict: Booking sections plus invoices/documents first pages and their cursors
+  """
+  data = dict(config_cache.get_cached(
+    _cache_key(user),
+    lambda: build_booking_sections(user),
+    ttl=PORTAL_CACHE_TTL
+  ))
+
+  invoices = invoices_page(user)
+  documents = documents_page(user)
+
+  data.update(
+    invoices=invoices['items'],
+    invoices_cursor=invoices['next_cursor'],
+    documents=documents['items'],
+    documents_cursor=documents['next_cursor']
+  )
+  return data
+
+
+PAGE_LOADERS = {
+  'past': past_bookings_page,
+  'invoices': invoices_page,
+  'documents': documents_page
+}
+
+
+@anvil.server.callable
+@anvil.users.login_required
+def get_portal_page(section, before=None, limit=PORTAL_PAGE_SIZE):
+  """
+  Get the next page of a client portal section for the current user.
+
+  Args:
+    section (str): 'past', 'invoices' or 'documents'
+    before (datetime): Cursor returned with the previous page
+    limit (int): Page size
+
+  Returns:
+    dict: {'success': bool, 'data': {'items': list, 'next_cursor': datetime or None}}
+          or {'success': bool, 'error': str}
+  """
+  try:
+    loader = PAGE_LOADERS.get(section)
+
+    if not loader:
+      return {'success': False, 'error': f'Unknown portal section: {section}'}
+
+    user = anvil.users.get_user()
+    return {'success': True, 'data': loader(user, before, limit)}
+
+  except Exception as e:
+    print(f"Error getting portal page: {e}")
+    return {'success': False, 'error': str(e)}
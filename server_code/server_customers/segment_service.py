@@ -36,7 +36,8 @@ def create_segment(segment_data):
       filter_criteria=segment_data['filter_criteria'],
       contact_count=0,
       is_active=True,
-      created_date=datetime.now()
+      created_date=datetime.now(),
+      updated_at=datetime.now()
     )
 
     # Calculate initial count
@@ -136,6 +137,7 @@ def get_segment_count(segment_id):
     try:
     count = get_segment_count(segment.get_id())
     segment['contact_count'] = count
+    segment['updated_at'] = datetime.now()
 except Exception as e:
 print(f"Error updating segment count: {e}")
 ```
@@ -11,15 +11,99 @@ import anvil.tables.query as q
 from anvil.tables import app_tables
 import anvil.server
 
-# This is a server module. It runs on the Anvil server,
-# rather than in the user's browser.
-#
-# To allow anvil.server.call() to call functions here, we mark
-# them with @anvil.server.callable.
-# Here is an example - you can replace it with your own:
-#
-# @anvil.server.callable
-# def say_hello(name):
-#   print("Hello, " + name + "!")
-#   return 42
+from datetime import datetime
+from ..server_shared import config as config_cache
+
+# Transactional email.
 #
+# send_email() records every send in `email_log`. When an idempotency key
+# is given, the key is claimed in its own transaction before the message
+# goes out, so a retried job (or two workers racing on the same job)
+# sends at most once.
+
+SENT = 'sent'
+DUPLICATE = 'duplicate'
+FAILED = 'failed'
+
+# A claim left in 'sending' means a worker died mid-send; the message may
+# or may not have been delivered, so it is never retried automatically.
+SENDING = 'sending'
+
+
+@tables.in_transaction
+def _claim(idempotency_key, recipient, subject, template_id):
+  """
+  Claim an idempotency key.
+
+  Returns:
+    Row or None: email_log row to complete, or None if the key was already
+    sent (or is being sent)
+  """
+  log = app_tables.email_log.get(idempotency_key=idempotency_key)
+
+  if log and log['status'] in [SENT, SENDING]:
+    return None
+
+  if log:
+    # Previous attempt failed before the provider accepted it - retry
+    log.update(status=SENDING, error_message=None, sent_at=None)
+    return log
+
+  return app_tables.email_log.add_row(
+    idempotency_key=idempotency_key,
+    recipient=recipient,
+    subject=subject,
+    template_id=template_id,
+    status=SENDING
+  )
+
+
+def _from_name():
+  """Sender name from the business profile"""
+  profile = config_cache.get_config_value('business_profile') or {}
+  return profile.get('business_name')
+
+
+def send_email(to, subject, text, html=None, idempotency_key=None, template_id=None):
+  """
+  Send a transactional email.
+
+  Args:
+    to (str): Recipient address
+    subject (str): Subject line
+    text (str): Plain-text body
+    html (str): Optional HTML body
+    idempotency_key (str): Unique key for this message; a second call with
+      the same key does not send again
+    template_id (str): Template reference recorded in the log
+
+  Returns:
+    str: SENT, DUPLICATE or FAILED
+  """
+  if idempotency_key:
+    log = _claim(idempotency_key, to, subject, template_id)
+    if log is None:
+      return DUPLICATE
+  else:
+    log = app_tables.email_log.add_row(
+      recipient=to,
+      subject=subject,
+      template_id=template_id,
+      status=SENDING
+    )
+
+  try:
+    anvil.email.send(
+      to=to,
+      subject=subject,
+      text=text,
+      html=html,
+      from_name=_from_name()
+    )
+  except Exception as e:
+    print(f"Error sending email to {to}: {e}")
+    log.update(status=FAILED, error_message=str(e))
+    return FAILED
+
+  log.update(status=SENT, sent_at=datetime.now())
+  return SENT
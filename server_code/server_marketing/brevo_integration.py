@@ -10,6 +10,7 @@ import anvil.tables as tables
 import anvil.tables.query as q
 from anvil.tables import app_tables
 import anvil.server
+from . import campaign_metrics
 
 # This is a server module. It runs on the Anvil server,
 # MODULE 6: server_marketing/brevo_integration.py
@@ -105,10 +106,8 @@ import anvil.server
     if campaign_tag.startswith('campaign_'):
       campaign_id = campaign_tag.replace('campaign_', '')
       
-      # Update campaign stats
-      campaign = app_tables.email_campaigns.get_by_id(campaign_id)
-      if campaign:
-        campaign['opens'] = (campaign['opens'] or 0) + 1
+      # Queue the counter update (applied in batches by flush_campaign_engagement)
+      campaign_metrics.queue_engagement(campaign_id, 'open')
       
       # Log event
       contact = app_tables.contacts.get(email=email)
@@ -148,10 +147,8 @@ def track_email_click(webhook_data):
     if campaign_tag.startswith('campaign_'):
       campaign_id = campaign_tag.replace('campaign_', '')
       
-      # Update campaign stats
-      campaign = app_tables.email_campaigns.get_by_id(campaign_id)
-      if campaign:
-        campaign['clicks'] = (campaign['clicks'] or 0) + 1
+      # Queue the counter update (applied in batches by flush_campaign_engagement)
+      campaign_metrics.queue_engagement(campaign_id, 'click')
       
       # Log event
       contact = app_tables.contacts.get(email=email)
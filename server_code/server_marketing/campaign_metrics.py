@@ -0,0 +1,225 @@
+import anvil.google.auth, anvil.google.drive, anvil.google.mail
+from anvil.google.drive import app_files
+import anvil.stripe
+import anvil.secrets
+import anvil.files
+from anvil.files import data_files
+import anvil.email
+import anvil.users
+import anvil.tables as tables
+import anvil.tables.query as q
+from anvil.tables import app_tables
+import anvil.server
+
+from datetime import datetime
+
+# Campaign metrics store.
+#
+# One `campaign_metrics` row per campaign holds enrollment counters by
+# status, updated in the same transaction as the enrollment change, so
+# stats are a single row read instead of four enrollment scans.
+#
+# Open/click webhooks append to `campaign_engagement_events` and the
+# flush_campaign_engagement task folds them into email_campaigns in
+# batches, so concurrent webhooks never race on the campaign row.
+# Payment webhooks queue 'conversion' events the same way.
+
+# Enrollment status -> counter column
+STATUS_COLUMNS = {
+  'Active': 'active',
+  'Completed': 'completed',
+  'Unsubscribed': 'unsubscribed'
+}
+
+# Engagement event type -> email_campaigns column
+ENGAGEMENT_COLUMNS = {
+  'open': 'opens',
+  'click': 'clicks',
+  'conversion': 'conversions'
+}
+
+FLUSH_BATCH_SIZE = 500
+
+
+def get_metrics_row(campaign):
+  """
+  Get a campaign's metrics row, creating it empty if missing.
+
+  Args:
+    campaign (Row): email_campaigns row
+
+  Returns:
+    Row: campaign_metrics row
+  """
+  row = app_tables.campaign_metrics.get(campaign_id=campaign)
+  if not row:
+    row = app_tables.campaign_metrics.add_row(
+      campaign_id=campaign,
+      enrolled=0,
+      active=0,
+      completed=0,
+      unsubscribed=0,
+      updated_at=datetime.now()
+    )
+  return row
+
+
+def record_transition(campaign, from_status, to_status):
+  """
+  Update counters for an enrollment status change.
+
+  Call inside the transaction that changes the enrollment.
+
+  Args:
+    campaign (Row): email_campaigns row
+    from_status (str): Previous status, or None for a new enrollment
+    to_status (str): New status
+  """
+  row = get_metrics_row(campaign)
+
+  if from_status is None:
+    row['enrolled'] = (row['enrolled'] or 0) + 1
+  elif from_status in STATUS_COLUMNS:
+    column = STATUS_COLUMNS[from_status]
+    row[column] = max((row[column] or 0) - 1, 0)
+
+  if to_status in STATUS_COLUMNS:
+    column = STATUS_COLUMNS[to_status]
+    row[column] = (row[column] or 0) + 1
+
+  row['updated_at'] = datetime.now()
+
+
+def queue_engagement(campaign_id, event_type, amount=None):
+  """
+  Record an open, click or conversion without touching the campaign row.
+
+  Args:
+    campaign_id (str): email_campaigns row ID
+    event_type (str): 'open', 'click' or 'conversion'
+    amount (float): Revenue of a conversion
+  """
+  app_tables.campaign_engagement_events.add_row(
+    campaign_id=campaign_id,
+    event_type=event_type,
+    amount=amount,
+    received_at=datetime.now()
+  )
+
+
+@anvil.server.background_task
+def flush_campaign_engagement():
+  """Apply queued open/click events to campaigns (run every 5 minutes)"""
+  while _flush_engagement_batch() == FLUSH_BATCH_SIZE:
+    pass
+
+
+@tables.in_transaction
+def _flush_engagement_batch():
+  """
+  Aggregate and apply one batch of engagement events.
+
+  Returns:
+    int: Number of events processed
+  """
+  events = list(app_tables.campaign_engagement_events.search(
+    tables.order_by('received_at')
+  )[:FLUSH_BATCH_SIZE])
+
+  deltas = {}
+  revenue = {}
+  for event in events:
+    key = (event['campaign_id'], event['event_type'])
+    deltas[key] = deltas.get(key, 0) + 1
+    if event['amount']:
+      revenue[event['campaign_id']] = revenue.get(event['campaign_id'], 0) + event['amount']
+
+  for (campaign_id, event_type), delta in deltas.items():
+    campaign = app_tables.email_campaigns.get_by_id(campaign_id)
+    column = ENGAGEMENT_COLUMNS.get(event_type)
+    if campaign and column:
+      campaign[column] = (campaign[column] or 0) + delta
+      campaign['updated_at'] = datetime.now()
+
+  for campaign_id, amount in revenue.items():
+    campaign = app_tables.email_campaigns.get_by_id(campaign_id)
+    if campaign:
+      campaign['revenue_generated'] = (campaign['revenue_generated'] or 0) + amount
+      campaign['updated_at'] = datetime.now()
+
+  for event in events:
+    event.delete()
+
+  return len(events)
+
+
+def build_stats(campaign, metrics):
+  """
+  Combine a campaign row and its metrics row into the stats dict.
+
+  Args:
+    campaign (Row): email_campaigns row
+    metrics (Row): campaign_metrics row, or None if never enrolled
+
+  Returns:
+    dict: Campaign statistics
+  """
+  emails_sent = campaign['emails_sent'] or 0
+  opens = campaign['opens'] or 0
+  clicks = campaign['clicks'] or 0
+
+  return {
+    'campaign_id': campaign.get_id(),
+    'campaign_name': campaign['campaign_name'],
+    'campaign_type': campaign['campaign_type'],
+    'status': campaign['status'],
+    'total_enrolled': metrics['enrolled'] or 0 if metrics else 0,
+    'active': metrics['active'] or 0 if metrics else 0,
+    'completed': metrics['completed'] or 0 if metrics else 0,
+    'unsubscribed': metrics['unsubscribed'] or 0 if metrics else 0,
+    'emails_sent': emails_sent,
+    'opens': opens,
+    'clicks': clicks,
+    'conversions': campaign['conversions'] or 0,
+    'revenue_generated': campaign['revenue_generated'] or 0,
+    'open_rate': (opens / emails_sent * 100) if emails_sent > 0 else 0,
+    'click_rate': (clicks / emails_sent * 100) if emails_sent > 0 else 0,
+    'created_date': campaign['created_date'],
+    'last_run_date': campaign['last_run_date']
+  }
+
+
+def get_metrics_for_campaigns(campaigns):
+  """
+  Load metrics rows for many campaigns in one query.
+
+  Args:
+    campaigns (list): email_campaigns rows
+
+  Returns:
+    dict: {campaign row ID: campaign_metrics row}
+  """
+  if not campaigns:
+    return {}
+
+  rows = app_tables.campaign_metrics.search(campaign_id=q.any_of(*campaigns))
+  return {row['campaign_id'].get_id(): row for row in rows}
+
+
+@anvil.server.background_task
+def rebuild_campaign_metrics():
+  """Recount enrollment counters for every campaign from contact_campaigns"""
+  for campaign in app_tables.email_campaigns.search():
+    counts = {'enrolled': 0, 'active': 0, 'completed': 0, 'unsubscribed': 0}
+
+    for enrollment in app_tables.contact_campaigns.search(
+      q.fetch_only('status'),
+      campaign_id=campaign
+    ):
+      counts['enrolled'] += 1
+      column = STATUS_COLUMNS.get(enrollment['status'])
+      if column:
+        counts[column] += 1
+
+    row = get_metrics_row(campaign)
+    row.update(updated_at=datetime.now(), **counts)
@@ -11,6 +11,7 @@ import anvil.tables.query as q
 from anvil.tables import app_tables
 import anvil.server
 from datetime import datetime, timedelta
+from . import campaign_metrics
 
 
 ## Function: create_campaign()
@@ -40,6 +41,7 @@ def create_campaign(campaign_data):
       conversions=0,
       revenue_generated=0,
       created_date=datetime.now(),
+      updated_at=datetime.now(),
       last_run_date=None,
       campaign_settings=campaign_data.get('settings', {})
     )
@@ -77,31 +79,39 @@ def enroll_contact_in_campaign(contact_id, campaign_id):
     if not campaign or campaign['instance_id'] != user:
       return {'success': False, 'error': 'Campaign not found'}
 
-    # Check if already enrolled
-    existing = app_tables.contact_campaigns.get(
-      contact_id=contact,
-      campaign_id=campaign,
-      status='Active'
-    )
-    if existing:
-      return {'success': False, 'error': 'Contact already enrolled'}
-
-    # Enroll
-    enrollment = app_tables.contact_campaigns.add_row(
-      contact_id=contact,
-      campaign_id=campaign,
-      sequence_day=1,
-      status='Active',
-      enrolled_date=datetime.now(),
-      last_email_sent_date=None,
-      completed_date=None
-    )
+    enrollment = _enroll(contact, campaign)
 
     return {'success': True, 'enrollment_id': enrollment.get_id()}
 
   except Exception as e:
     print(f"Error enrolling contact: {e}")
     return {'success': False, 'error': str(e)}
+
+
+@tables.in_transaction
+def _enroll(contact, campaign):
+  """Add the enrollment and update campaign counters together (raises to roll back)"""
+  # Check if already enrolled
+  existing = app_tables.contact_campaigns.get(
+    contact_id=contact,
+    campaign_id=campaign,
+    status='Active'
+  )
+  if existing:
+    raise ValueError('Contact already enrolled')
+
+  # Enroll
+  enrollment = app_tables.contact_campaigns.add_row(
+    contact_id=contact,
+    campaign_id=campaign,
+    sequence_day=1,
+    status='Active',
+    enrolled_date=datetime.now(),
+    last_email_sent_date=None,
+    completed_date=None
+  )
+  campaign_metrics.record_transition(campaign, None, 'Active')
+  return enrollment
 ```
 
 ---
@@ -137,11 +147,18 @@ def process_campaigns():
         # Check if campaign complete
         max_days = campaign['campaign_settings'].get('sequence_length', 7)
         if enrollment['sequence_day'] > max_days:
-          enrollment['status'] = 'Completed'
-          enrollment['completed_date'] = datetime.now()
+          _complete_enrollment(enrollment)
 
     except Exception as e:
       print(f"Error processing campaign enrollment: {e}")
+
+
+@tables.in_transaction
+def _complete_enrollment(enrollment):
+  """Mark enrollment completed and update campaign counters together"""
+  enrollment['status'] = 'Completed'
+  enrollment['completed_date'] = datetime.now()
+  campaign_metrics.record_transition(enrollment['campaign_id'], 'Active', 'Completed')
 ```
 
 ---
@@ -193,6 +210,7 @@ app_tables.contact_events.add_row(
 # Update campaign stats
 campaign['emails_sent'] = (campaign['emails_sent'] or 0) + 1
 campaign['last_run_date'] = datetime.now()
+campaign['updated_at'] = datetime.now()
 
 return True
 
@@ -263,31 +281,39 @@ return False
 def unenroll_contact(contact_id, campaign_id):
   """Unenroll contact from campaign"""
   try:
-    enrollment = app_tables.contact_campaigns.get(
-      contact_id=app_tables.contacts.get_by_id(contact_id),
-      campaign_id=app_tables.email_campaigns.get_by_id(campaign_id),
-      status='Active'
-    )
-
-    if enrollment:
-      enrollment['status'] = 'Unsubscribed'
-      enrollment['completed_date'] = datetime.now()
-
-      # Log event
-      app_tables.contact_events.add_row(
-        contact_id=enrollment['contact_id'],
-        event_type='unsubscribed',
-        event_date=datetime.now(),
-        event_data={'campaign_name': enrollment['campaign_id']['campaign_name']},
-        related_id=str(campaign_id),
-        user_visible=False
-      )
-
+    _unenroll(contact_id, campaign_id)
     return {'success': True}
 
   except Exception as e:
     print(f"Error unenrolling contact: {e}")
     return {'success': False, 'error': str(e)}
+
+
+@tables.in_transaction
+def _unenroll(contact_id, campaign_id):
+  """Close the enrollment, update counters and log the event together (raises to roll back)"""
+  enrollment = app_tables.contact_campaigns.get(
+    contact_id=app_tables.contacts.get_by_id(contact_id),
+    campaign_id=app_tables.email_campaigns.get_by_id(campaign_id),
+    status='Active'
+  )
+
+  if not enrollment:
+    return
+
+  enrollment['status'] = 'Unsubscribed'
+  enrollment['completed_date'] = datetime.now()
+  campaign_metrics.record_transition(enrollment['campaign_id'], 'Active', 'Unsubscribed')
+
+  # Log event
+  app_tables.contact_events.add_row(
+    contact_id=enrollment['contact_id'],
+    event_type='unsubscribed',
+    event_date=datetime.now(),
+    event_data={'campaign_name': enrollment['campaign_id']['campaign_name']},
+    related_id=str(campaign_id),
+    user_visible=False
+  )
 ```
 
 ---
@@ -312,44 +338,44 @@ def get_campaign_stats(campaign_id):
     if not campaign or campaign['instance_id'] != user:
       return {'success': False, 'error': 'Campaign not found'}
     
-    # Count enrollments
-    total_enrolled = len(list(app_tables.contact_campaigns.search(
-      campaign_id=campaign
-    )))
+    # Enrollment counters are maintained by campaign_metrics - one row read
+    metrics = app_tables.campaign_metrics.get(campaign_id=campaign)
+    stats = campaign_metrics.build_stats(campaign, metrics)
     
-    active = len(list(app_tables.contact_campaigns.search(
-      campaign_id=campaign,
-      status='Active'
-    )))
+    return {'success': True, 'stats': stats}
     
-    completed = len(list(app_tables.contact_campaigns.search(
-      campaign_id=campaign,
-      status='Completed'
-    )))
+  except Exception as e:
+    print(f"Error getting campaign stats: {e}")
+    return {'success': False, 'error': str(e)}
+```
+
+---
+
+## Function: get_all_campaign_stats()
+
+**Server:** server_marketing/campaign_service.py  
+**Purpose:** Get statistics for every campaign (marketing overview)  
+**Returns:** {'success': bool, 'stats': list} or error
+
+```python
+@anvil.server.callable
+def get_all_campaign_stats():
+  """Get performance stats for all of the user's campaigns in two queries"""
+  try:
+    user = anvil.users.get_user()
+    if not user:
+      return {'success': False, 'error': 'Not authenticated'}
     
-    unsubscribed = len(list(app_tables.contact_campaigns.search(
-      campaign_id=campaign,
-      status='Unsubscribed'
-    )))
+    campaigns = list(app_tables.email_campaigns.search(
+      tables.order_by('created_date', ascending=False),
+      instance_id=user
+    ))
+    metrics_by_campaign = campaign_metrics.get_metrics_for_campaigns(campaigns)
     
-    stats = {
-      'campaign_name': campaign['campaign_name'],
-      'campaign_type': campaign['campaign_type'],
-      'status': campaign['status'],
-      'total_enrolled': total_enrolled,
-      'active': active,
-      'completed': completed,
-      'unsubscribed': unsubscribed,
-      'emails_sent': campaign['emails_sent'] or 0,
-      'opens': campaign['opens'] or 0,
-      'clicks': campaign['clicks'] or 0,
-      'conversions': campaign['conversions'] or 0,
-      'revenue_generated': campaign['revenue_generated'] or 0,
-      'open_rate': (campaign['opens'] / campaign['emails_sent'] * 100) if campaign['emails_sent'] > 0 else 0,
-      'click_rate': (campaign['clicks'] / campaign['emails_sent'] * 100) if campaign['emails_sent'] > 0 else 0,
-      'created_date': campaign['created_date'],
-      'last_run_date': campaign['last_run_date']
-    }
+    stats = [
+      campaign_metrics.build_stats(c, metrics_by_campaign.get(c.get_id()))
+      for c in campaigns
+    ]
     
     return {'success': True, 'stats': stats}
     
@@ -381,6 +407,7 @@ def pause_campaign(campaign_id):
       return {'success': False, 'error': 'Campaign not found'}
     
     campaign['status'] = 'Paused'
+    campaign['updated_at'] = datetime.now()
     
     return {'success': True}
     
@@ -59,7 +59,8 @@ def create_task(task_data):
       completed_date=None,
       notes=task_data.get('notes', ''),
       auto_generated=task_data.get('auto_generated', False),
-      created_at=datetime.now()
+      created_at=datetime.now(),
+      updated_at=datetime.now()
     )
 
     return {'success': True, 'task_id': task.get_id()}
@@ -154,6 +155,7 @@ def complete_task(task_id):
 
     task['completed'] = True
     task['completed_date'] = datetime.now()
+    task['updated_at'] = datetime.now()
 
     # Log event if task is linked to contact
     if task['contact_id']:
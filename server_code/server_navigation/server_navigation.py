@@ -11,15 +11,73 @@ import anvil.tables.query as q
 from anvil.tables import app_tables
 import anvil.server
 
-# This is a server module. It runs on the Anvil server,
-# rather than in the user's browser.
-#
-# To allow anvil.server.call() to call functions here, we mark
-# them with @anvil.server.callable.
-# Here is an example - you can replace it with your own:
-#
-# @anvil.server.callable
-# def say_hello(name):
-#   print("Hello, " + name + "!")
-#   return 42
-#
+from ..server_shared import config as config_cache
+
+# Admin sidebar items and the feature flag that enables each one.
+# Items mapped to None are always visible.
+ADMIN_NAV_FEATURES = {
+  'dashboard': None,
+  'bookings': 'bookings',
+  'products': 'ecommerce',
+  'orders': 'ecommerce',
+  'rooms': 'hospitality',
+  'services': 'services',
+  'memberships': 'memberships',
+  'contacts': None,
+  'campaigns': 'marketing',
+  'broadcasts': 'marketing',
+  'segments': 'marketing',
+  'tasks': 'marketing',
+  'lead_capture': 'marketing',
+  'referrals': 'referrals',
+  'reviews': 'reviews',
+  'blog': 'blog',
+  'pages': None,
+  'media': None,
+  'support': None
+}
+
+
+def build_admin_navigation(features, role):
+  """
+  Work out which admin sidebar items a user should see.
+
+  Args:
+    features (dict): Enabled features (e.g. {'bookings': True})
+    role (str): User role
+
+  Returns:
+    dict: {'items': {name: bool}, 'show_finance': bool, 'show_settings': bool}
+  """
+  features = features or {}
+
+  items = {}
+  for name, feature in ADMIN_NAV_FEATURES.items():
+    items[name] = True if feature is None else bool(features.get(feature, False))
+
+  return {
+    'items': items,
+    'show_finance': role in ['owner', 'manager'],
+    'show_settings': role in ['owner', 'manager']
+  }
+
+
+@anvil.server.callable
+@anvil.users.login_required
+def get_admin_navigation():
+  """
+  Get admin sidebar visibility for the current user.
+
+  Returns:
+    dict: {'success': bool, 'data': dict} or {'success': bool, 'error': str}
+  """
+  try:
+    user = anvil.users.get_user()
+
+    features = config_cache.get_config_value('enabled_features', config_cache.DEFAULT_FEATURES)
+
+    return {'success': True, 'data': build_admin_navigation(features, user['role'])}
+
+  except Exception as e:
+    print(f"Error getting navigation: {e}")
+    return {'success': False, 'error': str(e)}
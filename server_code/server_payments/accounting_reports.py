@@ -11,15 +11,304 @@ import anvil.tables.query as q
 from anvil.tables import app_tables
 import anvil.server
 
-# This is a server module. It runs on the Anvil server,
-# rather than in the user's browser.
-#
-# To allow anvil.server.call() to call functions here, we mark
-# them with @anvil.server.callable.
-# Here is an example - you can replace it with your own:
-#
-# @anvil.server.callable
-# def say_hello(name):
-#   print("Hello, " + name + "!")
-#   return 42
+from datetime import datetime, date, timedelta
+from . import ledger
+
+# Reports from the ledger.
 #
+# A date range is read month by month: whole closed months come from their
+# period-close snapshot, whole open months from ledger_balances, and only
+# partial months at the edges of the range scan ledger_entries. Reports
+# over closed years therefore read one snapshot row per month and always
+# return the same figures.
+
+
+def _as_date(value):
+  return value.date() if isinstance(value, datetime) else value
+
+
+def _month_end(period):
+  return ledger.period_start(ledger.next_period(period)) - timedelta(days=1)
+
+
+def _entry_totals(start, end):
+  """Per-account totals of entries dated between two dates (inclusive)"""
+  totals = {}
+  entries = app_tables.ledger_entries.search(
+    q.fetch_only('account', 'debit', 'credit'),
+    entry_date=q.between(start, end, min_inclusive=True, max_inclusive=True)
+  )
+  for entry in entries:
+    ledger.add_totals(totals, entry['account'], entry['debit'], entry['credit'])
+  return totals
+
+
+def account_totals(start_date, end_date):
+  """
+  Per-account movement between two dates.
+
+  Args:
+    start_date (date): First day (inclusive)
+    end_date (date): Last day (inclusive)
+
+  Returns:
+    dict: {account: {'debit', 'credit'}}
+  """
+  start_date, end_date = _as_date(start_date), _as_date(end_date)
+  first_period, last_period = ledger.period_of(start_date), ledger.period_of(end_date)
+
+  closes = {
+    close['period']: close
+    for close in app_tables.ledger_period_closes.search(
+      period=q.between(first_period, last_period, min_inclusive=True, max_inclusive=True)
+    )
+  }
+
+  totals = {}
+  period = first_period
+
+  while period <= last_period:
+    month_start, month_end = ledger.period_start(period), _month_end(period)
+
+    if start_date <= month_start and end_date >= month_end:
+      movement = closes[period]['movement'] if period in closes else ledger.open_movement(period)
+    else:
+      movement = _entry_totals(max(start_date, month_start), min(end_date, month_end))
+
+    for account, values in movement.items():
+      ledger.add_totals(totals, account, values['debit'], values['credit'])
+
+    period = ledger.next_period(period)
+
+  return totals
+
+
+def _net_credit(totals, account):
+  values = totals.get(account) or {'debit': 0, 'credit': 0}
+  return round(values['credit'] - values['debit'], 2)
+
+
+def profit_and_loss(start_date, end_date):
+  """
+  Income, refunds and expenses by category between two dates.
+
+  Returns:
+    dict: {'income', 'refunds', 'expenses': {category: amount}, 'total_expenses', 'net_profit'}
+  """
+  totals = account_totals(start_date, end_date)
+
+  income = _net_credit(totals, ledger.SALES)
+  refunds = -_net_credit(totals, ledger.SALES_REFUNDS)
+  expenses = {
+    account[len(ledger.EXPENSE_PREFIX):]: -_net_credit(totals, account)
+    for account in sorted(totals)
+    if ledger.account_type(account) == 'expense'
+  }
+  total_expenses = round(sum(expenses.values()), 2)
+
+  return {
+    'income': income,
+    'refunds': refunds,
+    'expenses': expenses,
+    'total_expenses': total_expenses,
+    'net_profit': round(income - refunds - total_expenses, 2)
+  }
+
+
+def tax_summary(start_date, end_date):
+  """
+  Sales tax collected and refunded between two dates.
+
+  Returns:
+    dict: {'taxable_sales', 'tax_collected', 'tax_refunded', 'net_tax'}
+  """
+  totals = account_totals(start_date, end_date)
+  tax = totals.get(ledger.TAX_PAYABLE) or {'debit': 0, 'credit': 0}
+
+  return {
+    'taxable_sales': round(_net_credit(totals, ledger.SALES) + _net_credit(totals, ledger.SALES_REFUNDS), 2),
+    'tax_collected': tax['credit'],
+    'tax_refunded': tax['debit'],
+    'net_tax': round(tax['credit'] - tax['debit'], 2)
+  }
+
+
+def balance_sheet(period):
+  """
+  Cumulative account balances at the end of a period.
+
+  Starts from the latest close at or before the period and adds the
+  movement of the open periods after it.
+
+  Args:
+    period (str): 'YYYY-MM'
+
+  Returns:
+    dict: {'period', 'accounts': {account: balance}, 'retained_earnings'}
+  """
+  closing = {}
+  current = None
+
+  for close in app_tables.ledger_period_closes.search(
+    tables.order_by('period', ascending=False),
+    period=q.less_than_or_equal_to(period)
+  )[:1]:
+    closing = {k: dict(v) for k, v in close['closing'].items()}
+    current = close['period']
+
+  # Open periods before the first close still count
+  if current is None:
+    for earliest in app_tables.ledger_balances.search(tables.order_by('period'))[:1]:
+      current = earliest['period']
+    pending = current
+  else:
+    pending = ledger.next_period(current)
+
+  while pending and pending <= period:
+    for account, values in ledger.open_movement(pending).items():
+      ledger.add_totals(closing, account, values['debit'], values['credit'])
+    pending = ledger.next_period(pending)
+
+  accounts = {}
+  retained = 0
+  for account, values in sorted(closing.items()):
+    kind = ledger.account_type(account)
+    if kind == 'asset':
+      accounts[account] = round(values['debit'] - values['credit'], 2)
+    elif kind == 'liability':
+      accounts[account] = round(values['credit'] - values['debit'], 2)
+    else:
+      retained += values['credit'] - values['debit']
+
+  return {'period': period, 'accounts': accounts, 'retained_earnings': round(retained, 2)}
+
+
+@anvil.server.callable
+@anvil.users.login_required
+def get_balance_sheet(period):
+  """
+  Get account balances at the end of a period.
+
+  Args:
+    period (str): 'YYYY-MM'
+
+  Returns:
+    dict: {'success': bool, 'data': dict} or {'success': bool, 'error': str}
+  """
+  try:
+    user = anvil.users.get_user()
+
+    if user['role'] not in ['owner', 'manager']:
+      return {'success': False, 'error': 'Access denied'}
+
+    return {'success': True, 'data': balance_sheet(period)}
+
+  except Exception as e:
+    print(f"Error getting balance sheet: {e}")
+    return {'success': False, 'error': str(e)}
+
+
+@anvil.server.callable
+@anvil.users.login_required
+def get_period_closes():
+  """
+  List closed periods, newest first.
+
+  Returns:
+    dict: {'success': bool, 'data': list} or {'success': bool, 'error': str}
+  """
+  try:
+    user = anvil.users.get_user()
+
+    if user['role'] not in ['owner', 'manager']:
+      return {'success': False, 'error': 'Access denied'}
+
+    closes = app_tables.ledger_period_closes.search(
+      q.fetch_only('period', 'checksum', 'closed_at'),
+      tables.order_by('period', ascending=False)
+    )
+
+    return {'success': True, 'data': [{
+      'period': close['period'],
+      'checksum': close['checksum'],
+      'closed_at': close['closed_at']
+    } for close in closes]}
+
+  except Exception as e:
+    print(f"Error getting period closes: {e}")
+    return {'success': False, 'error': str(e)}
+
+
+@anvil.server.callable
+@anvil.users.login_required
+def close_accounting_period(period):
+  """
+  Close a period, freezing its balances.
+
+  Args:
+    period (str): 'YYYY-MM'; periods close in order
+
+  Returns:
+    dict: {'success': bool, 'checksum': str} or {'success': bool, 'error': str}
+  """
+  try:
+    user = anvil.users.get_user()
+
+    if user['role'] != 'owner':
+      return {'success': False, 'error': 'Access denied'}
+
+    close = ledger.close_period(period, user)
+
+    return {'success': True, 'checksum': close['checksum']}
+
+  except Exception as e:
+    print(f"Error closing period: {e}")
+    return {'success': False, 'error': str(e)}
+
+
+@anvil.server.callable
+@anvil.users.login_required
+def record_expense(expense_data):
+  """
+  Record an expense and post it to the ledger.
+
+  Args:
+    expense_data (dict): expense_date, category, description, amount, currency, receipt
+
+  Returns:
+    dict: {'success': bool, 'expense_id': str} or {'success': bool, 'error': str}
+  """
+  try:
+    user = anvil.users.get_user()
+
+    if user['role'] not in ['owner', 'manager']:
+      return {'success': False, 'error': 'Access denied'}
+
+    if not expense_data.get('amount') or expense_data['amount'] <= 0:
+      return {'success': False, 'error': 'Amount must be greater than zero'}
+
+    expense = _add_expense(user, expense_data)
+
+    return {'success': True, 'expense_id': expense.get_id()}
+
+  except Exception as e:
+    print(f"Error recording expense: {e}")
+    return {'success': False, 'error': str(e)}
+
+
+@tables.in_transaction
+def _add_expense(user, expense_data):
+  """Add the expense and its ledger entry together (raises to roll back)"""
+  expense = app_tables.expenses.add_row(
+    expense_date=expense_data.get('expense_date') or date.today(),
+    category=expense_data.get('category') or 'general',
+    description=expense_data.get('description', ''),
+    amount=expense_data['amount'],
+    currency=expense_data.get('currency'),
+    receipt=expense_data.get('receipt'),
+    created_by=user,
+    created_at=datetime.now()
+  )
+
+  ledger.post_expense(expense)
+  return expense
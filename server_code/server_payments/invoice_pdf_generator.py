@@ -11,15 +11,209 @@ import anvil.tables.query as q
 from anvil.tables import app_tables
 import anvil.server
 
-# This is a server module. It runs on the Anvil server,
-# rather than in the user's browser.
-#
-# To allow anvil.server.call() to call functions here, we mark
-# them with @anvil.server.callable.
-# Here is an example - you can replace it with your own:
-#
-# @anvil.server.callable
-# def say_hello(name):
-#   print("Hello, " + name + "!")
-#   return 42
+from anvil.pdf import PDFRenderer
+from datetime import datetime
+from string import Template
+import hashlib
+import html
+import json
+from ..server_shared import config as config_cache
+
+# Invoice PDF rendering.
 #
+# The invoice HTML template (the `invoice_template` config value, or
+# DEFAULT_TEMPLATE) is compiled once per server process. Each render is
+# keyed by a content hash of everything that appears on the PDF - invoice
+# fields, line items, business profile and the template itself - and
+# stored once in `invoice_pdfs`. Rows there are never modified: when an
+# invoice changes its hash changes, a new PDF is stored and
+# invoice['pdf_hash'] moves to it. Rendering an unchanged invoice is a
+# hash comparison and no PDF work.
+
+TEMPLATE_CACHE_TTL = 3600
+
+DEFAULT_TEMPLATE = """<html>
+<head>
+<style>
+  body { font-family: Helvetica, Arial, sans-serif; font-size: 12px; color: #222; }
+  h1 { font-size: 22px; margin-bottom: 4px; }
+  table { width: 100%; border-collapse: collapse; margin-top: 24px; }
+  th, td { padding: 6px; border-bottom: 1px solid #ddd; text-align: left; }
+  td.amount, th.amount { text-align: right; }
+  .total { font-weight: bold; font-size: 14px; }
+</style>
+</head>
+<body>
+  <h1>$business_name</h1>
+  <div>$business_address</div>
+  <div>$business_email</div>
+  <h2>Invoice $invoice_number</h2>
+  <div>Date: $invoice_date</div>
+  <div>Due: $due_date</div>
+  <div>Status: $status</div>
+  <h3>Bill to</h3>
+  <div>$customer_name</div>
+  <div>$customer_email</div>
+  <table>
+    <tr><th>Description</th><th class="amount">Qty</th><th class="amount">Unit price</th><th class="amount">Amount</th></tr>
+    $lines
+    <tr class="total"><td colspan="3">Total</td><td class="amount">$total</td></tr>
+  </table>
+  <p>$notes</p>
+</body>
+</html>"""
+
+LINE_TEMPLATE = ('<tr><td>$description</td><td class="amount">$quantity</td>'
+                 '<td class="amount">$unit_price</td><td class="amount">$amount</td></tr>')
+
+
+def get_template():
+  """
+  Compiled invoice template, cached per server process.
+
+  Returns:
+    dict: {'page': Template, 'line': Template, 'hash': str}
+  """
+  def load():
+    source = config_cache.get_config_value('invoice_template') or DEFAULT_TEMPLATE
+    return {
+      'page': Template(source),
+      'line': Template(LINE_TEMPLATE),
+      'hash': hashlib.sha256((source + LINE_TEMPLATE).encode('utf-8')).hexdigest()
+    }
+
+  return config_cache.get_cached('invoice_template', load, ttl=TEMPLATE_CACHE_TTL)
+
+
+def _money(amount, currency):
+  return f"{currency} {amount or 0:,.2f}".strip()
+
+
+def _date(value):
+  return value.strftime('%d %b %Y') if value else ''
+
+
+def invoice_content(invoice):
+  """
+  Everything printed on an invoice, as plain values.
+
+  Args:
+    invoice (Row): invoice row
+
+  Returns:
+    dict: Invoice fields, 'lines' list and business profile
+  """
+  customer = invoice['customer_id']
+  profile = config_cache.get_config_value('business_profile') or {}
+
+  lines = [{
+    'description': item['description'] or '',
+    'quantity': item['quantity'] or 0,
+    'unit_price': item['unit_price'] or 0,
+    'amount': item['amount'] or 0
+  } for item in app_tables.invoice_items.search(invoice_id=invoice)]
+
+  return {
+    'invoice_number': invoice['invoice_number'] or '',
+    'invoice_date': _date(invoice['invoice_date']),
+    'due_date': _date(invoice['due_date']),
+    'status': invoice['status'] or 'draft',
+    'currency': invoice['currency'] or '',
+    'total_amount': invoice['total_amount'] or 0,
+    'notes': invoice['notes'] or '',
+    'customer_name': ' '.join(filter(None, [customer['first_name'], customer['last_name']])) if customer else '',
+    'customer_email': customer['email'] if customer else '',
+    'business_name': profile.get('business_name') or '',
+    'business_address': profile.get('address') or '',
+    'business_email': profile.get('contact_email') or '',
+    'lines': lines
+  }
+
+
+def content_hash(content, template):
+  """
+  Hash identifying one rendering of an invoice.
+
+  Args:
+    content (dict): From invoice_content()
+    template (dict): From get_template()
+
+  Returns:
+    str: Hex SHA-256
+  """
+  payload = json.dumps(content, sort_keys=True, default=str) + template['hash']
+  return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def render_html(content, template):
+  """Fill the compiled template with escaped invoice content"""
+  currency = content['currency']
+
+  lines = ''.join(template['line'].safe_substitute(
+    description=html.escape(line['description']),
+    quantity=line['quantity'],
+    unit_price=_money(line['unit_price'], currency),
+    amount=_money(line['amount'], currency)
+  ) for line in content['lines'])
+
+  values = {k: html.escape(str(v)) for k, v in content.items() if k != 'lines'}
+  values['lines'] = lines
+  values['total'] = _money(content['total_amount'], currency)
+
+  return template['page'].safe_substitute(values)
+
+
+def _stored_pdf(invoice, digest):
+  """First stored PDF with this hash (concurrent renders may store two)"""
+  for row in app_tables.invoice_pdfs.search(invoice_id=invoice, content_hash=digest):
+    return row
+  return None
+
+
+def render_invoice(invoice):
+  """
+  Get the current PDF of an invoice, rendering it only if its content changed.
+
+  Args:
+    invoice (Row): invoice row
+
+  Returns:
+    tuple: (invoice_pdfs row, rendered) - rendered is False when reused
+  """
+  template = get_template()
+  content = invoice_content(invoice)
+  digest = content_hash(content, template)
+
+  stored = _stored_pdf(invoice, digest)
+
+  if stored:
+    if invoice['pdf_hash'] != digest:
+      invoice['pdf_hash'] = digest
+    return stored, False
+
+  pdf = PDFRenderer(
+    html=render_html(content, template),
+    filename=f"{content['invoice_number'] or 'invoice'}.pdf"
+  ).render_pdf()
+
+  stored = app_tables.invoice_pdfs.add_row(
+    invoice_id=invoice,
+    content_hash=digest,
+    pdf=pdf,
+    rendered_at=datetime.now()
+  )
+  invoice['pdf_hash'] = digest
+
+  return stored, True
+
+
+def current_pdf(invoice):
+  """
+  Stored PDF for the invoice's current hash, without rendering.
+
+  Returns:
+    Row or None: invoice_pdfs row
+  """
+  if not invoice['pdf_hash']:
+    return None
+  return _stored_pdf(invoice, invoice['pdf_hash'])
@@ -11,15 +11,230 @@ import anvil.tables.query as q
 from anvil.tables import app_tables
 import anvil.server
 
-# This is a server module. It runs on the Anvil server,
-# rather than in the user's browser.
-#
-# To allow anvil.server.call() to call functions here, we mark
-# them with @anvil.server.callable.
-# Here is an example - you can replace it with your own:
-#
-# @anvil.server.callable
-# def say_hello(name):
-#   print("Hello, " + name + "!")
-#   return 42
+from datetime import datetime
+import io
+import time
+import zipfile
+from . import invoice_pdf_generator
+
+# Invoice downloads and month-end batch rendering.
 #
+# Single downloads render on demand (a no-op when the stored PDF is
+# current). Month-end exports run as an `invoice_batches` job:
+# run_invoice_batch splits the month's invoices across at most
+# RENDER_WORKERS render_invoice_chunk tasks, waits for them, then zips the
+# stored PDFs into the batch row for download.
+
+RENDER_WORKERS = 4
+
+# Seconds between checks on worker tasks
+POLL_INTERVAL = 2
+
+# Invoices rendered between progress updates
+PROGRESS_EVERY = 10
+
+STAFF_ROLES = ['owner', 'manager', 'staff']
+
+
+def _month_range(year, month):
+  """Start of the month and start of the next month"""
+  start = datetime(year, month, 1)
+  end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+  return start, end
+
+
+def _can_view(user, invoice):
+  if user['role'] in STAFF_ROLES:
+    return True
+  customer = invoice['customer_id']
+  return bool(customer and customer['user_id'] == user)
+
+
+@anvil.server.callable
+@anvil.users.login_required
+def get_invoice_pdf(invoice_id):
+  """
+  Get an invoice PDF, rendering it only if the invoice changed.
+
+  Args:
+    invoice_id (str): invoice row ID
+
+  Returns:
+    dict: {'success': bool, 'pdf': Media} or {'success': bool, 'error': str}
+  """
+  try:
+    user = anvil.users.get_user()
+    invoice = app_tables.invoice.get_by_id(invoice_id)
+
+    if not invoice or not _can_view(user, invoice):
+      return {'success': False, 'error': 'Invoice not found'}
+
+    stored, _ = invoice_pdf_generator.render_invoice(invoice)
+
+    return {'success': True, 'pdf': stored['pdf']}
+
+  except Exception as e:
+    print(f"Error getting invoice PDF: {e}")
+    return {'success': False, 'error': str(e)}
+
+
+@anvil.server.callable
+@anvil.users.login_required
+def start_invoice_batch(year, month):
+  """
+  Render and zip every invoice dated in a month, in the background.
+
+  Args:
+    year (int): Year
+    month (int): Month (1-12)
+
+  Returns:
+    dict: {'success': bool, 'batch_id': str} or {'success': bool, 'error': str}
+  """
+  try:
+    user = anvil.users.get_user()
+
+    if user['role'] not in ['owner', 'manager']:
+      return {'success': False, 'error': 'Access denied'}
+
+    start, end = _month_range(year, month)
+
+    batch = app_tables.invoice_batches.add_row(
+      created_by=user,
+      period_start=start.date(),
+      period_end=end.date(),
+      status='queued',
+      total=0,
+      rendered_count=0,
+      reused_count=0,
+      error_count=0,
+      created_at=datetime.now()
+    )
+
+    anvil.server.launch_background_task('run_invoice_batch', batch.get_id())
+
+    return {'success': True, 'batch_id': batch.get_id()}
+
+  except Exception as e:
+    print(f"Error starting invoice batch: {e}")
+    return {'success': False, 'error': str(e)}
+
+
+@anvil.server.callable
+@anvil.users.login_required
+def get_invoice_batch_status(batch_id):
+  """
+  Get progress of an invoice batch, with the zip once completed.
+
+  Returns:
+    dict: {'success': bool, 'batch': dict} or {'success': False, 'error': str}
+  """
+  try:
+    user = anvil.users.get_user()
+
+    batch = app_tables.invoice_batches.get_by_id(batch_id)
+    if not batch or batch['created_by'] != user:
+      return {'success': False, 'error': 'Batch not found'}
+
+    return {
+      'success': True,
+      'batch': {
+        'batch_id': batch_id,
+        'period_start': batch['period_start'],
+        'status': batch['status'],
+        'total': batch['total'],
+        'rendered_count': batch['rendered_count'],
+        'reused_count': batch['reused_count'],
+        'error_count': batch['error_count'],
+        'last_error': batch['last_error'],
+        'zip_file': batch['zip_file'] if batch['status'] == 'completed' else None,
+        'completed_at': batch['completed_at']
+      }
+    }
+
+  except Exception as e:
+    print(f"Error getting invoice batch status: {e}")
+    return {'success': False, 'error': str(e)}
+
+
+@anvil.server.background_task
+def run_invoice_batch(batch_id):
+  """Fan a month's invoices out to render workers and zip the results"""
+  batch = app_tables.invoice_batches.get_by_id(batch_id)
+  if not batch or batch['status'] == 'completed':
+    return
+
+  try:
+    start = datetime.combine(batch['period_start'], datetime.min.time())
+    end = datetime.combine(batch['period_end'], datetime.min.time())
+
+    invoices = app_tables.invoice.search(
+      tables.order_by('invoice_date'),
+      invoice_date=q.between(start, end)
+    )
+    invoice_ids = [invoice.get_id() for invoice in invoices]
+
+    batch.update(status='running', total=len(invoice_ids), started_at=datetime.now())
+
+    # Contiguous slices, one per worker
+    size = -(-len(invoice_ids) // RENDER_WORKERS) or 1
+    workers = [
+      anvil.server.launch_background_task('render_invoice_chunk', batch_id, invoice_ids[i:i + size])
+      for i in range(0, len(invoice_ids), size)
+    ]
+
+    while not all(worker.is_completed() for worker in workers):
+      time.sleep(POLL_INTERVAL)
+
+    batch.update(
+      status='completed',
+      zip_file=_build_zip(invoice_ids, f"invoices-{batch['period_start'].strftime('%Y-%m')}.zip"),
+      completed_at=datetime.now()
+    )
+
+  except Exception as e:
+    print(f"Error running invoice batch: {e}")
+    batch.update(status='failed', last_error=str(e))
+
+
+@anvil.server.background_task
+def render_invoice_chunk(batch_id, invoice_ids):
+  """Render one worker's share of a batch, reporting progress"""
+  batch = app_tables.invoice_batches.get_by_id(batch_id)
+  counts = {'rendered_count': 0, 'reused_count': 0, 'error_count': 0}
+
+  for index, invoice_id in enumerate(invoice_ids, start=1):
+    try:
+      invoice = app_tables.invoice.get_by_id(invoice_id)
+      if invoice:
+        stored, rendered = invoice_pdf_generator.render_invoice(invoice)
+        counts['rendered_count' if rendered else 'reused_count'] += 1
+    except Exception as e:
+      print(f"Error rendering invoice {invoice_id}: {e}")
+      counts['error_count'] += 1
+      batch['last_error'] = str(e)
+
+    if index % PROGRESS_EVERY == 0 or index == len(invoice_ids):
+      _add_counts(batch, counts)
+      counts = {k: 0 for k in counts}
+
+
+@tables.in_transaction
+def _add_counts(batch, counts):
+  """Add a worker's progress to the batch (workers update it concurrently)"""
+  for column, count in counts.items():
+    batch[column] = (batch[column] or 0) + count
+
+
+def _build_zip(invoice_ids, filename):
+  """Zip the current stored PDF of each invoice"""
+  buffer = io.BytesIO()
+
+  with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+    for invoice_id in invoice_ids:
+      invoice = app_tables.invoice.get_by_id(invoice_id)
+      stored = invoice_pdf_generator.current_pdf(invoice) if invoice else None
+      if stored:
+        archive.writestr(f"{invoice['invoice_number'] or invoice_id}.pdf", stored['pdf'].get_bytes())
+
+  return anvil.BlobMedia('application/zip', buffer.getvalue(), name=filename)
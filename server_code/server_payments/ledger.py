@@ -0,0 +1,292 @@
+import anvil.google.auth, anvil.google.drive, anvil.google.mail
+from anvil.google.drive import app_files
+import anvil.stripe
+import anvil.secrets
+import anvil.files
+from anvil.files import data_files
+import anvil.email
+import anvil.users
+import anvil.tables as tables
+import anvil.tables.query as q
+from anvil.tables import app_tables
+import anvil.server
+
+from datetime import datetime, date
+import hashlib
+import json
+
+# Double-entry ledger.
+#
+# Payments, refunds and expenses post balanced lines to `ledger_entries`,
+# each posting identified by a posting_key so a repeated event posts once.
+# The same transaction adds the lines to `ledger_balances` (one row per
+# period and account), so a month's totals are a handful of row reads.
+#
+# close_period() freezes a month into `ledger_period_closes`: the
+# period's movement and the cumulative closing balance of every account,
+# with a checksum. Snapshot rows are never modified. Postings dated in a
+# closed period land on the first day of the next open period instead,
+# so closed figures stay reproducible.
+
+# Accounts and their normal side
+CASH = 'cash'
+SALES = 'sales_revenue'
+SALES_REFUNDS = 'sales_refunds'
+TAX_PAYABLE = 'sales_tax_payable'
+EXPENSE_PREFIX = 'expense:'
+
+INCOME_ACCOUNTS = [SALES, SALES_REFUNDS]
+
+
+def account_type(account):
+  """'asset', 'liability', 'income' or 'expense'"""
+  if account == CASH:
+    return 'asset'
+  if account == TAX_PAYABLE:
+    return 'liability'
+  if account.startswith(EXPENSE_PREFIX):
+    return 'expense'
+  return 'income'
+
+
+def period_of(day):
+  """'YYYY-MM' period of a date or datetime"""
+  return f"{day.year:04d}-{day.month:02d}"
+
+
+def next_period(period):
+  year, month = int(period[:4]), int(period[5:])
+  return f"{year + 1:04d}-01" if month == 12 else f"{year:04d}-{month + 1:02d}"
+
+
+def period_start(period):
+  return date(int(period[:4]), int(period[5:]), 1)
+
+
+def last_close():
+  """
+  Most recent period close.
+
+  Returns:
+    Row or None: ledger_period_closes row
+  """
+  for close in app_tables.ledger_period_closes.search(tables.order_by('period', ascending=False))[:1]:
+    return close
+  return None
+
+
+def _posting_date(entry_date):
+  """Move a date in a closed period to the start of the first open period"""
+  close = last_close()
+  if close and period_of(entry_date) <= close['period']:
+    return period_start(next_period(close['period']))
+  return entry_date
+
+
+@tables.in_transaction
+def post(posting_key, entry_date, lines, source_type, source_id, description=''):
+  """
+  Post a balanced set of lines once.
+
+  Args:
+    posting_key (str): Identifies the posting; a key already posted is ignored
+    entry_date (date): Accounting date
+    lines (list): (account, debit, credit) tuples; debits must equal credits
+    source_type (str): 'payment', 'refund' or 'expense'
+    source_id (str): Order or expense row ID
+    description (str): Shown on reports
+
+  Returns:
+    bool: False if the key was already posted
+  """
+  if len(app_tables.ledger_entries.search(posting_key=posting_key)):
+    return False
+
+  lines = [(account, round(debit, 2), round(credit, 2)) for account, debit, credit in lines
+           if debit or credit]
+  if round(sum(l[1] for l in lines) - sum(l[2] for l in lines), 2) != 0:
+    raise ValueError(f"Unbalanced posting {posting_key}")
+
+  if isinstance(entry_date, datetime):
+    entry_date = entry_date.date()
+  posted_on = _posting_date(entry_date)
+  period = period_of(posted_on)
+
+  for account, debit, credit in lines:
+    app_tables.ledger_entries.add_row(
+      posting_key=posting_key,
+      entry_date=posted_on,
+      source_date=entry_date,
+      period=period,
+      account=account,
+      debit=debit,
+      credit=credit,
+      source_type=source_type,
+      source_id=source_id,
+      description=description,
+      created_at=datetime.now()
+    )
+
+    balance = app_tables.ledger_balances.get(period=period, account=account)
+    if balance:
+      balance.update(debit=(balance['debit'] or 0) + debit, credit=(balance['credit'] or 0) + credit)
+    else:
+      app_tables.ledger_balances.add_row(period=period, account=account, debit=debit, credit=credit)
+
+  return True
+
+
+def _sale_lines(amount, tax, total):
+  """Split an amount into revenue and tax in the order's tax proportion"""
+  tax_part = round(amount * tax / total, 2) if total else 0
+  return amount - tax_part, tax_part
+
+
+def post_payment(order, amount, when=None):
+  """
+  Post a received order payment: cash against revenue and sales tax.
+
+  Args:
+    order (Row): orders row
+    amount (float): Amount received
+    when (date): Payment date (default today)
+  """
+  net, tax = _sale_lines(amount, order['tax'] or 0, order['total_amount'] or 0)
+  post(
+    f"payment:{order.get_id()}",
+    when or date.today(),
+    [(CASH, amount, 0), (SALES, 0, net), (TAX_PAYABLE, 0, tax)],
+    'payment', order.get_id(), f"Payment {order['order_number']}"
+  )
+
+
+def post_refund(order, amount_refunded, when=None):
+  """
+  Post the part of an order's refunds not yet in the ledger.
+
+  Args:
+    order (Row): orders row
+    amount_refunded (float): Total refunded so far on the payment
+    when (date): Refund date (default today)
+  """
+  amount = round(amount_refunded - refunded_total(order), 2)
+  if amount <= 0:
+    return
+
+  net, tax = _sale_lines(amount, order['tax'] or 0, order['total_amount'] or 0)
+  post(
+    f"refund:{order.get_id()}:{amount_refunded:.2f}",
+    when or date.today(),
+    [(SALES_REFUNDS, net, 0), (TAX_PAYABLE, tax, 0), (CASH, 0, amount)],
+    'refund', order.get_id(), f"Refund {order['order_number']}"
+  )
+
+
+def refunded_total(order):
+  """
+  Total already refunded on an order, from its posted refunds.
+
+  Args:
+    order (Row): orders row
+
+  Returns:
+    float: Refunded amount
+  """
+  return round(sum(
+    entry['credit'] or 0
+    for entry in app_tables.ledger_entries.search(source_type='refund', source_id=order.get_id(), account=CASH)
+  ), 2)
+
+
+def post_expense(expense):
+  """
+  Post an expense: expense account against cash.
+
+  Args:
+    expense (Row): expenses row
+  """
+  account = f"{EXPENSE_PREFIX}{(expense['category'] or 'general').lower()}"
+  post(
+    f"expense:{expense.get_id()}",
+    expense['expense_date'] or date.today(),
+    [(account, expense['amount'], 0), (CASH, 0, expense['amount'])],
+    'expense', expense.get_id(), expense['description'] or ''
+  )
+
+
+def add_totals(totals, account, debit, credit):
+  """Add debit and credit amounts to an {account: {'debit', 'credit'}} dict"""
+  entry = totals.setdefault(account, {'debit': 0, 'credit': 0})
+  entry['debit'] = round(entry['debit'] + (debit or 0), 2)
+  entry['credit'] = round(entry['credit'] + (credit or 0), 2)
+
+
+def open_movement(period):
+  """
+  Per-account totals of a period from ledger_balances.
+
+  Returns:
+    dict: {account: {'debit', 'credit'}}
+  """
+  totals = {}
+  for row in app_tables.ledger_balances.search(period=period):
+    add_totals(totals, row['account'], row['debit'], row['credit'])
+  return totals
+
+
+def snapshot_checksum(period, movement, closing):
+  payload = json.dumps({'period': period, 'movement': movement, 'closing': closing}, sort_keys=True)
+  return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+@tables.in_transaction
+def close_period(period, user=None):
+  """
+  Freeze a period's balances into an immutable snapshot.
+
+  Periods close in order, and only once they have ended.
+
+  Args:
+    period (str): 'YYYY-MM'
+    user (Row): User closing the period
+
+  Returns:
+    Row: ledger_period_closes row
+  """
+  previous = last_close()
+
+  if previous and period != next_period(previous['period']):
+    raise ValueError(f"Next period to close is {next_period(previous['period'])}")
+  if not previous:
+    for earlier in app_tables.ledger_balances.search(tables.order_by('period'), period=q.less_than(period))[:1]:
+      raise ValueError(f"Next period to close is {earlier['period']}")
+  if period >= period_of(date.today()):
+    raise ValueError("Only past periods can be closed")
+
+  movement = open_movement(period)
+
+  closing = {k: dict(v) for k, v in (previous['closing'] if previous else {}).items()}
+  for account, totals in movement.items():
+    add_totals(closing, account, totals['debit'], totals['credit'])
+
+  return app_tables.ledger_period_closes.add_row(
+    period=period,
+    movement=movement,
+    closing=closing,
+    checksum=snapshot_checksum(period, movement, closing),
+    closed_by=user,
+    closed_at=datetime.now()
+  )
+
+
+@anvil.server.background_task
+def backfill_ledger():
+  """Post paid orders, refunds and expenses recorded before the ledger existed"""
+  for order in app_tables.orders.search(payment_status=q.any_of('paid', 'partially_refunded', 'refunded')):
+    paid_on = order['created_at'] or datetime.now()
+    post_payment(order, order['total_amount'] or 0, paid_on)
+    if order['payment_status'] == 'refunded':
+      post_refund(order, order['total_amount'] or 0, order['updated_at'] or paid_on)
+
+  for expense in app_tables.expenses.search():
+    post_expense(expense)
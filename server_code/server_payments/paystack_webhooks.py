@@ -11,15 +11,135 @@ import anvil.tables.query as q
 from anvil.tables import app_tables
 import anvil.server
 
-# This is a server module. It runs on the Anvil server,
-# rather than in the user's browser.
-#
-# To allow anvil.server.call() to call functions here, we mark
-# them with @anvil.server.callable.
-# Here is an example - you can replace it with your own:
-#
-# @anvil.server.callable
-# def say_hello(name):
-#   print("Hello, " + name + "!")
-#   return 42
+import hashlib
+import hmac
+import json
+from datetime import datetime
+from . import webhook_queue
+from . import ledger
+from ..server_products import order_service
+from ..server_products import subscription_service
+from ..server_marketing import campaign_metrics
+
+# Paystack webhook endpoint.
 #
+# POST /_/api/webhooks/paystack verifies the x-paystack-signature header
+# (HMAC-SHA512 of the body with the `paystack_secret_key` secret) and hands
+# the event to webhook_queue; the handlers below run later from
+# process_webhook_events. Checkout uses the order number as the transaction
+# reference and may pass metadata.campaign_id.
+
+
+def verify_signature(body, signature, secret):
+  """
+  Check an x-paystack-signature header.
+
+  Args:
+    body (bytes): Raw request body
+    signature (str): Header value
+    secret (str): Paystack secret key
+
+  Returns:
+    bool: True if the signature matches
+  """
+  if not signature:
+    return False
+
+  expected = hmac.new(secret.encode('utf-8'), body, hashlib.sha512).hexdigest()
+  return hmac.compare_digest(expected, signature)
+
+
+def _parse_time(value):
+  """Paystack ISO timestamp -> naive datetime, or None"""
+  try:
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+  except (AttributeError, ValueError):
+    return None
+
+
+def _object_key(data):
+  """Key that orders events for the same order or subscription"""
+  subscription = data.get('subscription') or {}
+  return (data.get('transaction_reference') or data.get('reference')
+          or subscription.get('subscription_code') or str(data.get('id')))
+
+
+def _event_id(event, data):
+  """
+  Identify a delivery for deduplication.
+
+  Paystack events carry no event ID, and one invoice sends invoice.update
+  several times as it changes, so the object's status and paid_at are part
+  of the key. Only redeliveries of the same state collapse.
+  """
+  return f"{event['event']}:{data.get('id')}:{data.get('status') or ''}:{data.get('paid_at') or ''}"
+
+
+@anvil.server.http_endpoint('/webhooks/paystack', methods=['POST'])
+def paystack_webhook(**params):
+  """Verify and queue a Paystack event, acknowledging immediately"""
+  request = anvil.server.request
+  body = request.body.get_bytes() if request.body else b''
+  signature = request.headers.get('x-paystack-signature')
+
+  if not verify_signature(body, signature, anvil.secrets.get_secret('paystack_secret_key')):
+    return anvil.server.HttpResponse(400, 'Invalid signature')
+
+  event = json.loads(body)
+  data = event.get('data') or {}
+
+  webhook_queue.ingest(
+    'paystack',
+    _event_id(event, data),
+    event['event'],
+    _object_key(data),
+    event,
+    signature,
+    _parse_time(data.get('paid_at') or data.get('createdAt'))
+  )
+
+  return anvil.server.HttpResponse(200, 'ok')
+
+
+def _amount(value):
+  """Paystack minor units -> major units"""
+  return (value or 0) / 100
+
+
+def on_charge_success(event):
+  data = event['data']
+  order = app_tables.orders.get(order_number=data.get('reference'))
+  if not order:
+    return
+
+  amount = _amount(data.get('amount'))
+  if order_service.apply_payment(order, 'paystack', str(data['id']), amount, data.get('currency')):
+    campaign_id = (data.get('metadata') or {}).get('campaign_id')
+    if campaign_id:
+      campaign_metrics.queue_engagement(campaign_id, 'conversion', amount)
+
+
+def on_refund_processed(event):
+  data = event['data']
+  order = app_tables.orders.get(order_number=data.get('transaction_reference'))
+  if order:
+    # Paystack sends each refund's own amount; apply_refund takes the running total
+    refunded = ledger.refunded_total(order) + _amount(data.get('amount'))
+    order_service.apply_refund(order, refunded)
+
+
+def on_invoice_update(event):
+  data = event['data']
+  subscription = data.get('subscription') or {}
+  paid_until = _parse_time(subscription.get('next_payment_date'))
+
+  if data.get('paid') and subscription.get('subscription_code') and paid_until:
+    subscription_service.apply_renewal('paystack', subscription['subscription_code'], paid_until.date())
+
+
+# Event type -> handler(event payload)
+HANDLERS = {
+  'charge.success': on_charge_success,
+  'refund.processed': on_refund_processed,
+  'invoice.update': on_invoice_update
+}
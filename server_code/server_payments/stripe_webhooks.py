@@ -11,15 +11,153 @@ import anvil.tables.query as q
 from anvil.tables import app_tables
 import anvil.server
 
-# This is a server module. It runs on the Anvil server,
-# rather than in the user's browser.
-#
-# To allow anvil.server.call() to call functions here, we mark
-# them with @anvil.server.callable.
-# Here is an example - you can replace it with your own:
-#
-# @anvil.server.callable
-# def say_hello(name):
-#   print("Hello, " + name + "!")
-#   return 42
+import hashlib
+import hmac
+import json
+import time
+from datetime import datetime
+from . import webhook_queue
+from ..server_products import order_service
+from ..server_products import subscription_service
+from ..server_marketing import campaign_metrics
+
+# Stripe webhook endpoint.
 #
+# POST /_/api/webhooks/stripe verifies the Stripe-Signature header against
+# the `stripe_webhook_secret` secret and hands the event to webhook_queue;
+# the handlers below run later from process_webhook_events. Checkout sets
+# metadata.order_number (and optionally metadata.campaign_id) on the
+# PaymentIntent, which Stripe copies onto its charges.
+
+# Seconds a signed timestamp stays valid (Stripe's default tolerance)
+SIGNATURE_TOLERANCE = 300
+
+
+def verify_signature(body, header, secret, tolerance=SIGNATURE_TOLERANCE):
+  """
+  Check a Stripe-Signature header.
+
+  Args:
+    body (bytes): Raw request body
+    header (str): Stripe-Signature header ('t=...,v1=...,v1=...')
+    secret (str): Endpoint signing secret
+    tolerance (int): Maximum age of the signature in seconds
+
+  Returns:
+    bool: True if any v1 signature matches and the timestamp is recent
+  """
+  timestamp = None
+  signatures = []
+
+  for item in (header or '').split(','):
+    key, _, value = item.strip().partition('=')
+    if key == 't':
+      timestamp = value
+    elif key == 'v1':
+      signatures.append(value)
+
+  if not timestamp or not timestamp.isdigit() or not signatures:
+    return False
+
+  if abs(time.time() - int(timestamp)) > tolerance:
+    return False
+
+  expected = hmac.new(
+    secret.encode('utf-8'),
+    timestamp.encode('utf-8') + b'.' + body,
+    hashlib.sha256
+  ).hexdigest()
+
+  return any(hmac.compare_digest(expected, signature) for signature in signatures)
+
+
+def _object_key(obj):
+  """Key that orders events for the same order or subscription"""
+  metadata = obj.get('metadata') or {}
+  return metadata.get('order_number') or obj.get('subscription') or obj.get('payment_intent') or obj.get('id')
+
+
+@anvil.server.http_endpoint('/webhooks/stripe', methods=['POST'])
+def stripe_webhook(**params):
+  """Verify and queue a Stripe event, acknowledging immediately"""
+  request = anvil.server.request
+  body = request.body.get_bytes() if request.body else b''
+  header = request.headers.get('stripe-signature')
+
+  if not verify_signature(body, header, anvil.secrets.get_secret('stripe_webhook_secret')):
+    return anvil.server.HttpResponse(400, 'Invalid signature')
+
+  event = json.loads(body)
+  obj = event['data']['object']
+
+  webhook_queue.ingest(
+    'stripe',
+    event['id'],
+    event['type'],
+    _object_key(obj),
+    event,
+    header,
+    datetime.fromtimestamp(event['created'])
+  )
+
+  return anvil.server.HttpResponse(200, 'ok')
+
+
+def _amount(value):
+  """Stripe minor units -> major units"""
+  return (value or 0) / 100
+
+
+def _order(obj):
+  metadata = obj.get('metadata') or {}
+  if not metadata.get('order_number'):
+    return None
+  return app_tables.orders.get(order_number=metadata['order_number'])
+
+
+def _order_paid(obj, transaction_id, amount):
+  order = _order(obj)
+  if not order:
+    return
+
+  if order_service.apply_payment(order, 'stripe', transaction_id, amount, obj.get('currency')):
+    campaign_id = (obj.get('metadata') or {}).get('campaign_id')
+    if campaign_id:
+      campaign_metrics.queue_engagement(campaign_id, 'conversion', amount)
+
+
+def on_payment_intent_succeeded(event):
+  obj = event['data']['object']
+  _order_paid(obj, obj['id'], _amount(obj.get('amount_received')))
+
+
+def on_checkout_session_completed(event):
+  obj = event['data']['object']
+  if obj.get('payment_status') == 'paid':
+    _order_paid(obj, obj.get('payment_intent') or obj['id'], _amount(obj.get('amount_total')))
+
+
+def on_charge_refunded(event):
+  obj = event['data']['object']
+  order = _order(obj)
+  if order:
+    order_service.apply_refund(order, _amount(obj.get('amount_refunded')))
+
+
+def on_invoice_paid(event):
+  obj = event['data']['object']
+  lines = (obj.get('lines') or {}).get('data') or []
+  if not obj.get('subscription') or not lines:
+    return
+
+  paid_until = datetime.fromtimestamp(lines[0]['period']['end']).date()
+  subscription_service.apply_renewal('stripe', obj['subscription'], paid_until)
+
+
+# Event type -> handler(event payload)
+HANDLERS = {
+  'payment_intent.succeeded': on_payment_intent_succeeded,
+  'checkout.session.completed': on_checkout_session_completed,
+  'charge.refunded': on_charge_refunded,
+  'invoice.paid': on_invoice_paid
+}
@@ -0,0 +1,354 @@
+import anvil.google.auth, anvil.google.drive, anvil.google.mail
+from anvil.google.drive import app_files
+import anvil.stripe
+import anvil.secrets
+import anvil.files
+from anvil.files import data_files
+import anvil.email
+import anvil.users
+import anvil.tables as tables
+import anvil.tables.query as q
+from anvil.tables import app_tables
+import anvil.server
+
+from datetime import datetime, timedelta
+
+# Queue-backed payment webhook ingestion.
+#
+# HTTP handlers (stripe_webhooks, paystack_webhooks) only verify the
+# signature and call ingest(), which stores the raw event in `webhook_log`
+# and returns, so the gateway is acknowledged in milliseconds however busy
+# fulfilment is. Tables have no unique constraints; ingest() checks for the
+# (gateway, event_id) pair inside a transaction, and conflicting concurrent
+# deliveries of the same event are serialised so only one row is written.
+#
+# The process_webhook_events task works through pending events oldest
+# first. Events for the same object (order, subscription) are applied in
+# order: once one is waiting for a retry, later events for that object
+# wait behind it. Each handler runs in the same transaction that marks its
+# event done, so fulfilment is never applied twice. Events that keep
+# failing are dead-lettered (status 'dead'); later events for the same
+# object stay queued until an admin retries or discards the dead one, so a
+# refund is never applied ahead of the payment it reverses.
+
+# Event status values
+PENDING = 'pending'
+PROCESSING = 'processing'
+DONE = 'done'
+IGNORED = 'ignored'
+DEAD = 'dead'
+
+MAX_ATTEMPTS = 6
+
+# Minutes to wait before retry n (the last value repeats)
+RETRY_DELAYS = [1, 5, 15, 60, 240]
+
+# A claim older than this is from a worker that died mid-event
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+# Processed events are kept this long so late redeliveries are still deduped
+RETENTION_DAYS = 30
+
+PAGE_SIZE = 50
+
+
+def _handlers(gateway):
+  """Event type -> handler for a gateway"""
+  from . import stripe_webhooks, paystack_webhooks
+
+  return {
+    'stripe': stripe_webhooks.HANDLERS,
+    'paystack': paystack_webhooks.HANDLERS
+  }.get(gateway, {})
+
+
+@tables.in_transaction
+def ingest(gateway, event_id, event_type, object_key, payload, signature, occurred_at=None):
+  """
+  Store a verified webhook event for processing.
+
+  Args:
+    gateway (str): 'stripe' or 'paystack'
+    event_id (str): Gateway event ID
+    event_type (str): Gateway event type
+    object_key (str): Object the event applies to; events sharing a key
+      are processed in order
+    payload (dict): Raw event
+    signature (str): Signature header as received
+    occurred_at (datetime): When the gateway raised the event
+
+  Returns:
+    bool: False if the event was already received
+  """
+  if app_tables.webhook_log.get(gateway=gateway, event_id=event_id):
+    return False
+
+  now = datetime.now()
+  app_tables.webhook_log.add_row(
+    gateway=gateway,
+    event_id=event_id,
+    event_type=event_type,
+    object_key=object_key,
+    payload=payload,
+    signature=signature,
+    verified=True,
+    processed=False,
+    status=PENDING,
+    attempts=0,
+    occurred_at=occurred_at or now,
+    received_at=now
+  )
+  return True
+
+
+@anvil.server.background_task
+def process_webhook_events():
+  """Apply pending webhook events in order per object (run every minute)"""
+  _release_stale_claims()
+
+  now = datetime.now()
+  counts = {}
+
+  # Dead-lettered events hold back everything after them for their object
+  blocked = {
+    (event['gateway'], event['object_key'])
+    for event in app_tables.webhook_log.search(q.fetch_only('gateway', 'object_key'), status=DEAD)
+  }
+
+  events = app_tables.webhook_log.search(
+    tables.order_by('occurred_at'),
+    tables.order_by('received_at'),
+    status=q.any_of(PENDING, PROCESSING)
+  )
+
+  for event in events:
+    key = (event['gateway'], event['object_key'])
+    if key in blocked:
+      continue
+
+    if event['status'] == PROCESSING or (event['next_attempt_at'] and event['next_attempt_at'] > now):
+      blocked.add(key)
+      continue
+
+    outcome = _process(event)
+    if outcome in (PENDING, DEAD, None):
+      # Retry pending, dead-lettered, or another worker holds it - later events wait
+      blocked.add(key)
+    if outcome:
+      counts[outcome] = counts.get(outcome, 0) + 1
+
+  if counts:
+    print(f"Processed webhook events: {counts}")
+
+
+def _process(event):
+  """
+  Run one event's handler.
+
+  Returns:
+    str: Resulting status, or None if another worker took the event
+  """
+  handler = _handlers(event['gateway']).get(event['event_type'])
+
+  if not _claim(event):
+    return None
+
+  if not handler:
+    _finish(event, IGNORED)
+    return IGNORED
+
+  try:
+    _apply(event, handler)
+    return DONE
+  except Exception as e:
+    return _fail(event, e)
+
+
+@tables.in_transaction
+def _claim(event):
+  """Mark a pending event as being processed"""
+  if event['status'] != PENDING:
+    return False
+  event.update(status=PROCESSING, claimed_at=datetime.now())
+  return True
+
+
+@tables.in_transaction
+def _apply(event, handler):
+  """Run the handler and mark the event done in one transaction"""
+  handler(event['payload'])
+  _finish(event, DONE)
+
+
+def _finish(event, status):
+  event.update(
+    status=status,
+    processed=True,
+    processed_at=datetime.now(),
+    error_message=None
+  )
+
+
+@tables.in_transaction
+def _fail(event, error):
+  """
+  Schedule a retry, or dead-letter the event after MAX_ATTEMPTS.
+
+  Returns:
+    str: PENDING or DEAD
+  """
+  attempts = (event['attempts'] or 0) + 1
+  print(f"Error processing webhook {event['gateway']} {event['event_id']} (attempt {attempts}): {error}")
+
+  if attempts >= MAX_ATTEMPTS:
+    event.update(status=DEAD, attempts=attempts, error_message=str(error), next_attempt_at=None)
+    return DEAD
+
+  delay = RETRY_DELAYS[min(attempts, len(RETRY_DELAYS)) - 1]
+  event.update(
+    status=PENDING,
+    attempts=attempts,
+    error_message=str(error),
+    next_attempt_at=datetime.now() + timedelta(minutes=delay)
+  )
+  return PENDING
+
+
+def _release_stale_claims():
+  """Return events claimed by a worker that died back to the queue"""
+  cutoff = datetime.now() - CLAIM_TIMEOUT
+  for event in app_tables.webhook_log.search(status=PROCESSING, claimed_at=q.less_than(cutoff)):
+    event.update(status=PENDING, claimed_at=None)
+
+
+@anvil.server.background_task
+def prune_webhook_log():
+  """Delete processed events past the retention window (run daily)"""
+  cutoff = datetime.now() - timedelta(days=RETENTION_DAYS)
+  count = 0
+
+  for event in app_tables.webhook_log.search(
+    status=q.any_of(DONE, IGNORED),
+    processed_at=q.less_than(cutoff)
+  ):
+    event.delete()
+    count += 1
+
+  if count:
+    print(f"Pruned {count} webhook events")
+
+
+@anvil.server.callable
+@anvil.users.login_required
+def get_webhook_events(status=DEAD, page=1):
+  """
+  Get webhook events by status, newest first.
+
+  Args:
+    status (str): 'pending', 'dead', 'done', ...
+    page (int): 1-based page number
+
+  Returns:
+    dict: {'success': bool, 'data': {'items', 'total', 'page', 'has_more'}}
+      or {'success': bool, 'error': str}
+  """
+  try:
+    user = anvil.users.get_user()
+
+    if user['role'] not in ['owner', 'manager']:
+      return {'success': False, 'error': 'Access denied'}
+
+    events = app_tables.webhook_log.search(
+      tables.order_by('received_at', ascending=False),
+      status=status
+    )
+    total = len(events)
+    start = (page - 1) * PAGE_SIZE
+
+    items = [{
+      'id': event.get_id(),
+      'gateway': event['gateway'],
+      'event_id': event['event_id'],
+      'event_type': event['event_type'],
+      'object_key': event['object_key'],
+      'status': event['status'],
+      'attempts': event['attempts'] or 0,
+      'error_message': event['error_message'],
+      'received_at': event['received_at'],
+      'processed_at': event['processed_at']
+    } for event in events[start:start + PAGE_SIZE]]
+
+    return {'success': True, 'data': {
+      'items': items,
+      'total': total,
+      'page': page,
+      'has_more': start + PAGE_SIZE < total
+    }}
+
+  except Exception as e:
+    print(f"Error getting webhook events: {e}")
+    return {'success': False, 'error': str(e)}
+
+
+@anvil.server.callable
+@anvil.users.login_required
+def retry_webhook_event(event_row_id):
+  """
+  Put a dead-lettered event back on the queue.
+
+  Args:
+    event_row_id (str): webhook_log row ID
+
+  Returns:
+    dict: {'success': bool} or {'success': bool, 'error': str}
+  """
+  try:
+    user = anvil.users.get_user()
+
+    if user['role'] not in ['owner', 'manager']:
+      return {'success': False, 'error': 'Access denied'}
+
+    event = app_tables.webhook_log.get_by_id(event_row_id)
+
+    if not event or event['status'] != DEAD:
+      return {'success': False, 'error': 'Event is not dead-lettered'}
+
+    event.update(status=PENDING, attempts=0, next_attempt_at=None)
+
+    return {'success': True}
+
+  except Exception as e:
+    print(f"Error retrying webhook event: {e}")
+    return {'success': False, 'error': str(e)}
+
+
+@anvil.server.callable
+@anvil.users.login_required
+def discard_webhook_event(event_row_id):
+  """
+  Drop a dead-lettered event so later events for its object can proceed.
+
+  Args:
+    event_row_id (str): webhook_log row ID
+
+  Returns:
+    dict: {'success': bool} or {'success': bool, 'error': str}
+  """
+  try:
+    user = anvil.users.get_user()
+
+    if user['role'] not in ['owner', 'manager']:
+      return {'success': False, 'error': 'Access denied'}
+
+    event = app_tables.webhook_log.get_by_id(event_row_id)
+
+    if not event or event['status'] != DEAD:
+      return {'success': False, 'error': 'Event is not dead-lettered'}
+
+    event.update(status=IGNORED, processed=True, processed_at=datetime.now(), next_attempt_at=None)
+
+    return {'success': True}
+
+  except Exception as e:
+    print(f"Error discarding webhook event: {e}")
+    return {'success': False, 'error': str(e)}
@@ -11,6 +11,9 @@ import anvil.tables.query as q
 from anvil.tables import app_tables
 import anvil.server
 from datetime import datetime
+from ..server_customers import customer_summary
+from ..server_customers import contact_identity
+from ..server_payments import ledger
 
 @anvil.server.callable
 @anvil.users.login_required
@@ -28,66 +31,7 @@ def create_order_from_cart(customer_data, shipping_data, payment_method):
   """
   try:
     user = anvil.users.get_user()
-
-    # Get cart
-    cart = app_tables.cart.get(customer_id=user)
-
-    if not cart:
-      return {'success': False, 'error': 'Cart is empty'}
-
-    cart_items = list(app_tables.cart_items.search(cart_id=cart))
-
-    if not cart_items:
-      return {'success': False, 'error': 'Cart is empty'}
-
-    # Calculate totals
-    subtotal = sum(item['price_at_add'] * item['quantity'] for item in cart_items)
-    tax = subtotal * 0.10
-    shipping_cost = 5.00
-    total = subtotal + tax + shipping_cost
-
-    # Generate order number
-    order_number = generate_order_number()
-
-    # Create order
-    order = app_tables.orders.add_row(
-      order_number=order_number,
-      client_id=user,  # Business owner (for multi-tenant)
-      customer_id=user,
-      status='pending',
-      payment_status='unpaid',
-      subtotal=subtotal,
-      tax=tax,
-      shipping=shipping_cost,
-      discount=0,
-      total_amount=total,
-      shipping_address=shipping_data,
-      billing_address=shipping_data,  # Same as shipping for now
-      notes=None,
-      created_at=datetime.now(),
-      updated_at=datetime.now()
-    )
-
-    # Create order items
-    for item in cart_items:
-      app_tables.order_items.add_row(
-        order_id=order,
-        product_id=item['product_id'],
-        product_name=item['product_id']['name'],
-        quantity=item['quantity'],
-        price=item['price_at_add'],
-        subtotal=item['price_at_add'] * item['quantity']
-      )
-
-      # Deduct inventory
-      product = item['product_id']
-      if product['track_inventory']:
-        product['inventory_quantity'] -= item['quantity']
-        product.update()
-
-    # Clear cart
-    for item in cart_items:
-      item.delete()
+    order_number = _create_order(user, shipping_data)
 
     # TODO: Process payment with gateway
     # For now, mark as pending
@@ -98,6 +42,168 @@ def create_order_from_cart(customer_data, shipping_data, payment_method):
     print(f"Error creating order: {e}")
     return {'success': False, 'error': str(e)}
 
+
+@tables.in_transaction
+def _create_order(user, shipping_data):
+  """Turn the user's cart into an order (raises to roll back)"""
+  # Get cart
+  cart = app_tables.cart.get(customer_id=user)
+
+  if not cart:
+    raise ValueError('Cart is empty')
+
+  cart_items = list(app_tables.cart_items.search(cart_id=cart))
+
+  if not cart_items:
+    raise ValueError('Cart is empty')
+
+  # Calculate totals
+  subtotal = sum(item['price_at_add'] * item['quantity'] for item in cart_items)
+  tax = subtotal * 0.10
+  shipping_cost = 5.00
+  total = subtotal + tax + shipping_cost
+
+  # Generate order number
+  order_number = generate_order_number()
+
+  # Create order
+  order = app_tables.orders.add_row(
+    order_number=order_number,
+    client_id=user,  # Business owner (for multi-tenant)
+    customer_id=user,
+    status='pending',
+    payment_status='unpaid',
+    subtotal=subtotal,
+    tax=tax,
+    shipping=shipping_cost,
+    discount=0,
+    total_amount=total,
+    shipping_address=shipping_data,
+    billing_address=shipping_data,  # Same as shipping for now
+    notes=None,
+    created_at=datetime.now(),
+    updated_at=datetime.now()
+  )
+
+  # Create order items
+  for item in cart_items:
+    app_tables.order_items.add_row(
+      order_id=order,
+      product_id=item['product_id'],
+      product_name=item['product_id']['name'],
+      quantity=item['quantity'],
+      price=item['price_at_add'],
+      subtotal=item['price_at_add'] * item['quantity'],
+      created_at=datetime.now()
+    )
+
+    # Deduct inventory
+    product = item['product_id']
+    if product['track_inventory']:
+      product['inventory_quantity'] -= item['quantity']
+      product.update()
+
+  # Clear cart
+  for item in cart_items:
+    item.delete()
+
+  customer_summary.record('order', order)
+
+  return order_number
+
+
+def apply_payment(order, gateway, transaction_id, amount, currency=None):
+  """
+  Mark an order paid from a confirmed gateway payment.
+
+  Call inside a transaction. Already-paid orders are left alone, so a
+  redelivered payment event never fulfils twice. A payment short of the
+  order total, or in another currency, is recorded against the order but
+  flagged with payment_status 'review' instead of fulfilling it.
+
+  Args:
+    order (Row): orders row
+    gateway (str): 'stripe' or 'paystack'
+    transaction_id (str): Gateway payment reference
+    amount (float): Amount paid
+    currency (str): Currency code of the payment, if the gateway sent one
+
+  Returns:
+    bool: True if the order was marked paid
+  """
+  if order['payment_status'] in ['paid', 'partially_refunded', 'refunded', 'review']:
+    return False
+
+  order.update(
+    payment_gateway=gateway,
+    gateway_transaction_id=transaction_id,
+    paid_amount=amount,
+    updated_at=datetime.now()
+  )
+
+  # Cash was received either way
+  ledger.post_payment(order, amount)
+
+  if not _payment_matches(order, amount, currency):
+    print(f"Payment {transaction_id} for {order['order_number']} does not match the order; flagged for review")
+    order['payment_status'] = 'review'
+    return False
+
+  order.update(
+    payment_status='paid',
+    status='processing' if order['status'] == 'pending' else order['status']
+  )
+
+  if order['customer_id'] and order['customer_id']['email']:
+    contact_identity.record_transaction(
+      order['client_id'], order['customer_id']['email'], 'order', order.get_id(), amount
+    )
+
+  return True
+
+
+def _payment_matches(order, amount, currency):
+  """Whether a payment covers the order total in the order's currency"""
+  if round(amount or 0, 2) < round(order['total_amount'] or 0, 2):
+    return False
+  if currency and order['currency'] and currency.upper() != order['currency'].upper():
+    return False
+  return True
+
+
+def apply_refund(order, amount_refunded):
+  """
+  Record a gateway refund against an order.
+
+  Call inside a transaction. Refunded amounts not yet in the ledger are
+  posted; a full refund restocks tracked products once.
+
+  Args:
+    order (Row): orders row
+    amount_refunded (float): Total refunded so far on the payment
+
+  Returns:
+    bool: True if the order changed
+  """
+  if order['payment_status'] == 'refunded':
+    return False
+
+  ledger.post_refund(order, amount_refunded)
+
+  if amount_refunded < (order['total_amount'] or 0):
+    if order['payment_status'] == 'partially_refunded':
+      return False
+    order.update(payment_status='partially_refunded', updated_at=datetime.now())
+    return True
+
+  for item in app_tables.order_items.search(order_id=order):
+    product = item['product_id']
+    if product and product['track_inventory']:
+      product['inventory_quantity'] = (product['inventory_quantity'] or 0) + item['quantity']
+
+  order.update(payment_status='refunded', status='refunded', updated_at=datetime.now())
+  return True
+
 def generate_order_number():
   """Generate unique order number"""
   from datetime import datetime
@@ -10,6 +10,7 @@ import anvil.tables as tables
 import anvil.tables.query as q
 from anvil.tables import app_tables
 import anvil.server
+from datetime import datetime
 
 @anvil.server.callable
 @anvil.users.login_required
@@ -48,4 +49,38 @@ def get_all_subscriptions(filters):
 
   except Exception as e:
     print(f"Error getting subscriptions: {e}")
-    return {'success': False, 'error': str(e)}
\ No newline at end of file
+    return {'success': False, 'error': str(e)}
+
+
+def apply_renewal(gateway, gateway_subscription_id, paid_until):
+  """
+  Extend a subscription from a confirmed renewal payment.
+
+  Call inside a transaction. A renewal that does not move the billing date
+  forward (e.g. a redelivered event) is ignored.
+
+  Args:
+    gateway (str): 'stripe' or 'paystack'
+    gateway_subscription_id (str): Gateway subscription reference
+    paid_until (date): End of the period paid for
+
+  Returns:
+    bool: True if the subscription changed
+  """
+  subscription = app_tables.subscriptions.get(
+    payment_gateway=gateway,
+    gateway_subscription_id=gateway_subscription_id
+  )
+
+  if not subscription:
+    return False
+
+  if subscription['next_billing_date'] and subscription['next_billing_date'] >= paid_until:
+    return False
+
+  subscription.update(
+    status='active',
+    next_billing_date=paid_until,
+    updated_at=datetime.now()
+  )
+  return True
@@ -11,6 +11,8 @@ import anvil.tables.query as q
 from anvil.tables import app_tables
 import anvil.server
 from datetime import datetime
+from ..server_shared import config as config_cache
+from ..server_shared import audit_logger
 
 @anvil.server.callable
 @anvil.users.login_required
@@ -22,18 +24,14 @@ def get_business_profile():
     if user['role'] not in ['owner', 'manager']:
       return {'success': False, 'error': 'Access denied'}
 
-    config = app_tables.config.get(key='business_profile')
-
-    if config:
-      return {'success': True, 'data': config['value']}
-    else:
-      return {'success': True, 'data': None}
+    return {'success': True, 'data': config_cache.get_config_value('business_profile')}
 
   except Exception as e:
     return {'success': False, 'error': str(e)}
 
 @anvil.server.callable
 @anvil.users.login_required
+@audit_logger.audited('settings.business_profile')
 def save_business_profile(profile_data):
   """Save business profile"""
   try:
@@ -58,6 +56,8 @@ def save_business_profile(profile_data):
         updated_by=user
       )
 
+    config_cache.invalidate('business_profile')
+
     return {'success': True}
 
   except Exception as e:
@@ -86,6 +86,7 @@ def get_courier_config():
 
 @anvil.server.callable
 @anvil.users.login_required
+@audit_logger.audited('settings.courier')
 def save_courier_config(config_data):
   """Save courier configuration"""
   try:
@@ -144,6 +145,7 @@ def get_currency_settings():
 
 @anvil.server.callable
 @anvil.users.login_required
+@audit_logger.audited('settings.currency')
 def save_currency_settings(settings, is_locked):
   """Save currency settings"""
   try:
@@ -230,26 +232,16 @@ def get_enabled_features():
     if user['role'] not in ['owner', 'manager']:
       return {'success': False, 'error': 'Access denied'}
 
-    config = app_tables.config.get(key='enabled_features')
-
-    if config:
-      return {'success': True, 'data': config['value']}
-    else:
-      # Defaults
-      return {'success': True, 'data': {
-        'bookings': True,
-        'ecommerce': True,
-        'subscriptions': False,
-        'services': False,
-        'hospitality': False,
-        'blog': True
-      }}
+    return {'success': True, 'data': config_cache.get_config_value(
+      'enabled_features', config_cache.DEFAULT_FEATURES
+    )}
 
   except Exception as e:
     return {'success': False, 'error': str(e)}
 
 @anvil.server.callable
 @anvil.users.login_required
+@audit_logger.audited('settings.features')
 def save_enabled_features(features):
   """Save enabled features"""
   try:
@@ -274,6 +266,8 @@ def save_enabled_features(features):
         updated_by=user
       )
 
+    config_cache.invalidate('enabled_features')
+
     return {'success': True}
 
   except Exception as e:
@@ -282,6 +276,7 @@ def save_enabled_features(features):
 
 @anvil.server.callable
 @anvil.users.login_required
+@audit_logger.audited('settings.payment_gateway')
 def select_payment_gateway(gateway):
   """Select payment gateway"""
   try:
@@ -310,6 +305,7 @@ def select_payment_gateway(gateway):
 
 @anvil.server.callable
 @anvil.users.login_required
+@audit_logger.audited('settings.stripe_key')
 def save_stripe_api_key(api_key):
   """Save Stripe API key"""
   try:
@@ -378,23 +374,16 @@ def get_theme_settings():
     if user['role'] not in ['owner', 'manager']:
       return {'success': False, 'error': 'Access denied'}
 
-    config = app_tables.config.get(key='theme_settings')
-
-    if config:
-      return {'success': True, 'data': config['value']}
-    else:
-      return {'success': True, 'data': {
-        'primary_color': '#2196F3',
-        'accent_color': '#FF9800',
-        'font_family': 'default',
-        'header_style': 'light'
-      }}
+    return {'success': True, 'data': config_cache.get_config_value(
+      'theme_settings', config_cache.DEFAULT_THEME
+    )}
 
   except Exception as e:
     return {'success': False, 'error': str(e)}
 
 @anvil.server.callable
 @anvil.users.login_required
+@audit_logger.audited('settings.theme')
 def save_theme_settings(theme_data):
   """Save theme settings"""
   try:
@@ -419,6 +408,8 @@ def save_theme_settings(theme_data):
         updated_by=user
       )
 
+    config_cache.invalidate('theme_settings')
+
     return {'success': True}
 
   except Exception as e:
@@ -11,15 +11,255 @@ import anvil.tables.query as q
 from anvil.tables import app_tables
 import anvil.server
 
-# This is a server module. It runs on the Anvil server,
-# rather than in the user's browser.
-#
-# To allow anvil.server.call() to call functions here, we mark
-# them with @anvil.server.callable.
-# Here is an example - you can replace it with your own:
+from datetime import datetime
+import functools
+
+# Audit logging.
 #
-# @anvil.server.callable
-# def say_hello(name):
-#   print("Hello, " + name + "!")
-#   return 42
+# log() writes one entry to `activity_log`, inline or through a background
+# task so the request doesn't wait on the write. To record several actions
+# from one call, collect them with entry() and pass the list to write(),
+# which stores them with a single add_rows call. Entries are never held at
+# module level, because server modules are shared between requests. The
+# @audited decorator logs a successful callable for you.
 #
+# Each entry stores a 'YYYY-MM' partition, so retention pruning deletes
+# whole months with one range query.
+
+DEFAULT_RETENTION_MONTHS = 24
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def partition_key(when):
+  """Month partition for a timestamp ('YYYY-MM')"""
+  return when.strftime('%Y-%m')
+
+
+def _client_ip():
+  try:
+    return anvil.server.context.client.ip
+  except Exception:
+    return None
+
+
+def entry(action_type, description='', metadata=None, user=None):
+  """
+  Build an audit entry without writing it.
+
+  Args:
+    action_type (str): e.g. 'settings.update', 'ticket.assign'
+    description (str): Human-readable summary
+    metadata (dict): Extra details
+    user (Row): Acting user (default: logged-in user)
+
+  Returns:
+    dict: activity_log row values
+  """
+  now = datetime.now()
+  return {
+    'user_id': user or anvil.users.get_user(),
+    'action_type': action_type,
+    'description': description,
+    'metadata': metadata or {},
+    'ip_address': _client_ip(),
+    'created_at': now,
+    'partition': partition_key(now)
+  }
+
+
+def write(entries, background=False):
+  """
+  Write audit entries in one batch.
+
+  Args:
+    entries (list): Entries built with entry()
+    background (bool): Hand the batch to a background task instead of writing inline
+
+  Returns:
+    int: Number of entries written
+  """
+  if not entries:
+    return 0
+
+  try:
+    if background:
+      anvil.server.launch_background_task('write_audit_entries', entries)
+    else:
+      app_tables.activity_log.add_rows(entries)
+  except Exception as e:
+    # Auditing must never fail the request it describes
+    print(f"Error writing audit log: {e}")
+
+  return len(entries)
+
+
+def log(action_type, description='', metadata=None, user=None, background=False):
+  """
+  Write a single audit entry.
+
+  Args:
+    action_type (str): e.g. 'settings.update', 'ticket.assign'
+    description (str): Human-readable summary
+    metadata (dict): Extra details
+    user (Row): Acting user (default: logged-in user)
+    background (bool): Write via a background task
+  """
+  write([entry(action_type, description, metadata, user)], background=background)
+
+
+@anvil.server.background_task
+def write_audit_entries(entries):
+  """Write a batch of audit entries handed off by write(background=True)"""
+  app_tables.activity_log.add_rows(entries)
+
+
+def audited(action_type, description=None, background=False, include_args=False):
+  """
+  Decorator: log the callable when it succeeds.
+
+  Place it below @anvil.server.callable / @anvil.users.login_required.
+  Nothing is logged for a result of {'success': False, ...} or an exception.
+
+  Args:
+    action_type (str): Action recorded for the call
+    description (str): Summary (default: the function name)
+    background (bool): Write via a background task
+    include_args (bool): Record positional arguments (never for secrets)
+  """
+  def decorator(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+      result = func(*args, **kwargs)
+
+      if isinstance(result, dict) and result.get('success') is False:
+        return result
+
+      metadata = {'function': func.__name__}
+      if include_args:
+        metadata['args'] = [str(a) for a in args]
+
+      log(action_type, description or func.__name__, metadata, background=background)
+      return result
+
+    return wrapper
+  return decorator
+
+
+def query_log(user_id=None, action_type=None, start_date=None, end_date=None,
+              page=1, page_size=DEFAULT_PAGE_SIZE):
+  """
+  Search audit entries, newest first.
+
+  Args:
+    user_id (str): Acting user's row id
+    action_type (str): Exact action, or a prefix ending in '*' (e.g. 'settings.*')
+    start_date (datetime): Earliest entry
+    end_date (datetime): Latest entry
+    page (int): 1-based page
+    page_size (int): Entries per page (capped at MAX_PAGE_SIZE)
+
+  Returns:
+    dict: {'entries': list, 'total': int, 'page': int, 'has_more': bool}
+  """
+  page = max(int(page or 1), 1)
+  page_size = max(1, min(int(page_size or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+  start = (page - 1) * page_size
+
+  query = {}
+
+  if user_id:
+    query['user_id'] = app_tables.users.get_by_id(user_id)
+
+  if action_type:
+    if action_type.endswith('*'):
+      query['action_type'] = q.like(action_type[:-1] + '%')
+    else:
+      query['action_type'] = action_type
+
+  # Partition range narrows the scan before the timestamp range
+  conditions = []
+  if start_date:
+    conditions.append(q.all_of(
+      partition=q.greater_than_or_equal_to(partition_key(start_date)),
+      created_at=q.greater_than_or_equal_to(start_date)
+    ))
+  if end_date:
+    conditions.append(q.all_of(
+      partition=q.less_than_or_equal_to(partition_key(end_date)),
+      created_at=q.less_than_or_equal_to(end_date)
+    ))
+
+  results = app_tables.activity_log.search(
+    tables.order_by('created_at', ascending=False),
+    *conditions,
+    **query
+  )
+
+  total = len(results)
+  entries = [{
+    'user': row['user_id']['email'] if row['user_id'] else None,
+    'action_type': row['action_type'],
+    'description': row['description'],
+    'metadata': row['metadata'],
+    'ip_address': row['ip_address'],
+    'created_at': row['created_at']
+  } for row in results[start:start + page_size]]
+
+  return {
+    'entries': entries,
+    'total': total,
+    'page': page,
+    'has_more': start + page_size < total
+  }
+
+
+@anvil.server.callable
+@anvil.users.login_required
+def get_audit_log(filters=None, page=1, page_size=DEFAULT_PAGE_SIZE):
+  """
+  Get a page of the audit log.
+
+  Args:
+    filters (dict): {'user_id', 'action_type', 'start_date', 'end_date'}
+
+  Returns:
+    dict: {'success': bool, 'data': dict} or {'success': bool, 'error': str}
+  """
+  try:
+    user = anvil.users.get_user()
+
+    if user['role'] not in ['owner', 'manager']:
+      return {'success': False, 'error': 'Access denied'}
+
+    filters = filters or {}
+    data = query_log(
+      user_id=filters.get('user_id'),
+      action_type=filters.get('action_type'),
+      start_date=filters.get('start_date'),
+      end_date=filters.get('end_date'),
+      page=page,
+      page_size=page_size
+    )
+
+    return {'success': True, 'data': data}
+
+  except Exception as e:
+    print(f"Error getting audit log: {e}")
+    return {'success': False, 'error': str(e)}
+
+
+@anvil.server.background_task
+def prune_audit_log(retention_months=DEFAULT_RETENTION_MONTHS):
+  """Delete whole month partitions older than the retention period (run daily)"""
+  now = datetime.now()
+  months = now.year * 12 + now.month - 1 - retention_months
+  cutoff = f"{months // 12:04d}-{months % 12 + 1:02d}"
+
+  app_tables.activity_log.search(partition=q.less_than(cutoff)).delete_all_rows()
+
+  # Entries written before partitions existed
+  cutoff_date = datetime(months // 12, months % 12 + 1, 1)
+  app_tables.activity_log.search(partition=None, created_at=q.less_than(cutoff_date)).delete_all_rows()
+  print(f"Pruned audit log partitions before {cutoff}")
@@ -11,15 +11,436 @@ import anvil.tables.query as q
 from anvil.tables import app_tables
 import anvil.server
 
-# This is a server module. It runs on the Anvil server,
-# rather than in the user's browser.
-#
-# To allow anvil.server.call() to call functions here, we mark
-# them with @anvil.server.callable.
-# Here is an example - you can replace it with your own:
+import anvil.media
+from datetime import datetime, date, timedelta
+import gzip
+import json
+import os
+import tempfile
+import uuid
+from . import audit_logger
+
+# Tenant backups.
 #
-# @anvil.server.callable
-# def say_hello(name):
-#   print("Hello, " + name + "!")
-#   return 42
+# A backup is a gzipped newline-delimited JSON archive. The first line is a
+# header; every other line is one row: {"table", "id", "data"}. Rows are
+# streamed straight from table searches into the archive on disk, so large
+# tenants never sit in memory.
 #
+# Incremental backups only include rows whose watermark columns moved
+# since the tenant's previous backup (updated_at, or created_at for rows
+# never edited). Child rows (order items, contact events) travel with
+# their parent in full backups and are picked up by their own watermark in
+# incremental ones. Restores read the archive back and bulk-insert rows in
+# batches, remapping links between restored rows.
+
+ARCHIVE_FORMAT = 'ndjson-gzip-v1'
+
+# Table -> tenant column and incremental watermark columns (a row is
+# included when any of them is after the previous backup). Order matters:
+# tables are archived (and restored) in this order.
+BACKUP_TABLES = {
+  'contacts': {'tenant': 'instance_id', 'watermark': ['updated_at']},
+  'segments': {'tenant': 'instance_id', 'watermark': ['updated_at', 'created_date']},
+  'email_campaigns': {'tenant': 'instance_id', 'watermark': ['updated_at', 'created_date']},
+  'tasks': {'tenant': 'instance_id', 'watermark': ['updated_at', 'created_at']},
+  'products': {'tenant': 'client_id', 'watermark': ['updated_at']},
+  'orders': {'tenant': 'client_id', 'watermark': ['updated_at']},
+  'tbl_bookings': {'tenant': 'client_id', 'watermark': ['updated_at', 'created_at']},
+  'tbl_blog_posts': {'tenant': 'client_id', 'watermark': ['updated_at']}
+}
+
+# Parent table -> [(child table, link column to parent, watermark column)]
+CHILD_TABLES = {
+  'contacts': [('contact_events', 'contact_id', 'event_date')],
+  'orders': [('order_items', 'order_id', 'created_at')]
+}
+
+DEFAULT_RETENTION_DAYS = 30
+
+RESTORE_BATCH_SIZE = 500
+
+
+def _encode(value):
+  """JSON-safe form of a column value"""
+  if isinstance(value, datetime):
+    return {'$datetime': value.isoformat()}
+  if isinstance(value, date):
+    return {'$date': value.isoformat()}
+  if isinstance(value, anvil.Media):
+    # Media is not archived (product images, attachments)
+    return None
+  if hasattr(value, 'get_id'):
+    return {'$row': value.get_id()}
+  if isinstance(value, list) and any(hasattr(v, 'get_id') for v in value):
+    return [_encode(v) for v in value]
+  return value
+
+
+def _row_line(table_name, row):
+  data = {column: _encode(value) for column, value in dict(row).items()}
+  return json.dumps({'table': table_name, 'id': row.get_id(), 'data': data}, default=str) + '\n'
+
+
+def _tenant_rows(table_name, tenant, since):
+  """Search a table for a tenant's rows, changed since the watermark if given"""
+  config = BACKUP_TABLES[table_name]
+  table = getattr(app_tables, table_name)
+
+  if not since:
+    return table.search(**{config['tenant']: tenant})
+
+  changed = q.any_of(**{column: q.greater_than(since) for column in config['watermark']})
+  return table.search(changed, **{config['tenant']: tenant})
+
+
+def _changed_children(table_name, tenant, since):
+  """Yield (child table, row) for a tenant's child rows added since the watermark"""
+  tenant_column = BACKUP_TABLES[table_name]['tenant']
+
+  for child_table, parent_column, watermark in CHILD_TABLES.get(table_name, []):
+    for child in getattr(app_tables, child_table).search(**{watermark: q.greater_than(since)}):
+      parent = child[parent_column]
+      if parent and parent[tenant_column] == tenant:
+        yield child_table, child
+
+
+def write_archive(archive_file, tenant, backup_type, since):
+  """
+  Stream a tenant's rows into an open gzip text file.
+
+  Returns:
+    dict: Row counts by table
+  """
+  counts = {}
+
+  archive_file.write(json.dumps({
+    'format': ARCHIVE_FORMAT,
+    'tenant': tenant.get_id(),
+    'backup_type': backup_type,
+    'since': since.isoformat() if since else None,
+    'created_at': datetime.now().isoformat(),
+    'tables': list(BACKUP_TABLES)
+  }) + '\n')
+
+  def write(table_name, row):
+    archive_file.write(_row_line(table_name, row))
+    counts[table_name] = counts.get(table_name, 0) + 1
+
+  for table_name in BACKUP_TABLES:
+    for row in _tenant_rows(table_name, tenant, since):
+      write(table_name, row)
+
+      if not since:
+        for child_table, parent_column, _ in CHILD_TABLES.get(table_name, []):
+          for child in getattr(app_tables, child_table).search(**{parent_column: row}):
+            write(child_table, child)
+
+    if since:
+      for child_table, child in _changed_children(table_name, tenant, since):
+        write(child_table, child)
+
+  return counts
+
+
+def _last_backup(tenant):
+  """Most recent completed backup for a tenant"""
+  backups = app_tables.backups.search(
+    tables.order_by('backup_date', ascending=False),
+    client_id=tenant,
+    status='completed'
+  )
+  for backup in backups:
+    return backup
+  return None
+
+
+@anvil.server.background_task
+def run_backup(tenant_id, backup_type='incremental', retention_days=DEFAULT_RETENTION_DAYS):
+  """
+  Build a backup archive for one tenant.
+
+  An incremental backup with no earlier backup to build on runs as full.
+  """
+  tenant = app_tables.users.get_by_id(tenant_id)
+  started = datetime.now()
+
+  since = None
+  if backup_type == 'incremental':
+    previous = _last_backup(tenant)
+    if previous:
+      since = previous['backup_date']
+    else:
+      backup_type = 'full'
+
+  backup = app_tables.backups.add_row(
+    backup_id=str(uuid.uuid4()),
+    client_id=tenant,
+    backup_type=backup_type,
+    since=since,
+    status='running',
+    retention_days=retention_days,
+    creation_date=started
+  )
+
+  fd, path = tempfile.mkstemp(suffix='.ndjson.gz')
+  os.close(fd)
+
+  try:
+    with gzip.open(path, 'wt', encoding='utf-8') as archive_file:
+      counts = write_archive(archive_file, tenant, backup_type, since)
+
+    name = f"backup-{started.strftime('%Y%m%d-%H%M%S')}-{backup_type}.ndjson.gz"
+
+    backup.update(
+      archive=anvil.media.from_file(path, 'application/gzip', name=name),
+      backup_size=os.path.getsize(path),
+      row_counts=counts,
+      # Watermark for the next incremental: rows changed after this started
+      backup_date=started,
+      status='completed'
+    )
+    print(f"Backup {backup['backup_id']}: {sum(counts.values())} rows")
+
+  except Exception as e:
+    print(f"Error running backup: {e}")
+    backup.update(status='failed', error=str(e))
+
+  finally:
+    os.remove(path)
+
+
+@anvil.server.background_task
+def prune_expired_backups():
+  """Delete backups older than their retention_days (run daily)"""
+  now = datetime.now()
+  removed = 0
+
+  for backup in app_tables.backups.search(q.fetch_only('creation_date', 'retention_days')):
+    retention = backup['retention_days'] or DEFAULT_RETENTION_DAYS
+    if backup['creation_date'] and backup['creation_date'] + timedelta(days=retention) < now:
+      backup.delete()
+      removed += 1
+
+  if removed:
+    print(f"Pruned {removed} expired backups")
+
+
+class _Restorer:
+  """Batches restored rows per table and remaps links between them"""
+
+  def __init__(self, mode):
+    self.mode = mode
+    self.id_map = {}
+    self.pending = {}
+    self.pending_ids = set()
+    self.resolved = {}
+    self.counts = {'inserted': 0, 'updated': 0, 'skipped': 0}
+
+  def add(self, table_name, original_id, data):
+    table = getattr(app_tables, table_name)
+    existing = self._get_existing(table, original_id)
+
+    if existing:
+      self.id_map[original_id] = existing
+      if self.mode == 'overwrite':
+        existing.update(**self._decode_row(data))
+        self.counts['updated'] += 1
+      else:
+        self.counts['skipped'] += 1
+      return
+
+    self.pending.setdefault(table_name, []).append((original_id, data))
+    self.pending_ids.add(original_id)
+
+    if len(self.pending[table_name]) >= RESTORE_BATCH_SIZE:
+      self.flush()
+
+  def flush(self):
+    """Insert every pending batch with one add_rows call per table"""
+    pending, self.pending = self.pending, {}
+    self.pending_ids = set()
+
+    for table_name, items in pending.items():
+      rows = getattr(app_tables, table_name).add_rows(
+        [self._decode_row(data) for _, data in items]
+      )
+      for (original_id, _), row in zip(items, rows):
+        self.id_map[original_id] = row
+      self.counts['inserted'] += len(items)
+
+  def _get_existing(self, table, row_id):
+    try:
+      return table.get_by_id(row_id)
+    except Exception:
+      return None
+
+  def _decode_row(self, data):
+    return {column: self._decode(value) for column, value in data.items() if value is not None}
+
+  def _decode(self, value):
+    if isinstance(value, list):
+      return [self._decode(v) for v in value]
+    if not isinstance(value, dict) or len(value) != 1:
+      return value
+    if '$datetime' in value:
+      return datetime.fromisoformat(value['$datetime'])
+    if '$date' in value:
+      return date.fromisoformat(value['$date'])
+    if '$row' in value:
+      return self._resolve_link(value['$row'])
+    return value
+
+  def _resolve_link(self, row_id):
+    """Row for a linked id: restored in this run, or still in the database"""
+    if row_id in self.pending_ids:
+      # Linked row is waiting in a batch - insert it first
+      self.flush()
+    if row_id in self.id_map:
+      return self.id_map[row_id]
+    if row_id not in self.resolved:
+      self.resolved[row_id] = None
+      for table_name in ['users'] + list(BACKUP_TABLES):
+        row = self._get_existing(getattr(app_tables, table_name), row_id)
+        if row:
+          self.resolved[row_id] = row
+          break
+    return self.resolved[row_id]
+
+
+@anvil.server.background_task
+def run_restore(backup_id, mode='missing'):
+  """
+  Restore a backup archive.
+
+  Args:
+    backup_id (str): backups row id
+    mode (str): 'missing' re-inserts only rows that no longer exist;
+                'overwrite' also resets existing rows to their backed-up values
+
+  Returns:
+    dict: {'inserted', 'updated', 'skipped'} counts
+  """
+  backup = app_tables.backups.get_by_id(backup_id)
+  restorer = _Restorer(mode)
+
+  with anvil.media.TempFile(backup['archive']) as path:
+    with gzip.open(path, 'rt', encoding='utf-8') as archive_file:
+      header = json.loads(archive_file.readline())
+      if header.get('format') != ARCHIVE_FORMAT:
+        raise ValueError(f"Unsupported backup format: {header.get('format')}")
+
+      for line in archive_file:
+        record = json.loads(line)
+        restorer.add(record['table'], record['id'], record['data'])
+
+  restorer.flush()
+  print(f"Restored backup {backup['backup_id']}: {restorer.counts}")
+  return restorer.counts
+
+
+def _require_owner():
+  user = anvil.users.get_user()
+  if not user or user['role'] != 'owner':
+    return None
+  return user
+
+
+@anvil.server.callable
+@anvil.users.login_required
+@audit_logger.audited('backup.create')
+def create_backup(backup_type='incremental', retention_days=DEFAULT_RETENTION_DAYS):
+  """
+  Start a backup of the current owner's data.
+
+  Args:
+    backup_type (str): 'full' or 'incremental'
+    retention_days (int): Days to keep the archive
+
+  Returns:
+    dict: {'success': bool} or {'success': bool, 'error': str}
+  """
+  try:
+    user = _require_owner()
+    if not user:
+      return {'success': False, 'error': 'Access denied'}
+
+    if backup_type not in ['full', 'incremental']:
+      return {'success': False, 'error': f"Unknown backup type: {backup_type}"}
+
+    anvil.server.launch_background_task('run_backup', user.get_id(), backup_type, retention_days)
+    return {'success': True}
+
+  except Exception as e:
+    print(f"Error starting backup: {e}")
+    return {'success': False, 'error': str(e)}
+
+
+@anvil.server.callable
+@anvil.users.login_required
+def list_backups():
+  """
+  List the current owner's backups, newest first.
+
+  Returns:
+    dict: {'success': bool, 'data': list} or {'success': bool, 'error': str}
+  """
+  try:
+    user = _require_owner()
+    if not user:
+      return {'success': False, 'error': 'Access denied'}
+
+    backups = app_tables.backups.search(
+      tables.order_by('creation_date', ascending=False),
+      client_id=user
+    )
+
+    data = [{
+      'id': b.get_id(),
+      'backup_type': b['backup_type'],
+      'status': b['status'],
+      'creation_date': b['creation_date'],
+      'since': b['since'],
+      'backup_size': b['backup_size'],
+      'row_counts': b['row_counts'],
+      'retention_days': b['retention_days'],
+      'archive': b['archive']
+    } for b in backups]
+
+    return {'success': True, 'data': data}
+
+  except Exception as e:
+    print(f"Error listing backups: {e}")
+    return {'success': False, 'error': str(e)}
+
+
+@anvil.server.callable
+@anvil.users.login_required
+@audit_logger.audited('backup.restore')
+def restore_backup(backup_id, mode='missing'):
+  """
+  Start restoring one of the current owner's backups.
+
+  Restore a full backup first, then later incrementals in order.
+
+  Returns:
+    dict: {'success': bool} or {'success': bool, 'error': str}
+  """
+  try:
+    user = _require_owner()
+    if not user:
+      return {'success': False, 'error': 'Access denied'}
+
+    backup = app_tables.backups.get_by_id(backup_id)
+    if not backup or backup['client_id'] != user or backup['status'] != 'completed':
+      return {'success': False, 'error': 'Backup not found'}
+
+    if mode not in ['missing', 'overwrite']:
+      return {'success': False, 'error': f"Unknown restore mode: {mode}"}
+
+    anvil.server.launch_background_task('run_restore', backup_id, mode)
+    return {'success': True}
+
+  except Exception as e:
+    print(f"Error starting restore: {e}")
+    return {'success': False, 'error': str(e)}
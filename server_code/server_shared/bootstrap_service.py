@@ -0,0 +1,79 @@
+import anvil.google.auth, anvil.google.drive, anvil.google.mail
+from anvil.google.drive import app_files
+import anvil.stripe
+import anvil.secrets
+import anvil.files
+from anvil.files import data_files
+import anvil.email
+import anvil.users
+import anvil.tables as tables
+import anvil.tables.query as q
+from anvil.tables import app_tables
+import anvil.server
+from . import config as config_cache
+from ..server_navigation.server_navigation import build_admin_navigation
+
+# Seconds dashboard metrics are reused between shell loads
+DASHBOARD_METRICS_TTL = 60
+
+STAFF_ROLES = ['owner', 'manager', 'staff']
+
+
+@anvil.server.callable
+@anvil.users.login_required
+def get_app_bootstrap():
+  """
+  Get everything the app shell needs after login in one round trip.
+
+  Replaces the separate get_enabled_features, get_theme_settings,
+  get_business_profile, navigation and get_dashboard_metrics calls made
+  while the layout loads.
+
+  Returns:
+    dict: {'success': bool, 'data': dict} or {'success': bool, 'error': str}
+  """
+  try:
+    user = anvil.users.get_user()
+    role = user['role'] or 'customer'
+
+    features = config_cache.get_config_value('enabled_features', config_cache.DEFAULT_FEATURES)
+    theme = config_cache.get_config_value('theme_settings', config_cache.DEFAULT_THEME)
+    profile = config_cache.get_config_value('business_profile') or {}
+
+    data = {
+      'user': {
+        'id': user.get_id(),
+        'email': user['email'],
+        'role': role
+      },
+      'features': features,
+      'theme': theme,
+      'business_name': profile.get('business_name')
+    }
+
+    if role in STAFF_ROLES:
+      data['navigation'] = build_admin_navigation(features, role)
+      data['dashboard_metrics'] = _get_dashboard_metrics()
+      if role in ['owner', 'manager']:
+        data['business_profile'] = profile
+    else:
+      data['customer_activity'] = anvil.server.call('get_customer_activity', user.get_id())
+
+    return {'success': True, 'data': data}
+
+  except Exception as e:
+    print(f"Error getting app bootstrap: {e}")
+    return {'success': False, 'error': str(e)}
+
+
+def _get_dashboard_metrics():
+  """Dashboard metrics, reused for DASHBOARD_METRICS_TTL seconds"""
+  def load():
+    result = anvil.server.call('get_dashboard_metrics')
+    return result.get('data') if result.get('success') else None
+
+  try:
+    return config_cache.get_cached('dashboard_metrics', load, ttl=DASHBOARD_METRICS_TTL)
+  except Exception as e:
+    print(f"Error loading dashboard metrics: {e}")
+    return None
@@ -10,16 +10,96 @@ import anvil.tables as tables
 import anvil.tables.query as q
 from anvil.tables import app_tables
 import anvil.server
+import time
 
-# This is a server module. It runs on the Anvil server,
-# rather than in the user's browser.
-#
-# To allow anvil.server.call() to call functions here, we mark
-# them with @anvil.server.callable.
-# Here is an example - you can replace it with your own:
-#
-# @anvil.server.callable
-# def say_hello(name):
-#   print("Hello, " + name + "!")
-#   return 42
+# Cached access to the `config` table.
 #
+# Values are kept in a module-level dict so that, when the server runtime
+# is kept warm, repeated reads (features, theme, business profile) don't
+# hit the database on every call. Writers must call invalidate() after
+# changing a config row.
+
+CONFIG_CACHE_TTL = 300  # seconds
+
+DEFAULT_FEATURES = {
+  'bookings': True,
+  'ecommerce': True,
+  'subscriptions': False,
+  'services': False,
+  'hospitality': False,
+  'blog': True
+}
+
+DEFAULT_THEME = {
+  'primary_color': '#2196F3',
+  'accent_color': '#FF9800',
+  'font_family': 'default',
+  'header_style': 'light'
+}
+
+_cache = {}
+
+
+def get_cached(cache_key, loader, ttl=CONFIG_CACHE_TTL):
+  """
+  Return a cached value, calling loader() to refresh it when stale.
+
+  Args:
+    cache_key (str): Cache key
+    loader (callable): Zero-argument function producing the value
+    ttl (int): Seconds before the value is reloaded
+
+  Returns:
+    Cached or freshly loaded value
+  """
+  entry = _cache.get(cache_key)
+  now = time.time()
+
+  if entry and now - entry['loaded_at'] < ttl:
+    return entry['value']
+
+  value = loader()
+  _cache[cache_key] = {'value': value, 'loaded_at': now}
+  return value
+
+
+def get_config_value(key, default=None):
+  """
+  Get a config table value by key, served from cache when possible.
+
+  Args:
+    key (str): Config key (e.g. 'enabled_features')
+    default: Value returned when no row exists
+
+  Returns:
+    Config value or default
+  """
+  def load():
+    row = app_tables.config.get(key=key)
+    return row['value'] if row else None
+
+  value = get_cached(f"config:{key}", load)
+  return value if value is not None else default
+
+
+def invalidate(key=None):
+  """
+  Drop cached values.
+
+  Args:
+    key (str): Config key to drop, or None to clear the whole cache
+  """
+  if key is None:
+    _cache.clear()
+  else:
+    _cache.pop(f"config:{key}", None)
+
+
+def drop_cached(cache_key):
+  """
+  Drop one get_cached() entry.
+
+  Args:
+    cache_key (str): Key passed to get_cached()
+  """
+  _cache.pop(cache_key, None)
@@ -10,6 +10,7 @@ import anvil.tables as tables
 import anvil.tables.query as q
 from anvil.tables import app_tables
 import anvil.server
+from . import view_counter
 
 @anvil.server.callable
 @anvil.users.login_required
@@ -65,6 +66,46 @@ def get_kb_categories():
     return {'success': False, 'error': str(e)}
 
 
+@anvil.server.callable
+def get_article_by_slug(slug, related_limit=3):
+  """
+  Get published article by slug with related articles, and record a view.
+  
+  Args:
+    slug (str): Article slug
+    related_limit (int): Maximum number of related articles
+    
+  Returns:
+    dict: {'success': bool, 'data': dict} or {'success': bool, 'error': str}
+  """
+  try:
+    article = app_tables.kb_articles.get(slug=slug, published=True)
+
+    if not article:
+      return {'success': False, 'error': 'Article not found'}
+
+    # Popularity is counted write-behind (see view_counter.flush_view_counts)
+    view_counter.record_view('kb_article', article)
+
+    related = []
+    if article['category_id']:
+      for candidate in app_tables.kb_articles.search(
+        tables.order_by('view_count', ascending=False),
+        category_id=article['category_id'],
+        published=True
+      ):
+        if candidate != article:
+          related.append(candidate)
+        if len(related) >= related_limit:
+          break
+
+    return {'success': True, 'data': {'article': article, 'related_articles': related}}
+
+  except Exception as e:
+    print(f"Error getting article: {e}")
+    return {'success': False, 'error': str(e)}
+
+
 @anvil.server.callable
 def get_popular_articles(limit=5):
   """
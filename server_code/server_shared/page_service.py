@@ -10,36 +10,121 @@ import anvil.tables as tables
 import anvil.tables.query as q
 from anvil.tables import app_tables
 import anvil.server
+from datetime import datetime
+from . import view_counter
 
 @anvil.server.callable
-def get_page_by_slug(slug):
+def get_page_by_slug(slug, known_version=None):
   """
   Get published page by slug for public display.
+
+  Served from the `published_pages` cache. If the client already holds
+  the current publish version it gets a not-modified reply without the
+  page content.
   
   Args:
     slug (str): Page slug
+    known_version (int): Publish version cached by the client, if any
     
   Returns:
-    dict: {'success': bool, 'data': row} or {'success': bool, 'error': str}
+    dict: {'success': bool, 'data': dict, 'version': int},
+          {'success': bool, 'not_modified': True, 'version': int}
+          or {'success': bool, 'error': str}
   """
   try:
-    # Get published page only
-    page = app_tables.pages.get(slug=slug, is_published=True)
+    cached = app_tables.published_pages.get(slug=slug)
 
-    if not page:
-      return {'success': False, 'error': 'Page not found or not published'}
+    if cached:
+      page, page_data, version = cached['page_id'], cached['page_data'], cached['version']
+    else:
+      # Published before the cache existed and not yet backfilled
+      # (backfill_published_pages) - serve the page row without writing
+      page = app_tables.pages.get(slug=slug, is_published=True)
+      if not page:
+        return {'success': False, 'error': 'Page not found or not published'}
+      page_data, version = _page_data(page), page['publish_version'] or 0
 
-    # Increment view count (optional analytics)
-    page['view_count'] = page.get('view_count', 0) + 1
-    page.update()
+    # Count the view write-behind so public reads stay read-only
+    view_counter.record_view('page', page)
 
-    return {'success': True, 'data': page}
+    if known_version is not None and known_version == version:
+      return {'success': True, 'not_modified': True, 'version': version}
+
+    return {'success': True, 'data': page_data, 'version': version}
 
   except Exception as e:
     print(f"Error getting page: {e}")
     return {'success': False, 'error': str(e)}
 
 
+def _page_data(page):
+  """Public fields of a page"""
+  return {
+    'name': page['name'],
+    'slug': page['slug'],
+    'page_title': page['page_title'],
+    'components': page['components'] or []
+  }
+
+
+def _publish_page_cache(page):
+  """
+  Snapshot a published page into `published_pages` under a new version.
+
+  Call inside a transaction.
+
+  Args:
+    page (Row): pages row
+
+  Returns:
+    Row: published_pages row
+  """
+  version = (page['publish_version'] or 0) + 1
+  page['publish_version'] = version
+
+  page_data = _page_data(page)
+
+  cached = app_tables.published_pages.get(slug=page['slug'])
+  if cached:
+    cached.update(page_id=page, version=version, page_data=page_data, published_at=datetime.now())
+  else:
+    cached = app_tables.published_pages.add_row(
+      slug=page['slug'],
+      page_id=page,
+      version=version,
+      page_data=page_data,
+      published_at=datetime.now()
+    )
+
+  return cached
+
+
+def _drop_page_cache(page):
+  """Remove a page's published snapshot (unpublished or deleted)"""
+  cached = app_tables.published_pages.get(slug=page['slug'])
+  if cached:
+    cached.delete()
+
+
+@anvil.server.background_task
+def backfill_published_pages():
+  """Snapshot published pages that have no published_pages entry (run once)"""
+  count = 0
+  for page in app_tables.pages.search(is_published=True):
+    if _backfill_page(page):
+      count += 1
+  print(f"Backfilled {count} published page snapshots")
+
+
+@tables.in_transaction
+def _backfill_page(page):
+  """Snapshot one page unless save_page already has"""
+  if app_tables.published_pages.get(slug=page['slug']):
+    return False
+  _publish_page_cache(page)
+  return True
+
+
 import anvil.server
 import anvil.users
 from anvil.tables import app_tables
@@ -134,19 +219,30 @@ def save_page(page_id, components, is_published):
     if user['role'] not in ['owner', 'manager']:
       return {'success': False, 'error': 'Access denied'}
 
-    page = app_tables.pages.get_by_id(page_id)
-
-    if not page:
-      return {'success': False, 'error': 'Page not found'}
-
-    # Update page
-    page['components'] = components
-    page['is_published'] = is_published
-    page['updated_at'] = datetime.now()
-    page.update()
+    _save_page(page_id, components, is_published)
 
     return {'success': True}
 
   except Exception as e:
     print(f"Error saving page: {e}")
-    return {'success': False, 'error': str(e)}
\ No newline at end of file
+    return {'success': False, 'error': str(e)}
+
+
+@tables.in_transaction
+def _save_page(page_id, components, is_published):
+  """Update the page and its public snapshot together (raises to roll back)"""
+  page = app_tables.pages.get_by_id(page_id)
+
+  if not page:
+    raise ValueError('Page not found')
+
+  # Update page
+  page['components'] = components
+  page['is_published'] = is_published
+  page['updated_at'] = datetime.now()
+
+  # Refresh or drop the public snapshot so visitors never see stale content
+  if is_published:
+    _publish_page_cache(page)
+  else:
+    _drop_page_cache(page)
@@ -10,6 +10,8 @@ import anvil.tables as tables
 import anvil.tables.query as q
 from anvil.tables import app_tables
 import anvil.server
+from datetime import datetime
+from ..server_customers import customer_summary
 
 @anvil.server.callable
 def get_reviews(item_type, item_id, status='approved', sort_by='recent', page=1, page_size=10):
@@ -352,37 +354,10 @@ def submit_review(item_type, item_id, review_data):
   try:
     user = anvil.users.get_user()
 
-    # Check if user already reviewed this item
-    existing_review = app_tables.reviews.get(
-      item_type=item_type,
-      item_id=item_id,
-      customer_id=user
-    )
-
-    if existing_review:
-      return {'success': False, 'error': 'You have already reviewed this item'}
-
     # Check if verified purchase
     is_verified = check_verified_purchase(user, item_type, item_id)
 
-    # Get reviewer name
-    reviewer_name = user.get('name') or user['email'].split('@')[0]
-
-    # Create review
-    app_tables.reviews.add_row(
-      item_type=item_type,
-      item_id=item_id,
-      customer_id=user,
-      reviewer_name=reviewer_name,
-      rating=review_data['rating'],
-      title=review_data['title'],
-      comment=review_data['comment'],
-      status='pending',
-      is_verified_purchase=is_verified,
-      helpful_count=0,
-      reported=False,
-      created_at=datetime.now()
-    )
+    _add_review(user, item_type, item_id, review_data, is_verified)
 
     return {'success': True}
 
@@ -391,6 +366,41 @@ def submit_review(item_type, item_id, review_data):
     return {'success': False, 'error': str(e)}
 
 
+@tables.in_transaction
+def _add_review(user, item_type, item_id, review_data, is_verified):
+  """Add the review unless the user already reviewed the item (raises to roll back)"""
+  # Check if user already reviewed this item
+  existing_review = app_tables.reviews.get(
+    item_type=item_type,
+    item_id=item_id,
+    customer_id=user
+  )
+
+  if existing_review:
+    raise ValueError('You have already reviewed this item')
+
+  # Get reviewer name
+  reviewer_name = user.get('name') or user['email'].split('@')[0]
+
+  # Create review
+  review = app_tables.reviews.add_row(
+    item_type=item_type,
+    item_id=item_id,
+    customer_id=user,
+    reviewer_name=reviewer_name,
+    rating=review_data['rating'],
+    title=review_data['title'],
+    comment=review_data['comment'],
+    status='pending',
+    is_verified_purchase=is_verified,
+    helpful_count=0,
+    reported=False,
+    created_at=datetime.now()
+  )
+
+  customer_summary.record('review', review)
+
+
 def check_verified_purchase(user, item_type, item_id):
   """
   Check if user has purchased/booked this item.
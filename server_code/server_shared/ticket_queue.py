@@ -0,0 +1,297 @@
+import anvil.google.auth, anvil.google.drive, anvil.google.mail
+from anvil.google.drive import app_files
+import anvil.stripe
+import anvil.secrets
+import anvil.files
+from anvil.files import data_files
+import anvil.email
+import anvil.users
+import anvil.tables as tables
+import anvil.tables.query as q
+from anvil.tables import app_tables
+import anvil.server
+
+from datetime import datetime
+
+# Ticket queue engine.
+#
+# Each support ticket stores a `priority_rank` (urgent=0 ... low=3) so the
+# staff queues are ordered, limited queries instead of a full load and sort
+# in Python. Sidebar badge counts live in `ticket_queue_counts` and are
+# adjusted whenever a ticket moves between queues, so reading them is one
+# small query rather than a count of every queue.
+
+PRIORITY_RANK = {'urgent': 0, 'high': 1, 'medium': 2, 'low': 3}
+DEFAULT_PRIORITY_RANK = PRIORITY_RANK['medium']
+
+OPEN_STATUSES = ['open', 'in_progress']
+
+QUEUES = ['mine', 'unassigned_urgent', 'unassigned', 'all_open']
+
+DEFAULT_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 100
+
+STAFF_ROLES = ['owner', 'manager', 'staff']
+
+
+def priority_rank(priority):
+  """Sort rank for a priority (lower sorts first)"""
+  return PRIORITY_RANK.get(priority or 'medium', DEFAULT_PRIORITY_RANK)
+
+
+def queue_keys(ticket):
+  """
+  Get the badge counters a ticket currently contributes to.
+
+  Args:
+    ticket (Row): support_tickets row
+
+  Returns:
+    set: Counter keys ('all_open', 'unassigned', 'unassigned_urgent', 'mine:<user_id>')
+  """
+  if ticket['status'] not in OPEN_STATUSES:
+    return set()
+
+  keys = {'all_open'}
+  assignee = ticket['assigned_to']
+
+  if assignee:
+    keys.add(f"mine:{assignee.get_id()}")
+  else:
+    keys.add('unassigned')
+    if ticket['priority'] == 'urgent':
+      keys.add('unassigned_urgent')
+
+  return keys
+
+
+def on_ticket_changed(ticket, previous_keys=None):
+  """
+  Refresh a ticket's stored rank and move it between queue counters.
+
+  Call inside the transaction that changes the ticket, passing the
+  queue_keys() taken before the change (None for a new ticket).
+
+  Args:
+    ticket (Row): support_tickets row after the change
+    previous_keys (set): Counter keys before the change
+  """
+  rank = priority_rank(ticket['priority'])
+  if ticket['priority_rank'] != rank:
+    ticket['priority_rank'] = rank
+
+  previous_keys = previous_keys or set()
+  current_keys = queue_keys(ticket)
+
+  for key in previous_keys - current_keys:
+    _adjust_count(key, -1)
+  for key in current_keys - previous_keys:
+    _adjust_count(key, 1)
+
+
+def _adjust_count(queue_key, delta):
+  """Add delta to one queue counter, creating it if missing"""
+  row = app_tables.ticket_queue_counts.get(queue_key=queue_key)
+  if row:
+    row['count'] = max((row['count'] or 0) + delta, 0)
+    row['updated_at'] = datetime.now()
+  elif delta > 0:
+    app_tables.ticket_queue_counts.add_row(
+      queue_key=queue_key,
+      count=delta,
+      updated_at=datetime.now()
+    )
+
+
+def queue_query(queue, user):
+  """
+  Build search kwargs for a named queue.
+
+  Args:
+    queue (str): One of QUEUES
+    user (Row): Current staff user (for 'mine')
+
+  Returns:
+    dict: Keyword arguments for support_tickets.search()
+  """
+  query = {'status': q.any_of(*OPEN_STATUSES)}
+
+  if queue == 'mine':
+    query['assigned_to'] = user
+  elif queue == 'unassigned':
+    query['assigned_to'] = None
+  elif queue == 'unassigned_urgent':
+    query['assigned_to'] = None
+    query['priority_rank'] = PRIORITY_RANK['urgent']
+  elif queue != 'all_open':
+    raise ValueError(f"Unknown ticket queue: {queue}")
+
+  return query
+
+
+def search_ordered(query, cursor=None, limit=None):
+  """
+  Search tickets by priority (urgent first) then newest first.
+
+  Args:
+    query (dict): Search kwargs
+    cursor (dict): {'rank': int, 'created_at': datetime} of the last ticket seen
+    limit (int): Maximum tickets to return (None for all)
+
+  Returns:
+    tuple: (list of ticket rows, next cursor or None)
+  """
+  conditions = []
+  if cursor:
+    # Rows after the cursor: same rank and older, or a lower priority
+    conditions.append(q.any_of(
+      q.all_of(
+        priority_rank=cursor['rank'],
+        created_at=q.less_than(cursor['created_at'])
+      ),
+      priority_rank=q.greater_than(cursor['rank'])
+    ))
+
+  results = app_tables.support_tickets.search(
+    tables.order_by('priority_rank'),
+    tables.order_by('created_at', ascending=False),
+    *conditions,
+    **query
+  )
+
+  if limit is None:
+    return list(results), None
+
+  # Fetch one extra row to know whether another page exists
+  tickets = list(results[:limit + 1])
+  next_cursor = None
+
+  if len(tickets) > limit:
+    tickets = tickets[:limit]
+    last = tickets[-1]
+    next_cursor = {'rank': last['priority_rank'], 'created_at': last['created_at']}
+
+  return tickets, next_cursor
+
+
+def get_counts(user):
+  """
+  Get badge counts for every queue.
+
+  Args:
+    user (Row): Current staff user
+
+  Returns:
+    dict: {queue: count}
+  """
+  keys = {
+    'all_open': 'all_open',
+    'unassigned': 'unassigned',
+    'unassigned_urgent': 'unassigned_urgent',
+    'mine': f"mine:{user.get_id()}"
+  }
+
+  rows = app_tables.ticket_queue_counts.search(
+    queue_key=q.any_of(*keys.values())
+  )
+  stored = {row['queue_key']: row['count'] or 0 for row in rows}
+
+  return {queue: stored.get(key, 0) for queue, key in keys.items()}
+
+
+@anvil.server.callable
+@anvil.users.login_required
+def get_ticket_queue(queue='all_open', cursor=None, limit=DEFAULT_PAGE_SIZE, include_counts=True):
+  """
+  Get one page of a staff ticket queue.
+
+  Args:
+    queue (str): 'mine', 'unassigned_urgent', 'unassigned' or 'all_open'
+    cursor (dict): next_cursor from the previous page, or None for the first
+    limit (int): Page size (capped at MAX_PAGE_SIZE)
+    include_counts (bool): Also return badge counts for all queues
+
+  Returns:
+    dict: {'success': bool, 'data': list, 'next_cursor': dict, 'counts': dict}
+          or {'success': bool, 'error': str}
+  """
+  try:
+    user = anvil.users.get_user()
+
+    if user['role'] not in STAFF_ROLES:
+      return {'success': False, 'error': 'Access denied'}
+
+    if queue not in QUEUES:
+      return {'success': False, 'error': f"Unknown queue: {queue}"}
+
+    limit = max(1, min(int(limit or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+
+    tickets, next_cursor = search_ordered(queue_query(queue, user), cursor, limit)
+
+    result = {
+      'success': True,
+      'data': tickets,
+      'next_cursor': next_cursor
+    }
+
+    if include_counts:
+      result['counts'] = get_counts(user)
+
+    return result
+
+  except Exception as e:
+    print(f"Error getting ticket queue: {e}")
+    return {'success': False, 'error': str(e)}
+
+
+@anvil.server.callable
+@anvil.users.login_required
+def get_ticket_queue_counts():
+  """
+  Get badge counts for the ticket queues.
+
+  Returns:
+    dict: {'success': bool, 'data': dict} or {'success': bool, 'error': str}
+  """
+  try:
+    user = anvil.users.get_user()
+
+    if user['role'] not in STAFF_ROLES:
+      return {'success': False, 'error': 'Access denied'}
+
+    return {'success': True, 'data': get_counts(user)}
+
+  except Exception as e:
+    print(f"Error getting ticket queue counts: {e}")
+    return {'success': False, 'error': str(e)}
+
+
+@anvil.server.background_task
+def rebuild_ticket_queue():
+  """Backfill priority_rank on every ticket and recompute queue counts"""
+  counts = {}
+
+  for ticket in app_tables.support_tickets.search():
+    rank = priority_rank(ticket['priority'])
+    if ticket['priority_rank'] != rank:
+      ticket['priority_rank'] = rank
+
+    for key in queue_keys(ticket):
+      counts[key] = counts.get(key, 0) + 1
+
+  _replace_counts(counts)
+  print(f"Rebuilt ticket queue counts for {len(counts)} queues")
+
+
+@tables.in_transaction
+def _replace_counts(counts):
+  """Swap the stored queue counts for freshly computed ones"""
+  app_tables.ticket_queue_counts.search().delete_all_rows()
+
+  now = datetime.now()
+  for queue_key, count in counts.items():
+    app_tables.ticket_queue_counts.add_row(
+      queue_key=queue_key,
+      count=count,
+      updated_at=now
+    )
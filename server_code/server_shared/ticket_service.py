@@ -10,12 +10,18 @@ import anvil.tables as tables
 import anvil.tables.query as q
 from anvil.tables import app_tables
 import anvil.server
+from . import ticket_queue
+from . import ticket_thread
+from . import audit_logger
+from ..server_customers import customer_summary
 
 @anvil.server.callable
 @anvil.users.login_required
 def get_ticket(ticket_id):
   """
-  Get ticket details and messages.
+  Get ticket details and the latest page of messages.
+
+  Older messages are loaded with get_ticket_thread(ticket_id, before=older_cursor).
   
   Args:
     ticket_id (str): Ticket ID
@@ -42,17 +48,16 @@ def get_ticket(ticket_id):
     else:
       ticket['customer_display'] = ticket.get('customer_email', 'Guest')
 
-    # Get messages
-    messages = list(app_tables.ticket_messages.search(
-      ticket_id=ticket,
-      tables.order_by('created_at')
-    ))
+    # Get latest page of messages
+    page = ticket_thread.load_thread_page(ticket, is_staff=True)
 
     return {
       'success': True,
       'data': {
         'ticket': ticket,
-        'messages': messages
+        'messages': page['messages'],
+        'older_cursor': page['older_cursor'],
+        'last_message_at': ticket_thread.current_watermark(ticket)
       }
     }
 
@@ -107,14 +112,7 @@ def update_ticket_priority(ticket_id, priority):
     if user['role'] not in ['owner', 'manager', 'staff']:
       return {'success': False, 'error': 'Access denied'}
 
-    ticket = app_tables.support_tickets.get_by_id(ticket_id)
-
-    if not ticket:
-      return {'success': False, 'error': 'Ticket not found'}
-
-    ticket['priority'] = priority
-    ticket['updated_at'] = datetime.now()
-    ticket.update()
+    _set_priority(ticket_id, priority)
 
     return {'success': True}
 
@@ -123,8 +121,19 @@ def update_ticket_priority(ticket_id, priority):
     return {'success': False, 'error': str(e)}
 
 
+@tables.in_transaction
+def _set_priority(ticket_id, priority):
+  ticket = _get_ticket(ticket_id)
+  previous_queues = ticket_queue.queue_keys(ticket)
+
+  ticket['priority'] = priority
+  ticket['updated_at'] = datetime.now()
+  ticket_queue.on_ticket_changed(ticket, previous_queues)
+
+
 @anvil.server.callable
 @anvil.users.login_required
+@audit_logger.audited('ticket.status', include_args=True)
 def update_ticket_status(ticket_id, status):
   """
   Update ticket status.
@@ -142,20 +151,7 @@ def update_ticket_status(ticket_id, status):
     if user['role'] not in ['owner', 'manager', 'staff']:
       return {'success': False, 'error': 'Access denied'}
 
-    ticket = app_tables.support_tickets.get_by_id(ticket_id)
-
-    if not ticket:
-      return {'success': False, 'error': 'Ticket not found'}
-
-    old_status = ticket['status']
-    ticket['status'] = status
-    ticket['updated_at'] = datetime.now()
-
-    # If closing or resolving, set closed/resolved timestamp
-    if status in ['resolved', 'closed'] and old_status not in ['resolved', 'closed']:
-      ticket['resolved_at'] = datetime.now()
-
-    ticket.update()
+    _set_status(ticket_id, status)
 
     return {'success': True}
 
@@ -164,8 +160,26 @@ def update_ticket_status(ticket_id, status):
     return {'success': False, 'error': str(e)}
 
 
+@tables.in_transaction
+def _set_status(ticket_id, status):
+  ticket = _get_ticket(ticket_id)
+  previous_queues = ticket_queue.queue_keys(ticket)
+
+  old_status = ticket['status']
+  ticket['status'] = status
+  ticket['updated_at'] = datetime.now()
+
+  # If closing or resolving, set closed/resolved timestamp
+  if status in ['resolved', 'closed'] and old_status not in ['resolved', 'closed']:
+    ticket['resolved_at'] = datetime.now()
+
+  ticket_queue.on_ticket_changed(ticket, previous_queues)
+  customer_summary.on_ticket_status_changed(ticket, old_status)
+
+
 @anvil.server.callable
 @anvil.users.login_required
+@audit_logger.audited('ticket.assign', include_args=True)
 def assign_ticket(ticket_id, staff_id):
   """
   Assign ticket to staff member.
@@ -183,21 +197,13 @@ def assign_ticket(ticket_id, staff_id):
     if user['role'] not in ['owner', 'manager', 'staff']:
       return {'success': False, 'error': 'Access denied'}
 
-    ticket = app_tables.support_tickets.get_by_id(ticket_id)
-
-    if not ticket:
-      return {'success': False, 'error': 'Ticket not found'}
-
+    staff_user = None
     if staff_id:
       staff_user = app_tables.users.get_by_id(staff_id)
       if not staff_user:
         return {'success': False, 'error': 'Staff member not found'}
-      ticket['assigned_to'] = staff_user
-    else:
-      ticket['assigned_to'] = None
 
-    ticket['updated_at'] = datetime.now()
-    ticket.update()
+    _set_assignee(ticket_id, staff_user)
 
     return {'success': True}
 
@@ -206,6 +212,16 @@ def assign_ticket(ticket_id, staff_id):
     return {'success': False, 'error': str(e)}
 
 
+@tables.in_transaction
+def _set_assignee(ticket_id, staff_user):
+  ticket = _get_ticket(ticket_id)
+  previous_queues = ticket_queue.queue_keys(ticket)
+
+  ticket['assigned_to'] = staff_user
+  ticket['updated_at'] = datetime.now()
+  ticket_queue.on_ticket_changed(ticket, previous_queues)
+
+
 @anvil.server.callable
 @anvil.users.login_required
 def add_ticket_message(ticket_id, message, is_internal_note=False):
@@ -226,30 +242,7 @@ def add_ticket_message(ticket_id, message, is_internal_note=False):
     if user['role'] not in ['owner', 'manager', 'staff']:
       return {'success': False, 'error': 'Access denied'}
 
-    ticket = app_tables.support_tickets.get_by_id(ticket_id)
-
-    if not ticket:
-      return {'success': False, 'error': 'Ticket not found'}
-
-    # Create message
-    app_tables.ticket_messages.add_row(
-      ticket_id=ticket,
-      author_id=user,
-      author_type='staff',
-      message=message,
-      is_internal_note=is_internal_note,
-      created_at=datetime.now()
-    )
-
-    # Update ticket
-    ticket['updated_at'] = datetime.now()
-    ticket['last_reply_at'] = datetime.now()
-
-    # If status is closed, reopen to in_progress
-    if ticket['status'] == 'closed':
-      ticket['status'] = 'in_progress'
-
-    ticket.update()
+    _add_staff_message(user, ticket_id, message, is_internal_note)
 
     # Send email notification to customer (if not internal note)
     if not is_internal_note:
@@ -263,17 +256,56 @@ def add_ticket_message(ticket_id, message, is_internal_note=False):
     return {'success': False, 'error': str(e)}
 
 
+@tables.in_transaction
+def _add_staff_message(user, ticket_id, message, is_internal_note):
+  ticket = _get_ticket(ticket_id)
+
+  # Create message
+  now = datetime.now()
+  app_tables.ticket_messages.add_row(
+    ticket_id=ticket,
+    author_id=user,
+    author_type='staff',
+    message=message,
+    is_internal_note=is_internal_note,
+    created_at=now
+  )
+
+  # Update ticket
+  previous_queues = ticket_queue.queue_keys(ticket)
+  ticket['updated_at'] = now
+  ticket['last_reply_at'] = now
+  ticket_thread.touch_last_message(ticket, now)
+
+  # If status is closed, reopen to in_progress
+  if ticket['status'] == 'closed':
+    ticket['status'] = 'in_progress'
+    customer_summary.on_ticket_status_changed(ticket, 'closed')
+
+  ticket_queue.on_ticket_changed(ticket, previous_queues)
+
+
+def _get_ticket(ticket_id):
+  """Load a ticket inside a write transaction, raising if it is missing"""
+  ticket = app_tables.support_tickets.get_by_id(ticket_id)
+  if not ticket:
+    raise ValueError('Ticket not found')
+  return ticket
+
+
 @anvil.server.callable
 @anvil.users.login_required
-def get_all_tickets(filters):
+def get_all_tickets(filters, cursor=None, limit=None):
   """
-  Get all tickets with optional filters.
+  Get tickets with optional filters, urgent first then newest first.
   
   Args:
     filters (dict): {'status': str, 'priority': str, 'assigned': str}
+    cursor (dict): next_cursor from the previous page, or None
+    limit (int): Page size, or None for every matching ticket
     
   Returns:
-    dict: {'success': bool, 'data': list} or {'success': bool, 'error': str}
+    dict: {'success': bool, 'data': list, 'next_cursor': dict} or {'success': bool, 'error': str}
   """
   try:
     user = anvil.users.get_user()
@@ -281,6 +313,8 @@ def get_all_tickets(filters):
     if user['role'] not in ['owner', 'manager', 'staff']:
       return {'success': False, 'error': 'Access denied'}
 
+    filters = filters or {}
+
     # Build query
     query = {}
 
@@ -288,29 +322,20 @@ def get_all_tickets(filters):
     if filters.get('status'):
       query['status'] = filters['status']
 
-    # Apply priority filter
+    # Apply priority filter (on the stored rank)
     if filters.get('priority'):
-      query['priority'] = filters['priority']
-
-    # Query tickets
-    tickets = list(app_tables.support_tickets.search(**query))
+      query['priority_rank'] = ticket_queue.priority_rank(filters['priority'])
 
     # Apply assigned filter
     if filters.get('assigned') == 'unassigned':
-      tickets = [t for t in tickets if not t.get('assigned_to')]
+      query['assigned_to'] = None
     elif filters.get('assigned') == 'me':
-      tickets = [t for t in tickets if t.get('assigned_to') == user]
-
-    # Sort by priority (urgent first) then date (newest first)
-    priority_order = {'urgent': 0, 'high': 1, 'medium': 2, 'low': 3}
-    tickets.sort(
-      key=lambda t: (
-        priority_order.get(t.get('priority', 'medium'), 2),
-        -(t.get('created_at').timestamp() if t.get('created_at') else 0)
-      )
-    )
+      query['assigned_to'] = user
 
-    return {'success': True, 'data': tickets}
+    # Ordered by (priority_rank, created_at desc) in the query itself
+    tickets, next_cursor = ticket_queue.search_ordered(query, cursor, limit)
+
+    return {'success': True, 'data': tickets, 'next_cursor': next_cursor}
 
   except Exception as e:
     print(f"Error getting tickets: {e}")
@@ -359,30 +384,12 @@ def create_ticket(customer_data, ticket_data):
       customer_name = customer_data['name']
       customer_email = customer_data['email']
 
-    # Create ticket
-    ticket = app_tables.support_tickets.add_row(
-      ticket_number=ticket_number,
-      customer_id=customer_id,
-      customer_name=customer_name if not user else None,
-      customer_email=customer_email,
-      subject=ticket_data['subject'],
-      category=ticket_data['category'],
-      status='open',
-      priority='medium',
-      assigned_to=None,
-      created_at=datetime.now(),
-      updated_at=datetime.now()
-    )
-
-    # Add initial message with description
-    app_tables.ticket_messages.add_row(
-      ticket_id=ticket,
-      author_id=customer_id,
-      author_type='customer',
-      message=ticket_data['description'],
-      is_internal_note=False,
-      attachments=ticket_data.get('attachments'),
-      created_at=datetime.now()
+    _add_ticket(
+      ticket_number,
+      customer_id,
+      customer_name if not user else None,
+      customer_email,
+      ticket_data
     )
 
     # TODO: Send confirmation email
@@ -401,4 +408,48 @@ def create_ticket(customer_data, ticket_data):
     return {
       'success': False,
       'error': str(e)
-    }
\ No newline at end of file
+    }
+
+
+@tables.in_transaction
+def _add_ticket(ticket_number, customer_id, customer_name, customer_email, ticket_data):
+  """
+  Create the ticket, its first message and its read-model entries together.
+
+  Shared by the public form and the client portal.
+
+  Returns:
+    Row: support_tickets row
+  """
+  priority = ticket_data.get('priority') or 'medium'
+  now = datetime.now()
+  ticket = app_tables.support_tickets.add_row(
+    ticket_number=ticket_number,
+    customer_id=customer_id,
+    customer_name=customer_name,
+    customer_email=customer_email,
+    subject=ticket_data['subject'],
+    category=ticket_data['category'],
+    status='open',
+    priority=priority,
+    priority_rank=ticket_queue.priority_rank(priority),
+    assigned_to=None,
+    created_at=now,
+    updated_at=now,
+    last_message_at=now
+  )
+
+  # Add initial message with description
+  app_tables.ticket_messages.add_row(
+    ticket_id=ticket,
+    author_id=customer_id,
+    author_type='customer',
+    message=ticket_data['description'],
+    is_internal_note=False,
+    attachments=ticket_data.get('attachments'),
+    created_at=now
+  )
+
+  ticket_queue.on_ticket_changed(ticket)
+  customer_summary.record('ticket', ticket)
+  return ticket
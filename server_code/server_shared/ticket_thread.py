@@ -0,0 +1,232 @@
+import anvil.google.auth, anvil.google.drive, anvil.google.mail
+from anvil.google.drive import app_files
+import anvil.stripe
+import anvil.secrets
+import anvil.files
+from anvil.files import data_files
+import anvil.email
+import anvil.users
+import anvil.tables as tables
+import anvil.tables.query as q
+from anvil.tables import app_tables
+import anvil.server
+
+# Paginated ticket threads.
+#
+# Threads load newest-first in pages with a backwards cursor instead of
+# returning every message. Each ticket stores `last_message_at`, so
+# get_ticket_messages_since can answer "nothing new" from the ticket row
+# alone when a client polls.
+
+THREAD_PAGE_SIZE = 30
+MAX_THREAD_PAGE_SIZE = 100
+
+STAFF_ROLES = ['owner', 'manager', 'staff']
+
+
+def _get_viewable_ticket(user, ticket_id):
+  """
+  Get a ticket the user may read.
+
+  Returns:
+    tuple: (ticket row or None, is_staff)
+  """
+  ticket = app_tables.support_tickets.get_by_id(ticket_id)
+  is_staff = user['role'] in STAFF_ROLES
+
+  if not ticket:
+    return None, is_staff
+
+  if not is_staff and ticket['customer_id'] != user:
+    return None, is_staff
+
+  return ticket, is_staff
+
+
+def _message_query(ticket, is_staff):
+  """Search kwargs for messages the viewer can see"""
+  query = {'ticket_id': ticket}
+
+  # Customers never see internal staff notes
+  if not is_staff:
+    query['is_internal_note'] = False
+
+  return query
+
+
+def touch_last_message(ticket, created_at):
+  """
+  Move the ticket's last_message_at watermark forward.
+
+  Call whenever a message is added to the ticket.
+
+  Args:
+    ticket (Row): support_tickets row
+    created_at (datetime): Message timestamp
+  """
+  if not ticket['last_message_at'] or created_at > ticket['last_message_at']:
+    ticket['last_message_at'] = created_at
+
+
+def current_watermark(ticket):
+  """
+  The ticket's last_message_at, filled in from its newest message if unset.
+
+  Tickets created before the watermark existed get it on first read, so
+  polling never falls back to "everything is new".
+
+  Args:
+    ticket (Row): support_tickets row
+
+  Returns:
+    datetime or None: None only for a ticket with no messages
+  """
+  if not ticket['last_message_at']:
+    for latest in app_tables.ticket_messages.search(
+      tables.order_by('created_at', ascending=False),
+      ticket_id=ticket
+    )[:1]:
+      ticket['last_message_at'] = latest['created_at']
+
+  return ticket['last_message_at']
+
+
+def load_thread_page(ticket, is_staff, before=None, limit=THREAD_PAGE_SIZE):
+  """
+  Load one page of messages, newest page first.
+
+  Args:
+    ticket (Row): support_tickets row
+    is_staff (bool): Include internal notes
+    before (datetime): Only messages older than this (older_cursor of the previous page)
+    limit (int): Page size
+
+  Returns:
+    dict: {'messages': list (oldest first), 'older_cursor': datetime or None}
+  """
+  query = _message_query(ticket, is_staff)
+  if before:
+    query['created_at'] = q.less_than(before)
+
+  # Fetch one extra row to know whether older messages exist
+  messages = list(app_tables.ticket_messages.search(
+    tables.order_by('created_at', ascending=False),
+    **query
+  )[:limit + 1])
+
+  has_older = len(messages) > limit
+  messages = messages[:limit]
+  messages.reverse()
+
+  return {
+    'messages': messages,
+    'older_cursor': messages[0]['created_at'] if has_older else None
+  }
+
+
+@anvil.server.callable
+@anvil.users.login_required
+def get_ticket_thread(ticket_id, before=None, limit=THREAD_PAGE_SIZE):
+  """
+  Get the most recent messages of a ticket thread.
+
+  Args:
+    ticket_id (str): Ticket ID
+    before (datetime): older_cursor from the previous page, or None for the latest page
+    limit (int): Page size (capped at MAX_THREAD_PAGE_SIZE)
+
+  Returns:
+    dict: {'success': bool, 'data': {'messages', 'older_cursor', 'last_message_at'}}
+          or {'success': bool, 'error': str}
+  """
+  try:
+    user = anvil.users.get_user()
+    ticket, is_staff = _get_viewable_ticket(user, ticket_id)
+
+    if not ticket:
+      return {'success': False, 'error': 'Ticket not found'}
+
+    limit = max(1, min(int(limit or THREAD_PAGE_SIZE), MAX_THREAD_PAGE_SIZE))
+
+    page = load_thread_page(ticket, is_staff, before, limit)
+    page['last_message_at'] = current_watermark(ticket)
+
+    return {'success': True, 'data': page}
+
+  except Exception as e:
+    print(f"Error getting ticket thread: {e}")
+    return {'success': False, 'error': str(e)}
+
+
+@anvil.server.callable
+@anvil.users.login_required
+def get_ticket_messages_since(ticket_id, last_seen):
+  """
+  Get messages added after the client's last seen timestamp.
+
+  At most MAX_THREAD_PAGE_SIZE messages are returned; when more are
+  waiting, last_message_at is the newest message returned, so the next
+  poll continues from there.
+
+  Args:
+    ticket_id (str): Ticket ID
+    last_seen (datetime): last_message_at the client already has
+
+  Returns:
+    dict: {'success': bool, 'data': {'messages': list, 'last_message_at': datetime}}
+          or {'success': bool, 'error': str}
+  """
+  try:
+    user = anvil.users.get_user()
+    ticket, is_staff = _get_viewable_ticket(user, ticket_id)
+
+    if not ticket:
+      return {'success': False, 'error': 'Ticket not found'}
+
+    last_message_at = current_watermark(ticket)
+
+    # Nothing new - answer from the watermark without searching messages
+    if last_seen and last_message_at and last_message_at <= last_seen:
+      return {
+        'success': True,
+        'data': {'messages': [], 'last_message_at': last_message_at}
+      }
+
+    query = _message_query(ticket, is_staff)
+    if last_seen:
+      query['created_at'] = q.greater_than(last_seen)
+
+    messages = list(app_tables.ticket_messages.search(
+      tables.order_by('created_at'),
+      **query
+    )[:MAX_THREAD_PAGE_SIZE])
+
+    if len(messages) == MAX_THREAD_PAGE_SIZE:
+      last_message_at = messages[-1]['created_at']
+
+    return {
+      'success': True,
+      'data': {'messages': messages, 'last_message_at': last_message_at}
+    }
+
+  except Exception as e:
+    print(f"Error getting new ticket messages: {e}")
+    return {'success': False, 'error': str(e)}
+
+
+@anvil.server.background_task
+def backfill_last_message_at():
+  """Set last_message_at on tickets created before the watermark existed"""
+  updated = 0
+
+  for ticket in app_tables.support_tickets.search(last_message_at=None):
+    latest = list(app_tables.ticket_messages.search(
+      tables.order_by('created_at', ascending=False),
+      ticket_id=ticket
+    )[:1])
+
+    if latest:
+      ticket['last_message_at'] = latest[0]['created_at']
+      updated += 1
+
+  print(f"Backfilled last_message_at on {updated} tickets")
@@ -11,15 +11,70 @@ import anvil.tables.query as q
 from anvil.tables import app_tables
 import anvil.server
 
-# This is a server module. It runs on the Anvil server,
-# rather than in the user's browser.
-#
-# To allow anvil.server.call() to call functions here, we mark
-# them with @anvil.server.callable.
-# Here is an example - you can replace it with your own:
-#
-# @anvil.server.callable
-# def say_hello(name):
-#   print("Hello, " + name + "!")
-#   return 42
+import re
+
+# Field validators shared by server modules.
 #
+# Each validate_* function returns an error message, or None when the value
+# is valid, so callers can collect every problem with a record at once.
+
+EMAIL_PATTERN = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+# Digits, spaces and common separators, with an optional leading +
+PHONE_PATTERN = re.compile(r'^\+?[\d\s().-]{7,20}$')
+
+MAX_NAME_LENGTH = 100
+
+
+def validate_required(value, label):
+  """Error if value is missing or blank"""
+  if value is None or (isinstance(value, str) and not value.strip()):
+    return f"{label} is required"
+  return None
+
+
+def validate_email(email):
+  """Error if email is not a plausible address"""
+  if not email or not EMAIL_PATTERN.match(email.strip()):
+    return f"Invalid email address: {email}"
+  return None
+
+
+def validate_phone(phone):
+  """Error if a non-empty phone number has an invalid format"""
+  if phone and not PHONE_PATTERN.match(phone.strip()):
+    return f"Invalid phone number: {phone}"
+  return None
+
+
+def validate_max_length(value, label, max_length):
+  """Error if a string is longer than max_length"""
+  if value and len(value) > max_length:
+    return f"{label} must be {max_length} characters or fewer"
+  return None
+
+
+def validate_choice(value, label, choices):
+  """Error if a non-empty value is not one of choices"""
+  if value and value not in choices:
+    return f"{label} must be one of: {', '.join(choices)}"
+  return None
+
+
+def validate_contact(data):
+  """
+  Validate contact fields.
+
+  Args:
+    data (dict): Contact fields (email, first_name, last_name, phone)
+
+  Returns:
+    list: Error messages (empty when valid)
+  """
+  errors = [
+    validate_required(data.get('email'), 'Email') or validate_email(data.get('email')),
+    validate_max_length(data.get('first_name'), 'First name', MAX_NAME_LENGTH),
+    validate_max_length(data.get('last_name'), 'Last name', MAX_NAME_LENGTH),
+    validate_phone(data.get('phone'))
+  ]
+  return [e for e in errors if e]
@@ -0,0 +1,102 @@
+import anvil.google.auth, anvil.google.drive, anvil.google.mail
+from anvil.google.drive import app_files
+import anvil.stripe
+import anvil.secrets
+import anvil.files
+from anvil.files import data_files
+import anvil.email
+import anvil.users
+import anvil.tables as tables
+import anvil.tables.query as q
+from anvil.tables import app_tables
+import anvil.server
+from datetime import datetime
+
+# Write-behind view counters.
+#
+# Public reads append one row to `page_view_events` instead of doing a
+# read-modify-write on the viewed row. The flush_view_counts task (scheduled
+# every few minutes) aggregates pending events and applies one `view_count`
+# update per item.
+
+# Rows processed per flush transaction
+FLUSH_BATCH_SIZE = 500
+
+
+def _counted_tables():
+  """Tables with a view_count column, keyed by item_type"""
+  return {
+    'page': app_tables.pages,
+    'blog_post': app_tables.tbl_blog_posts,
+    'kb_article': app_tables.kb_articles
+  }
+
+
+def record_view(item_type, row):
+  """
+  Record a view without touching the viewed row.
+
+  Args:
+    item_type (str): 'page', 'blog_post' or 'kb_article'
+    row (Row): Viewed row
+  """
+  try:
+    app_tables.page_view_events.add_row(
+      item_type=item_type,
+      item_id=row.get_id(),
+      viewed_at=datetime.now()
+    )
+  except Exception as e:
+    # Analytics must never break a public page
+    print(f"Error recording view: {e}")
+
+
+@anvil.server.background_task
+def flush_view_counts():
+  """Apply pending view events to view_count columns (run every 5 minutes)"""
+  total_events = 0
+
+  while True:
+    flushed = _flush_batch()
+    total_events += flushed
+    if flushed < FLUSH_BATCH_SIZE:
+      break
+
+  if total_events:
+    print(f"Flushed {total_events} view events")
+
+
+@tables.in_transaction
+def _flush_batch():
+  """
+  Aggregate and apply one batch of view events.
+
+  Returns:
+    int: Number of events processed
+  """
+  events = list(app_tables.page_view_events.search(
+    tables.order_by('viewed_at')
+  )[:FLUSH_BATCH_SIZE])
+
+  if not events:
+    return 0
+
+  deltas = {}
+  for event in events:
+    key = (event['item_type'], event['item_id'])
+    deltas[key] = deltas.get(key, 0) + 1
+
+  counted_tables = _counted_tables()
+
+  for (item_type, item_id), delta in deltas.items():
+    table = counted_tables.get(item_type)
+    row = table.get_by_id(item_id) if table else None
+
+    # Item deleted since it was viewed - drop its events
+    if row:
+      row['view_count'] = (row['view_count'] or 0) + delta
+
+  for event in events:
+    event.delete()
+
+  return len(events)
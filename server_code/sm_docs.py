@@ -11,38 +11,91 @@ import anvil.tables.query as q
 from anvil.tables import app_tables
 import anvil.server
 import markdown
+import hashlib
+from datetime import datetime
+from .server_shared import config as config_cache
+
+# Rendered HTML is kept in `doc_render_cache`, keyed by path and a hash of
+# the markdown, so opening a doc doesn't re-run codehilite. Writers below
+# refresh or drop the cache; the sorted doc list is cached per server
+# process and dropped on upload/delete.
+
+MARKDOWN_EXTENSIONS = ['extra', 'codehilite', 'fenced_code']
+
+DOC_TREE_CACHE_KEY = 'docs:tree'
+
+
+def _content_hash(md_text):
+  return hashlib.sha256(md_text.encode('utf-8')).hexdigest()
+
+
+def _render_and_cache(path, md_text):
+  """Render markdown to HTML and store it in the render cache"""
+  content_hash = _content_hash(md_text)
+
+  cached = app_tables.doc_render_cache.get(path=path)
+  if cached and cached['content_hash'] == content_hash:
+    return cached['html']
+
+  html = markdown.markdown(md_text, extensions=MARKDOWN_EXTENSIONS)
+
+  if cached:
+    cached.update(content_hash=content_hash, markdown=md_text, html=html, rendered_at=datetime.now())
+  else:
+    app_tables.doc_render_cache.add_row(
+      path=path,
+      content_hash=content_hash,
+      markdown=md_text,
+      html=html,
+      rendered_at=datetime.now()
+    )
+
+  return html
+
+
+def _drop_render_cache(path):
+  cached = app_tables.doc_render_cache.get(path=path)
+  if cached:
+    cached.delete()
+
+
+def _load_doc_tree():
+  """Sorted display names of every markdown doc"""
+  docs = []
+  for row in app_tables.files.search(q.fetch_only('path'), path=q.like('%.md')):
+    # Convert path to visual hierarchy
+    docs.append(row['path'].replace('/', ' → '))
+  return sorted(docs)
+
 
 @anvil.server.callable
 def list_markdown_docs():
   """Returns display names with hierarchy, actual paths as values"""
-  docs = []
-  for row in app_tables.files.search():
-    path = row['path']
-    if path and path.endswith('.md'):
-      # Convert path to visual hierarchy
-      display = path.replace('/', ' → ')
-      docs.append(display)  # Just the display string
-  return sorted(docs)
+  return config_cache.get_cached(DOC_TREE_CACHE_KEY, _load_doc_tree)
 
 
 @anvil.server.callable
 def load_markdown_doc(filename):
   """Load and convert markdown to HTML"""
   try:
-    # Find the file in Files table
-    row = app_tables.files.get(path=filename)
+    # Serve from the render cache when the doc has been rendered
+    cached = app_tables.doc_render_cache.get(path=filename)
 
-    if not row:
-      return {'success': False, 'error': f'File not found: {filename}'}
+    if cached:
+      md_text = cached['markdown']
+      html = cached['html']
+    else:
+      # Find the file in Files table
+      row = app_tables.files.get(path=filename)
 
-    # Get the media object
-    media = row['file']
+      if not row:
+        return {'success': False, 'error': f'File not found: {filename}'}
 
-    # Read markdown content
-    md_text = media.get_bytes().decode('utf-8')
+      # Read markdown content
+      md_text = row['file'].get_bytes().decode('utf-8')
 
-    # Convert to HTML with extensions
-    html = markdown.markdown(md_text, extensions=['extra', 'codehilite', 'fenced_code'])
+      # Convert to HTML with extensions (and cache it)
+      html = _render_and_cache(filename, md_text)
 
     return {
       'success': True, 
@@ -74,6 +127,9 @@ def save_markdown_doc(filename, markdown_text):
     # Update the row
     row['file'] = new_media
 
+    # Re-render now so the next open is a cache hit
+    _render_and_cache(filename, markdown_text)
+
     return {'success': True, 'message': 'Document saved successfully'}
   except Exception as e:
     return {'success': False, 'error': str(e)}
@@ -101,6 +157,9 @@ def upload_new_doc(file, filename):
         file_version='1.0'
       )
       message = f'{filename} uploaded successfully'
+      config_cache.drop_cached(DOC_TREE_CACHE_KEY)
+
+    _render_and_cache(filename, file.get_bytes().decode('utf-8'))
 
     return {'success': True, 'message': message}
   except Exception as e:
@@ -112,5 +171,7 @@ def delete_markdown_doc(filename):
   row = app_tables.files.get(path=filename)
   if row:
     row.delete()
+    _drop_render_cache(filename)
+    config_cache.drop_cached(DOC_TREE_CACHE_KEY)
     return {'success': True}
   return {'success': False, 'error': 'File not found'}
@@ -10,6 +10,16 @@ import anvil.tables as tables
 import anvil.tables.query as q
 from anvil.tables import app_tables
 import anvil.server
+from .server_blog import service as blog_service
+from .server_analytics import booking_cube
+from .server_customers import contact_identity
+from .server_customers import customer_summary
+from .server_customers import history_service
+from .server_customers import portal_service
+from .server_bookings import appointment_reminders
+from .server_bookings import metadata_validator
+from .server_shared import ticket_thread
+from .server_shared import ticket_service
 
 
 # Temporary stub - will be moved to server_code/auth/service.py later
@@ -72,6 +82,7 @@ def delete_blog_post(post_id):
     post = app_tables.tbl_blog_posts.get_by_id(post_id)
 
     if post and post['client_id'] == user:
+      blog_service.on_post_deleted(post)
       post.delete()
       return {'success': True}
     else:
@@ -104,32 +115,39 @@ def save_blog_post(post_id, post_data):
   """Save or update blog post"""
   try:
     user = anvil.users.get_user()
-
-    if post_id:
-      # Update existing
-      post = app_tables.tbl_blog_posts.get_by_id(post_id)
-      if post and post['client_id'] == user:
-        post.update(**post_data)
-        if post_data['status'] == 'published' and not post['published_at']:
-          post['published_at'] = datetime.now()
-    else:
-      # Create new
-      post_data['client_id'] = user
-      post_data['author_id'] = user
-      post_data['view_count'] = 0
-      post_data['created_at'] = datetime.now()
-
-      if post_data['status'] == 'published':
-        post_data['published_at'] = datetime.now()
-
-      app_tables.tbl_blog_posts.add_row(**post_data)
-
+    _save_blog_post(user, post_id, post_data)
     return {'success': True}
 
   except Exception as e:
     print(f"Error saving post: {e}")
     return {'success': False, 'error': str(e)}
 
+@tables.in_transaction
+def _save_blog_post(user, post_id, post_data):
+  """Write the post and its read model together (raises to roll back)"""
+  if post_id:
+    # Update existing
+    post = app_tables.tbl_blog_posts.get_by_id(post_id)
+    if post and post['client_id'] == user:
+      previous_status = post['status']
+      previous_category = post['category_id']
+      post.update(**post_data)
+      if post_data['status'] == 'published' and not post['published_at']:
+        post['published_at'] = datetime.now()
+      blog_service.on_post_changed(post, previous_status, previous_category)
+  else:
+    # Create new
+    post_data['client_id'] = user
+    post_data['author_id'] = user
+    post_data['view_count'] = 0
+    post_data['created_at'] = datetime.now()
+
+    if post_data['status'] == 'published':
+      post_data['published_at'] = datetime.now()
+
+    post = app_tables.tbl_blog_posts.add_row(**post_data)
+    blog_service.on_post_changed(post)
+
 *****
 
 @anvil.server.callable
@@ -166,6 +184,7 @@ def delete_blog_post(post_id):
     post = app_tables.tbl_blog_posts.get_by_id(post_id)
 
     if post and post['client_id'] == user:
+      blog_service.on_post_deleted(post)
       post.delete()
       return {'success': True}
     else:
@@ -179,7 +198,7 @@ def delete_blog_post(post_id):
 
     @anvil.server.callable
     def get_public_blog_post(slug):
-      """Get published post by slug and increment view count"""
+      """Get published post by slug and record a view"""
   try:
     post = app_tables.tbl_blog_posts.get(
       slug=slug,
@@ -189,21 +208,24 @@ def delete_blog_post(post_id):
     if not post:
       return None
 
-    # Increment view count
-    post['view_count'] = (post['view_count'] or 0) + 1
-    post.update()
+    # Count the view write-behind (flushed by flush_view_counts)
+    from .server_shared import view_counter
+    view_counter.record_view('blog_post', post)
+
+    # Copy to a dict so display fields aren't written back to the row
+    post_data = dict(post)
 
     # Add author name
-    if post.get('author_id'):
-      post['author_name'] = post['author_id']['email'].split('@')[0]
+    if post['author_id']:
+      post_data['author_name'] = post['author_id']['email'].split('@')[0]
 
     # Add category name
-    if post.get('category_id'):
-      post['category_name'] = post['category_id']['name']
+    if post['category_id']:
+      post_data['category_name'] = post['category_id']['name']
     else:
-      post['category_name'] = 'Uncategorized'
+      post_data['category_name'] = 'Uncategorized'
 
-    return post
+    return post_data
 
   except Exception as e:
     print(f"Error getting post: {e}")
@@ -235,6 +257,7 @@ def save_blog_category(category_id, category_data):
     else:
       # Create new
       category_data['client_id'] = user
+      category_data['published_count'] = 0
       app_tables.tbl_blog_categories.add_row(**category_data)
 
     return {'success': True}
@@ -270,54 +293,8 @@ def delete_blog_category(category_id):
 
     *****
 
-@anvil.server.callable
-def get_public_blog_categories():
-  """Get categories that have published posts"""
-  # Get all categories with at least one published post
-  categories = []
-  for cat in app_tables.tbl_blog_categories.search():
-    posts_count = len(list(
-      app_tables.tbl_blog_posts.search(
-        category_id=cat,
-        status='published'
-      )
-    ))
-    if posts_count > 0:
-      categories.append(cat)
-
-  return categories
-
-@anvil.server.callable
-def get_public_blog_posts(category_id=None, search_term=None):
-  """Get published blog posts"""
-  query = {'status': 'published'}
-
-  if category_id:
-    category = app_tables.tbl_blog_categories.get_by_id(category_id)
-    query['category_id'] = category
-
-  posts = list(app_tables.tbl_blog_posts.search(
-    tables.order_by('published_at', ascending=False),
-    **query
-  ))
-
-  # Search filter
-  if search_term:
-    search_lower = search_term.lower()
-    posts = [
-      p for p in posts 
-      if search_lower in p['title'].lower() or 
-      search_lower in (p.get('excerpt', '') or '').lower()
-    ]
-
-  # Add category name for display
-  for post in posts:
-    if post.get('category_id'):
-      post['category_name'] = post['category_id']['name']
-    else:
-      post['category_name'] = 'Uncategorized'
-
-  return posts
+# get_public_blog_categories and get_public_blog_posts moved to server_blog
+# (category_service.py / service.py)
 
 *****
 
@@ -379,24 +356,27 @@ def schedule_appointment(appointment_data):
     if appointment_data.get('staff_id'):
       staff = app_tables.users.get_by_id(appointment_data['staff_id'])
 
+    metadata, errors = metadata_validator.validate_metadata('appointment', {
+      'meeting_type': appointment_data['meeting_type'],
+      'client_notes': appointment_data.get('client_notes', '')
+    })
+    if errors:
+      return {'success': False, 'error': '; '.join(errors)}
+
     # Create booking
-    booking = app_tables.tbl_bookings.add_row(
-      client_id=user,
-      customer_id=customer,
-      service_id=service,
-      staff_id=staff,
-      booking_type='appointment',
-      start_datetime=appointment_data['start_datetime'],
-      end_datetime=appointment_data['end_datetime'],
-      status='confirmed',
-      total_amount=appointment_data['total_amount'],
-      metadata={
-        'meeting_type': appointment_data['meeting_type'],
-        'client_notes': appointment_data.get('client_notes', '')
-      },
-      created_at=datetime.now(),
-      booking_number=f"APT-{datetime.now().strftime('%Y%m%d')}-{len(list(app_tables.tbl_bookings.search()))+1:03d}"
-    )
+    booking = _add_booking({
+      'client_id': user,
+      'customer_id': customer,
+      'service_id': service,
+      'staff_id': staff,
+      'booking_type': 'appointment',
+      'start_datetime': appointment_data['start_datetime'],
+      'end_datetime': appointment_data['end_datetime'],
+      'status': 'confirmed',
+      'total_amount': appointment_data['total_amount'],
+      'metadata': metadata,
+      'created_at': datetime.now()
+    }, 'APT')
 
     # TODO: Send confirmation email
     # TODO: Create calendar event
@@ -467,24 +447,27 @@ def schedule_appointment(appointment_data):
     if appointment_data.get('staff_id'):
       staff = app_tables.users.get_by_id(appointment_data['staff_id'])
 
+    metadata, errors = metadata_validator.validate_metadata('appointment', {
+      'meeting_type': appointment_data['meeting_type'],
+      'client_notes': appointment_data.get('client_notes', '')
+    })
+    if errors:
+      return {'success': False, 'error': '; '.join(errors)}
+
     # Create booking
-    booking = app_tables.tbl_bookings.add_row(
-      client_id=user,
-      customer_id=customer,
-      service_id=service,
-      staff_id=staff,
-      booking_type='appointment',
-      start_datetime=appointment_data['start_datetime'],
-      end_datetime=appointment_data['end_datetime'],
-      status='confirmed',
-      total_amount=appointment_data['total_amount'],
-      metadata={
-        'meeting_type': appointment_data['meeting_type'],
-        'client_notes': appointment_data.get('client_notes', '')
-      },
-      created_at=datetime.now(),
-      booking_number=f"APT-{datetime.now().strftime('%Y%m%d')}-{len(list(app_tables.tbl_bookings.search()))+1:03d}"
-    )
+    booking = _add_booking({
+      'client_id': user,
+      'customer_id': customer,
+      'service_id': service,
+      'staff_id': staff,
+      'booking_type': 'appointment',
+      'start_datetime': appointment_data['start_datetime'],
+      'end_datetime': appointment_data['end_datetime'],
+      'status': 'confirmed',
+      'total_amount': appointment_data['total_amount'],
+      'metadata': metadata,
+      'created_at': datetime.now()
+    }, 'APT')
 
     # TODO: Send confirmation email
     # TODO: Create calendar event
@@ -499,7 +482,7 @@ def schedule_appointment(appointment_data):
 
 @anvil.server.callable
 def get_booking_analytics(days):
-  """Get booking analytics for specified days"""
+  """Get booking analytics for specified days (served from the booking cube)"""
   try:
     user = anvil.users.get_user()
 
@@ -507,61 +490,47 @@ def get_booking_analytics(days):
     end_date = datetime.now()
     start_date = end_date - timedelta(days=days)
 
-    # Get bookings in range
-    bookings = list(app_tables.tbl_bookings.search(
-      client_id=user
-    ))
-
-    # Filter by date
-    current_bookings = [
-      b for b in bookings
-      if start_date <= b['start_datetime'] <= end_date
-    ]
-
     # Previous period for comparison
     prev_start = start_date - timedelta(days=days)
-    prev_bookings = [
-      b for b in bookings
-      if prev_start <= b['start_datetime'] < start_date
-    ]
+    prev_end = start_date - timedelta(days=1)
+
+    current = booking_cube.get_period_totals(user, start_date, end_date)
+    previous = booking_cube.get_period_totals(user, prev_start, prev_end)
 
     # Calculate stats
-    total_bookings = len(current_bookings)
-    prev_total = len(prev_bookings)
+    total_bookings = current['bookings']
+    prev_total = previous['bookings']
     bookings_change = f"+{int((total_bookings - prev_total) / prev_total * 100) if prev_total > 0 else 0}%"
 
-    total_revenue = sum(b.get('total_amount', 0) for b in current_bookings)
-    prev_revenue = sum(b.get('total_amount', 0) for b in prev_bookings)
+    total_revenue = current['revenue']
+    prev_revenue = previous['revenue']
     revenue_change = f"+{int((total_revenue - prev_revenue) / prev_revenue * 100) if prev_revenue > 0 else 0}%"
 
-    no_shows = len([b for b in current_bookings if b['status'] == 'no_show'])
+    # No-shows in the period
+    no_shows = booking_cube.get_period_cells(
+      user, 'day_status', start_date, end_date
+    ).get('no_show', {}).get('bookings', 0)
 
     avg_value = total_revenue / total_bookings if total_bookings > 0 else 0
 
-    # Top resources
-    resource_counts = {}
-    for booking in current_bookings:
-      if booking.get('resource_id'):
-        resource_name = booking['resource_id']['resource_name']
-        resource_counts[resource_name] = resource_counts.get(resource_name, 0) + 1
-
-    top_resources = [
-      {
-        'rank': i + 1,
-        'resource_name': name,
-        'booking_count': count
-      }
-      for i, (name, count) in enumerate(
-        sorted(resource_counts.items(), key=lambda x: x[1], reverse=True)[:5]
-      )
-    ]
+    # Top resources in the period
+    resource_cells = booking_cube.get_period_cells(user, 'day_resource', start_date, end_date)
+    top_ids = sorted(resource_cells, key=lambda r: resource_cells[r]['bookings'], reverse=True)[:5]
+
+    top_resources = []
+    for resource_id in top_ids:
+      resource = app_tables.tbl_bookable_resources.get_by_id(resource_id)
+      if resource:
+        top_resources.append({
+          'rank': len(top_resources) + 1,
+          'resource_name': resource['resource_name'],
+          'booking_count': resource_cells[resource_id]['bookings']
+        })
 
-    # Peak times
+    # Peak times in the period
     time_counts = {}
-    for booking in current_bookings:
-      hour = booking['start_datetime'].hour
-      time_str = f"{hour:02d}:00"
-      time_counts[time_str] = time_counts.get(time_str, 0) + 1
+    for hour, cell in booking_cube.get_period_cells(user, 'day_hour', start_date, end_date).items():
+      time_counts[f"{int(hour):02d}:00"] = cell['bookings']
 
     peak_times = [
       {'time': time, 'count': count}
@@ -645,14 +614,6 @@ def get_all_customers():
     account_status='active'
   ))
 
-@anvil.server.callable
-def get_booking_metadata_schema(booking_type):
-  """Get metadata schema for booking type"""
-  schema = app_tables.tbl_booking_metadata_schemas.get(
-    booking_type=booking_type
-  )
-  return dict(schema) if schema else None
-
 @anvil.server.callable
 def check_availability(resource_id, start_datetime, end_datetime, exclude_booking_id=None):
   """Check if resource is available for time slot"""
@@ -694,21 +655,27 @@ def save_booking(booking_id, booking_data):
   """Save or update booking"""
   try:
     user = anvil.users.get_user()
+    booking = app_tables.tbl_bookings.get_by_id(booking_id) if booking_id else None
+
+    if booking_id and not booking:
+      return {'success': False, 'error': 'Booking not found'}
 
-    if booking_id:
+    if 'metadata' in booking_data:
+      booking_type = booking_data.get('booking_type') or (booking['booking_type'] if booking else None)
+      booking_data['metadata'], errors = metadata_validator.validate_metadata(
+        booking_type, booking_data['metadata']
+      )
+      if errors:
+        return {'success': False, 'error': '; '.join(errors)}
+
+    if booking:
       # Update existing
-      booking = app_tables.tbl_bookings.get_by_id(booking_id)
-      booking.update(**booking_data)
+      _update_booking(booking_id, booking_data)
     else:
       # Create new
       booking_data['client_id'] = user
       booking_data['created_at'] = datetime.now()
-
-      # Generate booking number
-      count = len(list(app_tables.tbl_bookings.search(client_id=user)))
-      booking_data['booking_number'] = f"BK-{datetime.now().strftime('%Y%m%d')}-{count+1:03d}"
-
-      app_tables.tbl_bookings.add_row(**booking_data)
+      _add_booking(booking_data, 'BK', tenant=user)
 
     return {'success': True}
 
@@ -716,6 +683,65 @@ def save_booking(booking_id, booking_data):
     print(f"Error saving booking: {e}")
     return {'success': False, 'error': str(e)}
 
+@tables.in_transaction
+def _add_booking(booking_data, prefix, tenant=None):
+  """
+  Add a booking and update its read models (raises to roll back).
+
+  Args:
+    booking_data (dict): tbl_bookings row values
+    prefix (str): Booking number prefix ('BK', 'APT')
+    tenant (Row): Number bookings per tenant instead of across all bookings
+
+  Returns:
+    Row: New booking
+  """
+  count = len(app_tables.tbl_bookings.search(client_id=tenant) if tenant else app_tables.tbl_bookings.search())
+  booking_data['booking_number'] = f"{prefix}-{datetime.now().strftime('%Y%m%d')}-{count+1:03d}"
+
+  booking = app_tables.tbl_bookings.add_row(**booking_data)
+  booking_cube.on_booking_changed(booking)
+  portal_service.invalidate(booking['customer_id'])
+  appointment_reminders.sync_reminders(booking)
+  customer_summary.record('booking', booking)
+  return booking
+
+@tables.in_transaction
+def _update_booking(booking_id, changes):
+  """
+  Change a booking and move it between read-model buckets (raises to roll back).
+
+  Returns:
+    Row: Updated booking
+  """
+  booking = _get_booking(booking_id)
+
+  previous = booking_cube.snapshot(booking)
+  previous_customer = booking['customer_id']
+  booking.update(**changes)
+  booking['updated_at'] = datetime.now()
+  _after_booking_change(booking, previous)
+
+  if booking['customer_id'] != previous_customer:
+    customer_summary.forget('booking', booking, previous_customer)
+    customer_summary.record('booking', booking)
+    portal_service.invalidate(previous_customer)
+
+  return booking
+
+def _get_booking(booking_id):
+  """Load a booking inside a write transaction, raising if it is missing"""
+  booking = app_tables.tbl_bookings.get_by_id(booking_id)
+  if not booking:
+    raise ValueError('Booking not found')
+  return booking
+
+def _after_booking_change(booking, previous):
+  """Read-model hooks shared by every booking update"""
+  booking_cube.on_booking_changed(booking, previous)
+  portal_service.invalidate(booking['customer_id'])
+  appointment_reminders.sync_reminders(booking)
+
 *****
 
 @anvil.server.callable
@@ -754,27 +780,28 @@ def get_all_bookings(filters):
 @anvil.server.callable
 def update_booking_status(booking_id, new_status):
   """Update booking status"""
-  booking = app_tables.tbl_bookings.get_by_id(booking_id)
-  if booking:
-    booking['status'] = new_status
-    booking.update()
+  try:
+    _update_booking(booking_id, {'status': new_status})
     return {'success': True}
-  return {'success': False, 'error': 'Booking not found'}
+
+  except Exception as e:
+    print(f"Error updating booking status: {e}")
+    return {'success': False, 'error': str(e)}
 
 @anvil.server.callable
 def cancel_booking(booking_id, reason):
   """Cancel a booking"""
-  booking = app_tables.tbl_bookings.get_by_id(booking_id)
-  if booking:
-    booking['status'] = 'cancelled'
-    booking['notes'] = f"Cancelled: {reason}"
-    booking.update()
+  try:
+    _update_booking(booking_id, {'status': 'cancelled', 'notes': f"Cancelled: {reason}"})
 
     # TODO: Send cancellation email
     # TODO: Process refund if payment made
 
     return {'success': True}
-  return {'success': False, 'error': 'Booking not found'}
+
+  except Exception as e:
+    print(f"Error cancelling booking: {e}")
+    return {'success': False, 'error': str(e)}
 
 *****
 
@@ -807,26 +834,7 @@ def search_booking_for_checkin(search_term):
 def process_check_in(booking_id, checkin_data):
   """Process guest check-in"""
   try:
-    booking = app_tables.tbl_bookings.get_by_id(booking_id)
-
-    if not booking:
-      return {'success': False, 'error': 'Booking not found'}
-
-    if booking['status'] != 'confirmed':
-      return {'success': False, 'error': f'Cannot check in - status is {booking["status"]}'}
-
-    # Update booking
-    booking['status'] = 'checked_in'
-    booking['checked_in_at'] = datetime.now()
-    booking['id_document'] = checkin_data['id_document']
-    booking['key_number'] = checkin_data.get('key_number', '')
-
-    # Add notes
-    if checkin_data.get('special_requests'):
-      current_notes = booking.get('notes', '')
-      booking['notes'] = f"{current_notes}\nCheck-in requests: {checkin_data['special_requests']}"
-
-    booking.update()
+    _check_in(booking_id, checkin_data)
 
     # TODO: Send welcome email
 
@@ -836,35 +844,33 @@ def process_check_in(booking_id, checkin_data):
     print(f"Error processing check-in: {e}")
     return {'success': False, 'error': str(e)}
 
-@anvil.server.callable
-def process_check_out(booking_id, checkout_data):
-  """Process guest check-out"""
-  try:
-    booking = app_tables.tbl_bookings.get_by_id(booking_id)
-
-    if not booking:
-      return {'success': False, 'error': 'Booking not found'}
+@tables.in_transaction
+def _check_in(booking_id, checkin_data):
+  booking = _get_booking(booking_id)
 
-    if booking['status'] != 'checked_in':
-      return {'success': False, 'error': f'Cannot check out - status is {booking["status"]}'}
+  if booking['status'] != 'confirmed':
+    raise ValueError(f'Cannot check in - status is {booking["status"]}')
 
-    # Update booking
-    booking['status'] = 'checked_out'
-    booking['checked_out_at'] = datetime.now()
-    booking['final_amount'] = checkout_data['total']
-    booking['payment_status'] = checkout_data['payment_status']
+  # Update booking
+  previous = booking_cube.snapshot(booking)
+  booking['status'] = 'checked_in'
+  booking['checked_in_at'] = datetime.now()
+  booking['updated_at'] = datetime.now()
+  booking['id_document'] = checkin_data['id_document']
+  booking['key_number'] = checkin_data.get('key_number', '')
 
-    # Add charges breakdown to notes
-    notes = f"\nCheckout - Extras: ${checkout_data['extras']:.2f}, Tax: ${checkout_data['tax']:.2f}, Total: ${checkout_data['total']:.2f}"
+  # Add notes
+  if checkin_data.get('special_requests'):
     current_notes = booking.get('notes', '')
-    booking['notes'] = current_notes + notes
+    booking['notes'] = f"{current_notes}\nCheck-in requests: {checkin_data['special_requests']}"
 
-    booking.update()
+  _after_booking_change(booking, previous)
 
-    # Update room status to 'dirty' (needs cleaning)
-    if booking.get('resource_id'):
-      booking['resource_id']['status'] = 'dirty'
-      booking['resource_id'].update()
+@anvil.server.callable
+def process_check_out(booking_id, checkout_data):
+  """Process guest check-out"""
+  try:
+    _check_out(booking_id, checkout_data)
 
     # TODO: Send thank you email
     # TODO: Process payment if outstanding
@@ -875,6 +881,34 @@ def process_check_out(booking_id, checkout_data):
     print(f"Error processing check-out: {e}")
     return {'success': False, 'error': str(e)}
 
+@tables.in_transaction
+def _check_out(booking_id, checkout_data):
+  booking = _get_booking(booking_id)
+
+  if booking['status'] != 'checked_in':
+    raise ValueError(f'Cannot check out - status is {booking["status"]}')
+
+  # Update booking
+  previous = booking_cube.snapshot(booking)
+  booking['status'] = 'checked_out'
+  booking['checked_out_at'] = datetime.now()
+  booking['updated_at'] = datetime.now()
+  booking['final_amount'] = checkout_data['total']
+  booking['payment_status'] = checkout_data['payment_status']
+
+  # Add charges breakdown to notes
+  notes = f"\nCheckout - Extras: ${checkout_data['extras']:.2f}, Tax: ${checkout_data['tax']:.2f}, Total: ${checkout_data['total']:.2f}"
+  current_notes = booking.get('notes', '')
+  booking['notes'] = current_notes + notes
+
+  _after_booking_change(booking, previous)
+  history_service.record_stay(booking)
+
+  # Update room status to 'dirty' (needs cleaning)
+  if booking.get('resource_id'):
+    booking['resource_id']['status'] = 'dirty'
+    booking['resource_id'].update()
+
 *****
 
 @anvil.server.callable
@@ -1033,38 +1067,36 @@ def get_available_time_slots(resource_id, date):
 def create_public_booking(booking_data):
   """Create booking from public widget"""
   try:
-    # Get or create customer
-    customer = app_tables.users.get(email=booking_data['customer_email'])
-
-    if not customer:
-      # Create guest customer
-      customer = app_tables.users.add_row(
-        email=booking_data['customer_email'],
-        role='customer',
-        account_status='active',
-        created_at=datetime.now()
-      )
+    # Get or create customer (matched on normalised email)
+    customer = contact_identity.get_or_create_user(booking_data['customer_email'])
 
     # Get resource
     resource = app_tables.tbl_bookable_resources.get_by_id(booking_data['resource_id'])
 
+    # Public bookings are always appointments
+    metadata, errors = metadata_validator.validate_metadata(
+      'appointment', booking_data.get('metadata') or {}
+    )
+    if errors:
+      return {'success': False, 'error': '; '.join(errors)}
+
     # Calculate end time (default 1 hour)
     end_datetime = booking_data['start_datetime'] + timedelta(hours=1)
 
     # Create booking
-    booking = app_tables.tbl_bookings.add_row(
-      client_id=resource['client_id'],
-      customer_id=customer,
-      resource_id=resource,
-      booking_type='appointment',
-      start_datetime=booking_data['start_datetime'],
-      end_datetime=end_datetime,
-      status='pending',
-      total_amount=0,
-      customer_notes=booking_data.get('notes', ''),
-      created_at=datetime.now(),
-      booking_number=f"BK-{datetime.now().strftime('%Y%m%d')}-{len(list(app_tables.tbl_bookings.search()))+1:03d}"
-    )
+    booking = _add_booking({
+      'client_id': resource['client_id'],
+      'customer_id': customer,
+      'resource_id': resource,
+      'booking_type': 'appointment',
+      'start_datetime': booking_data['start_datetime'],
+      'end_datetime': end_datetime,
+      'status': 'pending',
+      'total_amount': 0,
+      'customer_notes': booking_data.get('notes', ''),
+      'metadata': metadata,
+      'created_at': datetime.now()
+    }, 'BK')
 
     # Send confirmation email
     # TODO: Implement in Phase 2
@@ -1353,54 +1385,10 @@ def delete_time_entry(entry_id):
 
 @anvil.server.callable
 def get_client_portal_data():
-  """Get all client portal data"""
+  """Get client portal data (first page of each section)"""
   try:
     user = anvil.users.get_user()
-
-    # Upcoming appointments
-    upcoming = list(app_tables.tbl_bookings.search(
-      customer_id=user,
-      status=q.any_of('pending', 'confirmed'),
-      start_datetime=q.greater_than(datetime.now())
-    ))
-
-    upcoming_data = []
-    for booking in upcoming:
-      service_name = booking.get('service_id', {}).get('service_name', 'Appointment')
-      staff_name = booking.get('staff_id', {}).get('email', 'Staff').split('@')[0]
-
-      upcoming_data.append({
-        'booking_id': booking.get_id(),
-        'datetime': booking['start_datetime'],
-        'service_name': service_name,
-        'staff_name': staff_name
-      })
-
-    # Past appointments
-    past = list(app_tables.tbl_bookings.search(
-      customer_id=user,
-      status=q.any_of('completed', 'cancelled'),
-      tables.order_by('start_datetime', ascending=False)
-    ))
-
-    past_data = [{
-      'datetime': b['start_datetime'],
-      'service_name': b.get('service_id', {}).get('service_name', 'Appointment'),
-      'status': b['status']
-    } for b in past]
-
-    # Invoices (placeholder)
-    invoices = []
-
-    # Documents (placeholder)
-    documents = []
-
-    return {
-      'upcoming': upcoming_data,
-      'past': past_data,
-      'invoices': invoices,
-      'documents': documents
-    }
+    return portal_service.get_portal_data(user)
 
   except Exception as e:
     print(f"Error getting portal data: {e}")
@@ -1415,77 +1403,28 @@ def get_client_portal_data():
 
 @anvil.server.callable
 def get_guest_history(guest_id):
-  """Get complete guest history"""
+  """Get guest stay statistics with the first page of bookings and notes"""
   try:
+    user = anvil.users.get_user()
     guest = app_tables.users.get_by_id(guest_id)
 
     if not guest:
       return None
 
-    # Get all bookings
-    bookings = list(app_tables.tbl_bookings.search(
-      customer_id=guest,
-      tables.order_by('start_datetime', ascending=False)
-    ))
-
-    # Calculate stats
-    total_stays = len([b for b in bookings if b['status'] in ['completed', 'checked_in']])
-
-    total_nights = 0
-    for booking in bookings:
-      if booking['status'] in ['completed', 'checked_in']:
-        nights = (booking['end_datetime'].date() - booking['start_datetime'].date()).days
-        total_nights += nights
-
-    total_revenue = sum(b.get('total_amount', 0) for b in bookings if b['status'] == 'completed')
-
-    last_visit = None
-    if bookings:
-      last_visit = bookings[0]['start_datetime']
-
-    # Find favorite room
-    room_counts = {}
-    for booking in bookings:
-      if booking.get('resource_id'):
-        room_name = booking['resource_id']['room_number']
-        room_counts[room_name] = room_counts.get(room_name, 0) + 1
-
-    favorite_room = max(room_counts.items(), key=lambda x: x[1])[0] if room_counts else 'None'
-
-    # Format booking data
-    booking_data = []
-    for booking in bookings:
-      nights = (booking['end_datetime'].date() - booking['start_datetime'].date()).days
-      room_name = booking['resource_id']['room_number'] if booking.get('resource_id') else 'Unknown'
-
-      booking_data.append({
-        'start_date': booking['start_datetime'],
-        'end_date': booking['end_datetime'],
-        'nights': nights,
-        'room_name': room_name,
-        'amount': booking.get('total_amount', 0),
-        'status': booking['status']
-      })
-
-    # Get notes
-    notes = list(app_tables.tbl_client_notes.search(
-      customer_id=guest,
-      tables.order_by('created_at', ascending=False)
-    ))
-
-    note_data = [{'note': n['note']} for n in notes]
+    # Stats are maintained at check-out; history is paged
+    bookings = history_service.booking_page(guest)
+    notes = history_service.note_page(
+      guest,
+      include_confidential=bool(user) and user['role'] in ['owner', 'manager']
+    )
 
     return {
       'guest': guest,
-      'stats': {
-        'total_stays': total_stays,
-        'total_nights': total_nights,
-        'total_revenue': total_revenue,
-        'last_visit': last_visit,
-        'favorite_room': favorite_room
-      },
-      'bookings': booking_data,
-      'notes': note_data
+      'stats': history_service.get_stats(guest),
+      'bookings': bookings['bookings'],
+      'bookings_has_more': bookings['has_more'],
+      'notes': notes['notes'],
+      'notes_has_more': notes['has_more']
     }
 
   except Exception as e:
@@ -1522,7 +1461,7 @@ def get_my_tickets(status_filter='all'):
   if status_filter != 'all':
     query['status'] = status_filter
 
-  tickets = list(app_tables.tbl_tickets.search(
+  tickets = list(app_tables.support_tickets.search(
     tables.order_by('created_at', ascending=False),
     **query
   ))
@@ -1535,32 +1474,14 @@ def create_ticket(ticket_data):
   try:
     user = anvil.users.get_user()
 
-    # Generate ticket number
-    count = len(list(app_tables.tbl_tickets.search()))
-    ticket_number = f"TKT-{datetime.now().strftime('%Y%m%d')}-{count+1:03d}"
-
-    # Create ticket
-    ticket = app_tables.tbl_tickets.add_row(
-      ticket_number=ticket_number,
-      customer_id=user,
-      customer_email=user['email'],
-      subject=ticket_data['subject'],
-      description=ticket_data['description'],
-      category=ticket_data['category'],
-      priority=ticket_data['priority'],
-      status='open',
-      created_at=datetime.now(),
-      updated_at=datetime.now()
-    )
-
-    # Add initial message
-    app_tables.tbl_ticket_messages.add_row(
-      ticket_id=ticket,
-      author_id=user,
-      author_type='customer',
-      message=ticket_data['description'],
-      is_internal_note=False,
-      created_at=datetime.now()
+    # Same path as the support form, so the ticket reaches the staff
+    # queue and the customer's 360 summary
+    ticket = ticket_service._add_ticket(
+      ticket_service.generate_ticket_number(),
+      user,
+      None,
+      user['email'],
+      ticket_data
     )
 
     # TODO: Send confirmation email
@@ -1574,10 +1495,12 @@ def create_ticket(ticket_data):
 @anvil.server.callable
 def get_ticket_messages(ticket_id):
   """Get all messages for a ticket"""
-  ticket = app_tables.tbl_tickets.get_by_id(ticket_id)
+  ticket = app_tables.support_tickets.get_by_id(ticket_id)
 
-  messages = list(app_tables.tbl_ticket_messages.search(
+  # Staff internal notes live in the same table and stay hidden here
+  messages = list(app_tables.ticket_messages.search(
     ticket_id=ticket,
+    is_internal_note=False,
     tables.order_by('created_at')
   ))
 
@@ -1595,19 +1518,21 @@ def add_ticket_message(ticket_id, message_text):
   """Add message to ticket"""
   try:
     user = anvil.users.get_user()
-    ticket = app_tables.tbl_tickets.get_by_id(ticket_id)
+    ticket = app_tables.support_tickets.get_by_id(ticket_id)
 
-    app_tables.tbl_ticket_messages.add_row(
+    now = datetime.now()
+    app_tables.ticket_messages.add_row(
       ticket_id=ticket,
       author_id=user,
       author_type='customer',
       message=message_text,
       is_internal_note=False,
-      created_at=datetime.now()
+      created_at=now
     )
 
     # Update ticket
-    ticket['updated_at'] = datetime.now()
+    ticket['updated_at'] = now
+    ticket_thread.touch_last_message(ticket, now)
     ticket.update()
 
     # TODO: Notify support staff
@@ -1684,23 +1609,10 @@ def get_customer_details(customer_id):
     if not customer:
       return None
 
-    # Calculate summary
-    orders = list(app_tables.tbl_orders.search(customer_id=customer))
-    bookings = list(app_tables.tbl_bookings.search(customer_id=customer))
-    tickets = list(app_tables.tbl_tickets.search(customer_id=customer))
-    reviews = list(app_tables.tbl_reviews.search(customer_id=customer))
-
-    total_spent = sum(o.get('total_amount', 0) for o in orders)
-
+    # Summary is maintained on writes - one row instead of the full history
     return {
       'customer': customer,
-      'summary': {
-        'orders_count': len(orders),
-        'total_spent': total_spent,
-        'bookings_count': len(bookings),
-        'tickets_count': len(tickets),
-        'reviews_count': len(reviews)
-      }
+      'summary': customer_summary.get_summary(customer)
     }
 
   except Exception as e:
@@ -1711,65 +1623,66 @@ def get_customer_details(customer_id):
 def get_customer_orders(customer_id):
   """Get customer's orders"""
   customer = app_tables.users.get_by_id(customer_id)
-  orders = list(app_tables.tbl_orders.search(
-    customer_id=customer,
-    tables.order_by('created_at', ascending=False)
-  ))
+  orders = customer_summary.latest(
+    'order', customer,
+    columns=['order_number', 'created_at', 'total_amount', 'status']
+  )
 
   return [{
     'number': o['order_number'],
     'date': o['created_at'],
     'amount': o['total_amount'],
     'status': o['status']
-  } for o in orders[:10]]
+  } for o in orders]
 
 @anvil.server.callable
 def get_customer_bookings(customer_id):
   """Get customer's bookings"""
   customer = app_tables.users.get_by_id(customer_id)
-  bookings = list(app_tables.tbl_bookings.search(
-    customer_id=customer,
-    tables.order_by('start_datetime', ascending=False)
-  ))
+  bookings = customer_summary.latest(
+    'booking', customer,
+    order_column='start_datetime',
+    columns=['booking_number', 'start_datetime', 'total_amount', 'status']
+  )
 
   return [{
     'number': b['booking_number'],
     'date': b['start_datetime'],
-    'amount': b.get('total_amount', 0),
+    'amount': b['total_amount'] or 0,
     'status': b['status']
-  } for b in bookings[:10]]
+  } for b in bookings]
 
 @anvil.server.callable
 def get_customer_tickets(customer_id):
   """Get customer's support tickets"""
   customer = app_tables.users.get_by_id(customer_id)
-  tickets = list(app_tables.tbl_tickets.search(
-    customer_id=customer,
-    tables.order_by('created_at', ascending=False)
-  ))
+  tickets = customer_summary.latest(
+    'ticket', customer,
+    columns=['ticket_number', 'created_at', 'status']
+  )
 
   return [{
     'number': t['ticket_number'],
     'date': t['created_at'],
     'amount': None,
     'status': t['status']
-  } for t in tickets[:10]]
+  } for t in tickets]
 
 @anvil.server.callable
 def get_customer_reviews(customer_id):
   """Get customer's reviews"""
   customer = app_tables.users.get_by_id(customer_id)
-  reviews = list(app_tables.tbl_reviews.search(
-    customer_id=customer,
-    tables.order_by('created_at', ascending=False)
-  ))
+  reviews = customer_summary.latest(
+    'review', customer,
+    columns=['rating', 'created_at', 'status']
+  )
 
   return [{
-    'number': f"⭐ {r.get('rating', 0)}/5",
+    'number': f"⭐ {r['rating'] or 0}/5",
     'date': r['created_at'],
     'amount': None,
-    'status': r.get('status', 'pending')
-  } for r in reviews[:10]]
+    'status': r['status'] or 'pending'
+  } for r in reviews]
 
   *****
 